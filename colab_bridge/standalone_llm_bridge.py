@@ -215,6 +215,7 @@ class ChatRequest(BaseModel):
     n: int = 1
     model: str = "default"
     use_rag: bool = False
+    prompt_layout: str = "classic"
 
 
 class SyncLoreRequest(BaseModel):
@@ -728,8 +729,13 @@ class TunnelManager:
                     pass
 
 
-def _inject_rag_into_messages(messages: list[dict], lore_manager: LoreManager) -> list[dict]:
-    """Retrieve relevant lore and prepend it to the system context."""
+def _inject_rag_into_messages(messages: list[dict], lore_manager: LoreManager, prompt_layout: str = "classic") -> list[dict]:
+    """
+    Retrieve relevant lore and prepend it to the system context.
+    With the "cache_friendly" layout the leading system message is left untouched
+    (it is the reusable prompt prefix) and lore goes in front of the user's message,
+    or at the end when there is none (e.g. an assistant-continue request).
+    """
     if not lore_manager.model or not messages:
         return messages
 
@@ -738,16 +744,26 @@ def _inject_rag_into_messages(messages: list[dict], lore_manager: LoreManager) -
         if msg.get("role") == "user":
             user_message = msg.get("content")
             break
+    # Without a user turn, retrieve for whatever the request ends with.
+    query = user_message or messages[-1].get("content")
 
-    if not user_message:
+    if not query:
         return messages
 
-    retrieved_lore = lore_manager.retrieve_top_k(user_message, k=3)
+    retrieved_lore = lore_manager.retrieve_top_k(query, k=3)
     if not retrieved_lore:
         return messages
 
     lore_text = "\n\n".join(retrieved_lore)
     updated_messages = list(messages)
+    if prompt_layout == "cache_friendly":
+        last_user = max((i for i, msg in enumerate(updated_messages) if msg.get("role") == "user"), default=None)
+        if last_user is None:
+            updated_messages.append({"role": "system", "content": lore_text})
+        else:
+            updated_messages.insert(last_user, {"role": "system", "content": lore_text})
+        return updated_messages
+
     for i, msg in enumerate(updated_messages):
         if msg.get("role") == "system":
             updated_messages[i] = {
@@ -836,7 +852,7 @@ def create_app(
 
         # Server-side RAG: retrieve lore and inject into system prompt
         if request.use_rag:
-            messages = _inject_rag_into_messages(messages, lore_manager)
+            messages = _inject_rag_into_messages(messages, lore_manager, request.prompt_layout)
 
         if not llm_engine:
             if request.n > 1:
@@ -53,6 +53,12 @@ class RewindRequested(Exception):
         super().__init__(f"Rewind requested to message {message_number}")
         self.message_number = message_number
 
+class BranchRestoreRequested(Exception):
+    """Exception raised to signal the TUI to switch history to an abandoned branch."""
+    def __init__(self, branch_id: int):
+        super().__init__(f"Branch restore requested for branch {branch_id}")
+        self.branch_id = branch_id
+
 def app_commands(ops: str, suppress_output: bool = False):
     """
     Dispatcher for internal operational commands.
@@ -143,7 +149,7 @@ def app_commands(ops: str, suppress_output: bool = False):
         _log("[SYSTEM] Conversation history reset.", Fore.YELLOW)
         history_path = pick_history()
         if history_path:
-            profile_name = os.path.basename(history_path).replace("_history.json", "")
+            profile_name = re.sub(r"_history\.jsonl?$", "", os.path.basename(history_path))
             memory_manager.save_history(profile_name, [])
             _log("[SYSTEM] History cleared.", Fore.GREEN)
         else:
@@ -155,20 +161,16 @@ def app_commands(ops: str, suppress_output: bool = False):
             # In TUI, we don't want interactive prompts here. 
             # We'll just assume they want to clear everything or we could make a specific TUI command.
             from engines.memory_v2 import memory_manager
-            for filename in os.listdir(HISTORY_PATH):
-                if filename.endswith(".json"):
-                    profile_name = filename.replace("_history.json", "")
-                    memory_manager.save_history(profile_name, [])
+            for profile_name in memory_manager.list_profiles():
+                memory_manager.save_history(profile_name, [])
             _log("[SYSTEM] All history files have been wiped.", Fore.GREEN)
             return
 
         confirm = input(Fore.RED + "Are you sure you want to reset ALL history files? (y/n): ").strip().lower()
         if confirm == 'y':
             from engines.memory_v2 import memory_manager
-            for filename in os.listdir(HISTORY_PATH):
-                if filename.endswith(".json"):
-                    profile_name = filename.replace("_history.json", "")
-                    memory_manager.save_history(profile_name, [])
+            for profile_name in memory_manager.list_profiles():
+                memory_manager.save_history(profile_name, [])
             _log("[SYSTEM] All history files have been wiped.", Fore.GREEN)
         else:
             _log("[SYSTEM] Reset cancelled.", Fore.YELLOW)
@@ -336,15 +338,14 @@ def app_commands(ops: str, suppress_output: bool = False):
             return
 
         profile_name = os.path.basename(current_profile_setting).replace(".json", "")
-        full_data = memory_manager.get_full_data(profile_name)
-        history = full_data.get("history", [])
+        history_len = memory_manager.get_history_length(profile_name)
 
-        if not history:
+        if not history_len:
             _log("[SYSTEM] No history found for the current profile.", Fore.YELLOW)
             return
 
-        if message_number > len(history):
-            _log(f"[ERROR] Message number out of range. Current history has {len(history)} messages.", Fore.RED)
+        if message_number > history_len:
+            _log(f"[ERROR] Message number out of range. Current history has {history_len} messages.", Fore.RED)
             return
 
         if suppress_output:
@@ -353,6 +354,57 @@ def app_commands(ops: str, suppress_output: bool = False):
         original_count, kept_count = memory_manager.rewind_history(profile_name, message_number)
         _log(f"[SYSTEM] Rewound conversation from {original_count} to {kept_count} messages.", Fore.GREEN)
 
+    def _active_history_profile():
+        current_profile_setting = get_setting("current_character_profile")
+        if not current_profile_setting:
+            _log("[SYSTEM] No character profile active.", Fore.RED)
+            return None
+        return os.path.basename(current_profile_setting).replace(".json", "")
+
+    def _branches():
+        """Lists conversation branches abandoned by //rewind."""
+        profile_name = _active_history_profile()
+        if not profile_name:
+            return
+        branches = memory_manager.list_branches(profile_name)
+        if not branches:
+            _log("[SYSTEM] No abandoned branches for the current profile.", Fore.YELLOW)
+            return
+        _log("[BRANCHES]", Fore.YELLOW)
+        for branch in branches:
+            _log(
+                f"  #{branch['id']}: {branch['count']} messages after message {branch['fork_at']} "
+                f"({branch['created']}) - {branch['preview']}",
+                Fore.CYAN,
+            )
+        _log("[SYSTEM] Use //branch <id> to switch to a branch.", Fore.GREEN)
+
+    def _branch(args):
+        """Switches the conversation to an abandoned branch. Usage: //branch <id>"""
+        raw_value = (args or "").strip().lstrip("#")
+        try:
+            branch_id = int(raw_value)
+        except ValueError:
+            _log("[ERROR] Usage: //branch <id> (see //branches)", Fore.RED)
+            return
+
+        profile_name = _active_history_profile()
+        if not profile_name:
+            return
+        if branch_id not in {branch["id"] for branch in memory_manager.list_branches(profile_name)}:
+            _log(f"[ERROR] Unknown branch: {branch_id}", Fore.RED)
+            return
+
+        if suppress_output:
+            raise BranchRestoreRequested(branch_id)
+
+        try:
+            original_count, restored_count = memory_manager.restore_branch(profile_name, branch_id)
+        except ValueError as exc:
+            _log(f"[ERROR] {exc}", Fore.RED)
+            return
+        _log(f"[SYSTEM] Switched to branch #{branch_id}: {original_count} -> {restored_count} messages.", Fore.GREEN)
+
     def _toggle_mode():
         """Toggles between Roleplay (RP) and Casual interaction modes."""
         current_mode = get_setting("interaction_mode", "rp")
@@ -468,6 +520,8 @@ def app_commands(ops: str, suppress_output: bool = False):
         "//regen": _regen,
         "//regenerate": _regen,
         "//rewind": _rewind,
+        "//branches": _branches,
+        "//branch": _branch,
     }
 
     pattern = re.match(r'^/+', ops.strip().lower())
@@ -505,6 +559,8 @@ def app_commands(ops: str, suppress_output: bool = False):
                 raise
             _log("[SYSTEM] Rewind is only supported in TUI mode.", Fore.RED)
             return True
+        except BranchRestoreRequested:
+            raise
         except Exception as e:
             _log(f"[ERROR] Command failed: {e}", Fore.RED)
             if suppress_output:
@@ -1,4 +1,4 @@
-from engines.app_commands import app_commands, RegenerateRequested, RestartRequested, RewindRequested
+from engines.app_commands import app_commands, RegenerateRequested, RestartRequested, RewindRequested, BranchRestoreRequested
 from engines.memory_v2 import memory_manager
 
 
@@ -11,9 +11,9 @@ def get_user_message_number(message: str, history_profile_name: str) -> int | No
 
 def get_latest_regeneration_prompt(history_profile_name: str) -> str | None:
     """Return the most recent user message text that can drive a regeneration."""
-    full_history = memory_manager.load_history(history_profile_name)
-    if len(full_history) >= 2 and full_history[-2].get("role") == "user":
-        return full_history[-2].get("content", "")
+    recent = memory_manager.load_history(history_profile_name, limit=2)
+    if len(recent) >= 2 and recent[-2].get("role") == "user":
+        return recent[-2].get("content", "")
     return None
 
 
@@ -43,43 +43,53 @@ def handle_command_input(message: str, history_profile_name: str) -> dict | None
             "original_count": original_count,
             "kept_count": kept_count,
         }
+    except BranchRestoreRequested as branch_request:
+        original_count, restored_count = memory_manager.restore_branch(
+            history_profile_name,
+            branch_request.branch_id,
+        )
+        return {
+            "type": "branch_restore",
+            "branch_id": branch_request.branch_id,
+            "original_count": original_count,
+            "kept_count": restored_count,
+        }
 
     return {"type": "command_noop", "messages": []}
 
 
 def previous_response_variant(history_profile_name: str) -> dict | None:
     """Move to the previous assistant alternative and persist selection."""
-    full_history = memory_manager.load_history(history_profile_name)
-    if not full_history or full_history[-1].get("role") != "assistant":
+    recent = memory_manager.load_history(history_profile_name, limit=1)
+    if not recent or recent[-1].get("role") != "assistant":
         return None
 
-    last_msg = full_history[-1]
+    last_msg = recent[-1]
     alternatives = last_msg.get("alternatives", [])
     selected_index = last_msg.get("selected_index", 0)
     if not alternatives or selected_index <= 0:
         return None
 
     new_index = selected_index - 1
-    last_msg["selected_index"] = new_index
-    last_msg["content"] = alternatives[new_index]
-    memory_manager.save_history(history_profile_name, full_history)
-    return {"content": last_msg["content"], "index": new_index, "total": len(alternatives)}
+    updated = memory_manager.select_alternative(history_profile_name, new_index)
+    if updated is None:
+        return None
+    return {"content": updated["content"], "index": new_index, "total": len(alternatives)}
 
 
 def next_response_variant_or_regen(history_profile_name: str) -> dict | None:
     """Advance assistant alternative or return regeneration prompt info."""
-    full_history = memory_manager.load_history(history_profile_name)
-    if not full_history or full_history[-1].get("role") != "assistant":
+    recent = memory_manager.load_history(history_profile_name, limit=1)
+    if not recent or recent[-1].get("role") != "assistant":
         return None
 
-    last_msg = full_history[-1]
+    last_msg = recent[-1]
     alternatives = last_msg.get("alternatives", [])
     selected_index = last_msg.get("selected_index", 0)
     if alternatives and selected_index < len(alternatives) - 1:
         new_index = selected_index + 1
-        last_msg["selected_index"] = new_index
-        last_msg["content"] = alternatives[new_index]
-        memory_manager.save_history(history_profile_name, full_history)
-        return {"type": "next", "content": last_msg["content"], "index": new_index, "total": len(alternatives)}
+        updated = memory_manager.select_alternative(history_profile_name, new_index)
+        if updated is not None:
+            return {"type": "next", "content": updated["content"], "index": new_index, "total": len(alternatives)}
 
     return {"type": "regenerate", "user_text": get_latest_regeneration_prompt(history_profile_name)}
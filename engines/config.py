@@ -5,6 +5,9 @@ Handles reading and writing to settings.json.
 
 import json
 import os
+import threading
+import time
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 # Load .env file if it exists
@@ -13,6 +16,89 @@ load_dotenv()
 # Path to the global settings file
 SETTINGS_FILE = "settings.json"
 
+# Parsed settings.json, reused until the file changes on disk (see _cached_settings).
+_settings_cache = {"path": None, "signature": None, "settings": {}}
+# Environment overrides, parsed once per process (see _env_overrides).
+_env_cache = None
+# Bumped whenever the effective settings may have changed (see LiveSetting).
+_settings_generation = 0
+_cache_lock = threading.Lock()
+# How often a LiveSetting looks at settings.json for edits made outside the app.
+LIVE_SETTING_RECHECK_SECONDS = 0.25
+
+
+def _file_signature(path):
+    """Returns what identifies a version of the file on disk, or None if it is missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _read_settings_file(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return {}
+    return settings if isinstance(settings, dict) else {}
+
+
+def _cached_settings():
+    """
+    Returns the parsed settings, re-reading settings.json only when its
+    modification time, size or inode changed since the last read. The
+    returned dict is shared; callers must not modify it.
+    """
+    path = SETTINGS_FILE
+    signature = _file_signature(path)
+    cache = _settings_cache
+    if cache["path"] == path and cache["signature"] == signature:
+        return cache["settings"]
+    global _settings_generation
+    with _cache_lock:
+        settings = _read_settings_file(path) if signature is not None else {}
+        cache.update(path=path, signature=signature, settings=settings)
+        _settings_generation += 1
+    return settings
+
+
+def _parse_env_value(env_val):
+    # Simple boolean/int conversion for env vars
+    if env_val.lower() == "true":
+        return True
+    if env_val.lower() == "false":
+        return False
+    try:
+        if "." in env_val:
+            return float(env_val)
+        return int(env_val)
+    except ValueError:
+        return env_val
+
+
+def _env_overrides():
+    """Returns {VARIABLE_NAME: parsed value} for the process environment, built on first use."""
+    global _env_cache
+    if _env_cache is None:
+        _env_cache = {name: _parse_env_value(value) for name, value in os.environ.items()}
+    return _env_cache
+
+
+def reload_settings():
+    """
+    Drops the cached settings and environment overrides so the next lookup
+    re-reads both. Only needed after changing os.environ at runtime; edits to
+    settings.json are picked up automatically.
+    """
+    global _env_cache, _settings_generation
+    with _cache_lock:
+        _settings_cache.update(path=None, signature=None, settings={})
+        _env_cache = None
+        _settings_generation += 1
+
+
 def load_settings():
     """
     Loads all settings from the JSON file.
@@ -20,13 +106,7 @@ def load_settings():
     Returns:
         dict: The loaded settings, or an empty dict if the file is missing/invalid.
     """
-    if not os.path.exists(SETTINGS_FILE):
-        return {}
-    try:
-        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
-        return {}
+    return dict(_cached_settings())
 
 def get_setting(key, default=None):
     """
@@ -41,21 +121,12 @@ def get_setting(key, default=None):
         The value of the setting or the default.
     """
     # Check env first (map 'remote_llm_url' to 'REMOTE_LLM_URL')
-    env_val = os.getenv(key.upper())
-    val = None
-    if env_val is not None:
-        # Simple boolean/int conversion for env vars
-        if env_val.lower() == "true": val = True
-        elif env_val.lower() == "false": val = False
-        else:
-            try:
-                if "." in env_val: val = float(env_val)
-                else: val = int(env_val)
-            except ValueError:
-                val = env_val
+    env = _env_overrides()
+    env_key = key.upper()
+    if env_key in env:
+        val = env[env_key]
     else:
-        settings = load_settings()
-        val = settings.get(key, default)
+        val = _cached_settings().get(key, default)
 
     # Security Validation for remote URLs (VULN-004)
     if key in ["remote_llm_url", "remote_tts_url"] and val:
@@ -83,6 +154,183 @@ def update_setting(key, value):
         bool: True if the update was successful, False otherwise.
     """
     from engines.utilities import save_json_atomic
-    settings = load_settings()
-    settings[key] = value
-    return save_json_atomic(SETTINGS_FILE, settings)
+    global _settings_generation
+    with _cache_lock:
+        path = SETTINGS_FILE
+        settings = _read_settings_file(path) if _file_signature(path) is not None else {}
+        settings[key] = value
+        saved = save_json_atomic(path, settings)
+        # Don't rely on the mtime alone: two writes within its resolution would look identical.
+        _settings_cache.update(path=None, signature=None, settings={})
+        _settings_generation += 1
+    return saved
+
+
+def _as_float(value, default):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def _as_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _as_paths(value) -> tuple:
+    if isinstance(value, str):
+        return (value,) if value else ()
+    if isinstance(value, (list, tuple)):
+        return tuple(str(path) for path in value if path)
+    return ()
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Immutable snapshot of the settings a response turn depends on.
+    Taken once per turn (`Settings.capture()`) and passed down the pipeline so
+    every stage sees the same values, however settings.json changes mid-turn.
+    """
+
+    default_llm_model: str = "llama3"
+    remote_llm_url: str | None = None
+    remote_tts_url: str | None = None
+    repetition_penalty: float = 1.15
+    memory_limit: int = 15
+    context_packing: str = "messages"
+    context_window_tokens: int = 8192
+    context_tokenizer: str = "approximate"
+    interaction_mode: str = "rp"
+    prompt_layout: str = "classic"
+    global_lorebooks: tuple = ()
+    lore_token_budget: int = 0
+    lore_recursion_depth: int = 1
+    lore_vector_enabled: bool = False
+    lore_vector_embedder: str = "hashing"
+    privacy_mode: bool = False
+    debug_mode: bool = False
+    suppress_errors: bool = False
+    local_utility_model: str = "llama3.2"
+    sentiment_engine: str = "llm"
+    sentiment_confidence_threshold: float = 0.6
+    # TTS
+    tts_enabled: bool = False
+    character_speak: bool = False
+    speak_narration: bool = False
+    narration_tts_voice: str = "en-US-AndrewNeural"
+    default_tts_voice: str = "en-GB-SoniaNeural"
+    # Narrative pipeline (the overhaul_* keys)
+    pipeline_enabled: bool = False
+    instrumentation_enabled: bool = False
+    state_enabled: bool = False
+    memory_enabled: bool = False
+    memory_scorer: str = "overlap"
+    vector_memory_enabled: bool = False
+    vector_memory_embedder: str = "hashing"
+    planner_enabled: bool = False
+    candidates_enabled: bool = False
+    critic_enabled: bool = False
+    candidate_count: int = 3
+    style_profile: str = "balanced"
+
+    @classmethod
+    def capture(cls, lookup=None) -> "Settings":
+        """
+        Reads the current settings into a new snapshot.
+
+        Args:
+            lookup: `get_setting`-compatible function to read values with
+                (defaults to `get_setting`).
+
+        Returns:
+            Settings: The snapshot.
+        """
+        get = lookup or get_setting
+        return cls(
+            default_llm_model=get("default_llm_model", "llama3"),
+            remote_llm_url=get("remote_llm_url"),
+            remote_tts_url=get("remote_tts_url"),
+            repetition_penalty=_as_float(get("repetition_penalty", 1.15), 1.15),
+            memory_limit=_as_int(get("memory_limit", 15), 15),
+            context_packing=get("context_packing", "messages"),
+            context_window_tokens=_as_int(get("context_window_tokens", 8192), 8192),
+            context_tokenizer=get("context_tokenizer", "approximate"),
+            interaction_mode=get("interaction_mode", "rp"),
+            prompt_layout=get("prompt_layout", "classic"),
+            global_lorebooks=_as_paths(get("global_lorebooks", [])),
+            lore_token_budget=max(0, _as_int(get("lore_token_budget", 0), 0)),
+            lore_recursion_depth=max(0, _as_int(get("lore_recursion_depth", 1), 1)),
+            lore_vector_enabled=bool(get("lore_vector_enabled", False)),
+            lore_vector_embedder=get("lore_vector_embedder", "hashing"),
+            privacy_mode=bool(get("privacy_mode", False)),
+            debug_mode=bool(get("debug_mode", False)),
+            suppress_errors=bool(get("suppress_errors", False)),
+            local_utility_model=get("local_utility_model", "llama3.2"),
+            sentiment_engine=get("sentiment_engine", "llm"),
+            sentiment_confidence_threshold=_as_float(get("sentiment_confidence_threshold", 0.6), 0.6),
+            tts_enabled=bool(get("tts_enabled", False)),
+            character_speak=bool(get("character_speak", False)),
+            speak_narration=bool(get("speak_narration", False)),
+            narration_tts_voice=get("narration_tts_voice", "en-US-AndrewNeural"),
+            default_tts_voice=get("default_tts_voice", "en-GB-SoniaNeural"),
+            pipeline_enabled=bool(get("overhaul_pipeline_enabled", False)),
+            instrumentation_enabled=bool(get("overhaul_instrumentation_enabled", False)),
+            state_enabled=bool(get("overhaul_state_enabled", False)),
+            memory_enabled=bool(get("overhaul_memory_enabled", False)),
+            memory_scorer=get("overhaul_memory_scorer", "overlap"),
+            vector_memory_enabled=bool(get("overhaul_vector_memory_enabled", False)),
+            vector_memory_embedder=get("overhaul_vector_memory_embedder", "hashing"),
+            planner_enabled=bool(get("overhaul_planner_enabled", False)),
+            candidates_enabled=bool(get("overhaul_candidates_enabled", False)),
+            critic_enabled=bool(get("overhaul_critic_enabled", False)),
+            candidate_count=max(1, _as_int(get("overhaul_candidate_count", 3), 3)),
+            style_profile=get("overhaul_style_profile", "balanced"),
+        )
+
+
+class LiveSetting:
+    """
+    Live view of one setting for hot loops that must honour changes while
+    they run (e.g. the TTS master toggle during streaming). Reading it costs a
+    counter comparison; the value is resolved again after `update_setting` in
+    this process, and at most every LIVE_SETTING_RECHECK_SECONDS for edits
+    made to settings.json from outside.
+    """
+
+    def __init__(self, key, default=None):
+        self.key = key
+        self.default = default
+        self._generation = None
+        self._next_check = 0.0
+        self._value = default
+
+    @property
+    def value(self):
+        now = time.monotonic()
+        if self._generation != _settings_generation or now >= self._next_check:
+            self._next_check = now + LIVE_SETTING_RECHECK_SECONDS
+            self._value = get_setting(self.key, self.default)
+            self._generation = _settings_generation
+        return self._value
+
+    def __bool__(self):
+        return bool(self.value)
+
+
+def subscribe_setting(key, default=None):
+    """
+    Returns a LiveSetting for `key`.
+
+    Args:
+        key (str): The setting key to follow.
+        default: The value to use if the key doesn't exist.
+
+    Returns:
+        LiveSetting: The live view.
+    """
+    return LiveSetting(key, default)
@@ -0,0 +1,188 @@
+"""
+Token-budget context packing: decides how much of each prompt section fits
+the model's context window, instead of cutting history by message count.
+
+The window (minus the tokens reserved for the reply) is split into budgets:
+memory core, activated lore and pipeline context are capped at a share each,
+the system prompt takes what it needs, and history gets the rest, filled
+newest-first with whole messages.
+
+Tokens are counted with a pluggable tokenizer. The default is a fast
+approximation (about four characters of a word per token); "tiktoken" or a
+Hugging Face tokenizer name give exact counts when those packages are
+installed. Per-message counts of the newest messages are cached in the history
+metadata under "token_counts", keyed by content fingerprint, so they are
+counted once.
+"""
+
+import re
+
+from engines.memory_index import message_fingerprint
+
+# Role markers and separators the chat template adds around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tokens kept free for the reply (the max_tokens sent with every request).
+RESPONSE_TOKEN_RESERVE = 1024
+# Caps for the context sections, as shares of the prompt budget.
+SECTION_SHARES = {"memory_core": 0.15, "lore": 0.15, "pipeline": 0.10}
+# How many recent messages are loaded as packing candidates.
+PACK_CANDIDATE_MESSAGES = 400
+# Most per-message counts kept in the history metadata (the newest messages').
+MAX_STORED_TOKEN_COUNTS = 128
+
+_APPROX_TOKEN_RE = re.compile(r"[^\W\d_]{1,4}|\d{1,3}|[^\w\s]|_")
+
+
+class ApproximateTokenizer:
+    """Dependency-free estimate: word pieces of up to four letters, digit groups and punctuation."""
+
+    name = "approximate"
+
+    def count(self, text: str) -> int:
+        return len(_APPROX_TOKEN_RE.findall(text or ""))
+
+
+class TiktokenTokenizer:
+    """Exact counts for OpenAI-style BPE vocabularies (needs `tiktoken`)."""
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        import tiktoken  # Optional dependency.
+
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.name = f"tiktoken-{encoding_name}"
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text or "", disallowed_special=()))
+
+
+class HuggingFaceTokenizer:
+    """Exact counts with a model's own tokenizer (needs `transformers`)."""
+
+    def __init__(self, model_name: str):
+        from transformers import AutoTokenizer  # Optional dependency.
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.name = f"hf-{model_name}"
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text or "", add_special_tokens=False))
+
+
+_tokenizers = {}
+
+
+def create_tokenizer(kind: str = "approximate"):
+    """
+    Returns a (shared) tokenizer for `kind`: "approximate", "tiktoken" or a
+    Hugging Face model name. Falls back to the approximation if the backing
+    package or model is unavailable.
+    """
+    kind = kind or "approximate"
+    tokenizer = _tokenizers.get(kind)
+    if tokenizer is None:
+        tokenizer = ApproximateTokenizer()
+        if kind == "tiktoken":
+            try:
+                tokenizer = TiktokenTokenizer()
+            except Exception:
+                pass
+        elif kind != "approximate":
+            try:
+                tokenizer = HuggingFaceTokenizer(kind)
+            except Exception:
+                pass
+        _tokenizers[kind] = tokenizer
+    return tokenizer
+
+
+def plan_budgets(context_window: int, reserve: int = RESPONSE_TOKEN_RESERVE) -> dict:
+    """Returns the token caps for the context sections and the total prompt budget."""
+    prompt_budget = max(0, int(context_window) - reserve)
+    budgets = {section: int(prompt_budget * share) for section, share in SECTION_SHARES.items()}
+    budgets["prompt"] = prompt_budget
+    return budgets
+
+
+def fit_text(text: str, budget: int, tokenizer) -> str:
+    """
+    Trims `text` to at most `budget` tokens, keeping whole paragraphs (then
+    whole lines) from the start. Returns "" if not even one line fits.
+    """
+    if not text or tokenizer.count(text) <= budget:
+        return text or ""
+    kept = []
+    used = 0
+    for paragraph in text.split("\n\n"):
+        cost = tokenizer.count(paragraph)
+        if used + cost <= budget:
+            kept.append(paragraph)
+            used += cost
+            continue
+        lines = []
+        for line in paragraph.split("\n"):
+            cost = tokenizer.count(line)
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        if lines:
+            kept.append("\n".join(lines))
+        break
+    return "\n\n".join(kept)
+
+
+class TokenCounter:
+    """
+    Counts message tokens, remembering counts by content fingerprint.
+    `stored` is the "token_counts" block from the history metadata; counts
+    made with another tokenizer are discarded.
+    """
+
+    def __init__(self, tokenizer, stored: dict | None = None):
+        self.tokenizer = tokenizer
+        stored = stored if isinstance(stored, dict) else {}
+        counts = stored.get("counts") if stored.get("tokenizer") == tokenizer.name else None
+        self._counts = dict(counts) if isinstance(counts, dict) else {}
+        self._used = {}  # keys in the order they were first counted
+        self.computed = 0
+
+    @staticmethod
+    def _key(message: dict) -> str:
+        return f"{message_fingerprint(message):08x}:{len(str(message.get('content', '')))}"
+
+    def count_text(self, text: str) -> int:
+        return self.tokenizer.count(text)
+
+    def count_message(self, message: dict) -> int:
+        key = self._key(message)
+        self._used.setdefault(key)
+        count = self._counts.get(key)
+        if count is None:
+            count = self._counts[key] = self.tokenizer.count(str(message.get("content", "")))
+            self.computed += 1
+        return count + MESSAGE_OVERHEAD_TOKENS
+
+    def to_metadata(self, latest: list = (), limit: int = MAX_STORED_TOKEN_COUNTS) -> dict:
+        """
+        The "token_counts" metadata block: counts of the messages looked at in this
+        turn, at most `limit` of them. `latest` (the turn's new messages) come first,
+        then the rest in the order counted, which `pack_history` makes newest first.
+        """
+        keys = dict.fromkeys([self._key(message) for message in latest] + list(self._used))
+        return {
+            "tokenizer": self.tokenizer.name,
+            "counts": {key: self._counts[key] for key in list(keys)[:limit] if key in self._counts},
+        }
+
+
+def pack_history(history: list, budget: int, counter: TokenCounter) -> list:
+    """Returns the longest tail of `history` whose messages fit `budget` tokens together."""
+    used = 0
+    start = len(history)
+    while start > 0:
+        cost = counter.count_message(history[start - 1])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return history[start:]
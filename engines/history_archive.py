@@ -0,0 +1,99 @@
+"""
+Compressed archive segments for summarized conversation history.
+Messages already folded into the Memory Core are moved out of the live history
+into immutable gzip files under `{history_dir}/archive/` and read back only
+when something needs the full conversation (recap, //history, deep rewinds).
+Abandoned rewind branches are kept in the same kind of segment.
+"""
+
+import gzip
+import json
+import os
+
+from engines.utilities import sanitize_profile_name
+
+ARCHIVE_DIRNAME = "archive"
+SEGMENT_SUFFIX = ".json.gz"
+
+
+class HistoryArchive:
+    """
+    Reads and writes archive segments. A segment is described by a small dict
+    kept in the profile's metadata: `{"file": name, "start": index, "count": n}`,
+    where `start` is the global (0-based) index of its first message.
+    Segments never change once written, so decompressed contents are cached for
+    the lifetime of the process.
+    """
+
+    def __init__(self, history_dir: str):
+        self.archive_dir = os.path.join(history_dir, ARCHIVE_DIRNAME)
+        self._loaded = {}
+
+    def _segment_path(self, segment: dict) -> str:
+        return os.path.join(self.archive_dir, os.path.basename(segment["file"]))
+
+    def write_segment(self, profile_name: str, start: int, messages: list, label: str = "") -> dict | None:
+        """
+        Compresses `messages` (global indexes start..start+len) into a new segment file.
+        `label` tells apart segments that are not part of the main conversation (branches).
+        """
+        safe_name = sanitize_profile_name(profile_name) or "session"
+        if label:
+            safe_name = f"{safe_name}_{label}"
+        segment = {
+            "file": f"{safe_name}_{start:08d}-{start + len(messages):08d}{SEGMENT_SUFFIX}",
+            "start": start,
+            "count": len(messages),
+        }
+        path = self._segment_path(segment)
+        temp_file = path + ".tmp"
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            payload = json.dumps(messages, ensure_ascii=False).encode("utf-8")
+            with gzip.open(temp_file, "wb") as f:
+                f.write(payload)
+            os.replace(temp_file, path)
+        except (TypeError, ValueError, OSError):
+            if os.path.exists(temp_file):
+                try:
+                    os.remove(temp_file)
+                except OSError:
+                    pass
+            return None
+        self._loaded[path] = messages
+        return segment
+
+    def read_segment(self, segment: dict) -> list:
+        """Returns the (cached, uncopied) messages of one segment; [] if it is unreadable."""
+        path = self._segment_path(segment)
+        messages = self._loaded.get(path)
+        if messages is None:
+            try:
+                with gzip.open(path, "rb") as f:
+                    messages = json.loads(f.read())
+            except (OSError, EOFError, json.JSONDecodeError, UnicodeDecodeError):
+                return []
+            self._loaded[path] = messages
+        return messages
+
+    def read_range(self, segments: list, start: int, end: int) -> list:
+        """Returns archived messages with global indexes in [start, end), touching only overlapping segments."""
+        messages = []
+        for segment in segments:
+            seg_start = int(segment.get("start", 0))
+            seg_end = seg_start + int(segment.get("count", 0))
+            if seg_end <= start or seg_start >= end:
+                continue
+            content = self.read_segment(segment)
+            messages.extend(content[max(start, seg_start) - seg_start:min(end, seg_end) - seg_start])
+        return messages
+
+    def delete(self, segments: list) -> None:
+        """Removes segment files (used once no metadata references them any more)."""
+        for segment in segments:
+            path = self._segment_path(segment)
+            self._loaded.pop(path, None)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,146 @@
+"""
+Byte-offset sidecar index for history files.
+Records where each message (and the metadata block) starts in the history file
+so the last N messages (or any chosen ones) can be read with a few seeks
+instead of a full parse.
+
+Layout: a fixed header followed by one fixed-width `(start, length)` entry per
+message, so the tail of the index is itself reachable by seek. The header holds
+the (mtime_ns, size) of the history file it describes; any mismatch means the
+index is stale and readers must fall back to a full parse.
+"""
+
+import os
+import struct
+
+_MAGIC = b"TAIOFS01"
+# magic, target mtime_ns, target size, message count, metadata start, metadata length
+_HEADER = struct.Struct("<8s5q")
+_ENTRY = struct.Struct("<2q")
+
+
+def file_signature(path: str) -> tuple | None:
+    """Returns (mtime_ns, size) for a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class OffsetIndex:
+    """Offset index for one history file (`target_path`), stored at `path`."""
+
+    def __init__(self, path: str, target_path: str):
+        self.path = path
+        self.target_path = target_path
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def write(self, entries: list, meta_range: tuple = (0, 0)) -> bool:
+        """Replaces the index with `entries` for the target file as it is on disk now."""
+        signature = file_signature(self.target_path)
+        if signature is None:
+            self.remove()
+            return False
+        payload = _HEADER.pack(_MAGIC, signature[0], signature[1], len(entries), *meta_range)
+        payload += b"".join(_ENTRY.pack(start, length) for start, length in entries)
+        temp_file = self.path + ".tmp"
+        try:
+            with open(temp_file, "wb") as f:
+                f.write(payload)
+            os.replace(temp_file, self.path)
+            return True
+        except OSError:
+            self.remove()
+            return False
+
+    def _read_header(self, f) -> tuple | None:
+        raw = f.read(_HEADER.size)
+        if len(raw) != _HEADER.size:
+            return None
+        magic, mtime_ns, size, count, meta_start, meta_len = _HEADER.unpack(raw)
+        if magic != _MAGIC:
+            return None
+        return (mtime_ns, size), count, (meta_start, meta_len)
+
+    def header(self) -> tuple | None:
+        """Returns (message_count, metadata_range) if the index matches the target file, else None."""
+        try:
+            with open(self.path, "rb") as f:
+                header = self._read_header(f)
+        except OSError:
+            return None
+        if header is None or header[0] != file_signature(self.target_path):
+            return None
+        return header[1], header[2]
+
+    def tail(self, limit: int) -> list | None:
+        """Returns the `(start, length)` entries of the last `limit` messages, or None if stale."""
+        try:
+            with open(self.path, "rb") as f:
+                header = self._read_header(f)
+                if header is None or header[0] != file_signature(self.target_path):
+                    return None
+                count = header[1]
+                first = max(0, count - limit)
+                f.seek(_HEADER.size + first * _ENTRY.size)
+                raw = f.read((count - first) * _ENTRY.size)
+        except OSError:
+            return None
+        if len(raw) != (count - first) * _ENTRY.size:
+            return None
+        return [_ENTRY.unpack_from(raw, i * _ENTRY.size) for i in range(count - first)]
+
+    def entries(self, positions: list) -> list | None:
+        """Returns the `(start, length)` entries of the messages at `positions`, or None if stale or out of range."""
+        entries = []
+        try:
+            with open(self.path, "rb") as f:
+                header = self._read_header(f)
+                if header is None or header[0] != file_signature(self.target_path):
+                    return None
+                for position in positions:
+                    if not 0 <= position < header[1]:
+                        return None
+                    f.seek(_HEADER.size + position * _ENTRY.size)
+                    raw = f.read(_ENTRY.size)
+                    if len(raw) != _ENTRY.size:
+                        return None
+                    entries.append(_ENTRY.unpack(raw))
+        except OSError:
+            return None
+        return entries
+
+    def update(self, previous_signature: tuple | None, keep_count: int, entries: list,
+               meta_range: tuple | None = None) -> bool:
+        """
+        Incrementally applies a change made to the target file: keeps the first
+        `keep_count` entries and adds `entries` after them. Only succeeds if the
+        index was current for `previous_signature` (the target's state before the change).
+        """
+        try:
+            with open(self.path, "r+b") as f:
+                header = self._read_header(f)
+                if header is None or previous_signature is None or header[0] != previous_signature:
+                    return False
+                if keep_count > header[1]:
+                    return False
+                signature = file_signature(self.target_path)
+                if signature is None:
+                    return False
+                f.seek(_HEADER.size + keep_count * _ENTRY.size)
+                f.write(b"".join(_ENTRY.pack(start, length) for start, length in entries))
+                f.truncate()
+                f.seek(0)
+                f.write(_HEADER.pack(
+                    _MAGIC, signature[0], signature[1], keep_count + len(entries),
+                    *(meta_range if meta_range is not None else header[2]),
+                ))
+            return True
+        except OSError:
+            return False
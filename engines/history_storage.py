@@ -0,0 +1,1056 @@
+"""
+Storage backends for conversation history.
+Each backend persists the `{metadata, history}` structure used by HistoryManager
+in its own on-disk layout. HistoryManager owns locking; backends only do I/O.
+
+The `history_storage` setting picks the layout:
+- "json": one `{profile}_history.json` per profile, rewritten on every change;
+  a `_history.idx` offset sidecar serves tail and count reads with a few seeks.
+- "journal": an append-only `{profile}_history.jsonl` plus a small metadata
+  file, so a turn appends two lines; compacted once dead records pile up.
+- "sqlite": one `history.sqlite3` database with a row per message, so partial
+  reads, rewinds and alternative switches touch only the affected rows.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from engines.history_index import OffsetIndex, file_signature
+from engines.utilities import sanitize_profile_name, save_json_atomic
+
+HISTORY_SUFFIX = "_history.json"
+JOURNAL_SUFFIX = "_history.jsonl"
+JOURNAL_META_SUFFIX = "_history.meta.json"
+OFFSET_INDEX_SUFFIX = "_history.idx"
+SQLITE_FILENAME = "history.sqlite3"
+
+# Compact the journal once it holds this many more records than live messages.
+JOURNAL_COMPACTION_SLACK = 64
+# Most positions read_messages binds into one query (SQLite limits bound parameters).
+SQLITE_MAX_POSITIONS = 500
+
+
+def default_metadata() -> dict:
+    """Returns a fresh metadata block with every known field at its default."""
+    return {
+        "last_interaction": None,
+        "mood_score": 0,
+        "current_scene": "Unknown Location",
+        "memory_core": "",
+        "last_summarized_index": 0,
+        "narrative_state": {},
+        "last_turn_metrics": {},
+    }
+
+
+def normalize_history_data(data) -> dict:
+    """
+    Coerces raw history file content into the `{metadata, history}` structure.
+    Handles the old format (bare list of messages) and fills missing metadata keys.
+    """
+    if isinstance(data, list):
+        # Try to find the timestamp in the last message (legacy behavior)
+        last_time = None
+        for msg in reversed(data):
+            if msg.get("role") == "system" and "Timestamp: " in msg.get("content", ""):
+                last_time = msg["content"].replace("Timestamp: ", "").strip()
+                break
+
+        metadata = default_metadata()
+        metadata["last_interaction"] = last_time
+        return {
+            "metadata": metadata,
+            "history": [m for m in data if m.get("role") != "system"]
+        }
+
+    if not isinstance(data, dict):
+        return {"metadata": default_metadata(), "history": []}
+
+    metadata = data.get("metadata")
+    if not isinstance(metadata, dict):
+        data["metadata"] = default_metadata()
+    else:
+        for key, val in default_metadata().items():
+            if key not in metadata:
+                metadata[key] = val
+    if not isinstance(data.get("history"), list):
+        data["history"] = []
+    return data
+
+
+def _dump_history_document(data: dict) -> tuple[bytes, tuple | None, list]:
+    """
+    Serializes `data` exactly like `json.dumps(data, indent=4, ensure_ascii=False)`
+    while recording where the metadata block and each message land in the output.
+
+    Returns:
+        tuple: (utf-8 bytes, (metadata_start, metadata_length) or None, [(start, length), ...]).
+        The ranges are None/empty if the layout could not be tracked.
+    """
+    meta_marker, history_marker = "\0metadata\0", "\0history\0"
+    skeleton = json.dumps(
+        {**data, "metadata": meta_marker, "history": history_marker},
+        indent=4,
+        ensure_ascii=False,
+    )
+    meta_token = json.dumps(meta_marker)
+    history_token = json.dumps(history_marker)
+    meta_at = skeleton.find(meta_token)
+    history_at = skeleton.find(history_token)
+
+    # Nested values are the standalone dump with every continuation line indented one level deeper.
+    meta_text = json.dumps(data.get("metadata"), indent=4, ensure_ascii=False).replace("\n", "\n    ")
+    message_texts = [
+        json.dumps(msg, indent=4, ensure_ascii=False).replace("\n", "\n        ").encode("utf-8")
+        for msg in data.get("history", [])
+    ]
+    if message_texts:
+        history_text = b"[\n        " + b",\n        ".join(message_texts) + b"\n    ]"
+    else:
+        history_text = b"[]"
+
+    if meta_at < 0 or history_at < meta_at:
+        # Unexpected key order: still produce the document, just without offsets.
+        document = skeleton.replace(meta_token, meta_text, 1).encode("utf-8")
+        return document.replace(history_token.encode("utf-8"), history_text, 1), None, []
+
+    head = skeleton[:meta_at].encode("utf-8")
+    meta_bytes = meta_text.encode("utf-8")
+    middle = skeleton[meta_at + len(meta_token):history_at].encode("utf-8")
+    tail = skeleton[history_at + len(history_token):].encode("utf-8")
+
+    entries = []
+    position = len(head) + len(meta_bytes) + len(middle) + len(b"[\n        ")
+    for text in message_texts:
+        entries.append((position, len(text)))
+        position += len(text) + len(b",\n        ")
+    document = head + meta_bytes + middle + history_text + tail
+    return document, (len(head), len(meta_bytes)), entries
+
+
+def _read_ranges(path: str, entries: list) -> list[bytes] | None:
+    """Reads the given (start, length) byte ranges of a file, or None on failure."""
+    chunks = []
+    try:
+        with open(path, "rb") as f:
+            for start, length in entries:
+                f.seek(start)
+                chunk = f.read(length)
+                if len(chunk) != length:
+                    return None
+                chunks.append(chunk)
+    except OSError:
+        return None
+    return chunks
+
+
+def _fsync_paths(paths: list, directory: str) -> None:
+    """fsyncs files and then their directory (so completed renames are durable too)."""
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+        except OSError:
+            pass
+    if os.name != "nt":
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class JsonHistoryStorage:
+    """
+    Legacy layout: one pretty-printed `{profile}_history.json` file per profile.
+    Mutators return True on success; `data`, when given, is the complete state
+    after the change. Partial reads use the `_history.idx` offset sidecar and
+    return None when the caller must do a full read.
+    """
+    name = "json"
+    indexed = False
+
+    def __init__(self, history_dir: str):
+        self.history_dir = history_dir
+
+    def _safe_name(self, profile_name: str) -> str:
+        return sanitize_profile_name(profile_name) or "session"
+
+    def get_path(self, profile_name: str) -> str:
+        """Returns the path of the primary history file for a profile."""
+        return os.path.join(self.history_dir, f"{self._safe_name(profile_name)}{HISTORY_SUFFIX}")
+
+    def cache_key(self, profile_name: str) -> str:
+        """Returns the key HistoryManager caches this profile's data under."""
+        return self.get_path(profile_name)
+
+    def get_index(self, profile_name: str) -> OffsetIndex:
+        """Returns the offset index describing this profile's primary history file."""
+        return OffsetIndex(
+            os.path.join(self.history_dir, f"{self._safe_name(profile_name)}{OFFSET_INDEX_SUFFIX}"),
+            self.get_path(profile_name),
+        )
+
+    def exists(self, profile_name: str) -> bool:
+        return os.path.exists(self.get_path(profile_name))
+
+    def signature(self, profile_name: str) -> tuple | None:
+        """Returns a cheap fingerprint of the backing files used for cache validation."""
+        return file_signature(self.get_path(profile_name))
+
+    def list_profiles(self) -> list[str]:
+        """Lists the sanitized profile names that have stored history."""
+        if not os.path.isdir(self.history_dir):
+            return []
+        return sorted(
+            filename[:-len(HISTORY_SUFFIX)]
+            for filename in os.listdir(self.history_dir)
+            if filename.endswith(HISTORY_SUFFIX)
+        )
+
+    @staticmethod
+    def _read_json_file(filename: str) -> dict | None:
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, "r", encoding="UTF-8") as f:
+                return normalize_history_data(json.load(f))
+        except (json.JSONDecodeError, OSError, AttributeError):
+            return None
+
+    def read(self, profile_name: str) -> dict | None:
+        """Returns the normalized stored data, or None if nothing (readable) is stored."""
+        return self._read_json_file(self.get_path(profile_name))
+
+    def count(self, profile_name: str) -> int | None:
+        """Returns the number of stored messages, or None if that needs a full read."""
+        header = self.get_index(profile_name).header()
+        return header[0] if header else None
+
+    def _decode_indexed(self, raw: bytes) -> dict:
+        return json.loads(raw)
+
+    def read_tail(self, profile_name: str, limit: int) -> list | None:
+        """Returns the last `limit` stored messages, or None if that needs a full read."""
+        index = self.get_index(profile_name)
+        return self._read_indexed(index, index.tail(max(0, limit)))
+
+    def read_messages(self, profile_name: str, positions: list) -> list | None:
+        """Returns the stored messages at `positions` (in that order), or None if that needs a full read."""
+        index = self.get_index(profile_name)
+        return self._read_indexed(index, index.entries(positions))
+
+    def _read_indexed(self, index: OffsetIndex, entries: list | None) -> list | None:
+        if entries is None:
+            return None
+        signature = file_signature(index.target_path)
+        chunks = _read_ranges(index.target_path, entries)
+        # The file may have been replaced between the index check and the reads.
+        if chunks is None or file_signature(index.target_path) != signature:
+            return None
+        try:
+            return [self._decode_indexed(chunk) for chunk in chunks]
+        except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+            return None
+
+    def read_metadata(self, profile_name: str) -> dict | None:
+        """Returns the stored metadata block, or None if that needs a full read."""
+        index = self.get_index(profile_name)
+        header = index.header()
+        if header is None or header[1][1] <= 0:
+            return None
+        chunks = _read_ranges(index.target_path, [header[1]])
+        if chunks is None:
+            return None
+        try:
+            return normalize_history_data({"metadata": json.loads(chunks[0]), "history": []})["metadata"]
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+
+    def write(self, profile_name: str, data: dict, stored_history: list | None = None) -> bool:
+        """
+        Replaces the stored history and metadata, then refreshes the offset index.
+        `stored_history` is the currently persisted history, if the caller knows it.
+        """
+        layout = {}
+
+        def serialize(data: dict) -> bytes:
+            # Keep where each part lands; the offset index is written from it afterwards.
+            document, layout["meta_range"], layout["entries"] = _dump_history_document(data)
+            return document
+
+        if not save_json_atomic(self.get_path(profile_name), data, serialize=serialize):
+            return False
+        index = self.get_index(profile_name)
+        if layout["meta_range"] is None:
+            index.remove()
+        else:
+            index.write(layout["entries"], layout["meta_range"])
+        return True
+
+    def append(self, profile_name: str, messages: list, metadata: dict, data: dict | None = None) -> bool:
+        """Appends messages and replaces metadata (read-modify-write for this layout)."""
+        if data is None:
+            data = self.read(profile_name) or {"metadata": default_metadata(), "history": []}
+            data["history"].extend(messages)
+            data["metadata"] = metadata
+        return self.write(profile_name, data)
+
+    def truncate(self, profile_name: str, keep_count: int, metadata: dict, data: dict | None = None) -> bool:
+        """Keeps only the first `keep_count` messages and replaces metadata."""
+        if data is None:
+            data = self.read(profile_name) or {"metadata": default_metadata(), "history": []}
+            data["history"] = data["history"][:keep_count]
+            data["metadata"] = metadata
+        return self.write(profile_name, data)
+
+    def write_metadata(self, profile_name: str, metadata: dict, data: dict | None = None) -> bool:
+        """Replaces metadata without touching history messages."""
+        if data is None:
+            data = self.read(profile_name) or {"metadata": default_metadata(), "history": []}
+            data["metadata"] = metadata
+        return self.write(profile_name, data)
+
+    def commit(self, profile_name: str, keep_count: int, messages: list, metadata: dict,
+               data: dict | None = None) -> bool:
+        """
+        Applies a whole turn as one write: keeps the first `keep_count` messages,
+        appends `messages` and replaces metadata.
+        """
+        if data is None:
+            data = self.read(profile_name) or {"metadata": default_metadata(), "history": []}
+            data["history"] = data["history"][:keep_count] + list(messages)
+            data["metadata"] = metadata
+        return self.write(profile_name, data)
+
+    def update_message(self, profile_name: str, position: int, message: dict, metadata: dict,
+                       data: dict | None = None) -> bool:
+        """Replaces the message at `position` (e.g. to switch alternatives) and replaces metadata."""
+        if data is None:
+            data = self.read(profile_name)
+            if data is None or not 0 <= position < len(data["history"]):
+                return False
+            data["history"][position] = message
+            data["metadata"] = metadata
+        return self.write(profile_name, data)
+
+    def sync(self, profile_name: str) -> None:
+        """Forces this profile's files to stable storage."""
+        _fsync_paths([self.get_path(profile_name)], self.history_dir)
+
+
+class JournalHistoryStorage(JsonHistoryStorage):
+    """
+    Append-only layout: `{profile}_history.jsonl` holds one append/truncate
+    record per line and `{profile}_history.meta.json` the metadata block.
+    The journal is compacted once dead records pile up.
+    """
+    name = "journal"
+
+    def get_path(self, profile_name: str) -> str:
+        return os.path.join(self.history_dir, f"{self._safe_name(profile_name)}{JOURNAL_SUFFIX}")
+
+    def get_meta_path(self, profile_name: str) -> str:
+        return os.path.join(self.history_dir, f"{self._safe_name(profile_name)}{JOURNAL_META_SUFFIX}")
+
+    def get_legacy_path(self, profile_name: str) -> str:
+        return super().get_path(profile_name)
+
+    def exists(self, profile_name: str) -> bool:
+        return os.path.exists(self.get_path(profile_name)) or os.path.exists(self.get_legacy_path(profile_name))
+
+    def signature(self, profile_name: str) -> tuple | None:
+        journal = file_signature(self.get_path(profile_name))
+        if journal is None:
+            legacy = file_signature(self.get_legacy_path(profile_name))
+            return ("legacy", legacy) if legacy else None
+        return (journal, file_signature(self.get_meta_path(profile_name)))
+
+    def list_profiles(self) -> list[str]:
+        if not os.path.isdir(self.history_dir):
+            return []
+        names = set()
+        for filename in os.listdir(self.history_dir):
+            for suffix in (JOURNAL_SUFFIX, HISTORY_SUFFIX):
+                if filename.endswith(suffix):
+                    names.add(filename[:-len(suffix)])
+        return sorted(names)
+
+    def _read_meta(self, profile_name: str) -> dict:
+        try:
+            with open(self.get_meta_path(profile_name), "r", encoding="UTF-8") as f:
+                meta = json.load(f)
+            return meta if isinstance(meta, dict) else {}
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def _write_meta(self, profile_name: str, metadata: dict, message_count: int, record_count: int) -> bool:
+        return save_json_atomic(
+            self.get_meta_path(profile_name),
+            {"metadata": metadata, "message_count": message_count, "record_count": record_count},
+            indent=None,
+        )
+
+    def _replay(self, profile_name: str) -> tuple[list, int]:
+        """
+        Rebuilds the message list from the journal and refreshes the offset index
+        as a side effect. Returns (history, record_count).
+        """
+        journal_path = self.get_path(profile_name)
+        signature = file_signature(journal_path)
+        history = []
+        entries = []
+        record_count = 0
+        position = 0
+        with open(journal_path, "rb") as f:
+            for line in f:
+                start = position
+                position += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # A torn line from an interrupted append; records around it are intact.
+                    continue
+                record_count += 1
+                op = record.get("op")
+                if op == "append":
+                    history.append(record.get("message", {}))
+                    entries.append((start, len(line.rstrip(b"\r\n"))))
+                elif op == "truncate":
+                    keep = max(0, int(record.get("count", 0)))
+                    del history[keep:]
+                    del entries[keep:]
+        if signature is not None and file_signature(journal_path) == signature:
+            self.get_index(profile_name).write(entries)
+        return history, record_count
+
+    def _migrate_legacy(self, profile_name: str) -> dict | None:
+        legacy_path = self.get_legacy_path(profile_name)
+        data = self._read_json_file(legacy_path)
+        if data is None:
+            return None
+        self._rewrite(profile_name, data["history"], data["metadata"])
+        try:
+            os.replace(legacy_path, legacy_path + ".bak")
+        except OSError:
+            pass
+        return data
+
+    def read(self, profile_name: str) -> dict | None:
+        if not os.path.exists(self.get_path(profile_name)):
+            if os.path.exists(self.get_legacy_path(profile_name)):
+                return self._migrate_legacy(profile_name)
+            return None
+        try:
+            history, _record_count = self._replay(profile_name)
+        except OSError:
+            return None
+        meta = self._read_meta(profile_name)
+        return normalize_history_data({"metadata": meta.get("metadata"), "history": history})
+
+    def _decode_indexed(self, raw: bytes) -> dict:
+        return json.loads(raw)["message"]
+
+    def count(self, profile_name: str) -> int | None:
+        if not os.path.exists(self.get_path(profile_name)):
+            return None
+        meta = self._read_meta(profile_name)
+        return int(meta["message_count"]) if "message_count" in meta else None
+
+    def read_metadata(self, profile_name: str) -> dict | None:
+        if not os.path.exists(self.get_path(profile_name)):
+            return None
+        meta = self._read_meta(profile_name)
+        if not isinstance(meta.get("metadata"), dict):
+            return None
+        return normalize_history_data({"metadata": meta["metadata"], "history": []})["metadata"]
+
+    def _append_records(self, profile_name: str, records: list, metadata: dict, message_count: int) -> bool:
+        meta = self._read_meta(profile_name)
+        record_count = int(meta.get("record_count", 0) or 0) + len(records)
+        journal_path = self.get_path(profile_name)
+        index = self.get_index(profile_name)
+        header = index.header()
+        previous_signature = file_signature(journal_path)
+
+        try:
+            lines = [(json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8") for record in records]
+            with open(journal_path, "ab") as f:
+                position = f.tell()
+                if position > 0:
+                    # Never glue a record onto a torn last line.
+                    with open(journal_path, "rb") as tail:
+                        tail.seek(position - 1)
+                        if tail.read(1) != b"\n":
+                            lines.insert(0, b"\n")
+                            records = [None] + records
+                f.write(b"".join(lines))
+        except (TypeError, ValueError, OSError):
+            # A partial write leaves at most a torn line, which replay skips; the offsets are stale though.
+            index.remove()
+            return False
+
+        if header is not None:
+            keep_count, new_entries = header[0], []
+            for record, line in zip(records, lines):
+                if record is not None and record["op"] == "append":
+                    new_entries.append((position, len(line) - 1))
+                elif record is not None and record["op"] == "truncate":
+                    keep = max(0, int(record["count"]))
+                    if keep <= keep_count:
+                        keep_count, new_entries = keep, []
+                    else:
+                        del new_entries[keep - keep_count:]
+                position += len(line)
+            if not index.update(previous_signature, keep_count, new_entries):
+                index.remove()
+        else:
+            index.remove()
+        return self._write_meta(profile_name, metadata, message_count, record_count)
+
+    def _message_count(self, profile_name: str) -> int:
+        meta = self._read_meta(profile_name)
+        if "message_count" in meta:
+            return int(meta["message_count"])
+        history, _record_count = self._replay(profile_name)
+        return len(history)
+
+    def write(self, profile_name: str, data: dict, stored_history: list | None = None) -> bool:
+        """
+        Persists a full history. If the stored journal is a prefix-compatible
+        version of it, only the difference is appended; otherwise the journal is
+        rewritten from scratch.
+        """
+        history = data.get("history", [])
+        metadata = data.get("metadata", default_metadata())
+        journal_path = self.get_path(profile_name)
+
+        if os.path.exists(journal_path):
+            record_count = int(self._read_meta(profile_name).get("record_count", 0) or 0)
+            if stored_history is None:
+                try:
+                    stored_history, record_count = self._replay(profile_name)
+                except OSError:
+                    stored_history = None
+            if stored_history is not None:
+                common = 0
+                for old, new in zip(stored_history, history):
+                    if old != new:
+                        break
+                    common += 1
+                records = []
+                if common < len(stored_history):
+                    records.append({"op": "truncate", "count": common})
+                records.extend({"op": "append", "message": msg} for msg in history[common:])
+                if record_count + len(records) <= len(history) + JOURNAL_COMPACTION_SLACK:
+                    if records:
+                        return self._append_records(profile_name, records, metadata, len(history))
+                    return self._write_meta(profile_name, metadata, len(history), record_count)
+
+        return self._rewrite(profile_name, history, metadata)
+
+    def _rewrite(self, profile_name: str, history: list, metadata: dict) -> bool:
+        """Writes a compacted journal (one append record per message) atomically."""
+        journal_path = self.get_path(profile_name)
+        temp_file = journal_path + ".tmp"
+        entries = []
+        position = 0
+        try:
+            with open(temp_file, "wb") as f:
+                for msg in history:
+                    line = json.dumps({"op": "append", "message": msg}, ensure_ascii=False).encode("utf-8")
+                    f.write(line + b"\n")
+                    entries.append((position, len(line)))
+                    position += len(line) + 1
+            os.replace(temp_file, journal_path)
+        except (TypeError, ValueError, OSError):
+            if os.path.exists(temp_file):
+                try:
+                    os.remove(temp_file)
+                except OSError:
+                    pass
+            return False
+        self.get_index(profile_name).write(entries)
+        return self._write_meta(profile_name, metadata, len(history), len(history))
+
+    def append(self, profile_name: str, messages: list, metadata: dict, data: dict | None = None) -> bool:
+        if not os.path.exists(self.get_path(profile_name)):
+            if data is None:
+                data = self.read(profile_name) or {"metadata": default_metadata(), "history": []}
+                data["history"].extend(messages)
+            return self._rewrite(profile_name, data["history"], metadata)
+        message_count = len(data["history"]) if data is not None else self._message_count(profile_name) + len(messages)
+        return self._append_records(
+            profile_name,
+            [{"op": "append", "message": msg} for msg in messages],
+            metadata,
+            message_count,
+        )
+
+    def truncate(self, profile_name: str, keep_count: int, metadata: dict, data: dict | None = None) -> bool:
+        if not os.path.exists(self.get_path(profile_name)):
+            return super().truncate(profile_name, keep_count, metadata, data)
+        message_count = min(keep_count, self._message_count(profile_name))
+        return self._append_records(profile_name, [{"op": "truncate", "count": keep_count}], metadata, message_count)
+
+    def write_metadata(self, profile_name: str, metadata: dict, data: dict | None = None) -> bool:
+        if not os.path.exists(self.get_path(profile_name)):
+            if data is None:
+                data = self.read(profile_name) or {"metadata": default_metadata(), "history": []}
+            return self._rewrite(profile_name, data["history"], metadata)
+        meta = self._read_meta(profile_name)
+        return self._write_meta(
+            profile_name,
+            metadata,
+            self._message_count(profile_name),
+            int(meta.get("record_count", 0) or 0),
+        )
+
+    def sync(self, profile_name: str) -> None:
+        _fsync_paths([self.get_path(profile_name), self.get_meta_path(profile_name)], self.history_dir)
+
+    def update_message(self, profile_name: str, position: int, message: dict, metadata: dict,
+                       data: dict | None = None) -> bool:
+        if not os.path.exists(self.get_path(profile_name)):
+            return super().update_message(profile_name, position, message, metadata, data)
+        if position != self._message_count(profile_name) - 1:
+            # Only the tail can be replaced with records; anything else is a rewrite.
+            return super().update_message(profile_name, position, message, metadata, data)
+        return self.commit(profile_name, position, [message], metadata, data)
+
+    def commit(self, profile_name: str, keep_count: int, messages: list, metadata: dict,
+               data: dict | None = None) -> bool:
+        if not os.path.exists(self.get_path(profile_name)):
+            return super().commit(profile_name, keep_count, messages, metadata, data)
+        meta = self._read_meta(profile_name)
+        stored_count = self._message_count(profile_name)
+        keep_count = min(keep_count, stored_count)
+        records = []
+        if keep_count < stored_count:
+            records.append({"op": "truncate", "count": keep_count})
+        records.extend({"op": "append", "message": msg} for msg in messages)
+        message_count = keep_count + len(messages)
+
+        record_count = int(meta.get("record_count", 0) or 0)
+        if record_count + len(records) > message_count + JOURNAL_COMPACTION_SLACK:
+            if data is None:
+                history, _record_count = self._replay(profile_name)
+                data = {"history": history[:keep_count] + list(messages)}
+            return self._rewrite(profile_name, data["history"], metadata)
+        return self._append_records(profile_name, records, metadata, message_count)
+
+
+# Message keys that get their own columns in the SQLite layout; anything else
+# is kept verbatim in the `extra` JSON column.
+_SQLITE_MESSAGE_FIELDS = ("role", "content", "alternatives", "selected_index")
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    profile TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    revision INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS messages (
+    profile TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    role TEXT,
+    content TEXT,
+    selected_index INTEGER,
+    alternative_count INTEGER,
+    extra TEXT,
+    PRIMARY KEY (profile, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alternatives (
+    profile TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    alt_index INTEGER NOT NULL,
+    content TEXT,
+    PRIMARY KEY (profile, position, alt_index)
+) WITHOUT ROWID;
+"""
+
+
+def _encode_message(profile: str, position: int, message: dict) -> tuple[tuple, list]:
+    """Splits a message into its `messages` row and its `alternatives` rows."""
+    extra = {key: val for key, val in message.items() if key not in _SQLITE_MESSAGE_FIELDS}
+    role = message.get("role")
+    content = message.get("content")
+    # Non-text role/content (never written by the app, but tolerated) round-trip through `extra`.
+    if role is not None and not isinstance(role, str):
+        extra["role"], role = role, None
+    if content is not None and not isinstance(content, str):
+        extra["content"], content = content, None
+    selected_index = message.get("selected_index")
+    if selected_index is not None and not isinstance(selected_index, int):
+        extra["selected_index"], selected_index = selected_index, None
+
+    alternatives = message.get("alternatives")
+    alternative_rows = []
+    alternative_count = None
+    if isinstance(alternatives, list) and all(isinstance(alt, str) for alt in alternatives):
+        alternative_count = len(alternatives)
+        alternative_rows = [(profile, position, i, alt) for i, alt in enumerate(alternatives)]
+    elif "alternatives" in message:
+        extra["alternatives"] = alternatives
+
+    row = (
+        profile, position, role, content, selected_index, alternative_count,
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+    return row, alternative_rows
+
+
+def _decode_message(row: tuple, alternatives: list) -> dict:
+    """Rebuilds a message dict from a `(role, content, selected_index, alternative_count, extra)` row."""
+    role, content, selected_index, alternative_count, extra = row
+    message = {}
+    if role is not None:
+        message["role"] = role
+    if content is not None:
+        message["content"] = content
+    if alternative_count is not None:
+        message["alternatives"] = alternatives
+    if selected_index is not None:
+        message["selected_index"] = selected_index
+    if extra:
+        message.update(json.loads(extra))
+    return message
+
+
+class SqliteHistoryStorage(JsonHistoryStorage):
+    """
+    Indexed layout: every profile lives in one `history.sqlite3` database (WAL
+    mode), with a row per message and per alternative, so partial operations
+    touch only the affected rows. `import_json_history` bulk-imports legacy files.
+    """
+    name = "sqlite"
+    indexed = True
+
+    def __init__(self, history_dir: str):
+        super().__init__(history_dir)
+        self.db_path = os.path.join(history_dir, SQLITE_FILENAME)
+        self._conn = None
+        self._db_lock = threading.RLock()
+
+    def get_path(self, profile_name: str) -> str:
+        return self.db_path
+
+    def get_legacy_path(self, profile_name: str) -> str:
+        return super().get_path(profile_name)
+
+    def cache_key(self, profile_name: str) -> str:
+        return f"{self.db_path}#{self._safe_name(profile_name)}"
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.history_dir, exist_ok=True)
+            # Autocommit mode: transactions are opened explicitly in `_transaction`.
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SQLITE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def sync(self, profile_name: str) -> None:
+        # WAL commits under synchronous=NORMAL are durable once checkpointed.
+        try:
+            self._query("PRAGMA wal_checkpoint(FULL)")
+        except sqlite3.Error:
+            pass
+
+    def close(self) -> None:
+        """Closes the database connection (it is reopened on next use)."""
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @contextmanager
+    def _transaction(self):
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._db_lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _profile_row(self, profile_name: str) -> tuple | None:
+        """Returns (metadata_json, message_count, revision) for a profile, importing legacy data first."""
+        if not os.path.exists(self.db_path) and not os.path.exists(self.get_legacy_path(profile_name)):
+            return None
+        rows = self._query(
+            "SELECT metadata, message_count, revision FROM profiles WHERE profile = ?",
+            (self._safe_name(profile_name),),
+        )
+        if rows:
+            return rows[0]
+        if self._migrate_legacy(profile_name):
+            return self._profile_row(profile_name)
+        return None
+
+    def _migrate_legacy(self, profile_name: str) -> bool:
+        legacy_path = self.get_legacy_path(profile_name)
+        data = self._read_json_file(legacy_path)
+        if data is None or not self.write(profile_name, data):
+            return False
+        try:
+            os.replace(legacy_path, legacy_path + ".bak")
+        except OSError:
+            pass
+        return True
+
+    def exists(self, profile_name: str) -> bool:
+        return self._profile_row(profile_name) is not None
+
+    def signature(self, profile_name: str) -> tuple | None:
+        row = self._profile_row(profile_name)
+        return (row[2], row[1]) if row else None
+
+    def list_profiles(self) -> list[str]:
+        names = set(super().list_profiles())
+        if os.path.exists(self.db_path):
+            names.update(row[0] for row in self._query("SELECT profile FROM profiles"))
+        return sorted(names)
+
+    def _read_messages(self, profile_name: str, start: int, positions: list | None = None) -> list:
+        """Messages from `start` on in order, or (with `positions`) just the ones at those positions."""
+        safe_name = self._safe_name(profile_name)
+        where, params = "position >= ?", (start,)
+        if positions is not None:
+            where, params = f"position IN ({', '.join('?' * len(positions))})", tuple(positions)
+        with self._db_lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT position, role, content, selected_index, alternative_count, extra "
+                f"FROM messages WHERE profile = ? AND {where} ORDER BY position",
+                (safe_name, *params),
+            ).fetchall()
+            alternatives = {}
+            for position, _alt_index, content in conn.execute(
+                "SELECT position, alt_index, content FROM alternatives "
+                f"WHERE profile = ? AND {where} ORDER BY position, alt_index",
+                (safe_name, *params),
+            ):
+                alternatives.setdefault(position, []).append(content)
+        return [_decode_message(row[1:], alternatives.get(row[0], [])) for row in rows]
+
+    def read(self, profile_name: str) -> dict | None:
+        row = self._profile_row(profile_name)
+        if row is None:
+            return None
+        return normalize_history_data({
+            "metadata": json.loads(row[0]),
+            "history": self._read_messages(profile_name, 0),
+        })
+
+    def count(self, profile_name: str) -> int:
+        row = self._profile_row(profile_name)
+        return int(row[1]) if row else 0
+
+    def read_tail(self, profile_name: str, limit: int) -> list:
+        row = self._profile_row(profile_name)
+        if row is None or limit <= 0:
+            return []
+        return self._read_messages(profile_name, max(0, int(row[1]) - limit))
+
+    def read_messages(self, profile_name: str, positions: list) -> list | None:
+        wanted = sorted(set(positions))
+        if len(wanted) > SQLITE_MAX_POSITIONS:
+            return None
+        messages = self._read_messages(profile_name, 0, wanted) if wanted else []
+        if len(messages) != len(wanted):
+            return None
+        found = dict(zip(wanted, messages))
+        return [found[position] for position in positions]
+
+    def read_metadata(self, profile_name: str) -> dict | None:
+        row = self._profile_row(profile_name)
+        if row is None:
+            return None
+        return normalize_history_data({"metadata": json.loads(row[0]), "history": []})["metadata"]
+
+    @staticmethod
+    def _stored_count(conn: sqlite3.Connection, safe_name: str) -> int:
+        row = conn.execute("SELECT message_count FROM profiles WHERE profile = ?", (safe_name,)).fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _put_profile(conn: sqlite3.Connection, safe_name: str, metadata: dict, message_count: int) -> None:
+        conn.execute(
+            "INSERT INTO profiles (profile, metadata, message_count) VALUES (?, ?, ?) "
+            "ON CONFLICT(profile) DO UPDATE SET metadata = excluded.metadata, "
+            "message_count = excluded.message_count, revision = revision + 1",
+            (safe_name, json.dumps(metadata, ensure_ascii=False), message_count),
+        )
+
+    @staticmethod
+    def _delete_from(conn: sqlite3.Connection, safe_name: str, start: int) -> None:
+        conn.execute("DELETE FROM messages WHERE profile = ? AND position >= ?", (safe_name, start))
+        conn.execute("DELETE FROM alternatives WHERE profile = ? AND position >= ?", (safe_name, start))
+
+    @staticmethod
+    def _insert_messages(conn: sqlite3.Connection, safe_name: str, start: int, messages: list) -> None:
+        message_rows = []
+        alternative_rows = []
+        for offset, msg in enumerate(messages):
+            row, alternatives = _encode_message(safe_name, start + offset, msg)
+            message_rows.append(row)
+            alternative_rows.extend(alternatives)
+        conn.executemany(
+            "INSERT INTO messages (profile, position, role, content, selected_index, alternative_count, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            message_rows,
+        )
+        conn.executemany(
+            "INSERT INTO alternatives (profile, position, alt_index, content) VALUES (?, ?, ?, ?)",
+            alternative_rows,
+        )
+
+    def write(self, profile_name: str, data: dict, stored_history: list | None = None) -> bool:
+        """
+        Persists a full history. When the caller knows the stored history, only
+        rows past the common prefix are replaced.
+        """
+        history = data.get("history", [])
+        metadata = data.get("metadata", default_metadata())
+        safe_name = self._safe_name(profile_name)
+        try:
+            with self._transaction() as conn:
+                common = 0
+                if stored_history is not None and len(stored_history) == self._stored_count(conn, safe_name):
+                    for old, new in zip(stored_history, history):
+                        if old != new:
+                            break
+                        common += 1
+                self._delete_from(conn, safe_name, common)
+                self._insert_messages(conn, safe_name, common, history[common:])
+                self._put_profile(conn, safe_name, metadata, len(history))
+        except sqlite3.Error:
+            return False
+        return True
+
+    def append(self, profile_name: str, messages: list, metadata: dict, data: dict | None = None) -> bool:
+        self._profile_row(profile_name)  # Imports legacy data before appending to it.
+        safe_name = self._safe_name(profile_name)
+        try:
+            with self._transaction() as conn:
+                start = self._stored_count(conn, safe_name)
+                self._insert_messages(conn, safe_name, start, messages)
+                self._put_profile(conn, safe_name, metadata, start + len(messages))
+        except sqlite3.Error:
+            return False
+        return True
+
+    def truncate(self, profile_name: str, keep_count: int, metadata: dict, data: dict | None = None) -> bool:
+        self._profile_row(profile_name)
+        safe_name = self._safe_name(profile_name)
+        try:
+            with self._transaction() as conn:
+                message_count = min(keep_count, self._stored_count(conn, safe_name))
+                self._delete_from(conn, safe_name, keep_count)
+                self._put_profile(conn, safe_name, metadata, message_count)
+        except sqlite3.Error:
+            return False
+        return True
+
+    def write_metadata(self, profile_name: str, metadata: dict, data: dict | None = None) -> bool:
+        self._profile_row(profile_name)
+        safe_name = self._safe_name(profile_name)
+        try:
+            with self._transaction() as conn:
+                self._put_profile(conn, safe_name, metadata, self._stored_count(conn, safe_name))
+        except sqlite3.Error:
+            return False
+        return True
+
+    def commit(self, profile_name: str, keep_count: int, messages: list, metadata: dict,
+               data: dict | None = None) -> bool:
+        self._profile_row(profile_name)
+        safe_name = self._safe_name(profile_name)
+        try:
+            with self._transaction() as conn:
+                keep_count = min(keep_count, self._stored_count(conn, safe_name))
+                self._delete_from(conn, safe_name, keep_count)
+                self._insert_messages(conn, safe_name, keep_count, messages)
+                self._put_profile(conn, safe_name, metadata, keep_count + len(messages))
+        except sqlite3.Error:
+            return False
+        return True
+
+    def update_message(self, profile_name: str, position: int, message: dict, metadata: dict,
+                       data: dict | None = None) -> bool:
+        self._profile_row(profile_name)
+        safe_name = self._safe_name(profile_name)
+        try:
+            with self._transaction() as conn:
+                message_count = self._stored_count(conn, safe_name)
+                if not 0 <= position < message_count:
+                    return False
+                conn.execute("DELETE FROM messages WHERE profile = ? AND position = ?", (safe_name, position))
+                conn.execute("DELETE FROM alternatives WHERE profile = ? AND position = ?", (safe_name, position))
+                self._insert_messages(conn, safe_name, position, [message])
+                self._put_profile(conn, safe_name, metadata, message_count)
+        except sqlite3.Error:
+            return False
+        return True
+
+    def import_json_history(self, source_dir: str | None = None, overwrite: bool = False) -> list[str]:
+        """
+        Imports every `*_history.json` file in `source_dir` (default: this
+        storage's history directory). Source files are left untouched.
+
+        Args:
+            source_dir (str, optional): Directory holding the legacy JSON files.
+            overwrite (bool): Replace profiles that are already in the database.
+
+        Returns:
+            list[str]: The profile names that were imported.
+        """
+        source_dir = source_dir or self.history_dir
+        if not os.path.isdir(source_dir):
+            return []
+        existing = {row[0] for row in self._query("SELECT profile FROM profiles")}
+        imported = []
+        for filename in sorted(os.listdir(source_dir)):
+            if not filename.endswith(HISTORY_SUFFIX):
+                continue
+            profile_name = filename[:-len(HISTORY_SUFFIX)]
+            if self._safe_name(profile_name) in existing and not overwrite:
+                continue
+            data = self._read_json_file(os.path.join(source_dir, filename))
+            if data is not None and self.write(profile_name, data):
+                imported.append(profile_name)
+        return imported
+
+
+HISTORY_STORAGE_BACKENDS = {
+    JsonHistoryStorage.name: JsonHistoryStorage,
+    JournalHistoryStorage.name: JournalHistoryStorage,
+    SqliteHistoryStorage.name: SqliteHistoryStorage,
+}
+
+
+def create_history_storage(mode: str, history_dir: str):
+    """Instantiates the storage backend registered under `mode` (falls back to JSON)."""
+    storage_cls = HISTORY_STORAGE_BACKENDS.get((mode or "json").lower(), JsonHistoryStorage)
+    return storage_cls(history_dir)
+
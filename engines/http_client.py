@@ -0,0 +1,183 @@
+"""
+Shared HTTP client for the remote bridges (LLM, XTTS, lore sync).
+
+Every remote call goes through one pooled keep-alive session per base URL
+(scheme, host and port), so only the first request to a bridge pays for the
+TCP and TLS handshakes through the tunnel; later ones reuse the connection.
+Pool size and connect timeout come from settings (`http_pool_size`,
+`http_connect_timeout`); callers pass the read timeout as before.
+
+With `http2_enabled` and `httpx` (with its `h2` extra) installed, sessions
+speak HTTP/2 and multiplex concurrent requests over one connection. Their
+responses and errors look like `requests` ones to the callers.
+"""
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from engines.config import get_setting
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTP2_AVAILABLE = False
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _base_url(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _connect_timeout() -> float:
+    try:
+        return float(get_setting("http_connect_timeout", DEFAULT_CONNECT_TIMEOUT))
+    except (TypeError, ValueError):
+        return DEFAULT_CONNECT_TIMEOUT
+
+
+def _pool_size() -> int:
+    try:
+        return max(1, int(get_setting("http_pool_size", DEFAULT_POOL_SIZE)))
+    except (TypeError, ValueError):
+        return DEFAULT_POOL_SIZE
+
+
+def _timeouts(timeout):
+    """A caller's read timeout becomes (connect, read); tuples pass through."""
+    if timeout is None or isinstance(timeout, tuple):
+        return timeout
+    return (min(_connect_timeout(), timeout), timeout)
+
+
+def _requests_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    # Retry only failures to connect; anything after the request went out is the caller's call.
+    retries = Retry(total=1, connect=1, read=0, redirect=0, status=0, other=0)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class _Http2Response:
+    """The parts of `requests.Response` the bridges' callers use, over an httpx response."""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+
+    @property
+    def content(self) -> bytes:
+        return self._response.read()
+
+    @property
+    def text(self) -> str:
+        self._response.read()
+        return self._response.text
+
+    def json(self):
+        self._response.read()
+        return self._response.json()
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def iter_content(self, chunk_size=None, decode_unicode=False):
+        if decode_unicode:
+            return self._response.iter_text(chunk_size)
+        return self._response.iter_bytes(chunk_size)
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False):
+        for line in self._response.iter_lines():
+            yield line if decode_unicode else line.encode("utf-8")
+
+    def close(self) -> None:
+        self._response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _Http2Session:
+    """`requests.Session`-style front for an HTTP/2 `httpx.Client`."""
+
+    def __init__(self, pool_size: int):
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._client = httpx.Client(http2=True, limits=limits)
+
+    def request(self, method: str, url: str, stream: bool = False, timeout=None, **kwargs) -> _Http2Response:
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        try:
+            request = self._client.build_request(method, url, timeout=timeout, **kwargs)
+            response = self._client.send(request, stream=stream)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+        return _Http2Response(response)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def get_session(url: str):
+    """Returns the pooled session for `url`'s base URL, creating it on first use."""
+    base = _base_url(url)
+    pool_size = _pool_size()
+    use_http2 = HTTP2_AVAILABLE and bool(get_setting("http2_enabled", False)) and base.startswith("https://")
+    key = (base, pool_size, use_http2)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _Http2Session(pool_size) if use_http2 else _requests_session(pool_size)
+    return session
+
+
+def request(method: str, url: str, timeout=None, **kwargs):
+    """
+    Sends a request through the pooled session for `url`.
+    Takes the same arguments as `requests.request`; `timeout` is the read timeout.
+    """
+    return get_session(url).request(method, url, timeout=_timeouts(timeout), **kwargs)
+
+
+def get(url: str, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def close_all() -> None:
+    """Closes every pooled connection (on exit, or to pick up new pool settings)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        try:
+            session.close()
+        except Exception:
+            pass
@@ -0,0 +1,240 @@
+"""
+Asyncio LLM client for streamed replies, with cancellation.
+
+Streams a reply from the remote bridge (`/chat`) or straight from the Ollama
+HTTP API (`/api/chat`) on one background event loop shared by every turn.
+Each stream is tied to a `CancellationToken`: cancelling it cancels the task
+reading the stream, which closes the upstream connection mid-response, so the
+bridge or Ollama stops generating instead of producing tokens nobody reads.
+
+The TUI consumes replies from a worker thread, so `stream_chat` bridges an
+async stream back into a plain generator.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+from urllib.parse import urlsplit
+
+from engines.config import get_setting
+from engines.http_client import DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+DEFAULT_OLLAMA_HOST = "http://127.0.0.1:11434"
+STREAM_READ_TIMEOUT = 60.0
+
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}
+_DONE = object()
+
+
+class GenerationCancelled(Exception):
+    """Raised by a stream whose cancellation token was cancelled."""
+
+
+class CancellationToken:
+    """
+    Thread-safe flag shared by whoever starts a generation and whoever may stop it.
+    Callbacks registered with `on_cancel` run once, on the cancelling thread.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback) -> None:
+        """Registers `callback`; runs it right away if the token is already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def run_unless_cancelled(self, callback) -> bool:
+        """
+        Runs `callback` unless the token is cancelled, holding off `cancel` meanwhile.
+        Once `cancel` returns, a callback has either finished or will never run.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            callback()
+            return True
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled()
+
+
+def ollama_host() -> str:
+    """Base URL of the local Ollama server, honouring `OLLAMA_HOST` like the ollama package does."""
+    host = os.environ.get("OLLAMA_HOST", "").strip()
+    if not host:
+        return DEFAULT_OLLAMA_HOST
+    if "://" not in host:
+        host = f"http://{host}"
+    parts = urlsplit(host)
+    hostname = parts.hostname or "127.0.0.1"
+    if hostname == "0.0.0.0":
+        hostname = "127.0.0.1"
+    if ":" in hostname:
+        hostname = f"[{hostname}]"
+    return f"{parts.scheme}://{hostname}:{parts.port or 11434}{parts.path.rstrip('/')}"
+
+
+class AsyncLLMClient:
+    """Streams chat replies over one pooled `httpx.AsyncClient`."""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._client = httpx.AsyncClient(limits=limits)
+
+    @staticmethod
+    def _timeout(read_timeout: float):
+        try:
+            connect = float(get_setting("http_connect_timeout", DEFAULT_CONNECT_TIMEOUT))
+        except (TypeError, ValueError):
+            connect = DEFAULT_CONNECT_TIMEOUT
+        return httpx.Timeout(read_timeout, connect=min(connect, read_timeout))
+
+    async def stream_remote(self, remote_url: str, payload: dict, timeout: float = STREAM_READ_TIMEOUT):
+        """Yields the text of a remote bridge reply as it arrives."""
+        url = f"{remote_url.rstrip('/')}/chat"
+        async with self._client.stream("POST", url, json=payload, timeout=self._timeout(timeout)) as response:
+            response.raise_for_status()
+            async for text in response.aiter_text():
+                if text:
+                    yield text
+
+    async def stream_ollama(self, model: str, messages: list, options: dict | None = None, timeout: float = STREAM_READ_TIMEOUT):
+        """Yields the content of an Ollama `/api/chat` reply, one NDJSON chunk at a time."""
+        payload = {"model": model, "messages": messages, "stream": True}
+        if options:
+            payload["options"] = options
+        url = f"{ollama_host()}/api/chat"
+        async with self._client.stream("POST", url, json=payload, timeout=self._timeout(timeout)) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                try:
+                    error = response.json().get("error")
+                except (ValueError, AttributeError):
+                    error = None
+                raise RuntimeError(f"Ollama error ({response.status_code}): {error or response.text}")
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                content = (chunk.get("message") or {}).get("content", "")
+                if content:
+                    yield content
+                if chunk.get("done"):
+                    break
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """The background loop every stream runs on, started on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _get_client(pool_size: int) -> AsyncLLMClient:
+    """One client per pool size; only ever called on the background loop."""
+    client = _clients.get(pool_size)
+    if client is None:
+        client = _clients[pool_size] = AsyncLLMClient(pool_size)
+    return client
+
+
+def _pool_size() -> int:
+    try:
+        return max(1, int(get_setting("http_pool_size", DEFAULT_POOL_SIZE)))
+    except (TypeError, ValueError):
+        return DEFAULT_POOL_SIZE
+
+
+def stream_chat(cancel_token: CancellationToken, remote_url: str | None = None, payload: dict | None = None,
+                model: str | None = None, messages: list | None = None, options: dict | None = None,
+                timeout: float = STREAM_READ_TIMEOUT):
+    """
+    Yields reply chunks from the remote bridge (when `remote_url` is given, posting
+    `payload`) or from local Ollama (`model`, `messages`, `options`).
+    Raises `GenerationCancelled` as soon as `cancel_token` is cancelled, while the
+    background loop closes the upstream connection. Closing the generator early
+    cancels the stream too.
+    """
+    cancel_token.raise_if_cancelled()
+    chunks = queue.Queue()
+    pool_size = _pool_size()
+
+    async def pump():
+        client = _get_client(pool_size)
+        if remote_url:
+            stream = client.stream_remote(remote_url, payload, timeout=timeout)
+        else:
+            stream = client.stream_ollama(model, messages, options, timeout=timeout)
+        try:
+            async for text in stream:
+                chunks.put(text)
+        except Exception as e:
+            chunks.put(e)
+        else:
+            chunks.put(_DONE)
+        finally:
+            await stream.aclose()
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _event_loop())
+
+    def cancel():
+        future.cancel()
+        chunks.put(GenerationCancelled())
+
+    cancel_token.on_cancel(cancel)
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            if cancel_token.cancelled:
+                raise GenerationCancelled()
+            yield item
+    finally:
+        future.cancel()
@@ -5,8 +5,20 @@ Efficiently injects world/character facts based on keywords in recent history.
 
 import json
 import os
-import re
+import threading
+import zlib
 import requests
+from collections import OrderedDict
+
+from engines import http_client
+from engines.context_packer import ApproximateTokenizer
+from engines.vector_memory import get_lore_vector_index
+
+DEFAULT_LOREBOOK_PATH = "lorebooks/default.json"
+LORE_HEADER = "[WORLD INFO / LORE]"
+# Semantic lore retrieval: entries returned per turn and the least similarity that counts.
+LORE_VECTOR_LIMIT = 4
+LORE_VECTOR_MIN_SCORE = 0.2
 
 def load_lorebook(filepath: str) -> dict:
     """
@@ -40,7 +52,7 @@ def sync_lore_to_remote(lorebook_data: dict, remote_url: str) -> bool:
         sync_url = f"{remote_url.rstrip('/')}/sync_lore"
         payload = lorebook_data
         
-        response = requests.post(sync_url, json=payload, timeout=30)
+        response = http_client.post(sync_url, json=payload, timeout=30)
         response.raise_for_status()
         
         data = response.json()
@@ -58,41 +70,465 @@ def sync_lore_to_remote(lorebook_data: dict, remote_url: str) -> bool:
         print(f"✗ Unexpected error during lore sync: {e}")
         return False
 
-def scan_for_lore(recent_messages: list, lorebook_data: dict) -> str:
+def lore_entry_key(entry: dict) -> str:
+    """Stable name for an entry across reloads and stacked lorebooks: its id plus a checksum of its content."""
+    content = str(entry.get("content", ""))
+    return f"{entry.get('id', '')}:{zlib.crc32(content.encode('utf-8')):08x}"
+
+
+def _is_word_char(char: str) -> bool:
+    r"""Same notion of a word character as the regex `\w` (Unicode-aware)."""
+    return char.isalnum() or char == "_"
+
+
+class LoreMatcher:
+    r"""
+    All keys of a lorebook compiled into one Aho-Corasick automaton, so a scan
+    reads the text once no matter how many entries or keys there are.
+
+    Matches keep the semantics of `re.search(r"\bkey\b", text)` on lowercased
+    text: case-insensitive, whole-word (the `\b` boundaries are checked where a
+    key is found), and only enabled entries take part.
     """
-    Scans the most recent conversation history for keywords defined in the lorebook.
-    Returns a formatted string of matched entries.
+
+    # Transitions live in one flat dict keyed by state << 21 | code point,
+    # which stays compact for lorebooks with hundreds of thousands of states.
+    _CHAR_BITS = 21
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        self._goto = {}
+        self._fail = [0]
+        self._outputs = [()]
+        self._patterns = []  # (length, starts with word char, ends with word char, entry ids)
+        self._ids_by_key = None
+
+        pattern_ids = {}
+        for entry_id, entry in enumerate(entries):
+            if not entry.get("enabled", True):
+                continue
+            for key in entry.get("keys", []):
+                key = str(key).lower()
+                if not key:
+                    continue
+                pattern_id = pattern_ids.get(key)
+                if pattern_id is None:
+                    pattern_id = pattern_ids[key] = len(self._patterns)
+                    self._patterns.append((len(key), _is_word_char(key[0]), _is_word_char(key[-1]), []))
+                    self._add_pattern(key, pattern_id)
+                entry_ids = self._patterns[pattern_id][3]
+                if not entry_ids or entry_ids[-1] != entry_id:
+                    entry_ids.append(entry_id)
+        self._build_failure_links()
+
+    def _add_pattern(self, key: str, pattern_id: int) -> None:
+        goto = self._goto
+        state = 0
+        for char in key:
+            edge = state << self._CHAR_BITS | ord(char)
+            next_state = goto.get(edge)
+            if next_state is None:
+                next_state = goto[edge] = len(self._fail)
+                self._fail.append(0)
+                self._outputs.append(())
+            state = next_state
+        self._outputs[state] = (pattern_id,)
+
+    def _build_failure_links(self) -> None:
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        children = [[] for _ in fail]
+        for edge, child in goto.items():
+            children[edge >> self._CHAR_BITS].append((edge & ((1 << self._CHAR_BITS) - 1), child))
+
+        # Breadth-first, so every state's failure target is finished before its children.
+        queue = [child for _code, child in children[0]]
+        for state in queue:
+            for code, child in children[state]:
+                target = fail[state]
+                while target and (target << self._CHAR_BITS | code) not in goto:
+                    target = fail[target]
+                fail[child] = goto.get(target << self._CHAR_BITS | code, 0)
+                # Keys that end inside this one are reported here too.
+                outputs[child] = outputs[child] + outputs[fail[child]]
+                queue.append(child)
+
+    def match(self, text: str) -> list[int]:
+        """Ids (positions in `entries`) of the entries activated by `text`, in lorebook order."""
+        text = text.lower()
+        goto, fail, outputs, patterns = self._goto, self._fail, self._outputs, self._patterns
+        shift = self._CHAR_BITS
+        last = len(text) - 1
+        seen = set()
+        activated = set()
+        state = 0
+        for pos, char in enumerate(text):
+            code = ord(char)
+            next_state = goto.get(state << shift | code)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto.get(state << shift | code)
+            state = next_state or 0
+            for pattern_id in outputs[state]:
+                if pattern_id in seen:
+                    continue
+                length, starts_word, ends_word, entry_ids = patterns[pattern_id]
+                start = pos - length + 1
+                before_word = start > 0 and _is_word_char(text[start - 1])
+                after_word = pos < last and _is_word_char(text[pos + 1])
+                if before_word != starts_word and after_word != ends_word:
+                    seen.add(pattern_id)
+                    activated.update(entry_ids)
+        return sorted(activated)
+
+    def entry_id(self, entry_key: str) -> int | None:
+        """Position of the entry with this `lore_entry_key`, or None if it is no longer in the lorebook."""
+        if self._ids_by_key is None:
+            self._ids_by_key = {lore_entry_key(entry): entry_id for entry_id, entry in enumerate(self.entries)}
+        return self._ids_by_key.get(entry_key)
+
+    def scan(self, text: str) -> list[dict]:
+        """Entries activated by `text`, sorted by `insertion_order` (lorebook order on ties)."""
+        active_lore = [self.entries[entry_id] for entry_id in self.match(text)]
+        active_lore.sort(key=lambda x: x.get("insertion_order", 100))
+        return active_lore
+
+
+_MATCHER_CACHE_SIZE = 8
+_matchers = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _remember_matcher(lorebook_data: dict, matcher: LoreMatcher) -> None:
+    entries = lorebook_data.get("entries") or []
+    with _cache_lock:
+        # Holding the lorebook keeps its id from being reused by another object.
+        _matchers[id(lorebook_data)] = (lorebook_data, entries, len(entries), matcher)
+        _matchers.move_to_end(id(lorebook_data))
+        if len(_matchers) > _MATCHER_CACHE_SIZE:
+            _matchers.popitem(last=False)
+
+
+def compile_lorebook(lorebook_data: dict) -> LoreMatcher:
     """
-    if not lorebook_data or not lorebook_data.get("entries"):
-        return ""
+    Returns the compiled matcher for a lorebook, reusing it while the same
+    lorebook object (with the same number of entries) is scanned again.
+    """
+    entries = lorebook_data.get("entries") or []
+    key = id(lorebook_data)
+    with _cache_lock:
+        cached = _matchers.get(key)
+        if cached is not None and cached[0] is lorebook_data and cached[1] is entries and cached[2] == len(entries):
+            _matchers.move_to_end(key)
+            return cached[3]
+    matcher = LoreMatcher(entries)
+    _remember_matcher(lorebook_data, matcher)
+    return matcher
 
-    # Consolidate text from recent messages to scan
-    text_to_scan = " ".join([msg.get("content", "").lower() for msg in recent_messages])
-    active_lore = []
 
-    for entry in lorebook_data.get("entries", []):
-        if not entry.get("enabled", True):
-            continue
-            
-        # Check if any of the keys are in the recent text using whole-word matching
-        for key in entry.get("keys", []):
-            # Use regex for whole word matching (\bkey\b) to avoid partial matches
-            if re.search(fr'\b{re.escape(key.lower())}\b', text_to_scan):
-                active_lore.append(entry)
-                break 
+def _file_signature(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+_files = {}  # path -> (signature, parsed lorebook)
+_stacks = {}  # tuple of paths -> (signatures, merged lorebook, matcher)
+
+
+def _load_version(path: str, signature) -> dict:
+    if signature is None:
+        return {"entries": []}
+    cached = _files.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    data = load_lorebook(path)
+    if not isinstance(data, dict) or not isinstance(data.get("entries", []), list):
+        data = {"entries": []}
+    with _cache_lock:
+        _files[path] = (signature, data)
+    return data
+
+
+def get_lorebook(filepath: str) -> dict:
+    """
+    Like `load_lorebook`, but parsed once per version of the file (mtime and
+    size). The result is shared between callers: read it, don't modify it.
+    """
+    return _load_version(filepath, _file_signature(filepath))
+
+
+def get_lorebooks(paths: list) -> dict:
+    """
+    Returns the lorebooks at `paths` merged into one (entries in path order,
+    so earlier books win `insertion_order` ties) with its matcher already
+    compiled. Both are reused until one of the files changes, so stacking
+    lorebooks adds one `stat` per file to a turn. Shared: don't modify it.
+    """
+    paths = tuple(dict.fromkeys(path for path in paths if path))
+    signatures = tuple(_file_signature(path) for path in paths)
+    cached = _stacks.get(paths)
+    if cached is None or cached[0] != signatures:
+        books = [_load_version(path, signature) for path, signature in zip(paths, signatures)]
+        if len(books) == 1:
+            merged = books[0]
+        else:
+            merged = {"entries": [entry for book in books for entry in book.get("entries", [])]}
+        cached = (signatures, merged, LoreMatcher(merged.get("entries") or []))
+        with _cache_lock:
+            _stacks[paths] = cached
+    _remember_matcher(cached[1], cached[2])
+    return cached[1]
+
+
+def lorebook_paths(profile: dict, metadata: dict | None = None, global_paths=()) -> list[str]:
+    """
+    The lorebooks that apply to a chat, in stacking order: the global ones
+    (`global_lorebooks` setting), the character's (`lorebook_path`, a path or
+    a list, `lorebooks/default.json` if unset) and the chat's own
+    (`lorebook_path` in the history metadata).
+    """
+    if isinstance(global_paths, str):
+        global_paths = [global_paths]
+    character_paths = profile.get("lorebook_path") or DEFAULT_LOREBOOK_PATH
+    if isinstance(character_paths, str):
+        character_paths = [character_paths]
+    chat_path = (metadata or {}).get("lorebook_path")
+    return [*global_paths, *character_paths, *([chat_path] if chat_path else [])]
 
+
+def format_lore(active_lore: list) -> str:
+    """Formats activated entries as the [WORLD INFO / LORE] block ("" if none have content)."""
     if not active_lore:
         return ""
-
-    # Sort by insertion_order (allows you to control which info appears first)
-    active_lore.sort(key=lambda x: x.get("insertion_order", 100))
-    
-    # Format the activated lore into a string block
-    lore_text = "[WORLD INFO / LORE]\n"
+    lore_text = f"{LORE_HEADER}\n"
     for entry in active_lore:
         content = entry.get("content", "").strip()
         if content:
             lore_text += f"- {content}\n"
-    
     return lore_text.strip()
 
+
+def scan_for_lore(recent_messages: list, lorebook_data: dict) -> str:
+    """
+    Scans the most recent conversation history for keywords defined in the lorebook.
+    Returns a formatted string of matched entries.
+    """
+    if not lorebook_data or not lorebook_data.get("entries"):
+        return ""
+
+    # Consolidate text from recent messages to scan
+    text_to_scan = " ".join([msg.get("content", "") for msg in recent_messages])
+    return format_lore(compile_lorebook(lorebook_data).scan(text_to_scan))
+
+
+def activate_lore(
+    recent_messages: list,
+    lorebook_data: dict,
+    state: dict | None = None,
+    token_budget: int | None = None,
+    recursion_depth: int = 0,
+    advance_turn: bool = True,
+    count_tokens=None,
+    semantic_scores: dict | None = None,
+    scan_cache: "LoreScanCache | None" = None,
+) -> tuple[str, dict]:
+    """
+    Decides which lore entries go into this turn's prompt.
+
+    Entries are activated by their keys in `recent_messages`, then, up to
+    `recursion_depth` times, by keys in the content of entries activated in
+    the step before (entries with `prevent_recursion` don't trigger others,
+    entries with `exclude_recursion` are only triggered by the chat). An entry
+    with `sticky: N` stays active for N more turns after it last triggered.
+    Entries found by `semantic_scores` (see `semantic_lore_scores`) count as
+    triggered too. Finally whole entries are packed while they fit
+    `token_budget` (None for no limit): best score first (1 for a key match,
+    plus the similarity), then by `insertion_order`; the block lists them in
+    `insertion_order`. Each piece of text is scanned once, so the cost stays
+    linear in the text and activated lore.
+
+    Args:
+        recent_messages (list): Messages to scan for keys.
+        lorebook_data (dict): The (merged) lorebook.
+        state (dict): The previous turn's state (`lore_state` in the history metadata).
+        token_budget (int): Most tokens the lore block may take.
+        recursion_depth (int): How many rounds of lore-triggers-lore to allow.
+        advance_turn (bool): False when regenerating, so sticky entries don't count a turn down.
+        count_tokens: Token counting function (defaults to the approximate tokenizer).
+        semantic_scores (dict): Entry id -> similarity from vector retrieval.
+        scan_cache (LoreScanCache): Per-chat cache of each message's matches, so
+            only messages not seen on earlier turns are scanned.
+
+    Returns:
+        tuple[str, dict]: The formatted lore block and the state to store for the next turn.
+    """
+    state = state if isinstance(state, dict) else {}
+    try:
+        turn = int(state.get("turn", 0)) + (1 if advance_turn else 0)
+    except (TypeError, ValueError):
+        turn = 1
+    sticky = {
+        key: last_turn for key, last_turn in (state.get("sticky") or {}).items()
+        if isinstance(last_turn, int) and last_turn >= turn
+    }
+    entries = lorebook_data.get("entries") if lorebook_data else None
+    if not entries:
+        return "", {"turn": turn, "sticky": sticky}
+
+    matcher = compile_lorebook(lorebook_data)
+    if scan_cache is not None:
+        matched = scan_cache.match(matcher, recent_messages)
+    else:
+        matched = matcher.match(" ".join([msg.get("content", "") for msg in recent_messages]))
+    triggered = set(matched)
+    scores = dict.fromkeys(matched, 1.0)
+    for entry_id, similarity in (semantic_scores or {}).items():
+        if 0 <= entry_id < len(entries) and entries[entry_id].get("enabled", True):
+            triggered.add(entry_id)
+            scores[entry_id] = scores.get(entry_id, 0.0) + similarity
+
+    frontier = triggered
+    for _ in range(max(0, recursion_depth)):
+        lore_text = " ".join(
+            str(entries[entry_id].get("content", ""))
+            for entry_id in sorted(frontier) if not entries[entry_id].get("prevent_recursion")
+        )
+        frontier = {
+            entry_id for entry_id in matcher.match(lore_text)
+            if entry_id not in triggered and not entries[entry_id].get("exclude_recursion")
+        } if lore_text else set()
+        if not frontier:
+            break
+        triggered |= frontier
+
+    active = set(triggered)
+    for key in sticky:
+        entry_id = matcher.entry_id(key)
+        if entry_id is not None and entries[entry_id].get("enabled", True):
+            active.add(entry_id)
+    for entry_id in triggered:
+        try:
+            duration = int(entries[entry_id].get("sticky", 0) or 0)
+        except (TypeError, ValueError):
+            duration = 0
+        if duration > 0:
+            sticky[lore_entry_key(entries[entry_id])] = turn + duration
+
+    def order(entry_id):
+        return (entries[entry_id].get("insertion_order", 100), entry_id)
+
+    selected = sorted(active, key=order)
+    if token_budget is not None:
+        count_tokens = count_tokens or ApproximateTokenizer().count
+        used = count_tokens(LORE_HEADER)
+        packed = []
+        # Sticky and recursion-found entries rank like key matches.
+        for entry_id in sorted(selected, key=lambda entry_id: -scores.get(entry_id, 1.0)):
+            content = entries[entry_id].get("content", "").strip()
+            cost = count_tokens(f"- {content}") if content else 0
+            if used + cost <= token_budget:
+                packed.append(entry_id)
+                used += cost
+        selected = sorted(packed, key=order)
+    return format_lore([entries[entry_id] for entry_id in selected]), {"turn": turn, "sticky": sticky}
+
+
+class LoreScanCache:
+    """
+    Remembers which entries each message activated, keyed by a checksum of
+    its content, so a turn scans only the messages it hasn't seen before
+    (normally the latest reply and the new input) and unions the cached
+    matches of the rest of the window. A rewound or regenerated message has
+    new content and therefore a new key, so stale matches are never reused.
+    Keys spanning two messages are not matched, unlike a scan of the joined
+    window. The cache is dropped when the lorebook is recompiled.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self._matcher = None
+        self._matches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def match(self, matcher: LoreMatcher, messages: list) -> list[int]:
+        """Ids of the entries activated by any of `messages`, in lorebook order."""
+        activated = set()
+        with self._lock:
+            if matcher is not self._matcher:
+                self._matcher = matcher
+                self._matches.clear()
+            for msg in messages:
+                content = str(msg.get("content", ""))
+                key = (zlib.crc32(content.encode("utf-8")), len(content))
+                entry_ids = self._matches.get(key)
+                if entry_ids is None:
+                    entry_ids = self._matches[key] = tuple(matcher.match(content))
+                    if len(self._matches) > self.capacity:
+                        self._matches.popitem(last=False)
+                else:
+                    self._matches.move_to_end(key)
+                activated.update(entry_ids)
+        return sorted(activated)
+
+
+_scan_caches = {}
+
+
+def get_lore_scan_cache(profile_name: str) -> LoreScanCache:
+    """Returns the process-wide lore scan cache for a chat."""
+    cache = _scan_caches.get(profile_name)
+    if cache is None:
+        cache = _scan_caches.setdefault(profile_name, LoreScanCache())
+    return cache
+
+
+def _embedding_text(entry: dict) -> str:
+    keys = ", ".join(str(key) for key in entry.get("keys", []))
+    return f"{keys}\n{entry.get('content', '')}".strip()
+
+
+_synced_vector_indexes = {}  # (lorebook path, embedder) -> entries list the index was last synced with
+
+
+def semantic_lore_scores(
+    query: str,
+    lorebook_data: dict,
+    paths: list,
+    embedder_kind: str = "hashing",
+    limit: int = LORE_VECTOR_LIMIT,
+    min_score: float = LORE_VECTOR_MIN_SCORE,
+) -> dict:
+    """
+    Finds the `limit` lorebook entries closest in meaning to `query` with a
+    CPU embedding index per lorebook file (see engines.vector_memory). An
+    index is re-synced only when its file was reloaded, and then embeds only
+    new or edited entries.
+
+    Returns:
+        dict: Entry id in the merged `lorebook_data` -> cosine similarity
+        ({} if NumPy is not installed).
+    """
+    entries = lorebook_data.get("entries") if lorebook_data else None
+    if not entries or not query or limit <= 0:
+        return {}
+    matcher = compile_lorebook(lorebook_data)
+    hits = {}
+    for path in dict.fromkeys(path for path in paths if path):
+        book_entries = get_lorebook(path).get("entries") or []
+        if not book_entries:
+            continue
+        index = get_lore_vector_index(path, embedder_kind)
+        if index is None:
+            return {}
+        synced_key = (path, embedder_kind)
+        if _synced_vector_indexes.get(synced_key) is not book_entries:
+            index.sync([lore_entry_key(entry) for entry in book_entries], [_embedding_text(entry) for entry in book_entries])
+            _synced_vector_indexes[synced_key] = book_entries
+        for key, score in index.search(query, limit, min_score):
+            entry_id = matcher.entry_id(key)
+            if entry_id is not None and entries[entry_id].get("enabled", True):
+                hits[entry_id] = max(hits.get(entry_id, 0.0), score)
+    best = sorted(hits.items(), key=lambda item: (item[1], -item[0]), reverse=True)[:limit]
+    return dict(best)
@@ -0,0 +1,360 @@
+"""
+Persistent inverted index over conversation messages for semantic retrieval.
+Maps each token to the ids (global message numbers, 0-based) of the messages
+containing it, so scoring a query only touches the postings of its tokens
+instead of re-tokenizing the whole history every turn.
+
+Two scorers run on the same postings: "overlap" counts shared query tokens,
+"bm25" ranks with Okapi BM25 using per-message term frequencies and lengths,
+with document frequencies and the average length maintained incrementally.
+
+The index is kept per profile next to its history as an append-only JSON Lines
+log (`{profile}_tokens.jsonl`): one record per indexed message and a truncate
+record whenever the conversation is cut back (rewind, regeneration, reset).
+"""
+
+import bisect
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+
+from engines.utilities import sanitize_profile_name
+
+INDEX_SUFFIX = "_tokens.jsonl"
+# Rewrite the log once it holds this many records more than there are messages.
+INDEX_COMPACTION_SLACK = 256
+SCORERS = ("overlap", "bm25")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-zA-Z0-9']+")
+
+
+def word_tokens(text: str) -> list[str]:
+    """Lowercased word tokens longer than two characters, in order."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 2]
+
+
+def tokenize(text: str) -> set[str]:
+    """The distinct tokens of `text` (see `word_tokens`)."""
+    return set(word_tokens(text))
+
+
+def term_counts(text: str) -> Counter:
+    """Like `tokenize`, but keeps how often each token occurs."""
+    return Counter(word_tokens(text))
+
+
+def message_fingerprint(message: dict) -> int:
+    """Cheap checksum of a message's content, used to notice which messages changed."""
+    return zlib.crc32(str(message.get("content", "")).encode("utf-8"))
+
+
+def text_fingerprint(text: str, previous: int = 0) -> int:
+    """Checksum of `text` chained onto `previous`; the length prefix keeps ("ab", "c") apart from ("a", "bc")."""
+    data = str(text).encode("utf-8")
+    return zlib.crc32(data, zlib.crc32(len(data).to_bytes(8, "little"), previous))
+
+
+def prefix_fingerprints(messages: list, previous: int = 0) -> list[int]:
+    """
+    Chained checksums of `messages`: entry i covers every message up to and
+    including i (continuing from `previous`, the entry before the first one),
+    so two equal entries mean the whole prefixes are equal.
+    """
+    fingerprints = []
+    for message in messages:
+        previous = text_fingerprint(message.get("content", ""), previous)
+        fingerprints.append(previous)
+    return fingerprints
+
+
+def unchanged_prefix(stored: list[int], fingerprints: list[int]) -> int:
+    """How many leading messages two lists of `prefix_fingerprints` agree on."""
+    keep = min(len(stored), len(fingerprints))
+    while keep and stored[keep - 1] != fingerprints[keep - 1]:
+        keep -= 1
+    return keep
+
+
+class MessageIndex:
+    """
+    Inverted index for one conversation. `sync(history)` brings it up to date
+    with the full message list: each message stores a fingerprint of the whole
+    conversation up to it (`prefix_fingerprints`), so the last one that still
+    matches marks where the conversation changed and only the messages after
+    it are re-indexed. `sync(messages, start)` does the same for a conversation
+    whose messages from `start` on are `messages`, without reading the rest.
+    Without a `path` the index lives in memory only.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self._fingerprints = []
+        self._terms = []
+        self._lengths = []
+        self._total_length = 0
+        self._postings = {}
+        self._frequencies = {}  # token -> term frequencies, parallel to its postings
+        self._word_tokens = {}  # word -> tokens holding it between apostrophes ("scene" -> {"scene's"})
+        self._record_count = 0
+        self._loaded = path is None
+        self._lock = threading.Lock()
+        # Set once the index describes the stored history; HistoryManager changes then keep it current.
+        self.tracks_history = False
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._terms)
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+                if "truncate" in record:
+                    self._truncate(int(record["truncate"]))
+                else:
+                    self._add(int(record["id"]), int(record["fp"]), record["tf"])
+            except (ValueError, KeyError, TypeError):
+                # Torn or foreign line; whatever it described gets re-indexed on the next sync.
+                continue
+            self._record_count += 1
+
+    def _add(self, message_id: int, fingerprint: int, terms: dict) -> None:
+        if message_id != len(self._terms):
+            raise ValueError("index records out of order")
+        terms = {str(token): int(count) for token, count in terms.items()}
+        length = sum(terms.values())
+        self._fingerprints.append(fingerprint)
+        self._terms.append(terms)
+        self._lengths.append(length)
+        self._total_length += length
+        for token, count in terms.items():
+            if token not in self._postings and "'" in token:
+                for word in token.split("'"):
+                    self._word_tokens.setdefault(word, set()).add(token)
+            self._postings.setdefault(token, []).append(message_id)
+            self._frequencies.setdefault(token, []).append(count)
+
+    def _truncate(self, count: int) -> None:
+        while len(self._terms) > max(0, count):
+            self._total_length -= self._lengths.pop()
+            for token in self._terms.pop():
+                postings = self._postings[token]
+                postings.pop()  # Ids are ascending, so the removed message is the last posting.
+                self._frequencies[token].pop()
+                if not postings:
+                    del self._postings[token]
+                    del self._frequencies[token]
+                    if "'" in token:
+                        for word in token.split("'"):
+                            self._word_tokens.get(word, set()).discard(token)
+            self._fingerprints.pop()
+
+    def _write_records(self, records: list) -> None:
+        if self.path is None or not records:
+            return
+        self._record_count += len(records)
+        if self._record_count > len(self._terms) + INDEX_COMPACTION_SLACK:
+            self._rewrite()
+            return
+        try:
+            with open(self.path, "a", encoding="UTF-8") as f:
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        except OSError:
+            pass
+
+    def _rewrite(self) -> None:
+        temp_file = self.path + ".tmp"
+        try:
+            with open(temp_file, "w", encoding="UTF-8") as f:
+                for message_id, terms in enumerate(self._terms):
+                    record = {"id": message_id, "fp": self._fingerprints[message_id], "tf": terms}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(temp_file, self.path)
+            self._record_count = len(self._terms)
+        except OSError:
+            if os.path.exists(temp_file):
+                try:
+                    os.remove(temp_file)
+                except OSError:
+                    pass
+
+    def sync(self, history: list, start: int = 0) -> int:
+        """
+        Updates the index to describe `history` (the full conversation, archived
+        messages included). With `start`, `history` holds only the messages from
+        `start` on and the first `start` indexed messages are taken as unchanged.
+        Returns the number of messages that were (re)indexed.
+        """
+        with self._lock:
+            self._load()
+            if start > len(self._fingerprints):
+                raise ValueError(f"index holds {len(self._fingerprints)} messages, cannot sync from {start}")
+            previous = self._fingerprints[start - 1] if start else 0
+            fingerprints = prefix_fingerprints(history, previous)
+            keep = start + unchanged_prefix(self._fingerprints[start:], fingerprints)
+
+            records = []
+            if keep < len(self._terms):
+                self._truncate(keep)
+                records.append({"truncate": keep})
+            for message_id in range(keep, start + len(history)):
+                message = history[message_id - start]
+                fingerprint = fingerprints[message_id - start]
+                terms = dict(term_counts(str(message.get("content", ""))))
+                self._add(message_id, fingerprint, terms)
+                records.append({"id": message_id, "fp": fingerprint, "tf": terms})
+            self._write_records(records)
+            return start + len(history) - keep
+
+    def latest_containing(self, words, limit: int, before: int) -> list[int]:
+        """
+        Ids of the `limit` most recent messages below `before` containing any of
+        `words` as a whole word, newest first. Like a `\\bword\\b` search, "scene"
+        also finds "scene's" and "'scene'", which tokenize as one token.
+        """
+        with self._lock:
+            self._load()
+            tokens = set(words)
+            for word in words:
+                tokens.update(self._word_tokens.get(word, ()))
+            found = set()
+            for token in tokens:
+                postings = self._postings.get(token, [])
+                # Postings are ascending, so the newest matches are at the end.
+                end = bisect.bisect_left(postings, before)
+                found.update(postings[max(0, end - limit):end])
+        return heapq.nlargest(limit, found)
+
+    def _bm25_scores(self, query_tokens: set[str], limit: int) -> dict:
+        """
+        BM25 scores of the messages that can still reach the top `limit`.
+        Terms are applied rarest first (MaxScore): once the remaining terms
+        together cannot lift an unseen message past the current top `limit`,
+        common terms only update existing candidates instead of walking their
+        (long) postings. The top results are exactly those of a full scan.
+        """
+        count = len(self._terms)
+        if not count:
+            return {}
+        average_length = self._total_length / count or 1.0
+        # norm(message) = k1 * (1 - b + b * length / average_length)
+        norm_base = BM25_K1 * (1.0 - BM25_B)
+        norm_per_token = BM25_K1 * BM25_B / average_length
+        lengths = self._lengths
+        terms = []
+        for token in query_tokens:
+            postings = self._postings.get(token)
+            if postings:
+                idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                terms.append((idf, token, postings))
+        terms.sort(key=lambda term: term[0], reverse=True)
+        # A term adds at most idf * (k1 + 1) to any message.
+        remaining_bound = sum(idf for idf, _token, _postings in terms) * (BM25_K1 + 1.0)
+
+        scores = {}
+        for idf, token, postings in terms:
+            matches = zip(postings, self._frequencies[token])
+            if len(scores) >= limit:
+                threshold = heapq.nlargest(limit, scores.values())[-1]
+                if threshold > remaining_bound:
+                    # Unseen messages can no longer make it, and neither can candidates too far behind.
+                    scores = {
+                        message_id: score for message_id, score in scores.items()
+                        if score + remaining_bound >= threshold
+                    }
+                    if len(scores) < len(postings):
+                        matches = [
+                            (message_id, self._terms[message_id][token])
+                            for message_id in scores if token in self._terms[message_id]
+                        ]
+            remaining_bound -= idf * (BM25_K1 + 1.0)
+            weight = idf * (BM25_K1 + 1.0)
+            get = scores.get
+            for message_id, tf in matches:
+                scores[message_id] = get(message_id, 0.0) + weight * tf / (tf + norm_base + norm_per_token * lengths[message_id])
+        return scores
+
+    def search(self, query_tokens: set[str], limit: int, scorer: str = "overlap") -> list[int]:
+        """
+        Returns the ids of the `limit` best messages for the query, best first
+        (ties go to the most recent). Messages sharing no token are skipped.
+        `scorer` is "overlap" (number of shared tokens) or "bm25".
+        """
+        if scorer not in SCORERS:
+            raise ValueError(f"Unknown memory scorer: {scorer}")
+        if limit <= 0:
+            return []
+        with self._lock:
+            self._load()
+            if scorer == "bm25":
+                scores = self._bm25_scores(query_tokens, limit)
+            else:
+                scores = {}
+                for token in query_tokens:
+                    for message_id in self._postings.get(token, ()):
+                        scores[message_id] = scores.get(message_id, 0) + 1
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [message_id for message_id, _score in best]
+
+
+_indexes = {}
+
+
+def _index_path(profile_name: str, history_dir: str) -> str:
+    safe_name = sanitize_profile_name(profile_name) or "session"
+    return os.path.join(history_dir, f"{safe_name}{INDEX_SUFFIX}")
+
+
+def get_message_index(profile_name: str, history_dir: str = "history") -> MessageIndex:
+    """Returns the process-wide index for a profile's conversation, loading it on first use."""
+    path = _index_path(profile_name, history_dir)
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = MessageIndex(path)
+    return index
+
+
+def apply_history_change(history_dir: str, profile_name: str, start: int, messages: list) -> None:
+    """
+    HistoryManager change listener: the conversation's messages from `start` on
+    are now `messages`. Indexes that track the history are synced with just
+    those; one that cannot follow goes back to a full sync (see `follow_history`).
+    """
+    index = _indexes.get(_index_path(profile_name, history_dir))
+    if index is not None and index.tracks_history:
+        try:
+            index.sync(messages, start)
+        except ValueError:
+            index.tracks_history = False
+
+
+def follow_history(indexes: list, history_length: int, load_history) -> None:
+    """
+    Makes sure each index (a MessageIndex or VectorMemoryIndex) describes the
+    stored conversation of `history_length` messages. Tracking indexes are
+    already current; the others are synced once with `load_history()` (the
+    full history) and then follow changes through `apply_history_change`.
+    """
+    stale = [index for index in indexes if index is not None and (not index.tracks_history or len(index) != history_length)]
+    if not stale:
+        return
+    history = load_history()
+    for index in stale:
+        index.sync(history)
+        index.tracks_history = True
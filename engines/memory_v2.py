@@ -3,25 +3,89 @@ Enhanced persistent memory management for conversation history.
 Handles per-profile history storage, metadata (timestamps, mood), and history truncation.
 """
 
-import json
-import re
+import atexit
+import copy
 import os
 import threading
+import time
 from datetime import datetime
-from engines.utilities import sanitize_profile_name, save_json_atomic
+from engines.config import get_setting
+from engines.history_archive import HistoryArchive
+from engines.history_storage import create_history_storage, default_metadata
+from engines.utilities import sanitize_profile_name
+
+def _now_stamp() -> str:
+    return datetime.now().strftime("%Y-%m-%d | %H:%M:%S")
+
+
+def _copy_message(msg: dict) -> dict:
+    """Copies a message deep enough that callers can edit content/alternatives safely."""
+    return {key: list(val) if isinstance(val, list) else val for key, val in msg.items()}
+
+
+def _archived_count(metadata: dict) -> int:
+    """Number of leading messages that live in archive segments rather than the history file."""
+    return int(metadata.get("archived_count", 0) or 0)
+
+
+def _visible_count(metadata: dict, stored_count: int) -> int:
+    """Number of stored live messages on the current branch; anything past the head was rewound away."""
+    head = metadata.get("head")
+    return stored_count if head is None else min(int(head), stored_count)
+
 
 class HistoryManager:
     """
-    Manages loading, saving, and truncation of conversation history.
-    Thread-safe writes to prevent concurrent modification corruption.
+    Manages loading, saving, and truncation of conversation history through a
+    storage backend (see engines.history_storage). Thread-safe writes; parsed data
+    is cached per file and revalidated on read, and callers always receive copies.
+    Rewinds only move the `head` pointer, so abandoned messages stay restorable
+    as branches. With `history_write_behind`, writes are batched by a background
+    flusher and `history_fsync` ("always", "flush", "never") picks when they are fsynced.
     """
     REWIND_MEMORY_CORE_RESET_THRESHOLD = 15
+    # Archive only once this many summarized messages have piled up, and always
+    # keep at least ARCHIVE_KEEP_LIVE messages in the live history.
+    ARCHIVE_MIN_SEGMENT = 50
+    ARCHIVE_KEEP_LIVE = 2
 
-    def __init__(self, history_dir: str = "history"):
+    def __init__(self, history_dir: str = "history", storage_mode: str | None = None,
+                 write_behind: bool | None = None):
         self.history_dir = history_dir
         self._ensure_history_dir()
         self._write_locks = {}
         self._lock_manager = threading.Lock()
+        if storage_mode is None:
+            storage_mode = get_setting("history_storage", "json")
+        self.storage = create_history_storage(storage_mode, history_dir)
+        self.archive = HistoryArchive(history_dir)
+        self._cache = {}
+
+        if write_behind is None:
+            write_behind = get_setting("history_write_behind", False)
+        self.write_behind = bool(write_behind)
+        self.write_delay = float(get_setting("history_write_delay", 0.5))
+        self.fsync_policy = get_setting("history_fsync", "flush")
+        self._pending = {}
+        self._pending_cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._change_listeners = []
+
+    def add_change_listener(self, listener) -> None:
+        """
+        Registers `listener(history_dir, profile_name, start, messages)`, called
+        after every change to a conversation: its messages from number `start`
+        on are now `messages` (rewinds pass none).
+        """
+        self._change_listeners.append(listener)
+
+    def _notify_change(self, profile_name: str, start: int, messages: list) -> None:
+        for listener in self._change_listeners:
+            try:
+                listener(self.history_dir, profile_name, start, messages)
+            except Exception as e:
+                print(f"[ERROR] History change listener failed for {profile_name}: {e}")
 
     def _ensure_history_dir(self) -> None:
         """Ensures the history directory exists on the filesystem."""
@@ -29,9 +93,8 @@ class HistoryManager:
             os.makedirs(self.history_dir)
 
     def _get_filename(self, profile_name: str) -> str:
-        """Generates a safe filename for the history JSON file."""
-        safe_name = sanitize_profile_name(profile_name) or "session"
-        return os.path.join(self.history_dir, f"{safe_name}_history.json")
+        """Returns the primary history file path for the active storage mode."""
+        return self.storage.get_path(profile_name)
 
     def _get_profile_lock(self, profile_name: str) -> threading.Lock:
         """Get or create a per-profile lock for thread-safe writes."""
@@ -40,15 +103,187 @@ class HistoryManager:
                 self._write_locks[profile_name] = threading.Lock()
             return self._write_locks[profile_name]
 
+    def _get_cached(self, profile_name: str, load: bool = True) -> dict | None:
+        """
+        Returns the cached (uncopied) data for a profile, re-reading storage only
+        when the backing files changed. Returns None if nothing is stored, or
+        (with `load=False`) if the cache holds no valid entry.
+        """
+        key = self.storage.cache_key(profile_name)
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Not flushed yet: the in-memory state is the truth.
+            return pending["data"]
+        signature = self.storage.signature(profile_name)
+        if signature is None:
+            self._cache.pop(key, None)
+            return None
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        if not load:
+            return None
+
+        data = self.storage.read(profile_name)
+        if data is None:
+            self._cache.pop(key, None)
+            return None
+        # Stamp with the signature taken *before* the read: a concurrent external
+        # write then shows up as a mismatch on the next read instead of being masked.
+        self._cache[key] = (signature, data)
+        return data
+
+    def _store_cached(self, profile_name: str, data: dict | None, written: bool) -> None:
+        """
+        Refreshes the cache after a write (must be called with the profile lock held).
+        `data=None` means the write bypassed the cache, so the entry is dropped.
+        """
+        key = self.storage.cache_key(profile_name)
+        signature = self.storage.signature(profile_name) if written and data is not None else None
+        if signature is None:
+            self._cache.pop(key, None)
+        else:
+            self._cache[key] = (signature, data)
+
+    def invalidate_cache(self, profile_name: str | None = None) -> None:
+        """Drops cached data for one profile (or all), forcing the next read to hit storage."""
+        if profile_name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(self.storage.cache_key(profile_name), None)
+
+    def _persist(self, profile_name: str, data: dict | None, write, on_persisted=None) -> bool:
+        """
+        Persists a mutation (must be called with the profile lock held).
+        Synchronously runs `write()` and refreshes the cache, or, with write-behind,
+        queues `data` for the flusher. `on_persisted` runs once the data is on disk.
+        """
+        if not self.write_behind:
+            written = write()
+            self._store_cached(profile_name, data, written)
+            if written and on_persisted is not None:
+                on_persisted()
+            return written
+
+        key = self.storage.cache_key(profile_name)
+        with self._pending_cond:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = {"profile": profile_name, "callbacks": [], "due": time.monotonic() + self.write_delay}
+                self._pending[key] = entry
+            entry["data"] = data
+            if on_persisted is not None:
+                entry["callbacks"].append(on_persisted)
+            self._start_flusher()
+            self._pending_cond.notify()
+        return True
+
+    def _start_flusher(self) -> None:
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flusher_loop, name="history-flusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _flusher_loop(self) -> None:
+        while True:
+            with self._pending_cond:
+                now = time.monotonic()
+                due = [key for key, entry in self._pending.items() if entry["due"] <= now]
+                if not due:
+                    next_due = min((entry["due"] for entry in self._pending.values()), default=None)
+                    self._pending_cond.wait(None if next_due is None else max(0.0, next_due - now))
+                    continue
+            for key in due:
+                try:
+                    self._flush_key(key, fsync=self.fsync_policy == "always")
+                except Exception as e:
+                    # A failing callback must not take down the only flusher thread.
+                    print(f"[ERROR] History flush failed: {e}")
+
+    def _flush_key(self, key: str, fsync: bool) -> bool:
+        """Writes one profile's pending state; it stays pending (and retried) if the write fails."""
+        with self._flush_lock:
+            with self._pending_cond:
+                entry = self._pending.get(key)
+                if entry is None:
+                    return True
+                profile_name, data, callbacks = entry["profile"], entry["data"], entry["callbacks"]
+                entry["callbacks"] = []
+
+            cached = self._cache.get(key)
+            stored_history = None
+            if cached is not None and cached[0] == self.storage.signature(profile_name):
+                stored_history = cached[1]["history"]
+            try:
+                written = self.storage.write(profile_name, data, stored_history=stored_history)
+                if written and fsync:
+                    self.storage.sync(profile_name)
+            except Exception as e:
+                print(f"[ERROR] Failed to write history for {profile_name}: {e}")
+                written = False
+
+            with self._pending_cond:
+                entry = self._pending.get(key)
+                if not written:
+                    if entry is not None:
+                        entry["callbacks"][:0] = callbacks
+                        entry["due"] = time.monotonic() + max(self.write_delay, 1.0)
+                    return False
+                self._store_cached(profile_name, data, True)
+                if entry is not None and entry["data"] is data:
+                    del self._pending[key]
+        for callback in callbacks:
+            callback()
+        return True
+
+    def flush(self, profile_name: str | None = None) -> bool:
+        """
+        Persists pending write-behind state now (for one profile or all).
+        A no-op without write-behind. Returns False if any write failed.
+        """
+        if profile_name is None:
+            with self._pending_cond:
+                keys = list(self._pending)
+        else:
+            keys = [self.storage.cache_key(profile_name)]
+        fsync = self.fsync_policy in ("always", "flush")
+        return all([self._flush_key(key, fsync=fsync) for key in keys])
+
     def has_history(self, profile_name: str) -> bool:
         """Checks if the history file exists for a given profile."""
-        filename = self._get_filename(profile_name)
-        return os.path.exists(filename)
+        return self.storage.cache_key(profile_name) in self._pending or self.storage.exists(profile_name)
+
+    def list_profiles(self) -> list[str]:
+        """Lists the (sanitized) profile names that have stored history."""
+        with self._pending_cond:
+            pending = {sanitize_profile_name(entry["profile"]) or "session" for entry in self._pending.values()}
+        return sorted(set(self.storage.list_profiles()) | pending)
+
+    def _read_for_update(self, profile_name: str) -> tuple[dict, list | None]:
+        """
+        Returns (metadata copy safe to edit, stored history) for a write.
+        History is None only for indexed backends with a cold cache; the caller
+        then lets the backend apply the change without loading every message.
+        """
+        data = self._get_cached(profile_name, load=not self.storage.indexed or self.write_behind)
+        if data is None and self.storage.indexed and not self.write_behind:
+            return self.storage.read_metadata(profile_name) or default_metadata(), None
+        if data is None:
+            return default_metadata(), []
+        return copy.deepcopy(data["metadata"]), data["history"]
 
     def get_history_length(self, profile_name: str) -> int:
         """Returns the number of messages in the history."""
-        data = self.get_full_data(profile_name)
-        return len(data.get("history", [])) if data else 0
+        data = self._get_cached(profile_name, load=False)
+        if data is None:
+            count = self.storage.count(profile_name)
+            metadata = self.storage.read_metadata(profile_name) if count is not None else None
+            if metadata is not None:
+                return _archived_count(metadata) + _visible_count(metadata, count)
+            data = self._get_cached(profile_name)
+        if data is None:
+            return 0
+        return _archived_count(data["metadata"]) + _visible_count(data["metadata"], len(data["history"]))
 
     def save_history(self, profile_name: str, history: list, mood_score: int = 0,
                      current_scene: str = "Unknown Location", memory_core: str = "",
@@ -66,82 +301,136 @@ class HistoryManager:
         """
         lock = self._get_profile_lock(profile_name)
         with lock:
-            filename = self._get_filename(profile_name)
-            now = datetime.now()
-            current_time = now.strftime("%Y-%m-%d | %H:%M:%S")
-
             data_to_save = {
                 "metadata": {
-                    "last_interaction": current_time,
+                    "last_interaction": _now_stamp(),
                     "mood_score": mood_score,
                     "current_scene": current_scene,
                     "memory_core": memory_core,
                     "last_summarized_index": last_summarized_index
                 },
-                "history": history
+                "history": [_copy_message(msg) for msg in history]
             }
 
-            save_json_atomic(filename, data_to_save)
+            stored = self._get_cached(profile_name)
+            stored_history = stored["history"] if stored else None
+            # `history` is the whole conversation, so earlier archive and branch segments are superseded.
+            old_segments = self._owned_segments(stored["metadata"]) if stored else []
+            if self._persist(
+                profile_name,
+                data_to_save,
+                lambda: self.storage.write(profile_name, data_to_save, stored_history=stored_history),
+                on_persisted=(lambda: self.archive.delete(old_segments)) if old_segments else None,
+            ):
+                self._notify_change(profile_name, 0, data_to_save["history"])
+
+    def append_messages(self, profile_name: str, messages: list, metadata: dict | None = None) -> None:
+        """
+        Appends messages to the stored history without rewriting earlier ones (thread-safe).
+        Metadata fields in `metadata` are merged into the stored metadata; every
+        other field (memory core, narrative state, ...) is preserved.
+
+        Args:
+            profile_name (str): The name of the character.
+            messages (list): Message dictionaries to append, in order.
+            metadata (dict, optional): Metadata fields to update alongside the append.
+        """
+        lock = self._get_profile_lock(profile_name)
+        with lock:
+            new_messages = [_copy_message(msg) for msg in messages]
+            stored_metadata, stored_history = self._read_for_update(profile_name)
+            stored_count = len(stored_history) if stored_history is not None else self.storage.count(profile_name)
+            keep_count = self._settle_head(profile_name, stored_metadata, stored_history, stored_count)
+            start = _archived_count(stored_metadata) + keep_count
+            stored_metadata.update(metadata or {})
+            stored_metadata["last_interaction"] = _now_stamp()
+            data = None
+            if stored_history is not None:
+                data = {"metadata": stored_metadata, "history": stored_history[:keep_count] + new_messages}
+            # Appending after a rewind forks the log: everything past the head is replaced.
+            if self._persist(
+                profile_name,
+                data,
+                lambda: self.storage.commit(profile_name, keep_count, new_messages, stored_metadata, data=data)
+                if keep_count < stored_count
+                else self.storage.append(profile_name, new_messages, stored_metadata, data=data),
+            ):
+                self._notify_change(profile_name, start, new_messages)
+
+    def commit_turn(self, profile_name: str, messages: list | None = None, replace_last: dict | None = None,
+                    metadata: dict | None = None) -> bool:
+        """
+        Persists everything a turn changes as one atomic storage write (thread-safe).
+        Metadata fields in `metadata` (mood, scene, narrative_state, last_turn_metrics,
+        memory core, ...) are merged into the stored metadata; other fields are preserved.
+
+        Args:
+            profile_name (str): The name of the character.
+            messages (list, optional): Message dictionaries to append, in order.
+            replace_last (dict, optional): Replacement for the last stored message
+                (regeneration), written before `messages`.
+            metadata (dict, optional): Metadata fields to update.
+
+        Returns:
+            bool: True if the write succeeded.
+        """
+        lock = self._get_profile_lock(profile_name)
+        with lock:
+            new_messages = [_copy_message(msg) for msg in messages or []]
+            stored_metadata, history = self._read_for_update(profile_name)
+            stored_count = len(history) if history is not None else self.storage.count(profile_name)
+            keep_count = self._settle_head(profile_name, stored_metadata, history, stored_count)
+            if replace_last is not None:
+                keep_count = max(0, keep_count - 1)
+                new_messages.insert(0, _copy_message(replace_last))
+            start = _archived_count(stored_metadata) + keep_count
+
+            stored_metadata.update(metadata or {})
+            stored_metadata["last_interaction"] = _now_stamp()
+            data = None
+            if history is not None:
+                data = {"metadata": stored_metadata, "history": history[:keep_count] + new_messages}
+            written = self._persist(
+                profile_name,
+                data,
+                lambda: self.storage.commit(profile_name, keep_count, new_messages, stored_metadata, data=data),
+            )
+            if written:
+                self._notify_change(profile_name, start, new_messages)
+            return written
 
     def get_full_data(self, profile_name: str) -> dict:
         """
-        Loads the full JSON structure from the history file.
+        Loads the full `{metadata, history}` structure for a profile.
         Handles transition from the old format (list of messages).
         """
-        filename = self._get_filename(profile_name)
-        default_data = {
-            "metadata": {
-                "last_interaction": None,
-                "mood_score": 0,
-                "current_scene": "Unknown Location",
-                "memory_core": "",
-                "last_summarized_index": 0,
-                "narrative_state": {},
-                "last_turn_metrics": {},
-            },
-            "history": []
+        data = self._get_cached(profile_name)
+        if data is None:
+            return {"metadata": default_metadata(), "history": []}
+        live = data["history"][:_visible_count(data["metadata"], len(data["history"]))]
+        return {
+            "metadata": copy.deepcopy(data["metadata"]),
+            "history": self._read_archived(data["metadata"], 0) + [_copy_message(msg) for msg in live],
         }
 
-        if not os.path.exists(filename):
-            return default_data
-
-        try:
-            with open(filename, "r", encoding="UTF-8") as f:
-                data = json.load(f)
-
-                # Handle old format (list)
-                if isinstance(data, list):
-                    # Try to find the timestamp in the last message (legacy behavior)
-                    last_time = None
-                    for msg in reversed(data):
-                        if msg.get("role") == "system" and "Timestamp: " in msg.get("content", ""):
-                            last_time = msg["content"].replace("Timestamp: ", "").strip()
-                            break
-
-                    return {
-                        "metadata": {
-                            "last_interaction": last_time,
-                            "mood_score": 0,
-                            "current_scene": "Unknown Location",
-                            "memory_core": "",
-                            "last_summarized_index": 0,
-                            "narrative_state": {},
-                            "last_turn_metrics": {},
-                        },
-                        "history": [m for m in data if m.get("role") != "system"]
-                    }
-
-                # Ensure all metadata fields exist
-                if "metadata" not in data:
-                    data["metadata"] = default_data["metadata"]
-                else:
-                    for key, val in default_data["metadata"].items():
-                        if key not in data["metadata"]:
-                            data["metadata"][key] = val
-
-                return data
-        except (json.JSONDecodeError, Exception):
-            return default_data
+    def _read_archived(self, metadata: dict, start: int, end: int | None = None) -> list:
+        """Returns copies of archived messages with global indexes in [start, end)."""
+        archived = _archived_count(metadata)
+        end = archived if end is None else min(end, archived)
+        if start >= end:
+            return []
+        segments = metadata.get("archive_segments", [])
+        return [_copy_message(msg) for msg in self.archive.read_range(segments, start, end)]
+
+    def get_metadata(self, profile_name: str) -> dict:
+        """Returns a copy of the metadata block without copying the history."""
+        data = self._get_cached(profile_name, load=False)
+        if data is None:
+            metadata = self.storage.read_metadata(profile_name)
+            if metadata is not None:
+                return metadata
+            data = self._get_cached(profile_name)
+        return copy.deepcopy(data["metadata"]) if data else default_metadata()
 
     def load_history(self, profile_name: str, limit: int = None) -> list:
         """
@@ -154,20 +443,73 @@ class HistoryManager:
         Returns:
             list: List of loaded messages.
         """
-        data = self.get_full_data(profile_name)
-        history = data.get("history", [])
-
-        if limit and len(history) > limit:
+        if limit:
+            # Cold cache: try a tail-only read before parsing the whole history.
+            data = self._get_cached(profile_name, load=False)
+            if data is None:
+                metadata = self.storage.read_metadata(profile_name)
+                count = self.storage.count(profile_name) if metadata is not None else None
+                if count is not None:
+                    hidden = count - _visible_count(metadata, count)
+                    tail = self.storage.read_tail(profile_name, limit + hidden)
+                    if tail is not None:
+                        tail = tail[:len(tail) - hidden]
+                        if len(tail) >= limit or not _archived_count(metadata):
+                            return tail
+        data = self._get_cached(profile_name)
+        if data is None:
+            return []
+        history = data["history"][:_visible_count(data["metadata"], len(data["history"]))]
+
+        if limit and len(history) >= limit:
             # Truncate to the last 'limit' messages
-            return history[-limit:]
-        return history
+            return [_copy_message(msg) for msg in history[-limit:]]
+        # Reaching past the live part: pull in archived messages (lazily, only the needed segments).
+        total = _archived_count(data["metadata"]) + len(history)
+        start = max(0, total - limit) if limit else 0
+        return self._read_archived(data["metadata"], start) + [_copy_message(msg) for msg in history]
+
+    def load_messages(self, profile_name: str, message_ids: list) -> list:
+        """
+        Loads copies of the messages with the given numbers (archived ones
+        included), in the order given; numbers outside the conversation are
+        skipped. On a cold cache only those messages are read, if the backend can.
+        """
+        data = self._get_cached(profile_name, load=False)
+        live = None
+        if data is None:
+            metadata = self.storage.read_metadata(profile_name)
+            count = self.storage.count(profile_name) if metadata is not None else None
+            if count is not None:
+                archived = _archived_count(metadata)
+                visible = _visible_count(metadata, count)
+                positions = sorted({i - archived for i in message_ids if archived <= i < archived + visible})
+                messages = self.storage.read_messages(profile_name, positions)
+                if messages is not None:
+                    live = dict(zip(positions, messages))
+        if live is None:
+            data = self._get_cached(profile_name)
+            if data is None:
+                return []
+            metadata = data["metadata"]
+            archived = _archived_count(metadata)
+            history = data["history"]
+            visible = _visible_count(metadata, len(history))
+            live = {i - archived: history[i - archived] for i in message_ids if archived <= i < archived + visible}
+
+        messages = []
+        for message_id in message_ids:
+            if 0 <= message_id < archived:
+                messages.extend(self._read_archived(metadata, message_id, message_id + 1))
+            elif message_id - archived in live:
+                messages.append(_copy_message(live[message_id - archived]))
+        return messages
 
     def get_last_timestamp(self, profile_name: str) -> datetime | None:
         """
         Retrieves the last interaction timestamp for mood decay.
         """
-        data = self.get_full_data(profile_name)
-        time_str = data.get("metadata", {}).get("last_interaction")
+        time_str = self.get_metadata(profile_name).get("last_interaction")
         if time_str:
             try:
                 return datetime.strptime(time_str, "%Y-%m-%d | %H:%M:%S")
@@ -189,46 +531,222 @@ class HistoryManager:
 
     def get_memory_core(self, profile_name: str) -> str:
         """Retrieves the consolidated rolling summary for a profile."""
-        data = self.get_full_data(profile_name)
-        return data.get("metadata", {}).get("memory_core", "")
+        return self.get_metadata(profile_name).get("memory_core", "")
 
     def get_last_summarized_index(self, profile_name: str) -> int:
         """Retrieves the index of the last summarized message."""
-        data = self.get_full_data(profile_name)
-        return data.get("metadata", {}).get("last_summarized_index", 0)
+        return self.get_metadata(profile_name).get("last_summarized_index", 0)
 
     def update_memory_core(self, profile_name: str, summary: str, last_index: int) -> None:
         """Updates the Memory Core and its last summarized index without losing history (thread-safe)."""
         lock = self._get_profile_lock(profile_name)
         with lock:
-            data = self.get_full_data(profile_name)
-            data["metadata"]["memory_core"] = summary
-            data["metadata"]["last_summarized_index"] = last_index
+            metadata, history = self._read_for_update(profile_name)
+            metadata["memory_core"] = summary
+            metadata["last_summarized_index"] = last_index
+            if not self._archive_summarized(profile_name, metadata, history):
+                self._write_metadata(profile_name, metadata, history)
 
-            filename = self._get_filename(profile_name)
-            save_json_atomic(filename, data)
+    def archive_summarized_history(self, profile_name: str) -> int:
+        """
+        Moves messages already covered by the Memory Core into a compressed archive
+        segment (thread-safe). This also runs automatically whenever the Memory Core advances.
+
+        Returns:
+            int: Total number of archived messages afterwards.
+        """
+        lock = self._get_profile_lock(profile_name)
+        with lock:
+            metadata, history = self._read_for_update(profile_name)
+            self._archive_summarized(profile_name, metadata, history)
+            return _archived_count(metadata)
+
+    def _archive_summarized(self, profile_name: str, metadata: dict, history: list | None) -> bool:
+        """
+        Writes `metadata` together with the archival of every summarized live message,
+        as one history write. Returns False (writing nothing) if there is not enough
+        to archive; `metadata` is updated in place when archival happens.
+        """
+        if not get_setting("history_archive", True):
+            return False
+        archived = _archived_count(metadata)
+        summarized = int(metadata.get("last_summarized_index", 0) or 0)
+        stored_count = len(history) if history is not None else self.storage.count(profile_name) or 0
+        live_count = _visible_count(metadata, stored_count)
+        move = min(summarized - archived, live_count - self.ARCHIVE_KEEP_LIVE)
+        if move < self.ARCHIVE_MIN_SEGMENT:
+            return False
+
+        if history is None:
+            stored = self._get_cached(profile_name)
+            if stored is None:
+                return False
+            history = stored["history"]
+        segment = self.archive.write_segment(profile_name, archived, history[:move])
+        if segment is None:
+            return False
+
+        metadata["archive_segments"] = list(metadata.get("archive_segments", [])) + [segment]
+        metadata["archived_count"] = archived + move
+        if metadata.get("head") is not None:
+            metadata["head"] = live_count - move
+        for branch in metadata.get("branches", []):
+            if "position" in branch:
+                branch["position"] -= move
+        data = {"metadata": metadata, "history": history[move:]}
+        written = self._persist(
+            profile_name, data, lambda: self.storage.write(profile_name, data, stored_history=history)
+        )
+        if not written:
+            self.archive.delete([segment])
+        return written
+
+    def _write_metadata(self, profile_name: str, metadata: dict, history: list | None) -> None:
+        data = None if history is None else {"metadata": metadata, "history": history}
+        self._persist(profile_name, data, lambda: self.storage.write_metadata(profile_name, metadata, data=data))
 
     def get_narrative_state(self, profile_name: str) -> dict:
         """Retrieves persisted narrative state for pipeline-based generation."""
-        data = self.get_full_data(profile_name)
-        return data.get("metadata", {}).get("narrative_state", {})
+        return self.get_metadata(profile_name).get("narrative_state", {})
 
     def update_narrative_state(self, profile_name: str, narrative_state: dict, turn_metrics: dict | None = None) -> None:
         """Persists narrative state and optional turn metrics without touching history messages (thread-safe)."""
         lock = self._get_profile_lock(profile_name)
         with lock:
-            data = self.get_full_data(profile_name)
-            metadata = data.setdefault("metadata", {})
+            metadata, history = self._read_for_update(profile_name)
             metadata["narrative_state"] = narrative_state or {}
             if turn_metrics is not None:
                 metadata["last_turn_metrics"] = turn_metrics
+            self._write_metadata(profile_name, metadata, history)
+
+    def select_alternative(self, profile_name: str, index: int) -> dict | None:
+        """
+        Makes alternative `index` the visible content of the last assistant message (thread-safe).
+
+        Returns:
+            dict | None: A copy of the updated message, or None if the last message
+            is not an assistant reply or has no alternative at `index`.
+        """
+        lock = self._get_profile_lock(profile_name)
+        with lock:
+            metadata, history = self._read_for_update(profile_name)
+            stored_count = len(history) if history is not None else self.storage.count(profile_name)
+            position = _visible_count(metadata, stored_count) - 1
+            tail = self._live_slice(profile_name, history, stored_count, position, position + 1) if position >= 0 else []
+            if not tail or tail[-1].get("role") != "assistant":
+                return None
+
+            message = _copy_message(tail[-1])
+            alternatives = message.get("alternatives") or []
+            if not 0 <= index < len(alternatives):
+                return None
+            message["selected_index"] = index
+            message["content"] = alternatives[index]
+
+            data = None
+            if history is not None:
+                data = {"metadata": metadata, "history": history[:position] + [message] + history[position + 1:]}
+            if self._persist(
+                profile_name,
+                data,
+                lambda: self.storage.update_message(profile_name, position, message, metadata, data=data),
+            ):
+                self._notify_change(profile_name, _archived_count(metadata) + position, [message])
+            return _copy_message(message)
+
+    def _owned_segments(self, metadata: dict) -> list:
+        """Archive and branch segments referenced by `metadata`."""
+        branches = [branch for branch in metadata.get("branches", []) if "file" in branch]
+        return list(metadata.get("archive_segments", [])) + branches
+
+    def _live_slice(self, profile_name: str, history: list | None, stored_count: int, start: int, end: int) -> list:
+        """Returns stored live messages [start, end) (uncopied); reads only the tail if `history` is not loaded."""
+        if start >= end:
+            return []
+        if history is None:
+            tail = self.storage.read_tail(profile_name, stored_count - start)
+            if tail is not None and len(tail) == stored_count - start:
+                return tail[:end - start]
+            stored = self._get_cached(profile_name)
+            history = stored["history"] if stored else []
+        return history[start:end]
+
+    def _new_branch(self, metadata: dict, fork_at: int, count: int, **location) -> dict:
+        """Records an abandoned branch of `count` messages continuing from message `fork_at`."""
+        branch_id = int(metadata.get("next_branch_id", 1) or 1)
+        branch = {"id": branch_id, "fork_at": fork_at, "count": count, "created": _now_stamp(), **location}
+        metadata["next_branch_id"] = branch_id + 1
+        metadata["branches"] = list(metadata.get("branches", [])) + [branch]
+        return branch
+
+    def _store_branch(self, profile_name: str, metadata: dict, branch: dict, messages: list) -> None:
+        """Moves a branch's messages into a segment; the branch is dropped if that fails."""
+        segment = self.archive.write_segment(profile_name, branch["fork_at"], messages, label=f"branch{branch['id']}")
+        if segment is None:
+            metadata["branches"] = [other for other in metadata["branches"] if other is not branch]
+            return
+        branch.pop("position", None)
+        branch["file"] = segment["file"]
+
+    def _settle_head(self, profile_name: str, metadata: dict, history: list | None, stored_count: int) -> int:
+        """
+        Prepares a write that replaces everything past the head: branches still
+        living in the log are moved into segments and the head is cleared from
+        `metadata`. Returns the number of stored live messages to keep.
+        """
+        keep_count = _visible_count(metadata, stored_count)
+        metadata.pop("head", None)
+        in_log = [branch for branch in metadata.get("branches", []) if "position" in branch]
+        if in_log:
+            tail = self._live_slice(profile_name, history, stored_count, keep_count, stored_count)
+            for branch in in_log:
+                offset = branch["position"] - keep_count
+                self._store_branch(profile_name, metadata, branch, tail[offset:offset + branch["count"]])
+        return keep_count
+
+    def _rebase_memory_core(self, metadata: dict, keep_count: int, removed_count: int) -> None:
+        """Resets or clamps the Memory Core when `removed_count` messages after `keep_count` leave the branch."""
+        old_last_summarized = int(metadata.get("last_summarized_index", 0) or 0)
+        if removed_count >= self.REWIND_MEMORY_CORE_RESET_THRESHOLD or keep_count < old_last_summarized:
+            metadata["memory_core"] = ""
+            metadata["last_summarized_index"] = 0
+        else:
+            metadata["last_summarized_index"] = min(old_last_summarized, keep_count)
 
-            filename = self._get_filename(profile_name)
-            save_json_atomic(filename, data)
+    def _replace_tail(self, profile_name: str, metadata: dict, history: list | None, keep_count: int,
+                      messages: list, stale_segments: list) -> bool:
+        """
+        Writes the conversation as its first `keep_count` messages followed by
+        `messages` (the head must already be settled). `stale_segments` are
+        deleted once the write has landed.
+        """
+        archived = _archived_count(metadata)
+        if keep_count >= archived:
+            live_keep = keep_count - archived
+            data = None if history is None else {"metadata": metadata, "history": history[:live_keep] + messages}
+            return self._persist(
+                profile_name,
+                data,
+                lambda: self.storage.commit(profile_name, live_keep, messages, metadata, data=data),
+                on_persisted=(lambda: self.archive.delete(stale_segments)) if stale_segments else None,
+            )
+        # Replacing archived messages: the surviving ones become live again.
+        old_segments = metadata.pop("archive_segments", [])
+        restored = self.archive.read_range(old_segments, 0, keep_count)
+        metadata["archived_count"] = 0
+        data = {"metadata": metadata, "history": [_copy_message(msg) for msg in restored] + messages}
+        return self._persist(
+            profile_name,
+            data,
+            lambda: self.storage.write(profile_name, data, stored_history=history),
+            on_persisted=lambda: self.archive.delete(old_segments + stale_segments),
+        )
 
     def rewind_history(self, profile_name: str, keep_count: int) -> tuple[int, int]:
         """
-        Truncates conversation history to the first `keep_count` messages.
+        Rewinds conversation history to the first `keep_count` messages.
+        Within the live part this only moves the head; the rewound messages
+        are kept as an abandoned branch (see `list_branches`).
 
         Args:
             profile_name (str): The profile whose history should be rewound.
@@ -240,31 +758,118 @@ class HistoryManager:
         if keep_count < 0:
             raise ValueError("keep_count must be 0 or greater")
 
-        data = self.get_full_data(profile_name)
-        history = data.get("history", [])
-        original_count = len(history)
-        removed_count = original_count - keep_count
+        lock = self._get_profile_lock(profile_name)
+        with lock:
+            metadata, history = self._read_for_update(profile_name)
+            archived = _archived_count(metadata)
+            stored_count = len(history) if history is not None else self.storage.count(profile_name)
+            live_count = _visible_count(metadata, stored_count)
+            original_count = archived + live_count
+            removed_count = original_count - keep_count
+
+            if keep_count > original_count:
+                raise ValueError("keep_count cannot exceed history length")
+
+            self._rebase_memory_core(metadata, keep_count, removed_count)
+            metadata["last_interaction"] = _now_stamp()
+            if keep_count >= archived:
+                if removed_count:
+                    live_keep = keep_count - archived
+                    self._new_branch(metadata, keep_count, removed_count, position=live_keep)
+                    metadata["head"] = live_keep
+                self._write_metadata(profile_name, metadata, history)
+            else:
+                # Rewinding into the archive rewrites the history, so the branch is stored right away.
+                self._settle_head(profile_name, metadata, history, stored_count)
+                abandoned = self.archive.read_range(metadata.get("archive_segments", []), keep_count, archived)
+                abandoned += self._live_slice(profile_name, history, stored_count, 0, live_count)
+                branch = self._new_branch(metadata, keep_count, removed_count)
+                self._store_branch(profile_name, metadata, branch, abandoned)
+                self._replace_tail(profile_name, metadata, history, keep_count, [], [])
+            self._notify_change(profile_name, keep_count, [])
 
-        if keep_count > original_count:
-            raise ValueError("keep_count cannot exceed history length")
+        return original_count, keep_count
 
-        metadata = data.setdefault("metadata", {})
-        old_last_summarized = int(metadata.get("last_summarized_index", 0) or 0)
-        if removed_count >= self.REWIND_MEMORY_CORE_RESET_THRESHOLD or keep_count < old_last_summarized:
-            metadata["memory_core"] = ""
-            metadata["last_summarized_index"] = 0
-        else:
-            metadata["last_summarized_index"] = min(old_last_summarized, keep_count)
+    def list_branches(self, profile_name: str) -> list[dict]:
+        """
+        Lists the branches abandoned by rewinds, oldest first.
 
-        metadata["last_interaction"] = datetime.now().strftime("%Y-%m-%d | %H:%M:%S")
-        data["history"] = history[:keep_count]
+        Returns:
+            list[dict]: One dict per branch with `id`, `fork_at` (the message number
+            it continues from), `count`, `created` and `preview` (its first message).
+        """
+        data = self._get_cached(profile_name)
+        if data is None:
+            return []
+        branches = []
+        for branch in data["metadata"].get("branches", []):
+            if "position" in branch:
+                first = data["history"][branch["position"]:branch["position"] + 1]
+            else:
+                first = self.archive.read_segment(branch)[:1]
+            preview = " ".join(str(first[0].get("content", "")).split()) if first else ""
+            branches.append({
+                "id": branch["id"],
+                "fork_at": branch["fork_at"],
+                "count": branch["count"],
+                "created": branch.get("created", ""),
+                "preview": preview[:80],
+            })
+        return branches
+
+    def restore_branch(self, profile_name: str, branch_id: int) -> tuple[int, int]:
+        """
+        Makes an abandoned branch the current conversation again (thread-safe).
+        The messages it replaces are kept as a new branch, so switching back is always possible.
 
+        Args:
+            profile_name (str): The profile whose history should be switched.
+            branch_id (int): The `id` of a branch from `list_branches`.
+
+        Returns:
+            tuple[int, int]: (original_count, restored_count)
+        """
         lock = self._get_profile_lock(profile_name)
         with lock:
-            filename = self._get_filename(profile_name)
-            save_json_atomic(filename, data)
-
-        return original_count, keep_count
+            metadata, history = self._read_for_update(profile_name)
+            branch = next((b for b in metadata.get("branches", []) if b.get("id") == branch_id), None)
+            if branch is None:
+                raise ValueError(f"Unknown branch: {branch_id}")
+            archived = _archived_count(metadata)
+            stored_count = len(history) if history is not None else self.storage.count(profile_name)
+            live_count = _visible_count(metadata, stored_count)
+            original_count = archived + live_count
+            fork_at = int(branch["fork_at"])
+            if fork_at > original_count:
+                raise ValueError(
+                    f"Branch {branch_id} continues from message {fork_at}, "
+                    f"but the conversation only has {original_count} messages"
+                )
+
+            if "position" in branch:
+                start = branch["position"]
+                messages = self._live_slice(profile_name, history, stored_count, start, start + branch["count"])
+            else:
+                messages = self.archive.read_segment(branch)
+            if len(messages) != branch["count"]:
+                raise ValueError(f"Branch {branch_id} could not be read")
+            messages = [_copy_message(msg) for msg in messages]
+            metadata["branches"] = [other for other in metadata["branches"] if other is not branch]
+
+            self._settle_head(profile_name, metadata, history, stored_count)
+            replaced_count = original_count - fork_at
+            if replaced_count:
+                replaced = self._read_archived(metadata, fork_at)
+                replaced += self._live_slice(profile_name, history, stored_count, max(0, fork_at - archived), live_count)
+                self._store_branch(profile_name, metadata, self._new_branch(metadata, fork_at, replaced_count), replaced)
+
+            self._rebase_memory_core(metadata, fork_at, replaced_count)
+            metadata["last_interaction"] = _now_stamp()
+            stale_segments = [branch] if "file" in branch else []
+            if self._replace_tail(profile_name, metadata, history, fork_at, messages, stale_segments):
+                self._notify_change(profile_name, fork_at, messages)
+
+        return original_count, fork_at + len(messages)
 
 # Global instance for easy access across the application
 memory_manager = HistoryManager()
@@ -10,12 +10,13 @@ import os
 import re
 from datetime import datetime
 
-from engines.config import get_setting
+from engines.config import Settings, get_setting
+from engines.memory_index import MessageIndex, tokenize as _tokenize
 from engines.utilities import sanitize_profile_name
 
-
-def _tokenize(text: str) -> set[str]:
-    return {token for token in re.findall(r"[a-zA-Z0-9']+", text.lower()) if len(token) > 2}
+# Words that mark a message worth keeping in the episodic layer.
+EPISODIC_CUES = ("scene", "promise", "plan", "later", "remember", "quest", "goal")
+_EPISODIC_CUE_RE = re.compile(r"\b(" + "|".join(EPISODIC_CUES) + r")\b", flags=re.IGNORECASE)
 
 
 def _score_overlap(text: str, reference_tokens: set[str]) -> int:
@@ -24,21 +25,26 @@ def _score_overlap(text: str, reference_tokens: set[str]) -> int:
     return len(_tokenize(text) & reference_tokens)
 
 
-def get_pipeline_flags() -> dict:
+def get_pipeline_flags(settings: Settings | None = None) -> dict:
+    settings = settings or Settings.capture(get_setting)
     return {
-        "enabled": get_setting("overhaul_pipeline_enabled", False),
-        "instrumentation": get_setting("overhaul_instrumentation_enabled", False),
-        "state": get_setting("overhaul_state_enabled", False),
-        "memory": get_setting("overhaul_memory_enabled", False),
-        "planner": get_setting("overhaul_planner_enabled", False),
-        "candidates": get_setting("overhaul_candidates_enabled", False),
-        "critic": get_setting("overhaul_critic_enabled", False),
-        "candidate_count": max(1, int(get_setting("overhaul_candidate_count", 3))),
-        "style_profile": get_setting("overhaul_style_profile", "balanced"),
+        "enabled": settings.pipeline_enabled,
+        "instrumentation": settings.instrumentation_enabled,
+        "state": settings.state_enabled,
+        "memory": settings.memory_enabled,
+        "memory_scorer": settings.memory_scorer,
+        "vector_memory": settings.vector_memory_enabled,
+        "vector_embedder": settings.vector_memory_embedder,
+        "planner": settings.planner_enabled,
+        "candidates": settings.candidates_enabled,
+        "critic": settings.critic_enabled,
+        "candidate_count": settings.candidate_count,
+        "style_profile": settings.style_profile,
     }
 
 
-def build_canonical_state(profile: dict, metadata: dict, user_input: str) -> dict:
+def build_canonical_state(profile: dict, metadata: dict, user_input: str, settings: Settings | None = None) -> dict:
+    settings = settings or Settings.capture(get_setting)
     narrative_state = metadata.get("narrative_state") or {}
     unresolved_threads = narrative_state.get("unresolved_threads", [])
     return {
@@ -56,47 +62,126 @@ def build_canonical_state(profile: dict, metadata: dict, user_input: str) -> dic
             "last_emotional_shift": narrative_state.get("last_emotional_shift", "steady"),
             "unresolved_threads": unresolved_threads[-8:],
             "last_user_intent": user_input[:180],
-            "style_profile": get_setting("overhaul_style_profile", "balanced"),
+            "style_profile": settings.style_profile,
         },
     }
 
 
-def retrieve_memory_stack(full_history: list, user_input: str, short_limit: int = 12, episodic_limit: int = 6, semantic_limit: int = 6) -> dict:
+def retrieve_memory_stack(full_history: list, user_input: str, short_limit: int = 12, episodic_limit: int = 6, semantic_limit: int = 6,
+                          index: MessageIndex | None = None, scorer: str = "overlap", vector_index=None) -> dict:
+    """
+    Builds the short-term / episodic / semantic memory layers for a turn.
+    With an `index` (see engines.memory_index) semantic retrieval only touches the
+    postings of the query tokens. `scorer` is "overlap" or "bm25"; overlap without
+    an index scores every message directly, bm25 indexes the history in memory.
+    A `vector_index` (see engines.vector_memory) fills the episodic layer with the
+    older messages closest to the input before falling back to keyword cues.
+    """
     history = full_history or []
     short_term = history[-short_limit:]
     remainder = history[:-short_limit] if len(history) > short_limit else []
     query_tokens = _tokenize(user_input)
 
-    semantic_pool = []
-    for index, msg in enumerate(history):
-        content = msg.get("content", "")
-        score = _score_overlap(content, query_tokens)
-        if score > 0:
-            semantic_pool.append((score, index, msg))
-    semantic_pool.sort(key=lambda row: (row[0], row[1]), reverse=True)
-    semantic_retrieval = [row[2] for row in semantic_pool[:semantic_limit]]
-
-    episodic = []
-    for msg in reversed(remainder):
-        content = msg.get("content", "")
-        if re.search(r"\b(scene|promise|plan|later|remember|quest|goal)\b", content, flags=re.IGNORECASE):
-            episodic.append(msg)
-        if len(episodic) >= episodic_limit:
+    if index is None and scorer != "overlap":
+        index = MessageIndex()
+    if index is not None:
+        index.sync(history)
+        semantic_ids = index.search(query_tokens, semantic_limit, scorer=scorer)
+        semantic_retrieval = [history[message_id] for message_id in semantic_ids]
+    else:
+        semantic_pool = []
+        for message_id, msg in enumerate(history):
+            content = msg.get("content", "")
+            score = _score_overlap(content, query_tokens)
+            if score > 0:
+                semantic_pool.append((score, message_id, msg))
+        semantic_pool.sort(key=lambda row: (row[0], row[1]), reverse=True)
+        semantic_retrieval = [row[2] for row in semantic_pool[:semantic_limit]]
+
+    episodic_ids = []
+    if vector_index is not None:
+        vector_index.sync(history)
+        episodic_ids = vector_index.search(user_input, episodic_limit, before=len(remainder))
+    for message_id in range(len(remainder) - 1, -1, -1):
+        if len(episodic_ids) >= episodic_limit:
             break
-    episodic.reverse()
-
-    contradictions = []
-    if "actually" in user_input.lower() or "not true" in user_input.lower():
-        contradictions.append("User may be correcting prior context; verify continuity.")
+        content = remainder[message_id].get("content", "")
+        if message_id not in episodic_ids and _EPISODIC_CUE_RE.search(content):
+            episodic_ids.append(message_id)
+    episodic = [remainder[message_id] for message_id in sorted(episodic_ids)]
 
     return {
         "short_term": short_term,
         "episodic": episodic,
         "semantic": semantic_retrieval,
-        "continuity_flags": contradictions,
+        "continuity_flags": _continuity_flags(user_input),
     }
 
 
+def retrieve_indexed_memory_stack(recent: list, history_length: int, load_messages, user_input: str, index: MessageIndex,
+                                  short_limit: int = 12, episodic_limit: int = 6, semantic_limit: int = 6,
+                                  scorer: str = "overlap", vector_index=None) -> dict:
+    """
+    `retrieve_memory_stack` for indexes that already describe the whole
+    conversation of `history_length` messages (see engines.memory_index.follow_history).
+    `recent` holds at least its last `short_limit` messages and `load_messages(ids)`
+    fetches the retrieved ones, so the full history is never loaded. Episodic
+    keyword cues are looked up in the index and confirmed on the loaded candidates
+    instead of scanning old messages.
+    """
+    remainder_length = max(0, history_length - short_limit)
+    semantic_ids = index.search(_tokenize(user_input), semantic_limit, scorer=scorer)
+
+    episodic_ids = []
+    if vector_index is not None:
+        episodic_ids = vector_index.search(user_input, episodic_limit, before=remainder_length)
+    messages = {}
+    consistent = True
+    before = remainder_length
+    while consistent and len(episodic_ids) < episodic_limit:
+        cue_ids = index.latest_containing(EPISODIC_CUES, episodic_limit, before)
+        if not cue_ids:
+            break
+        before = cue_ids[-1]
+        cue_ids = [message_id for message_id in cue_ids if message_id not in episodic_ids]
+        consistent = _load_into(messages, cue_ids, load_messages)
+        # Tokens only approximate the cue regex (e.g. "scene_1"), so candidates are checked against it.
+        episodic_ids += [
+            message_id for message_id in cue_ids
+            if consistent and _EPISODIC_CUE_RE.search(messages[message_id].get("content", ""))
+        ][:episodic_limit - len(episodic_ids)]
+    episodic_ids.sort()
+
+    wanted = [message_id for message_id in dict.fromkeys(semantic_ids + episodic_ids) if message_id not in messages]
+    if not (consistent and _load_into(messages, wanted, load_messages)):
+        # The history changed under the index; leave those layers empty this turn.
+        messages = {}
+    return {
+        "short_term": recent[-short_limit:],
+        "episodic": [messages[message_id] for message_id in episodic_ids if message_id in messages],
+        "semantic": [messages[message_id] for message_id in semantic_ids if message_id in messages],
+        "continuity_flags": _continuity_flags(user_input),
+    }
+
+
+def _load_into(messages: dict, message_ids: list, load_messages) -> bool:
+    """Adds the loaded `message_ids` to `messages`; False if some of them no longer exist."""
+    if not message_ids:
+        return True
+    loaded = load_messages(message_ids)
+    if len(loaded) != len(message_ids):
+        return False
+    messages.update(zip(message_ids, loaded))
+    return True
+
+
+def _continuity_flags(user_input: str) -> list:
+    contradictions = []
+    if "actually" in user_input.lower() or "not true" in user_input.lower():
+        contradictions.append("User may be correcting prior context; verify continuity.")
+    return contradictions
+
+
 def build_narrative_plan(canonical_state: dict, user_input: str, interaction_mode: str) -> dict:
     rel = canonical_state["mutable"]["relationship_score"]
     unresolved_threads = canonical_state["mutable"]["unresolved_threads"]
@@ -267,8 +352,9 @@ def update_narrative_state(previous_state: dict | None, user_input: str, assista
     return state
 
 
-def append_turn_telemetry(history_profile_name: str, payload: dict) -> None:
-    if not get_setting("overhaul_instrumentation_enabled", False):
+def append_turn_telemetry(history_profile_name: str, payload: dict, settings: Settings | None = None) -> None:
+    settings = settings or Settings.capture(get_setting)
+    if not settings.instrumentation_enabled:
         return
     safe_name = sanitize_profile_name(history_profile_name)
     if not safe_name:
@@ -3,8 +3,11 @@ System prompt construction and character context management.
 Builds the 'brain' instructions for the LLM based on character and user profiles.
 """
 
+import bisect
 import json
 import os
+import threading
+from functools import lru_cache
 
 from engines.utilities import replace_placeholders
 
@@ -12,132 +15,218 @@ RP_RULES_PATH = "response_rule/rp_rule.md"
 CASUAL_RULES_PATH = "response_rule/casual_rule.md"
 MOOD_INTENSITY_PATH = "response_rule/mood_intensity.json"
 
-def get_mood_rule(rel_score: int) -> dict:
+# path -> (signature, parsed value); see _load_cached.
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+
+def _file_signature(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _load_cached(path: str, loader):
     """
-    Loads the mood_intensity.json and returns the correct rule object
-    based on the current relationship score.
+    Returns `loader(path)`, reusing the previous result while the file's
+    mtime and size are unchanged (a missing file is asked again every time).
     """
-    if not os.path.exists(MOOD_INTENSITY_PATH):
-        return {}
-    
+    signature = _file_signature(path)
+    cached = _file_cache.get(path)
+    if cached is not None and signature is not None and cached[0] == signature:
+        return cached[1]
+    value = loader(path)
+    with _file_cache_lock:
+        _file_cache[path] = (signature, value)
+    return value
+
+
+def _read_mood_table(path: str) -> tuple[list, list]:
+    """Returns (ascending min_scores, matching rules), ready for bisect."""
+    if not os.path.exists(path):
+        return [], []
     try:
-        with open(MOOD_INTENSITY_PATH, "r", encoding="UTF-8") as f:
+        with open(path, "r", encoding="UTF-8") as f:
             intensity_rules = json.load(f)
-            
-        # Sort by min_score descending to find the highest bracket the score falls into
-        sorted_rules = sorted(intensity_rules.values(), key=lambda x: x["min_score"], reverse=True)
-        
-        for rule in sorted_rules:
-            if rel_score >= rule["min_score"]:
-                return rule
-                
+        # Lookups take the right-most bracket, so feed equal min_scores in reverse
+        # to keep the first one in the file winning, as before.
+        rules = sorted(reversed(list(intensity_rules.values())), key=lambda x: x["min_score"])
+        return [rule["min_score"] for rule in rules], rules
     except Exception as e:
         print(f"Error loading mood intensity: {e}")
-        
-    return {}
+        return [], []
 
-def load_user_profile():
-    """
-    Loads the currently selected user profile from the user_profiles directory.
 
-    Returns:
-        dict: The user profile data, or None if loading fails.
+def _read_rules(path: str) -> str:
+    try:
+        with open(path, "r", encoding="UTF-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return "No response rules."
+
+
+def _read_user_profile(path: str) -> tuple[dict | None, str]:
+    """Returns the user profile at `path` and its rendered prompt block."""
+    if not os.path.exists(path):
+        return None, ""
+    try:
+        with open(path, "r", encoding="UTF-8") as f:
+            user_profile = json.load(f)
+    except Exception:
+        return None, ""
+    if not user_profile:
+        return user_profile, ""
+    u_info = user_profile.get("character_info", {})
+    user_details = f"""
+[USER PROFILE (WHO YOU ARE TALKING TO)]
+Name: {user_profile.get('name', 'User')}
+Personality: {user_profile.get('personality_type', 'Unknown')}
+Appearance: {u_info.get('appearance', 'Unknown')}
+Pet: {u_info.get('pet', 'None')}
+Likes: {', '.join(u_info.get('likes', []))}
+Mannerisms to watch for: {', '.join(user_profile.get('rp_mannerisms', []))}
+"""
+    return user_profile, user_details
+
+
+def get_mood_rule(rel_score: int) -> dict:
+    """
+    Loads the mood_intensity.json and returns the correct rule object
+    based on the current relationship score.
     """
+    min_scores, rules = _load_cached(MOOD_INTENSITY_PATH, _read_mood_table)
+    # The highest bracket whose min_score the score reaches.
+    position = bisect.bisect_right(min_scores, rel_score)
+    return rules[position - 1] if position else {}
+
+def _current_user_profile_path() -> str:
     from engines.config import get_setting
     user_filename = get_setting("current_user_profile", "Manganese.json")
-    user_path = os.path.join("user_profiles", user_filename)
+    return os.path.join("user_profiles", user_filename)
 
-    if os.path.exists(user_path):
-        try:
-            with open(user_path, "r", encoding="UTF-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
-    return None
-
-def build_system_prompt(profile: dict, rel_score: int, action_req: str, tone_mod: str, mode: str = "rp", system_extra_info: str = None) -> str:
+def load_user_profile():
     """
-    Constructs the master system prompt for the LLM.
-    Combines character backstory, mannerisms, user details, and behavioral rules.
-
-    Args:
-        profile (dict): The active companion's profile data.
-        rel_score (int): Current relationship score (-100 to 100).
-        action_req (str): Instruction on whether to obey or refuse requests.
-        tone_mod (str): Instruction on the tone of the response.
-        mode (str): Interaction mode ('rp' or 'casual').
-        system_extra_info (str): Temporary context/notes for this specific turn.
+    Loads the currently selected user profile from the user_profiles directory.
 
     Returns:
-        str: The full system instruction string.
+        dict: The user profile data, or None if loading fails.
     """
-    base_prompt = profile.get("system_prompt", "")
+    return _load_cached(_current_user_profile_path(), _read_user_profile)[0]
 
-    # 1. Companion Character Details
-    backstory = profile.get("backstory", "Unknown.")
-    mannerisms = ", ".join(profile.get("rp_mannerisms", []))
-    info = profile.get("character_info", {})
 
+def _character_fields(profile: dict) -> tuple:
+    """The rendered values of the character block, hashable for the prefix cache."""
+    info = profile.get("character_info", {})
+    return (
+        f"{profile.get('name', 'Unknown')}",
+        f"{profile.get('alt_names', 'None')}",
+        f"{profile.get('personality_type', 'Unknown')}",
+        f"{profile.get('backstory', 'Unknown.')}",
+        f"{info.get('age', 'Unknown')}",
+        f"{info.get('appearance', 'Unknown')}",
+        ", ".join(info.get("likes", [])),
+        ", ".join(info.get("dislikes", [])),
+        ", ".join(profile.get("rp_mannerisms", [])),
+    )
+
+
+@lru_cache(maxsize=32)
+def _compile_prefix(base_prompt: str, character_fields: tuple, user_details: str, user_name: str, char_name: str) -> str:
+    """The part of the system prompt before [CONTEXT], placeholders already filled in."""
+    name, alt_names, personality_type, backstory, age, appearance, likes, dislikes, mannerisms = character_fields
     char_details = f"""
 [CHARACTER PROFILE]
-Name: {profile.get('name', 'Unknown')}
-Alternate Names: {profile.get('alt_names', 'None')}
-Personality Type: {profile.get('personality_type', 'Unknown')}
+Name: {name}
+Alternate Names: {alt_names}
+Personality Type: {personality_type}
 Backstory: {backstory}
-Age: {info.get('age', 'Unknown')}
-Appearance: {info.get('appearance', 'Unknown')}
-Likes: {', '.join(info.get('likes', []))}
-Dislikes: {', '.join(info.get('dislikes', []))}
+Age: {age}
+Appearance: {appearance}
+Likes: {likes}
+Dislikes: {dislikes}
 Mannerisms: {mannerisms}
 """
+    prefix = f"""{base_prompt}
+
+{char_details}
+{user_details}
 
-    # 2. User Profile Details (Who the AI thinks it's talking to)
-    user_profile = load_user_profile()
-    user_details = ""
-    if user_profile:
-        u_info = user_profile.get("character_info", {})
-        user_details = f"""
-[USER PROFILE (WHO YOU ARE TALKING TO)]
-Name: {user_profile.get('name', 'User')}
-Personality: {user_profile.get('personality_type', 'Unknown')}
-Appearance: {u_info.get('appearance', 'Unknown')}
-Pet: {u_info.get('pet', 'None')}
-Likes: {', '.join(u_info.get('likes', []))}
-Mannerisms to watch for: {', '.join(user_profile.get('rp_mannerisms', []))}
 """
+    return replace_placeholders(prefix, user_name=user_name, char_name=char_name)
+
+
+@lru_cache(maxsize=16)
+def _compile_rules(rule: str, user_name: str, char_name: str) -> str:
+    return replace_placeholders(rule, user_name=user_name, char_name=char_name)
+
+
+def _prompt_parts(profile: dict, rel_score: int, action_req: str, tone_mod: str, mode: str, system_extra_info: str | None) -> tuple[str, str, str]:
+    """Returns the compiled prefix, this turn's [CONTEXT] block and the compiled rules."""
+    # 1. Companion Character Details + 2. User Profile Details (Who the AI thinks it's talking to)
+    user_profile, user_details = _load_cached(_current_user_profile_path(), _read_user_profile)
+    user_name = user_profile.get("name", "User") if user_profile else "User"
+    char_name = profile.get("name", "Assistant")
+    prefix = _compile_prefix(
+        f"{profile.get('system_prompt', '')}", _character_fields(profile), user_details, user_name, char_name
+    )
 
     # 3. Dynamic Context (Relationship and Tone)
     mood_rule = get_mood_rule(rel_score)
     rel_label = mood_rule.get("label", "Neutral")
     mood_instruction = mood_rule.get("instruction", "") if mode == "rp" else ""
-    
-    system_content = f"""{base_prompt}
 
-{char_details}
-{user_details}
-
-[CONTEXT]
+    context = f"""[CONTEXT]
 Rel: {rel_label} ({rel_score}/100)
 Action: {action_req}
 Tone: {tone_mod}
 Mode: {mode.upper()}
 {mood_instruction}
 """
+    if system_extra_info:
+        context += f"Note: {system_extra_info}\n"
+    # The static parts were filled in when compiled; only the context needs it now.
+    context = replace_placeholders(context, user_name=user_name, char_name=char_name)
 
     # 4. Global Behavioral Rules
     rule_path = RP_RULES_PATH if mode == "rp" else CASUAL_RULES_PATH
-    try:
-        with open(rule_path, "r", encoding="UTF-8") as f:
-            rule = f.read()
-    except FileNotFoundError:
-        rule = "No response rules."
+    rules = _compile_rules(_load_cached(rule_path, _read_rules), user_name, char_name)
+    return prefix, context, rules
 
-    if system_extra_info:
-        system_content += f"Note: {system_extra_info}\n"
 
-    system_content += f"{rule}"
+def build_system_prompt(profile: dict, rel_score: int, action_req: str, tone_mod: str, mode: str = "rp", system_extra_info: str = None) -> str:
+    """
+    Constructs the master system prompt for the LLM.
+    Combines character backstory, mannerisms, user details, and behavioral rules.
 
-    ### Final pass to replace any placeholders in the base prompt with actual values from the profile
-    system_content = replace_placeholders(system_content, user_name=user_profile.get("name", "User") if user_profile else "User", char_name=profile.get("name", "Assistant"))
+    Everything but the [CONTEXT] block is compiled once per profile, user
+    profile and rules file version, so a turn only renders its own context.
 
-    return system_content
+    Args:
+        profile (dict): The active companion's profile data.
+        rel_score (int): Current relationship score (-100 to 100).
+        action_req (str): Instruction on whether to obey or refuse requests.
+        tone_mod (str): Instruction on the tone of the response.
+        mode (str): Interaction mode ('rp' or 'casual').
+        system_extra_info (str): Temporary context/notes for this specific turn.
+
+    Returns:
+        str: The full system instruction string.
+    """
+    prefix, context, rules = _prompt_parts(profile, rel_score, action_req, tone_mod, mode, system_extra_info)
+    return prefix + context + rules
+
+
+def build_split_system_prompt(profile: dict, rel_score: int, action_req: str, tone_mod: str, mode: str = "rp", system_extra_info: str = None) -> tuple[str, str]:
+    """
+    Same content as `build_system_prompt`, split for the "cache_friendly"
+    prompt layout: a static part (base prompt, character and user profiles,
+    rules) that stays byte-identical from turn to turn, so the backend can
+    reuse its evaluated prompt prefix, and the per-turn [CONTEXT] block.
+
+    Returns:
+        tuple[str, str]: (static system prompt, turn context)
+    """
+    prefix, context, rules = _prompt_parts(profile, rel_score, action_req, tone_mod, mode, system_extra_info)
+    return prefix + rules, context.rstrip("\n")
@@ -1,19 +1,20 @@
-from engines.config import get_setting
+from engines.config import Settings, get_setting, subscribe_setting
 from engines.formatting import get_tts_split_points
+from engines.llm_client import CancellationToken
 from engines.responses import get_respond_stream
 from engines.tts_module import clean_text_for_tts
 
 
-def _resolve_tts_runtime(character_profile: dict) -> dict:
+def _resolve_tts_runtime(character_profile: dict, settings: Settings) -> dict:
     return {
         "char_voice": character_profile.get("preferred_edge_voice"),
         "char_engine": character_profile.get("tts_engine", "edge-tts"),
         "char_clone_ref": character_profile.get("voice_clone_ref"),
         "char_language": character_profile.get("tts_language", "en"),
-        "speak_enable": get_setting("character_speak", False),
-        "narrator_voice": get_setting("narration_tts_voice", "en-US-AndrewNeural"),
+        "speak_enable": settings.character_speak,
+        "narrator_voice": settings.narration_tts_voice,
         "narrator_engine": "edge-tts",
-        "narration_enable": get_setting("speak_narration", False),
+        "narration_enable": settings.speak_narration,
     }
 
 
@@ -37,15 +38,24 @@ def iterate_response_events(
     history_profile_name: str,
     is_regeneration: bool = False,
     user_name: str = "User",
+    settings: Settings | None = None,
+    cancel_token: CancellationToken | None = None,
 ):
     """
     Yield response streaming events decoupled from UI concerns.
+    Settings are captured once for the whole turn unless `settings` is given.
+    Cancelling `cancel_token` stops the stream; the turn then ends with a
+    "cancelled" event instead of "complete" and nothing is saved.
     Event shapes:
     - {"type":"chunk","full_response": str}
-    - {"type":"tts","payload": tuple[text, voice, engine, clone_ref, language]}
+    - {"type":"tts","payload": tuple[text, voice, engine, clone_ref, language, user_name], "settings": Settings}
     - {"type":"complete","full_response": str}
+    - {"type":"cancelled","full_response": str}
     """
-    runtime = _resolve_tts_runtime(character_profile)
+    settings = settings or Settings.capture(get_setting)
+    # The TTS master toggle is the one setting that stays live for the turn.
+    tts_switch = subscribe_setting("tts_enabled", False)
+    runtime = _resolve_tts_runtime(character_profile, settings)
     full_response = ""
     current_buffer = ""
     tts_in_narration = False
@@ -56,6 +66,8 @@ def iterate_response_events(
         history_profile_name=history_profile_name,
         is_regeneration=is_regeneration,
         user_name=user_name,
+        settings=settings,
+        cancel_token=cancel_token,
     ):
         full_response += chunk
         current_buffer += chunk
@@ -63,7 +75,7 @@ def iterate_response_events(
 
         # Preserve legacy behavior: the TTS master toggle should apply immediately
         # even while a response is still streaming.
-        if not get_setting("tts_enabled", False):
+        if not tts_switch:
             continue
 
         split_points = get_tts_split_points(current_buffer)
@@ -89,12 +101,16 @@ def iterate_response_events(
                 speak_enable=runtime["speak_enable"],
                 narration_enable=runtime["narration_enable"],
             ):
-                yield {"type": "tts", "payload": (cleaned, voice, engine, clone_ref, language, user_name)}
+                yield {"type": "tts", "payload": (cleaned, voice, engine, clone_ref, language, user_name), "settings": settings}
             last_point = point
 
         current_buffer = current_buffer[last_point:]
 
-    if get_setting("tts_enabled", False) and current_buffer.strip():
+    if cancel_token is not None and cancel_token.cancelled:
+        yield {"type": "cancelled", "full_response": full_response}
+        return
+
+    if tts_switch and current_buffer.strip():
         cleaned = clean_text_for_tts(current_buffer.strip(), speak_narration=True)
         voice = runtime["narrator_voice"] if tts_in_narration else runtime["char_voice"]
         engine = runtime["narrator_engine"] if tts_in_narration else runtime["char_engine"]
@@ -108,7 +124,7 @@ def iterate_response_events(
             speak_enable=runtime["speak_enable"],
             narration_enable=runtime["narration_enable"],
         ):
-            yield {"type": "tts", "payload": (cleaned, voice, engine, clone_ref, language, user_name)}
+            yield {"type": "tts", "payload": (cleaned, voice, engine, clone_ref, language, user_name), "settings": settings}
 
     yield {"type": "complete", "full_response": full_response}
 
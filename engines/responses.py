@@ -9,12 +9,26 @@ import json
 import time
 import traceback
 import os
+from abc import ABC, abstractmethod
 import ollama
 import requests
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
+from engines import http_client, llm_client, memory_index, vector_memory
 from engines.memory_v2 import memory_manager
-from engines.config import get_setting
+from engines.memory_index import follow_history, get_message_index
+from engines.vector_memory import get_vector_index
+from engines.config import Settings, get_setting
+from engines.llm_client import CancellationToken, GenerationCancelled
+from engines.context_packer import (
+    MESSAGE_OVERHEAD_TOKENS,
+    PACK_CANDIDATE_MESSAGES,
+    TokenCounter,
+    create_tokenizer,
+    fit_text,
+    pack_history,
+    plan_budgets,
+)
 from engines.narrative_pipeline import (
     append_turn_telemetry,
     build_canonical_state,
@@ -24,11 +38,19 @@ from engines.narrative_pipeline import (
     rank_candidates,
     score_candidate,
     render_pipeline_context,
-    retrieve_memory_stack,
+    retrieve_indexed_memory_stack,
     update_narrative_state,
 )
-from engines.prompts import build_system_prompt
-from engines.lorebook import load_lorebook, scan_for_lore, sync_lore_to_remote
+from engines.prompts import build_split_system_prompt, build_system_prompt
+from engines.sentiment import score_sentiment
+from engines.lorebook import (
+    activate_lore,
+    get_lore_scan_cache,
+    get_lorebooks,
+    lorebook_paths,
+    semantic_lore_scores,
+    sync_lore_to_remote,
+)
 from engines.utilities import redact_pii
 
 MAX_CANDIDATE_WORKERS = 4
@@ -36,15 +58,11 @@ SIM_STREAM_CHUNK_SIZE = 32
 SIM_STREAM_DELAY_SECONDS = 0.001
 SIM_STREAM_REGEN_CHUNK_SIZE = 32
 SIM_STREAM_REGEN_DELAY_SECONDS = 0.001
+UTILITY_WORKERS = 2
 
-
-def _get_repetition_penalty() -> float:
-    penalty = get_setting("repetition_penalty", 1.15)
-    try:
-        penalty = float(penalty)
-    except (TypeError, ValueError):
-        return 1.15
-    return penalty if penalty > 0 else 1.15
+# Retrieval indexes follow every history change instead of re-reading the history each turn.
+memory_manager.add_change_listener(memory_index.apply_history_change)
+memory_manager.add_change_listener(vector_memory.apply_history_change)
 
 
 def _normalize_for_duplicate_check(text: str) -> str:
@@ -170,16 +188,16 @@ def update_profile_score(profile_path: str, score_change: int):
     except Exception as e:
         print(f"Error updating profile score: {e}")
 
-def get_sentiment_score(user_input: str, model: str, remote_url: str = None, profile: dict = None) -> int:
+def _llm_sentiment_score(user_input: str, profile: dict | None, settings: Settings) -> int | None:
     """
     Makes a separate lightweight LLM call to score the sentiment of the user's message.
     Always runs locally via Ollama to avoid blocking the remote GPU.
 
     Returns:
-        int: A score from -5 to +5.
+        int | None: A score from -5 to +5, or None if the call or its parsing failed.
     """
     char_name = profile.get("name", "the character") if profile else "the character"
-    utility_model = get_setting("local_utility_model", "llama3.2")
+    utility_model = settings.local_utility_model
 
     messages = [
         {
@@ -209,9 +227,133 @@ def get_sentiment_score(user_input: str, model: str, remote_url: str = None, pro
         if match:
             return max(-5, min(5, int(match.group(1))))
     except Exception as e:
-        if get_setting("debug_mode", False):
+        if settings.debug_mode:
             print(f"Local sentiment scoring failed: {e}")
-    return 0
+    return None
+
+class SentimentEngine(ABC):
+    """
+    Scores how the user's message makes the character feel, from -5 to +5.
+    Subclass it and call `register_sentiment_engine` to plug in another scorer;
+    the `sentiment_engine` setting picks one by name.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def score(self, user_input: str, model: str, remote_url: str | None = None, profile: dict | None = None, settings: Settings | None = None) -> int:
+        """Returns the score for `user_input`."""
+
+class LLMSentimentEngine(SentimentEngine):
+    """Asks the local utility model; accurate but costs a model call (and often a model swap)."""
+
+    name = "llm"
+
+    def score(self, user_input: str, model: str, remote_url: str | None = None, profile: dict | None = None, settings: Settings | None = None) -> int:
+        settings = settings or Settings.capture(get_setting)
+        result = _llm_sentiment_score(user_input, profile, settings)
+        return 0 if result is None else result
+
+class LexiconSentimentEngine(SentimentEngine):
+    """Rule-based scoring from `engines.sentiment`; no model call, microseconds per message."""
+
+    name = "lexicon"
+
+    def score(self, user_input: str, model: str, remote_url: str | None = None, profile: dict | None = None, settings: Settings | None = None) -> int:
+        return score_sentiment(user_input).score
+
+class HybridSentimentEngine(SentimentEngine):
+    """The lexicon scorer, escalating to the LLM only when its confidence is below `sentiment_confidence_threshold`."""
+
+    name = "hybrid"
+
+    def score(self, user_input: str, model: str, remote_url: str | None = None, profile: dict | None = None, settings: Settings | None = None) -> int:
+        settings = settings or Settings.capture(get_setting)
+        estimate = score_sentiment(user_input)
+        if estimate.confidence >= settings.sentiment_confidence_threshold:
+            return estimate.score
+        if settings.debug_mode:
+            print(f"[DEBUG] Sentiment escalated to LLM (lexicon {estimate.score:+d} at confidence {estimate.confidence:.2f})")
+        result = _llm_sentiment_score(user_input, profile, settings)
+        return estimate.score if result is None else result
+
+SENTIMENT_ENGINES = {
+    LLMSentimentEngine.name: LLMSentimentEngine,
+    LexiconSentimentEngine.name: LexiconSentimentEngine,
+    HybridSentimentEngine.name: HybridSentimentEngine,
+}
+_sentiment_engines = {}
+
+def register_sentiment_engine(name: str, factory) -> None:
+    """Makes `factory` (a SentimentEngine subclass or any zero-argument callable returning one) selectable as `name`."""
+    SENTIMENT_ENGINES[name] = factory
+    _sentiment_engines.pop(name, None)
+
+def create_sentiment_engine(kind: str = "llm") -> SentimentEngine:
+    """Returns the (shared) engine registered as `kind`; unknown names fall back to the LLM scorer."""
+    kind = kind if kind in SENTIMENT_ENGINES else LLMSentimentEngine.name
+    engine = _sentiment_engines.get(kind)
+    if engine is None:
+        engine = _sentiment_engines[kind] = SENTIMENT_ENGINES[kind]()
+    return engine
+
+def get_sentiment_score(user_input: str, model: str, remote_url: str = None, profile: dict = None, settings: Settings | None = None) -> int:
+    """
+    Scores the sentiment of the user's message with the engine named by the
+    `sentiment_engine` setting ("llm", "lexicon", "hybrid" or a registered one).
+
+    Returns:
+        int: A score from -5 to +5.
+    """
+    settings = settings or Settings.capture(get_setting)
+    engine = create_sentiment_engine(settings.sentiment_engine)
+    return engine.score(user_input, model, remote_url, profile, settings=settings)
+
+_utility_executor = None
+_utility_executor_lock = threading.Lock()
+
+def _get_utility_executor() -> ThreadPoolExecutor:
+    """The shared pool for per-turn utility-model calls that run alongside generation, created on first use."""
+    global _utility_executor
+    if _utility_executor is None:
+        with _utility_executor_lock:
+            if _utility_executor is None:
+                _utility_executor = ThreadPoolExecutor(max_workers=UTILITY_WORKERS, thread_name_prefix="utility")
+    return _utility_executor
+
+def _start_sentiment_score(user_input: str, model: str, remote_url: str, profile: dict, settings: Settings, turn_timings: dict) -> Future:
+    """Scores the user's message on the utility executor; post-processing joins the result."""
+    def task():
+        turn_timings["sentiment_started"] = time.perf_counter()
+        try:
+            return get_sentiment_score(user_input, model, remote_url, profile, settings=settings)
+        finally:
+            turn_timings["sentiment_finished"] = time.perf_counter()
+
+    return _get_utility_executor().submit(task)
+
+def _turn_timing_report(turn_timings: dict) -> dict:
+    """Per-turn durations in milliseconds, including how long sentiment scoring overlapped generation."""
+    def span(start: str, end: str) -> float | None:
+        if start in turn_timings and end in turn_timings:
+            return round((turn_timings[end] - turn_timings[start]) * 1000, 1)
+        return None
+
+    report = {
+        "generation_ms": span("generation_started", "generation_finished"),
+        "sentiment_ms": span("sentiment_started", "sentiment_finished"),
+        "sentiment_wait_ms": span("post_processing_started", "sentiment_joined"),
+        "post_processing_ms": span("post_processing_started", "post_processing_finished"),
+        "turn_ms": span("turn_started", "post_processing_finished"),
+        "overlap_ms": None,
+    }
+    if report["generation_ms"] is not None and report["sentiment_ms"] is not None:
+        overlap = (
+            min(turn_timings["generation_finished"], turn_timings["sentiment_finished"])
+            - max(turn_timings["generation_started"], turn_timings["sentiment_started"])
+        )
+        report["overlap_ms"] = round(max(0.0, overlap) * 1000, 1)
+    return report
 
 def generate_summary(messages: list, model: str, remote_url: str = None, user_name: str = "User", char_name: str = "Assistant") -> str:
     """
@@ -303,12 +445,13 @@ def update_rolling_summary(existing_core: str, new_messages: list, model: str,
         return f"Error updating rolling summary: {str(e)}"
 
 
-def _call_llm_once(messages: list, model: str, remote_url: str = None, temperature: float = 0.8, max_tokens: int = 1024, user_name: str = "User", char_name: str = "Assistant") -> str:
+def _call_llm_once(messages: list, model: str, remote_url: str = None, temperature: float = 0.8, max_tokens: int = 1024, user_name: str = "User", char_name: str = "Assistant", settings: Settings | None = None) -> str:
     """Single-turn non-streaming helper used by candidate/reranker pipeline stages."""
-    repetition_penalty = _get_repetition_penalty()
+    settings = settings or Settings.capture(get_setting)
+    repetition_penalty = settings.repetition_penalty
     if remote_url:
         # Redact PII for remote requests if Privacy Mode is active (VULN-004)
-        if get_setting("privacy_mode", False):
+        if settings.privacy_mode:
             messages = [
                 {**msg, "content": redact_pii(msg["content"], user_name=user_name, char_name=char_name)} 
                 for msg in messages
@@ -321,7 +464,7 @@ def _call_llm_once(messages: list, model: str, remote_url: str = None, temperatu
             "max_tokens": max_tokens,
             "repetition_penalty": repetition_penalty,
         }
-        response = requests.post(full_url, json=payload, stream=False, timeout=90)
+        response = http_client.post(full_url, json=payload, stream=False, timeout=90)
         return _extract_remote_message_content(response)
 
     result = ollama.chat(
@@ -333,21 +476,22 @@ def _call_llm_once(messages: list, model: str, remote_url: str = None, temperatu
     return result["message"]["content"].strip()
 
 
-def _generate_candidate_replies(messages: list, model: str, remote_url: str | None = None, candidate_count: int = 1, user_name: str = "User", char_name: str = "Assistant") -> list[str]:
+def _generate_candidate_replies(messages: list, model: str, remote_url: str | None = None, candidate_count: int = 1, user_name: str = "User", char_name: str = "Assistant", settings: Settings | None = None) -> list[str]:
+    settings = settings or Settings.capture(get_setting)
     candidate_count = max(1, candidate_count)
 
     # Optimization: Batch remote call for Colab/Kaggle
     if remote_url:
         try:
             # Redact PII for remote requests if Privacy Mode is active (VULN-004)
-            if get_setting("privacy_mode", False):
+            if settings.privacy_mode:
                 messages = [
                     {**msg, "content": redact_pii(msg["content"], user_name=user_name, char_name=char_name)} 
                     for msg in messages
                 ]
 
             full_url = f"{remote_url.rstrip('/')}/chat"
-            repetition_penalty = _get_repetition_penalty()
+            repetition_penalty = settings.repetition_penalty
             # Temperature average for the batch
             payload = {
                 "messages": messages,
@@ -355,9 +499,10 @@ def _generate_candidate_replies(messages: list, model: str, remote_url: str | No
                 "max_tokens": 1024,
                 "repetition_penalty": repetition_penalty,
                 "n": candidate_count,
-                "use_rag": True
+                "use_rag": True,
+                "prompt_layout": settings.prompt_layout,
             }
-            response = requests.post(full_url, json=payload, stream=False, timeout=120)
+            response = http_client.post(full_url, json=payload, stream=False, timeout=120)
             response.raise_for_status()
             data = response.json()
             if isinstance(data, dict) and "candidates" in data:
@@ -368,13 +513,13 @@ def _generate_candidate_replies(messages: list, model: str, remote_url: str | No
                     if candidates:
                         return candidates
         except Exception as e:
-            if get_setting("debug_mode", False):
+            if settings.debug_mode:
                 print(f"Batch remote candidate generation failed: {e}. Falling back to sequential.")
 
     def generate_task(idx):
         temperature = min(1.0, 0.75 + (0.08 * idx))
         try:
-            return _call_llm_once(messages, model=model, remote_url=remote_url, temperature=temperature, user_name=user_name, char_name=char_name)
+            return _call_llm_once(messages, model=model, remote_url=remote_url, temperature=temperature, user_name=user_name, char_name=char_name, settings=settings)
         except Exception:
             return ""
 
@@ -385,7 +530,7 @@ def _generate_candidate_replies(messages: list, model: str, remote_url: str | No
     return [r for r in results if r]
 
 
-def _rewrite_with_critic(messages: list, original_reply: str, model: str, remote_url: str, interaction_mode: str, user_name: str = "User", char_name: str = "Assistant") -> str:
+def _rewrite_with_critic(messages: list, original_reply: str, model: str, remote_url: str, interaction_mode: str, user_name: str = "User", char_name: str = "Assistant", settings: Settings | None = None) -> str:
     repair_instruction = (
         "Repair the assistant reply to remain strictly in-character, preserve continuity, "
         "and push the story forward with one concrete beat. "
@@ -404,7 +549,7 @@ def _rewrite_with_critic(messages: list, original_reply: str, model: str, remote
         },
     ]
     try:
-        rewritten = _call_llm_once(critic_messages, model=model, remote_url=remote_url, temperature=0.5, user_name=user_name, char_name=char_name)
+        rewritten = _call_llm_once(critic_messages, model=model, remote_url=remote_url, temperature=0.5, user_name=user_name, char_name=char_name, settings=settings)
         return rewritten or original_reply
     except Exception:
         return original_reply
@@ -420,17 +565,26 @@ def _perform_post_processing(
     full_reply: str,
     current_scene: str,
     rel_score: int,
-
-    memory_core: str,
-    last_summarized_index: int,
     pipeline_flags: dict,
     narrative_plan: any,
     memory_stack: any,
     selected_metrics: dict,
     candidate_metrics: list,
     critic_applied: bool,
+    settings: Settings | None = None,
+    token_counter: TokenCounter | None = None,
+    lore_state: dict | None = None,
+    sentiment_future: Future | None = None,
+    turn_timings: dict | None = None,
+    cancel_token: CancellationToken | None = None,
 ):
-    """Handles background tasks like sentiment scoring and saving history."""
+    """
+    Handles background tasks like sentiment scoring and saving history.
+    Nothing is saved once `cancel_token` is cancelled (e.g. by a rewind).
+    """
+    settings = settings or Settings.capture(get_setting)
+    turn_timings = turn_timings if turn_timings is not None else {}
+    turn_timings["post_processing_started"] = time.perf_counter()
     try:
         reply = full_reply.strip()
 
@@ -441,7 +595,7 @@ def _perform_post_processing(
             "Remote bridge error",
         ]
         if any(marker in reply for marker in error_markers):
-            if get_setting("debug_mode", False):
+            if settings.debug_mode:
                 print(f"[DEBUG] Skipping history save due to error marker in reply: {reply[:50]}...")
             return
 
@@ -453,78 +607,105 @@ def _perform_post_processing(
             new_scene = scene_match.group(1).strip()
             reply = re.sub(r'\[SCENE:\s*.*?\]', '', reply).strip()
 
-        # Score sentiment
-        if is_regeneration:
-            score_change = 0
-        else:
-            score_change = get_sentiment_score(user_input, model, remote_url, profile)
-
-        # Persist relationship update
-        if profile_path and score_change != 0:
-            update_profile_score(profile_path, score_change)
-
-        # Save to persistent memory
-        full_history = memory_manager.load_history(history_profile_name)
+        # Score sentiment (usually already scored while the reply was generating)
+        score_change = 0
+        if not is_regeneration:
+            try:
+                if sentiment_future is not None:
+                    score_change = sentiment_future.result()
+                else:
+                    score_change = get_sentiment_score(user_input, model, remote_url, profile, settings=settings)
+            except Exception as e:
+                # A registered engine may raise; the reply is still saved, just unscored.
+                if settings.debug_mode:
+                    print(f"Sentiment scoring failed: {e}")
+        turn_timings["sentiment_joined"] = time.perf_counter()
+
+        # Everything the turn changes goes to storage in a single commit.
+        turn_messages = []
+        replace_last = None
         if is_regeneration:
-            if full_history and full_history[-1].get("role") == "assistant":
-                last_msg = full_history[-1]
-                if "alternatives" not in last_msg:
-                    last_msg["alternatives"] = [last_msg.get("content", "")]
-                last_msg["alternatives"].append(reply)
-                last_msg["selected_index"] = len(last_msg["alternatives"]) - 1
-                last_msg["content"] = reply
+            recent = memory_manager.load_history(history_profile_name, limit=1)
+            if recent and recent[-1].get("role") == "assistant":
+                replace_last = recent[-1]
+                if "alternatives" not in replace_last:
+                    replace_last["alternatives"] = [replace_last.get("content", "")]
+                replace_last["alternatives"].append(reply)
+                replace_last["selected_index"] = len(replace_last["alternatives"]) - 1
+                replace_last["content"] = reply
         else:
-            full_history.append({'role': 'user', 'content': user_input})
-            full_history.append({'role': 'assistant', 'content': reply})
-
-        memory_manager.save_history(
-            history_profile_name,
-            full_history,
-            mood_score=rel_score,
-            current_scene=new_scene,
-            memory_core=memory_core,
-            last_summarized_index=last_summarized_index
-        )
+            turn_messages = [
+                {'role': 'user', 'content': user_input},
+                {'role': 'assistant', 'content': reply},
+            ]
+        turn_metadata = {"mood_score": rel_score, "current_scene": new_scene}
+        if token_counter is not None:
+            # Count the new messages now so the next turn's packing finds every count cached.
+            new_messages = turn_messages or [replace_last or {'content': reply}]
+            for message in new_messages:
+                token_counter.count_message(message)
+            turn_metadata["token_counts"] = token_counter.to_metadata(latest=new_messages)
+        if lore_state is not None:
+            turn_metadata["lore_state"] = lore_state
 
         # Update Narrative State
         if pipeline_flags["enabled"] and pipeline_flags["state"]:
-            # Need to reload metadata as it might have changed
-            full_data = memory_manager.get_full_data(history_profile_name)
-            previous_state = full_data.get("metadata", {}).get("narrative_state", {})
-            new_state = update_narrative_state(
+            previous_state = memory_manager.get_metadata(history_profile_name).get("narrative_state", {})
+            turn_metadata["narrative_state"] = update_narrative_state(
                 previous_state,
                 user_input=user_input,
                 assistant_reply=reply,
                 sentiment_score=score_change,
                 current_scene=new_scene,
-            )
-            memory_manager.update_narrative_state(
+            ) or {}
+            if selected_metrics is not None:
+                turn_metadata["last_turn_metrics"] = selected_metrics
+
+        def commit():
+            # Persist relationship update
+            if profile_path and score_change != 0:
+                update_profile_score(profile_path, score_change)
+            memory_manager.commit_turn(
                 history_profile_name,
-                new_state,
-                turn_metrics=selected_metrics,
+                messages=turn_messages,
+                replace_last=replace_last,
+                metadata=turn_metadata,
             )
 
+        # A rewind or branch switch cancels the token first, so it never lands
+        # between this check and the write.
+        if cancel_token is None:
+            commit()
+        elif not cancel_token.run_unless_cancelled(commit):
+            return
+        turn_timings["post_processing_finished"] = time.perf_counter()
+
         # Telemetry
         append_turn_telemetry(
             history_profile_name,
             {
                 "pipeline_enabled": pipeline_flags["enabled"],
                 "is_regeneration": is_regeneration,
-                "mode": get_setting("interaction_mode", "rp"),
+                "mode": settings.interaction_mode,
                 "candidate_count": len(candidate_metrics),
                 "candidate_totals": [metrics.get("total", 0) for metrics in candidate_metrics],
                 "selected_metrics": selected_metrics,
                 "critic_applied": critic_applied,
                 "memory_flags": (memory_stack or {}).get("continuity_flags", []),
                 "plan": narrative_plan or {},
+                "timings": _turn_timing_report(turn_timings),
             },
+            settings=settings,
         )
     except Exception as e:
-        if get_setting("debug_mode", False):
+        if settings.debug_mode:
             print(f"Background post-processing failed: {e}")
             traceback.print_exc()
 
-def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None = None, profile_path: str = None, system_extra_info: str = None, history_profile_name: str = None, is_regeneration: bool = False, user_name: str = "User"):
+def _is_cancelled(cancel_token: CancellationToken | None) -> bool:
+    return cancel_token is not None and cancel_token.cancelled
+
+def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None = None, profile_path: str = None, system_extra_info: str = None, history_profile_name: str = None, is_regeneration: bool = False, user_name: str = "User", settings: Settings | None = None, cancel_token: CancellationToken | None = None):
     """
     Generates a streaming response from the LLM (Local Ollama or Remote API).
     Parses sentiment tags [REL: +X] to update relationship status in real-time.
@@ -538,14 +719,17 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
         history_profile_name (str): The name of the profile for history management.
         is_regeneration (bool): If True, we are regenerating the last AI message.
         user_name (str): The name of the active user profile.
+        settings (Settings): Snapshot to use for the whole turn; captured now if omitted.
+        cancel_token (CancellationToken): Stops generation when cancelled; the partial reply is not saved.
 
     Yields:
         str: Chunks of text as they are generated by the LLM.
     """
+    settings = settings or Settings.capture(get_setting)
     char_name = profile.get("name", "Assistant")
-    model = profile.get("llm_model", get_setting("default_llm_model", "llama3"))
-    remote_url = get_setting("remote_llm_url")
-    repetition_penalty = _get_repetition_penalty()
+    model = profile.get("llm_model", settings.default_llm_model)
+    remote_url = settings.remote_llm_url
+    repetition_penalty = settings.repetition_penalty
 
     if not history_profile_name:
         if profile_path:
@@ -553,31 +737,62 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
         else:
             history_profile_name = char_name # Fallback to display name
 
-    # Load history and metadata
-    full_data = memory_manager.get_full_data(history_profile_name)
-    current_scene = full_data.get("metadata", {}).get("current_scene", "Unknown Location")
-    memory_core = full_data.get("metadata", {}).get("memory_core", "")
-    last_summarized_index = full_data.get("metadata", {}).get("last_summarized_index", 0)
+    # Sentiment depends only on the user's message, so it is scored while the reply generates.
+    turn_timings = {"turn_started": time.perf_counter()}
+    sentiment_future = None
+    if not is_regeneration:
+        sentiment_future = _start_sentiment_score(user_input, model, remote_url, profile, settings, turn_timings)
 
-    limit = get_setting("memory_limit", 15)
-    history = memory_manager.load_history(history_profile_name, limit=limit)
+    # Load history and metadata
+    metadata = memory_manager.get_metadata(history_profile_name)
+    current_scene = metadata.get("current_scene", "Unknown Location")
+    memory_core = metadata.get("memory_core", "")
+    last_summarized_index = metadata.get("last_summarized_index", 0)
+
+    limit = settings.memory_limit
+    token_counter = None
+    if settings.context_packing == "tokens":
+        # Load more than can fit; the history budget decides how much of it is sent.
+        tokenizer = create_tokenizer(settings.context_tokenizer)
+        token_counter = TokenCounter(tokenizer, metadata.get("token_counts"))
+        budgets = plan_budgets(settings.context_window_tokens)
+        memory_core = fit_text(memory_core, budgets["memory_core"], tokenizer)
+        history = memory_manager.load_history(history_profile_name, limit=max(limit, PACK_CANDIDATE_MESSAGES))
+    else:
+        history = memory_manager.load_history(history_profile_name, limit=limit)
     prompt_history = list(history) if history else []
 
     # 1. Lorebook Scanning
     # Skip local scanning if using remote RAG (server handles it internally)
     activated_lore = ""
+    lore_state = None
     if not remote_url:
         # Scan recent history (last 3 messages) + current user input for keywords
-        lore_file = profile.get("lorebook_path") or "lorebooks/default.json"
-        lorebook_data = load_lorebook(lore_file)
+        lore_paths = lorebook_paths(profile, metadata, settings.global_lorebooks)
+        lorebook_data = get_lorebooks(lore_paths)
         recent_context = history[-3:] + [{'role': 'user', 'content': user_input}]
-        activated_lore = scan_for_lore(recent_context, lorebook_data)
+        semantic_scores = None
+        if settings.lore_vector_enabled:
+            # Entries that match the input in meaning, not just by keyword.
+            semantic_scores = semantic_lore_scores(user_input, lorebook_data, lore_paths, settings.lore_vector_embedder)
+        lore_budget = settings.lore_token_budget or (budgets["lore"] if token_counter is not None else None)
+        activated_lore, lore_state = activate_lore(
+            recent_context,
+            lorebook_data,
+            metadata.get("lore_state"),
+            token_budget=lore_budget,
+            recursion_depth=settings.lore_recursion_depth,
+            advance_turn=not is_regeneration,
+            count_tokens=token_counter.count_text if token_counter is not None else None,
+            semantic_scores=semantic_scores,
+            scan_cache=get_lore_scan_cache(history_profile_name),
+        )
 
 
     # Determine relationship score and interaction mode
     rel_score = profile.get("relationship_score", 0)
-    interaction_mode = get_setting("interaction_mode", "rp")
-    pipeline_flags = get_pipeline_flags()
+    interaction_mode = settings.interaction_mode
+    pipeline_flags = get_pipeline_flags(settings)
     canonical_state = None
     memory_stack = None
     narrative_plan = None
@@ -601,15 +816,33 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
         system_extra_info = scene_instruction
 
     if pipeline_flags["enabled"]:
-        metadata = full_data.get("metadata", {})
-        canonical_state = build_canonical_state(profile, metadata, user_input) if pipeline_flags["state"] else None
+        canonical_state = build_canonical_state(profile, metadata, user_input, settings) if pipeline_flags["state"] else None
 
         if pipeline_flags["memory"]:
-            full_history_for_memory = memory_manager.load_history(history_profile_name)
-            memory_stack = retrieve_memory_stack(
-                full_history_for_memory,
+            message_index = get_message_index(history_profile_name, memory_manager.history_dir)
+            vector_index = None
+            if pipeline_flags.get("vector_memory"):
+                vector_index = get_vector_index(
+                    history_profile_name,
+                    memory_manager.history_dir,
+                    pipeline_flags.get("vector_embedder", "hashing"),
+                )
+            # Only the first turn of a session (or one after a missed change) reads the whole history.
+            history_length = memory_manager.get_history_length(history_profile_name)
+            follow_history([message_index, vector_index], history_length, lambda: memory_manager.load_history(history_profile_name))
+            short_limit = max(6, min(20, limit))
+            recent = history
+            if len(recent) < min(short_limit, history_length):
+                recent = memory_manager.load_history(history_profile_name, limit=short_limit)
+            memory_stack = retrieve_indexed_memory_stack(
+                recent,
+                history_length,
+                lambda message_ids: memory_manager.load_messages(history_profile_name, message_ids),
                 user_input,
-                short_limit=max(6, min(20, limit)),
+                message_index,
+                short_limit=short_limit,
+                scorer=pipeline_flags.get("memory_scorer", "overlap"),
+                vector_index=vector_index,
             )
 
         if pipeline_flags["planner"] and canonical_state is not None:
@@ -617,6 +850,8 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
 
         if canonical_state is not None:
             pipeline_context = render_pipeline_context(canonical_state, memory_stack, narrative_plan)
+            if token_counter is not None:
+                pipeline_context = fit_text(pipeline_context, budgets["pipeline"], tokenizer)
             system_extra_info = f"{system_extra_info}\n\n{pipeline_context}"
 
     # Set behavioral requirements based on the Mood Engine's 'should_obey' decision
@@ -632,7 +867,22 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
         tone_mod = "Maintain a balanced tone."
 
     # Construct the master system instruction
-    system_content = build_system_prompt(profile, rel_score, action_req, tone_mod, interaction_mode, system_extra_info)
+    turn_context = None
+    if settings.prompt_layout == "cache_friendly":
+        # Keep the system message identical across turns; this turn's context travels separately.
+        system_content, turn_context = build_split_system_prompt(profile, rel_score, action_req, tone_mod, interaction_mode, system_extra_info)
+    else:
+        system_content = build_system_prompt(profile, rel_score, action_req, tone_mod, interaction_mode, system_extra_info)
+
+    if token_counter is not None:
+        # History gets whatever the prompt budget has left, filled newest-first in whole messages.
+        fixed_tokens = (
+            token_counter.count_text(system_content)
+            + token_counter.count_text(turn_context or "")
+            + token_counter.count_text(user_input)
+            + 3 * MESSAGE_OVERHEAD_TOKENS
+        )
+        prompt_history = pack_history(prompt_history, budgets["prompt"] - fixed_tokens, token_counter)
 
     # Compile message list for the LLM
     messages = [{'role': 'system', 'content': system_content}]
@@ -660,21 +910,30 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
 
         if regeneration_previous_replies:
             replay_block = "\n".join(f"- {reply[:220]}" for reply in regeneration_previous_replies[-3:])
-            messages[0]["content"] = (
-                f"{messages[0]['content']}\n\n"
+            diversity_constraint = (
                 "[REGENERATION DIVERSITY CONSTRAINT]\n"
                 "Generate a substantially different alternative response while preserving canon and scene continuity.\n"
                 "Do not paraphrase the same response structure.\n"
                 f"Previous assistant attempts:\n{replay_block}\n"
             )
+            if turn_context is not None:
+                turn_context = f"{turn_context}\n\n{diversity_constraint}"
+            else:
+                messages[0]["content"] = f"{messages[0]['content']}\n\n{diversity_constraint}"
     else:
         messages.extend(prompt_history)
         messages.append({'role': 'user', 'content': user_input})
 
+    if turn_context is not None:
+        # Volatile context sits just before the user's message, after everything that can be reused.
+        messages.insert(len(messages) - 1, {'role': 'system', 'content': turn_context})
+
     full_reply = ""
     selected_metrics = {}
     candidate_metrics = []
     critic_applied = False
+    post_process_thread = None
+    turn_timings["generation_started"] = time.perf_counter()
 
     try:
         # Only use the non-streaming candidate/critic pipeline if multiple candidates are requested or critic is enabled.
@@ -686,7 +945,7 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
 
         if use_pipeline_branch:
             if canonical_state is None:
-                canonical_state = build_canonical_state(profile, full_data.get("metadata", {}), user_input)
+                canonical_state = build_canonical_state(profile, metadata, user_input, settings)
 
             if pipeline_flags["candidates"]:
                 candidate_replies = _generate_candidate_replies(
@@ -696,9 +955,10 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
                     candidate_count=pipeline_flags["candidate_count"],
                     user_name=user_name,
                     char_name=char_name,
+                    settings=settings,
                 )
                 if not candidate_replies:
-                    candidate_replies = [_call_llm_once(messages, model=model, remote_url=remote_url, temperature=0.8, user_name=user_name, char_name=char_name)]
+                    candidate_replies = [_call_llm_once(messages, model=model, remote_url=remote_url, temperature=0.8, user_name=user_name, char_name=char_name, settings=settings)]
 
                 ranked = rank_candidates(candidate_replies, canonical_state, narrative_plan, interaction_mode)
                 best = ranked[0]
@@ -726,6 +986,7 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
                             temperature=1.05,
                             user_name=user_name,
                             char_name=char_name,
+                            settings=settings,
                         ).strip()
                         if diversified:
                             best = {
@@ -739,7 +1000,7 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
                 selected_metrics = best["metrics"]
                 candidate_metrics = [row["metrics"] for row in ranked]
             else:
-                reply = _call_llm_once(messages, model=model, remote_url=remote_url, temperature=0.8, user_name=user_name, char_name=char_name).strip()
+                reply = _call_llm_once(messages, model=model, remote_url=remote_url, temperature=0.8, user_name=user_name, char_name=char_name, settings=settings).strip()
                 selected_metrics = score_candidate(reply, canonical_state, narrative_plan, interaction_mode)
                 candidate_metrics = [selected_metrics]
 
@@ -753,12 +1014,15 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
                     interaction_mode=interaction_mode,
                     user_name=user_name,
                     char_name=char_name,
+                    settings=settings,
                 )
 
             full_reply = reply
             # Simulated streaming visual
             sim_chunk_size = SIM_STREAM_CHUNK_SIZE
             for index in range(0, len(reply), sim_chunk_size):
+                if _is_cancelled(cancel_token):
+                    return
                 yield reply[index : index + sim_chunk_size]
                 time.sleep(SIM_STREAM_DELAY_SECONDS)
         else:
@@ -766,7 +1030,7 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
             generation_temperature = 0.95 if is_regeneration else 0.8
             if remote_url:
                 # Redact PII for remote requests if Privacy Mode is active (VULN-004)
-                if get_setting("privacy_mode", False):
+                if settings.privacy_mode:
                     messages = [
                         {**msg, "content": redact_pii(msg["content"], user_name=user_name, char_name=char_name)} 
                         for msg in messages
@@ -778,12 +1042,26 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
                     "temperature": generation_temperature, 
                     "max_tokens": 1024,
                     "repetition_penalty": repetition_penalty,
-                    "use_rag": True
+                    "use_rag": True,
+                    "prompt_layout": settings.prompt_layout,
                 }
-                response = requests.post(full_url, json=payload, stream=True, timeout=60)
-                response.raise_for_status()
-                stream = response.iter_content(chunk_size=None, decode_unicode=True)
+                if cancel_token is not None and llm_client.HTTPX_AVAILABLE:
+                    stream = llm_client.stream_chat(cancel_token, remote_url=remote_url, payload=payload, timeout=60)
+                else:
+                    response = http_client.post(full_url, json=payload, stream=True, timeout=60)
+                    response.raise_for_status()
+                    if cancel_token is not None:
+                        # Closing the response drops the connection and ends iter_content.
+                        cancel_token.on_cancel(response.close)
+                    stream = response.iter_content(chunk_size=None, decode_unicode=True)
             # Handle Local Ollama Request
+            elif cancel_token is not None and llm_client.HTTPX_AVAILABLE:
+                stream = llm_client.stream_chat(
+                    cancel_token,
+                    model=model,
+                    messages=messages,
+                    options={"temperature": generation_temperature, "repeat_penalty": repetition_penalty},
+                )
             else:
                 ollama_stream = ollama.chat(
                     model=model,
@@ -812,13 +1090,21 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
 
             # Iterate through the generator stream — yield content directly, no tag filtering needed
             for content in stream:
+                if _is_cancelled(cancel_token):
+                    break
                 full_reply += content
                 yield content
 
+        turn_timings["generation_finished"] = time.perf_counter()
+
+        # A stopped generation is discarded: no scoring, no history save.
+        if _is_cancelled(cancel_token):
+            return
+
         # Spawn background post-processing thread (Hybrid + Async)
         if pipeline_flags["enabled"] and not selected_metrics and full_reply:
             if canonical_state is None:
-                canonical_state = build_canonical_state(profile, full_data.get("metadata", {}), user_input)
+                canonical_state = build_canonical_state(profile, metadata, user_input, settings)
             selected_metrics = score_candidate(full_reply, canonical_state, narrative_plan, interaction_mode)
             candidate_metrics = [selected_metrics]
 
@@ -835,24 +1121,36 @@ def get_respond_stream(user_input: str, profile: dict, should_obey: bool | None
                 "full_reply": full_reply,
                 "current_scene": current_scene,
                 "rel_score": rel_score,
-                "memory_core": memory_core,
-                "last_summarized_index": last_summarized_index,
                 "pipeline_flags": pipeline_flags,
                 "narrative_plan": narrative_plan,
                 "memory_stack": memory_stack,
                 "selected_metrics": selected_metrics,
                 "candidate_metrics": candidate_metrics,
                 "critic_applied": critic_applied,
+                "settings": settings,
+                "token_counter": token_counter,
+                "lore_state": lore_state,
+                "sentiment_future": sentiment_future,
+                "turn_timings": turn_timings,
+                "cancel_token": cancel_token,
             },
             daemon=True,
         )
         post_process_thread.start()
 
+    except GenerationCancelled:
+        return
     except Exception as e:
-        if get_setting("debug_mode", False):
+        if _is_cancelled(cancel_token):
+            return
+        if settings.debug_mode:
             yield f"\n[BRAIN ERROR] {traceback.format_exc()}"
         else:
             yield f"\n[BRAIN ERROR] {str(e)}"
+    finally:
+        if sentiment_future is not None and post_process_thread is None:
+            # The turn was stopped or failed: drop the score if it hasn't started yet.
+            sentiment_future.cancel()
 
 def get_respond(user_input: str, profile: dict, should_obey: bool = True, profile_path: str = None, is_regeneration: bool = False) -> str:
     """Non-streaming version of the response generator."""
@@ -0,0 +1,249 @@
+"""
+Rule-based sentiment scoring for the user's message, without a model call.
+
+Scores on the same -5..+5 scale as the LLM scorer in `engines.responses`, from
+a small lexicon tuned for companion chat: multi-word phrases, negation ("not
+nice"), intensifiers and softeners ("really", "kinda"), contrast ("..., but"),
+shouting in caps, exclamation marks, emoji and emoticons, and roleplay
+actions between asterisks ("*hugs you*"), which weigh more than words.
+
+Each estimate carries a confidence in [0, 1]. It drops for mixed signals,
+negated cues, sarcasm markers and long messages the lexicon barely covers,
+so a caller can hand the unsure ones to a model instead.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+
+# Valence of single words, roughly -4..+4.
+LEXICON = {
+    # Affection and warmth
+    "love": 3.2, "loved": 3.0, "lovely": 2.8, "adore": 3.4, "adorable": 2.8, "cute": 2.2,
+    "sweet": 2.2, "sweetheart": 2.5, "darling": 2.2, "dear": 1.6, "kind": 2.0, "caring": 2.2,
+    "care": 1.6, "gentle": 1.6, "warm": 1.4, "beautiful": 2.8, "gorgeous": 2.8, "pretty": 1.8,
+    "handsome": 2.2, "precious": 2.4, "cherish": 3.0, "hug": 2.2, "hugs": 2.2, "kiss": 2.4,
+    "kisses": 2.4, "cuddle": 2.6, "miss": 1.4, "missed": 1.8, "trust": 2.0, "safe": 1.4, "friend": 1.8,
+    "friends": 1.6, "bestie": 2.2,
+    # Approval and gratitude
+    "thanks": 2.2, "thank": 2.0, "thankful": 2.4, "grateful": 2.6, "appreciate": 2.4,
+    "appreciated": 2.4, "good": 1.8, "great": 2.4, "nice": 1.8, "awesome": 2.8, "amazing": 2.9,
+    "wonderful": 3.0, "fantastic": 3.0, "brilliant": 2.8, "perfect": 2.8, "best": 2.4,
+    "excellent": 2.8, "incredible": 2.6, "impressive": 2.2, "proud": 2.2, "smart": 2.0,
+    "clever": 2.0, "funny": 1.8, "fun": 1.8, "cool": 1.4, "glad": 2.0, "happy": 2.4,
+    "excited": 2.0, "enjoy": 2.0, "enjoyed": 2.0, "yay": 2.2, "welcome": 1.4, "sorry": 0.8,
+    "please": 0.4, "forgive": 1.2, "fine": 0.8, "okay": 0.4, "ok": 0.4,
+    # Hostility and insult
+    "hate": -3.4, "hated": -3.2, "despise": -3.6, "loathe": -3.6, "stupid": -3.0, "idiot": -3.2,
+    "dumb": -2.6, "moron": -3.2, "useless": -3.0, "worthless": -3.4, "pathetic": -3.0,
+    "ugly": -2.8, "annoying": -2.4, "annoyed": -2.0, "boring": -2.0, "bored": -1.4,
+    "terrible": -2.8, "awful": -2.8, "horrible": -3.0, "bad": -2.0, "worst": -3.0,
+    "disgusting": -3.2, "gross": -2.4, "creepy": -2.6, "weird": -1.2, "liar": -3.0,
+    "lie": -2.0, "lied": -2.4, "lying": -2.4, "fake": -2.0, "jerk": -2.8, "loser": -3.0,
+    "trash": -3.0, "garbage": -3.0, "rude": -2.4, "mean": -1.8, "cruel": -3.0, "selfish": -2.4,
+    "disappointed": -2.4, "disappointing": -2.4, "disappoint": -2.2, "betray": -3.2,
+    "betrayed": -3.2, "angry": -2.4, "mad": -2.0, "furious": -3.0, "upset": -2.0, "hurt": -2.2,
+    "sad": -0.8, "lonely": -0.6, "kill": -3.4, "die": -2.8, "shut": -1.2, "whatever": -1.0,
+    "ugh": -1.6, "meh": -1.0, "sucks": -2.6, "suck": -2.4, "damn": -1.4, "hell": -1.2,
+    "shit": -2.4, "fuck": -3.0, "fucking": -2.4, "pissed": -2.6, "tired": -0.4, "ignore": -1.8,
+    "ignored": -2.0, "leave": -1.0, "ruin": -2.4, "ruined": -2.4, "screw": -2.0, "scared": -0.6, "afraid": -0.6, "cheer": 1.2,
+}
+
+# Phrases read before single words; the longest match wins.
+PHRASES = {
+    ("love", "you"): 3.6, ("thank", "you"): 2.6, ("miss", "you"): 2.8, ("missed", "you"): 2.8, ("proud", "of", "you"): 3.0,
+    ("i", "like", "you"): 2.6, ("like", "you"): 2.2, ("care", "about", "you"): 2.8,
+    ("good", "job"): 2.4, ("well", "done"): 2.4, ("you're", "the", "best"): 3.2,
+    ("shut", "up"): -3.0, ("go", "away"): -3.0, ("leave", "me", "alone"): -3.2,
+    ("get", "lost"): -3.0, ("screw", "you"): -3.4, ("fuck", "you"): -4.0, ("hate", "you"): -3.8,
+    ("sick", "of"): -2.4, ("fed", "up"): -2.4, ("tired", "of"): -2.0, ("piss", "off"): -3.4,
+    ("thanks", "for", "nothing"): -3.2, ("don't", "care"): -1.8, ("i", "don't", "care"): -2.2, ("not", "bad"): 1.2,
+    # Hedges that only look like cues.
+    ("kind", "of"): 0.0, ("sort", "of"): 0.0, ("a", "bit"): 0.0,
+}
+
+# Verbs that carry sentiment inside roleplay actions (*...*); inflections are derived.
+ACTION_VERBS = {
+    "hug": 2.8, "cuddle": 3.0, "kiss": 3.0, "smile": 2.0, "grin": 1.8, "laugh": 1.6, "giggle": 1.8,
+    "pat": 2.0, "nuzzle": 2.6, "snuggle": 2.8, "blush": 1.6, "wave": 1.0, "hold": 1.2,
+    "squeeze": 1.4, "beam": 2.2, "wink": 1.2, "comfort": 2.4, "caress": 2.4, "stroke": 1.4,
+    "slap": -3.6, "punch": -3.8, "kick": -3.6, "hit": -3.2, "shove": -3.0, "push": -1.6,
+    "glare": -2.4, "frown": -1.8, "scowl": -2.4, "sigh": -1.0, "groan": -1.4, "growl": -2.2,
+    "sneer": -2.6, "scoff": -2.0, "storm": -1.8, "ignore": -2.2, "spit": -3.4, "yell": -2.4,
+    "scream": -2.2, "shout": -1.8, "cry": -1.4, "sob": -1.6, "stab": -4.0, "choke": -3.8,
+    "strangle": -4.0, "throw": -1.2, "pout": -0.8,
+}
+# Actions count for more than the same words said aloud.
+ACTION_WEIGHT = 1.3
+
+# Emoji and text emoticons; emoji are matched by code point (variation selectors ignored).
+EMOJI = {
+    "❤": 3.0, "💕": 3.0, "💖": 3.0, "💗": 3.0, "💞": 3.0, "😍": 3.0, "🥰": 3.2, "😘": 2.8,
+    "😊": 2.2, "☺": 2.2, "🙂": 1.2, "😀": 2.0, "😃": 2.0, "😄": 2.2, "😁": 2.0, "😂": 1.6,
+    "🤣": 1.6, "🤗": 2.6, "👍": 1.6, "🙏": 1.6, "✨": 1.0, "🥺": 0.8, "😉": 1.2, "😌": 1.2,
+    "😠": -2.6, "😡": -3.0, "🤬": -3.4, "😢": -1.6, "😭": -1.6, "😞": -1.8, "😔": -1.6,
+    "😒": -2.0, "🙄": -2.2, "👎": -2.2, "💔": -2.4, "😤": -2.2, "🖕": -3.6, "😑": -1.4,
+    "🤮": -3.0, "😫": -1.6, "😩": -1.4,
+}
+EMOTICONS = {
+    ":)": 2.0, ":-)": 2.0, ":D": 2.4, ":-D": 2.4, "xD": 1.8, "XD": 1.8, ";)": 1.4, ";-)": 1.4,
+    "<3": 3.0, "^^": 1.8, "^_^": 2.0, ":P": 1.0, ":3": 2.0,
+    ":(": -2.0, ":-(": -2.0, ":'(": -1.8, "</3": -2.4, ">:(": -2.8, "-_-": -1.4, ":/": -1.0,
+}
+
+NEGATIONS = {
+    "not", "no", "never", "nothing", "nobody", "nowhere", "neither", "nor", "hardly",
+    "barely", "without", "cannot", "dont", "doesnt", "didnt", "isnt", "arent", "wasnt",
+    "werent", "wont", "cant", "couldnt", "shouldnt", "wouldnt", "aint",
+}
+NEGATION_SCOPE = 3
+# A negated cue flips and weakens ("not great" is milder than "terrible");
+# a negated insult weakens more ("I don't hate you" is hardly a compliment).
+NEGATION_FACTOR = -0.74
+NEGATED_NEGATIVE_FACTOR = -0.4
+
+BOOSTERS = {
+    "very": 0.3, "really": 0.3, "so": 0.3, "extremely": 0.4, "totally": 0.3, "absolutely": 0.4,
+    "super": 0.3, "incredibly": 0.4, "truly": 0.3, "such": 0.2, "completely": 0.3, "utterly": 0.4,
+    "most": 0.3, "too": 0.2, "fucking": 0.4, "deeply": 0.3, "seriously": 0.3,
+    "kinda": -0.3, "somewhat": -0.3, "slightly": -0.4, "bit": -0.3,
+    "little": -0.3, "sorta": -0.3, "almost": -0.2, "fairly": -0.2, "quite": -0.1,
+}
+CAPS_BOOST = 0.25
+EXCLAMATION_BOOST = 0.3
+MAX_EXCLAMATIONS = 4
+# Before the last "but" counts half, after it one and a half.
+CONTRAST_WORDS = {"but", "however", "though", "although", "yet"}
+
+SARCASM_MARKERS = ("yeah right", " /s", "oh great", "sure, whatever", "as if", "big deal", "wow, thanks")
+# Normalisation constant for mapping the summed valence onto -1..1.
+NORMALIZATION_ALPHA = 15.0
+MAX_SCORE = 5
+
+_ACTION_RE = re.compile(r"\*([^*\n]+)\*")
+_TOKEN_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?|[.,;!?]")
+_CLAUSE_BREAKS = {".", ",", ";", "?"}
+_EMOTICON_RE = re.compile(
+    r"(?<!\S)(" + "|".join(re.escape(e) for e in sorted(EMOTICONS, key=len, reverse=True)) + r")(?=$|[\s.,!?])"
+)
+
+
+def _inflections(verb: str) -> set[str]:
+    forms = {verb, f"{verb}s", f"{verb}es", f"{verb}ed", f"{verb}ing"}
+    if verb.endswith("e"):
+        forms |= {f"{verb}d", f"{verb[:-1]}ing"}
+    else:
+        forms |= {f"{verb}{verb[-1]}ed", f"{verb}{verb[-1]}ing"}
+    if verb.endswith("y"):
+        forms |= {f"{verb[:-1]}ies", f"{verb[:-1]}ied"}
+    return forms
+
+
+_ACTION_LEXICON = {**LEXICON, **{form: value for verb, value in ACTION_VERBS.items() for form in _inflections(verb)}}
+_MAX_PHRASE = max(len(phrase) for phrase in PHRASES)
+
+
+@dataclass(frozen=True)
+class SentimentEstimate:
+    """A score from -5 to +5 and how sure the rules are about it (0..1)."""
+
+    score: int
+    confidence: float
+
+
+def _normalize(token: str) -> str:
+    return token.lower().replace("’", "'")
+
+
+def _is_negation(token: str) -> bool:
+    return token in NEGATIONS or token.replace("'", "") in NEGATIONS or token.endswith("n't")
+
+
+def _score_segment(tokens: list[str], is_action: bool, cues: list) -> bool:
+    """Appends the weighted valence of each cue in one span of text to `cues`; returns whether any was negated."""
+    words = [_normalize(token) for token in tokens]
+    lexicon = _ACTION_LEXICON if is_action else LEXICON
+    weight = ACTION_WEIGHT if is_action else 1.0
+    contrast_at = max((i for i, word in enumerate(words) if word in CONTRAST_WORDS), default=-1)
+    negated_any = False
+    # Caps only add emphasis when the rest of the message isn't shouted too.
+    emphasis = any(not token.isupper() for token in tokens if token[0].isalpha())
+
+    i = 0
+    while i < len(words):
+        valence, length = None, 1
+        for size in range(min(_MAX_PHRASE, len(words) - i), 1, -1):
+            phrase = tuple(words[i:i + size])
+            if phrase in PHRASES:
+                valence, length = PHRASES[phrase], size
+                break
+        if valence is None:
+            valence = lexicon.get(words[i])
+        if valence is None or valence == 0:
+            i += length
+            continue
+
+        # Intensifiers and negations just before the cue, stopping at a clause break.
+        scale = 1.0
+        for back in range(1, NEGATION_SCOPE + 1):
+            j = i - back
+            if j < 0 or words[j] in _CLAUSE_BREAKS:
+                break
+            if back <= 2 and words[j] in BOOSTERS:
+                scale *= 1.0 + BOOSTERS[words[j]]
+            if _is_negation(words[j]):
+                scale *= NEGATION_FACTOR if valence > 0 else NEGATED_NEGATIVE_FACTOR
+                negated_any = True
+                break
+        if emphasis and tokens[i].isupper() and len(tokens[i]) > 1:
+            scale *= 1.0 + CAPS_BOOST
+        if contrast_at >= 0:
+            scale *= 1.5 if i > contrast_at else 0.5
+        cues.append(valence * scale * weight)
+        i += length
+    return negated_any
+
+
+def score_sentiment(text: str) -> SentimentEstimate:
+    """Scores `text` from -5 (hostile) to +5 (affectionate) with lexicon rules."""
+    text = text or ""
+    cues = []
+    negated = False
+
+    for match in _EMOTICON_RE.finditer(text):
+        cues.append(EMOTICONS[match.group(1)])
+    for char in text:
+        if char in EMOJI:
+            cues.append(EMOJI[char])
+
+    spoken = _ACTION_RE.sub(" . ", text)
+    negated |= _score_segment(_TOKEN_RE.findall(spoken), False, cues)
+    for action in _ACTION_RE.findall(text):
+        negated |= _score_segment(_TOKEN_RE.findall(action), True, cues)
+
+    word_count = len(re.findall(r"\w+", text))
+    lowered = text.lower()
+    sarcastic = any(marker in lowered for marker in SARCASM_MARKERS)
+
+    total = sum(cues)
+    if total:
+        exclamations = min(MAX_EXCLAMATIONS, text.count("!"))
+        total += math.copysign(EXCLAMATION_BOOST * exclamations, total)
+    compound = total / math.sqrt(total * total + NORMALIZATION_ALPHA)
+    score = max(-MAX_SCORE, min(MAX_SCORE, round(compound * MAX_SCORE)))
+
+    if not cues:
+        # No cue at all: short small talk is safely neutral, a long message may hide something.
+        confidence = 0.8 if word_count <= 20 else 0.45
+    else:
+        positive = sum(cue for cue in cues if cue > 0)
+        negative = -sum(cue for cue in cues if cue < 0)
+        agreement = abs(positive - negative) / (positive + negative)
+        confidence = 0.35 + 0.45 * agreement + 0.2 * min(1.0, len(cues) / 3)
+        if negated:
+            confidence -= 0.1
+        if word_count > 60 and len(cues) < 3:
+            confidence -= 0.15
+    if sarcastic:
+        confidence -= 0.3
+    return SentimentEstimate(score=score, confidence=round(max(0.0, min(1.0, confidence)), 2))
@@ -14,7 +14,7 @@ import wave
 
 from colorama import Fore
 import shutil
-from engines.config import get_setting
+from engines.config import Settings, get_setting
 from engines.xtts_local import XTTSWorker, is_xtts_supported
 from engines.audio_cache import get_cache_path, save_to_cache
 from engines.utilities import save_pcm_as_wav
@@ -194,13 +194,15 @@ def resolve_voice_refs(clone_ref):
     return resolved if resolved else None
 
 
-def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None, language="en", user_name="User"):
+def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None, language="en", user_name="User", settings=None):
     """
     Converts text to an MP3 or WAV file.
     Supports edge-tts (default) and XTTS.
+    `settings` is the turn's Settings snapshot; the TTS master toggle is always read live.
     """
     if not get_setting("tts_enabled", True):
         return False
+    settings = settings or Settings.capture(get_setting)
 
     # Resolve voice_clone_ref: expand directories to sorted WAV file lists
     clone_ref = resolve_voice_refs(clone_ref)
@@ -209,7 +211,7 @@ def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None
     if not cleaned_text:
         return False
 
-    if get_setting("debug_mode", False):
+    if settings.debug_mode:
         print(Fore.MAGENTA + f"[DEBUG] Final TTS Text: '{cleaned_text}'" + Fore.RESET)
 
     # --- Cache Check ---
@@ -254,11 +256,11 @@ def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None
                         save_to_cache(cleaned_text, cache_voice, cache_key_engine, f.read())
                     xtts_success = True
             except Exception as e:
-                if not get_setting("suppress_errors", False):
+                if not settings.suppress_errors:
                     print(Fore.YELLOW + f"[XTTS LOCAL ERROR] {e}" + Fore.RESET)
 
         # Try Remote if Local failed or not available
-        if not xtts_success and clone_ref and get_setting("remote_tts_url"):
+        if not xtts_success and clone_ref and settings.remote_tts_url:
             from engines.xtts_remote import generate_remote_xtts
             try:
                 # Use .wav for remote generation to ensure compatibility, then rename back
@@ -270,7 +272,7 @@ def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None
                             save_to_cache(cleaned_text, cache_voice, cache_key_engine, f.read())
                         xtts_success = True
             except Exception as e:
-                if not get_setting("suppress_errors", False):
+                if not settings.suppress_errors:
                     print(Fore.YELLOW + f"[XTTS REMOTE ERROR] {e}" + Fore.RESET)
 
         if xtts_success:
@@ -282,7 +284,7 @@ def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None
             return True
 
         # Fallback to edge-tts if XTTS failed or not supported
-        if not get_setting("suppress_errors", False):
+        if not settings.suppress_errors:
             print(Fore.YELLOW + "[XTTS FALLBACK] Switching to Edge-TTS." + Fore.RESET)
         engine = "edge-tts"
 
@@ -292,7 +294,7 @@ def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None
             return False
         try:
             if voice is None:
-                voice = get_setting("default_tts_voice", "en-GB-SoniaNeural")
+                voice = settings.default_tts_voice
 
             asyncio.run(generate_edge_tts(cleaned_text, filename, voice=voice))
 
@@ -303,7 +305,7 @@ def generate_audio(text, filename, voice=None, engine="edge-tts", clone_ref=None
 
             return True
         except Exception as e:
-            if not get_setting("suppress_errors", False):
+            if not settings.suppress_errors:
                 print(Fore.RED + f"\n[TTS GEN ERROR] {e}")
             return False
 
@@ -18,7 +18,7 @@ def sanitize_profile_name(profile_name: str) -> str:
     safe_name = (profile_name or "").replace(" ", "_")
     return "".join(char for char in safe_name if char.isalnum() or char in ("_", "-", "(", ")")).rstrip()
 
-def save_json_atomic(file_path, data, indent=4):
+def save_json_atomic(file_path, data, indent=4, serialize=None):
     """
     Saves a dictionary to a JSON file atomically to prevent corruption.
     
@@ -26,6 +26,8 @@ def save_json_atomic(file_path, data, indent=4):
         file_path (str): The destination file path.
         data (dict): The data to save.
         indent (int): JSON indentation level.
+        serialize (callable, optional): Turns `data` into the file content (str, or
+            bytes written as-is) instead of `json.dumps`.
         
     Returns:
         bool: True if successful, False otherwise.
@@ -34,16 +36,23 @@ def save_json_atomic(file_path, data, indent=4):
     try:
         # 1. Serialize to string first to catch TypeErrors (non-serializable objects)
         # before we even touch the file system.
-        json_data = json.dumps(data, indent=indent, ensure_ascii=False)
+        if serialize is None:
+            json_data = json.dumps(data, indent=indent, ensure_ascii=False)
+        else:
+            json_data = serialize(data)
         
         # 2. Write to a temporary file.
-        with open(temp_file, "w", encoding="utf-8") as f:
-            f.write(json_data)
+        if isinstance(json_data, bytes):
+            with open(temp_file, "wb") as f:
+                f.write(json_data)
+        else:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                f.write(json_data)
         
         # 3. Atomic rename (overwrites existing file).
         os.replace(temp_file, file_path)
         return True
-    except (TypeError, IOError, OSError):
+    except (TypeError, ValueError, OSError):
         if os.path.exists(temp_file):
             try:
                 os.remove(temp_file)
@@ -155,13 +164,13 @@ def pick_history() -> str:
     if not os.path.exists(history_dir):
         return None
 
-    history_files = [f for f in os.listdir(history_dir) if f.endswith(".json")]
+    history_files = [f for f in os.listdir(history_dir) if f.endswith(("_history.json", "_history.jsonl"))]
     if not history_files:
         return None
 
     print(Fore.YELLOW + Style.BRIGHT + "\n--- Select Conversation History ---")
     for i, h in enumerate(history_files, 1):
-        display_name = h.replace(".json", "").replace("_", " ").title()
+        display_name = re.sub(r"\.jsonl?$", "", h).replace("_", " ").title()
         print(Fore.CYAN + f"  [{i}] {display_name}")
 
     while True:
@@ -0,0 +1,399 @@
+"""
+Local episodic memory: an embedding index over conversation messages that
+runs on the CPU without the remote bridge.
+
+Each message is embedded once and stored as a row of a float32 matrix on disk
+(`{profile}_vectors.f32`, memory-mapped for queries) with a parallel file of
+chained content checksums (`{profile}_vectors.fp`) that lets `sync` re-embed
+only the changed tail, like engines.memory_index. Queries are one vectorized cosine
+product over the matrix.
+
+`LoreVectorIndex` does the same for lorebook entries, stored next to each
+lorebook file.
+
+Embedders are pluggable: "hashing" (default) is a dependency-free hashing
+vectorizer; "sentence-transformers" uses a local sentence-transformers model
+when that package is installed. NumPy is required for the index itself.
+"""
+
+import json
+import math
+import os
+import threading
+import zlib
+from collections import Counter
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from engines.memory_index import prefix_fingerprints, text_fingerprint, unchanged_prefix, word_tokens
+from engines.utilities import sanitize_profile_name
+
+VECTORS_SUFFIX = "_vectors.f32"
+FINGERPRINTS_SUFFIX = "_vectors.fp"
+VECTOR_META_SUFFIX = "_vectors.json"
+LORE_VECTORS_SUFFIX = ".vectors.f32"
+LORE_VECTOR_META_SUFFIX = ".vectors.json"
+DEFAULT_SENTENCE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedder: words and word bigrams are hashed into `dim`
+    signed buckets with sublinear term weights, then L2-normalized.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Counter:
+        words = word_tokens(text)
+        counts = Counter(words)
+        counts.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+        return counts
+
+    def embed(self, texts: list[str]):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dim] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """Embeds with a local sentence-transformers model on the CPU."""
+
+    def __init__(self, model_name: str = DEFAULT_SENTENCE_MODEL):
+        from sentence_transformers import SentenceTransformer  # Optional dependency.
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: list[str]):
+        vectors = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+
+
+def create_embedder(kind: str = "hashing"):
+    """Returns an embedder for `kind`, falling back to hashing if sentence-transformers is unavailable."""
+    if kind in ("sentence-transformers", "sentence_transformers"):
+        try:
+            return SentenceTransformerEmbedder()
+        except Exception:
+            pass
+    return HashingEmbedder()
+
+
+class VectorMemoryIndex:
+    """
+    Embedding index for one conversation, stored under `path_prefix`.
+    `sync(history)` embeds only messages that are new or changed since the
+    last sync (`sync(messages, start)` when only the messages from `start` on
+    are at hand); `search(text, limit)` returns message ids by cosine similarity.
+    """
+
+    def __init__(self, path_prefix: str, embedder):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is required for vector memory")
+        self.embedder = embedder
+        self.vectors_path = path_prefix + VECTORS_SUFFIX
+        self.fingerprints_path = path_prefix + FINGERPRINTS_SUFFIX
+        self.meta_path = path_prefix + VECTOR_META_SUFFIX
+        self._fingerprints = None
+        self._matrix = None
+        self._lock = threading.Lock()
+        # See MessageIndex.tracks_history.
+        self.tracks_history = False
+
+    def _row_bytes(self) -> int:
+        return self.embedder.dim * 4
+
+    def _reset_files(self) -> None:
+        for path in (self.vectors_path, self.fingerprints_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            with open(self.meta_path, "w", encoding="UTF-8") as f:
+                json.dump({"embedder": self.embedder.name, "dim": self.embedder.dim}, f)
+        except OSError:
+            pass
+
+    def _load(self) -> None:
+        if self._fingerprints is not None:
+            return
+        try:
+            with open(self.meta_path, "r", encoding="UTF-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("embedder") != self.embedder.name or meta.get("dim") != self.embedder.dim:
+            # Vectors from another embedder are meaningless here; start over.
+            self._reset_files()
+            self._fingerprints = []
+            return
+        try:
+            fingerprints = np.fromfile(self.fingerprints_path, dtype=np.uint32).tolist()
+            rows = os.path.getsize(self.vectors_path) // self._row_bytes()
+        except (OSError, ValueError):
+            fingerprints, rows = [], 0
+        # A crash between the two appends leaves one file longer; keep what both describe.
+        self._fingerprints = fingerprints[:rows]
+        self._truncate_files(len(self._fingerprints))
+
+    def _truncate_files(self, count: int) -> None:
+        self._matrix = None
+        for path, size in ((self.vectors_path, count * self._row_bytes()), (self.fingerprints_path, count * 4)):
+            try:
+                if os.path.getsize(path) > size:
+                    os.truncate(path, size)
+            except OSError:
+                pass
+
+    def _append(self, fingerprints: list, vectors) -> bool:
+        self._matrix = None
+        try:
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.fingerprints_path, "ab") as f:
+                f.write(np.asarray(fingerprints, dtype=np.uint32).tobytes())
+        except OSError:
+            self._truncate_files(len(self._fingerprints))
+            return False
+        self._fingerprints.extend(fingerprints)
+        return True
+
+    def _get_matrix(self):
+        if self._matrix is None:
+            count = len(self._fingerprints)
+            if not count:
+                return np.zeros((0, self.embedder.dim), dtype=np.float32)
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.embedder.dim))
+        return self._matrix
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._fingerprints)
+
+    def sync(self, history: list, start: int = 0) -> int:
+        """
+        Updates the index to describe `history` (the full conversation), or,
+        with `start`, a conversation whose messages from `start` on are `history`.
+        Returns the number of messages that were embedded.
+        """
+        with self._lock:
+            self._load()
+            if start > len(self._fingerprints):
+                raise ValueError(f"index holds {len(self._fingerprints)} messages, cannot sync from {start}")
+            previous = self._fingerprints[start - 1] if start else 0
+            fingerprints = prefix_fingerprints(history, previous)
+            keep = unchanged_prefix(self._fingerprints[start:], fingerprints)
+            if start + keep < len(self._fingerprints):
+                del self._fingerprints[start + keep:]
+                self._truncate_files(start + keep)
+
+            new_messages = history[keep:]
+            if new_messages:
+                vectors = self.embedder.embed([str(msg.get("content", "")) for msg in new_messages])
+                if not self._append(fingerprints[keep:], vectors):
+                    return 0
+            return len(new_messages)
+
+    def search(self, text: str, limit: int, before: int | None = None, min_score: float = 0.0) -> list[int]:
+        """
+        Returns ids of the `limit` messages most similar to `text`, best first.
+        Only ids below `before` are considered, and only scores above `min_score`.
+        """
+        if limit <= 0:
+            return []
+        query = self.embedder.embed([text])[0]
+        with self._lock:
+            self._load()
+            matrix = self._get_matrix()
+            if before is not None:
+                matrix = matrix[:max(0, before)]
+            if not len(matrix):
+                return []
+            scores = np.asarray(matrix @ query)
+            del matrix
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        ranked = sorted(top.tolist(), key=lambda message_id: (float(scores[message_id]), message_id), reverse=True)
+        return [message_id for message_id in ranked if scores[message_id] > min_score]
+
+
+class LoreVectorIndex:
+    """
+    Embedding index over the entries of one lorebook, stored next to the
+    lorebook file (`{lorebook}.vectors.f32` plus `{lorebook}.vectors.json`
+    naming the entry and text checksum of each row). `sync(keys, texts)`
+    embeds only entries whose key or text is new, so editing one entry
+    re-embeds just that entry.
+    """
+
+    def __init__(self, lorebook_path: str, embedder):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is required for vector memory")
+        self.embedder = embedder
+        self.vectors_path = lorebook_path + LORE_VECTORS_SUFFIX
+        self.meta_path = lorebook_path + LORE_VECTOR_META_SUFFIX
+        self._keys = None
+        self._fingerprints = []
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        if self._keys is not None:
+            return
+        self._keys = []
+        self._matrix = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        try:
+            with open(self.meta_path, "r", encoding="UTF-8") as f:
+                meta = json.load(f)
+            if meta.get("embedder") != self.embedder.name or meta.get("dim") != self.embedder.dim:
+                return
+            keys = [str(key) for key in meta.get("keys", [])]
+            fingerprints = [int(fingerprint) for fingerprint in meta.get("fingerprints", [])]
+            matrix = np.fromfile(self.vectors_path, dtype=np.float32)
+        except (OSError, ValueError, TypeError, AttributeError):
+            return
+        # Files from an interrupted save don't describe each other; everything is re-embedded.
+        if matrix.size == len(keys) * self.embedder.dim and len(fingerprints) == len(keys):
+            self._keys = keys
+            self._fingerprints = fingerprints
+            self._matrix = matrix.reshape(len(keys), self.embedder.dim)
+
+    def _save(self) -> None:
+        meta = {"embedder": self.embedder.name, "dim": self.embedder.dim, "keys": self._keys, "fingerprints": self._fingerprints}
+        for path, write in (
+            (self.vectors_path, lambda f: f.write(self._matrix.tobytes())),
+            (self.meta_path, lambda f: f.write(json.dumps(meta).encode("utf-8"))),
+        ):
+            temp_file = path + ".tmp"
+            try:
+                with open(temp_file, "wb") as f:
+                    write(f)
+                os.replace(temp_file, path)
+            except OSError:
+                if os.path.exists(temp_file):
+                    try:
+                        os.remove(temp_file)
+                    except OSError:
+                        pass
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._keys)
+
+    def sync(self, keys: list[str], texts: list[str]) -> int:
+        """
+        Makes the index describe the entries `keys` (with embedding texts
+        `texts`, in the same order). Returns the number of entries embedded.
+        """
+        with self._lock:
+            self._load()
+            fingerprints = [text_fingerprint(text) for text in texts]
+            if keys == self._keys and fingerprints == self._fingerprints:
+                return 0
+            rows = {row_id: row for row, row_id in enumerate(zip(self._keys, self._fingerprints))}
+            row_ids = list(zip(keys, fingerprints))
+            missing = [position for position, row_id in enumerate(row_ids) if row_id not in rows]
+            matrix = np.zeros((len(keys), self.embedder.dim), dtype=np.float32)
+            if missing:
+                matrix[missing] = self.embedder.embed([texts[position] for position in missing])
+            kept = [(position, rows[row_id]) for position, row_id in enumerate(row_ids) if row_id in rows]
+            if kept:
+                positions, old_rows = zip(*kept)
+                matrix[list(positions)] = self._matrix[list(old_rows)]
+            self._keys = list(keys)
+            self._fingerprints = fingerprints
+            self._matrix = matrix
+            self._save()
+            return len(missing)
+
+    def search(self, text: str, limit: int, min_score: float = 0.0) -> list[tuple[str, float]]:
+        """Returns (entry key, cosine score) of the `limit` entries most similar to `text`, best first."""
+        if limit <= 0:
+            return []
+        query = self.embedder.embed([text])[0]
+        with self._lock:
+            self._load()
+            keys, matrix = self._keys, self._matrix
+        if not keys:
+            return []
+        scores = matrix @ query
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        ranked = sorted(top.tolist(), key=lambda row: (float(scores[row]), -row), reverse=True)
+        return [(keys[row], float(scores[row])) for row in ranked if scores[row] > min_score]
+
+
+_indexes = {}
+_lore_indexes = {}
+_embedders = {}
+_registry_lock = threading.Lock()
+
+
+def _get_embedder(embedder_kind: str):
+    embedder = _embedders.get(embedder_kind)
+    if embedder is None:
+        embedder = _embedders[embedder_kind] = create_embedder(embedder_kind)
+    return embedder
+
+
+def get_vector_index(profile_name: str, history_dir: str = "history", embedder_kind: str = "hashing") -> VectorMemoryIndex | None:
+    """Returns the process-wide vector index for a profile, or None if NumPy is not installed."""
+    if not NUMPY_AVAILABLE:
+        return None
+    safe_name = sanitize_profile_name(profile_name) or "session"
+    path_prefix = os.path.join(history_dir, safe_name)
+    with _registry_lock:
+        embedder = _get_embedder(embedder_kind)
+        key = (path_prefix, embedder.name)
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = VectorMemoryIndex(path_prefix, embedder)
+        return index
+
+
+def apply_history_change(history_dir: str, profile_name: str, start: int, messages: list) -> None:
+    """HistoryManager change listener for vector indexes (see engines.memory_index.apply_history_change)."""
+    path_prefix = os.path.join(history_dir, sanitize_profile_name(profile_name) or "session")
+    with _registry_lock:
+        indexes = [index for key, index in _indexes.items() if key[0] == path_prefix]
+    for index in indexes:
+        if index.tracks_history:
+            try:
+                index.sync(messages, start)
+            except ValueError:
+                index.tracks_history = False
+
+
+def get_lore_vector_index(lorebook_path: str, embedder_kind: str = "hashing") -> LoreVectorIndex | None:
+    """Returns the process-wide vector index for a lorebook file, or None if NumPy is not installed."""
+    if not NUMPY_AVAILABLE:
+        return None
+    with _registry_lock:
+        embedder = _get_embedder(embedder_kind)
+        key = (os.path.abspath(lorebook_path), embedder.name)
+        index = _lore_indexes.get(key)
+        if index is None:
+            index = _lore_indexes[key] = LoreVectorIndex(lorebook_path, embedder)
+        return index
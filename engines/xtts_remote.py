@@ -7,6 +7,7 @@ import requests
 import os
 import hashlib
 from colorama import Fore
+from engines import http_client
 from engines.config import get_setting
 from engines.utilities import save_pcm_as_wav, redact_pii
 
@@ -31,17 +32,14 @@ def ensure_voice_on_bridge(bridge_url, speaker_id, speaker_wavs):
     if speaker_id in _UPLOADED_VOICES:
         return True
 
-    # Common headers for ngrok-based bridges to bypass warning pages
-    # Connection: close can help with 10054 resets on some proxies
-    headers = {
-        "ngrok-skip-browser-warning": "true",
-        "Connection": "close"
-    }
+    # Common headers for ngrok-based bridges to bypass warning pages.
+    # The connection stays open (pooled in engines.http_client) for the requests that follow.
+    headers = {"ngrok-skip-browser-warning": "true"}
 
     try:
         # 1. Pre-flight Check: Ensure bridge is reachable at all
         try:
-            r_ping = requests.get(bridge_url.rstrip('/'), headers=headers, timeout=5)
+            r_ping = http_client.get(bridge_url.rstrip('/'), headers=headers, timeout=5)
             if r_ping.status_code >= 500:
                 print(Fore.YELLOW + f"[XTTS REMOTE] Warning: Bridge returned {r_ping.status_code}. It might still be starting up." + Fore.RESET)
         except Exception as e:
@@ -53,7 +51,7 @@ def ensure_voice_on_bridge(bridge_url, speaker_id, speaker_wavs):
         if get_setting("debug_mode", False):
             print(Fore.MAGENTA + f"[DEBUG] Checking speaker existence: {check_url}" + Fore.RESET)
             
-        r = requests.get(check_url, headers=headers, timeout=10)
+        r = http_client.get(check_url, headers=headers, timeout=10)
         
         if r.status_code == 200:
             try:
@@ -93,7 +91,7 @@ def ensure_voice_on_bridge(bridge_url, speaker_id, speaker_wavs):
             })
             
             # Use a conservative 60s timeout for the single-file POST
-            resp = requests.post(upload_url, data=data, files=files, headers=headers, timeout=60)
+            resp = http_client.post(upload_url, data=data, files=files, headers=headers, timeout=60)
 
             if resp.status_code == 200:
                 print(Fore.GREEN + f"[XTTS REMOTE] Voice profile '{speaker_id}' registered successfully." + Fore.RESET)
@@ -154,7 +152,7 @@ def generate_remote_xtts(text, filename, speaker_wav, language="en", user_name="
         
         # Use a context manager to ensure the connection is closed after reading the stream
         # Phase 2 will implement real-time streaming playback.
-        with requests.post(endpoint, data=data, headers=headers, timeout=120, stream=True) as response:
+        with http_client.post(endpoint, data=data, headers=headers, timeout=120, stream=True) as response:
             if response.status_code == 200:
                 all_pcm = b""
                 for chunk in response.iter_content(chunk_size=4096):
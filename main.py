@@ -75,6 +75,7 @@ def main():
             from menu import TaiMenu, set_terminal_appearance
             from engines.app_commands import RestartRequested
             from engines.config import get_setting
+            from engines.memory_v2 import memory_manager
             
             if get_setting("clear_on_start", True):
                 print("\033[H\033[J", end="")
@@ -83,7 +84,11 @@ def main():
             set_terminal_appearance(title="t.ai")
             
             app = TaiMenu(char_path=None, user_path=None)
-            app.run()
+            try:
+                app.run()
+            finally:
+                # Persist any write-behind history before exiting or restarting
+                memory_manager.flush()
             
             # If app.run() returns normally, break the loop
             break
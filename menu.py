@@ -45,7 +45,11 @@ from engines.recap_service import (
 from engines.response_orchestrator import iterate_response_events
 from engines.tts_module import generate_audio, play_audio
 from engines.memory_v2 import memory_manager
-from engines.lorebook import sync_lore_to_remote, load_lorebook
+from engines.lorebook import get_lorebooks, lorebook_paths, sync_lore_to_remote
+from engines.llm_client import CancellationToken
+
+# Commands that rewind or switch the stored conversation under a running turn.
+CHAT_CHANGING_COMMANDS = ("rewind", "branch")
 
 # Ensure the project root is in sys.path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -129,6 +133,7 @@ class TaiMenu(App):
         ("ctrl+q", "quit", "Quit"),
         ("alt+left", "previous_response", "Prev Resp"),
         ("alt+right", "next_or_regenerate_response", "Next/Regen"),
+        ("escape", "stop_generation", "Stop"),
     ]
 
     show_sidebar = reactive(True)
@@ -176,6 +181,7 @@ class TaiMenu(App):
         self.history_profile_name = ""
         self._current_char_avatar_path = None
         self._current_user_avatar_path = None
+        self._generation_token = None
 
     def _resolve_image_widget_type(self) -> type[Image]:
         protocol = get_setting("image_protocol", "auto")
@@ -268,6 +274,17 @@ class TaiMenu(App):
                 pass
             self.stream_response(user_text, is_regeneration=True)
 
+    def action_stop_generation(self) -> None:
+        """Stops the reply being generated; the partial reply is not saved."""
+        if self._generation_token is not None:
+            self._generation_token.cancel()
+
+    def _cancel_generation(self) -> None:
+        """Stops and forgets the running generation before the chat changes under it."""
+        token, self._generation_token = self._generation_token, None
+        if token is not None:
+            token.cancel()
+
     def _message_header(self, role: str, message_number: int | None) -> str:
         """Build a standardized bubble header with optional message numbering."""
         if role == "user":
@@ -283,9 +300,9 @@ class TaiMenu(App):
 
     def _current_assistant_message_number(self) -> int | None:
         """Return the 1-based history index for the latest assistant message, if available."""
-        full_history = memory_manager.load_history(self.history_profile_name)
-        if full_history and full_history[-1].get("role") == "assistant":
-            return len(full_history)
+        recent = memory_manager.load_history(self.history_profile_name, limit=1)
+        if recent and recent[-1].get("role") == "assistant":
+            return memory_manager.get_history_length(self.history_profile_name)
         return None
 
     def refresh_last_ai_message(self, content: str, index: int, total: int) -> None:
@@ -398,6 +415,8 @@ class TaiMenu(App):
         if not char_path:
             return
 
+        self._cancel_generation()
+
         # Clear TTS queues
         while not self.tts_text_queue.empty():
             try:
@@ -562,9 +581,9 @@ class TaiMenu(App):
         while True:
             data = self.tts_text_queue.get()
             if data is None: break
-            text, voice, engine, clone_ref, language, user_name = data
+            text, voice, engine, clone_ref, language, user_name, settings = data
             temp_filename = os.path.join(os.environ.get("TEMP", "/tmp"), f"tts_{time.time()}.mp3")
-            if generate_audio(text, temp_filename, voice=voice, engine=engine, clone_ref=clone_ref, language=language, user_name=user_name):
+            if generate_audio(text, temp_filename, voice=voice, engine=engine, clone_ref=clone_ref, language=language, user_name=user_name, settings=settings):
                 self.audio_file_queue.put(temp_filename)
             self.tts_text_queue.task_done()
 
@@ -681,8 +700,11 @@ class TaiMenu(App):
         # Sync lore to remote bridge if configured
         remote_url = get_setting("remote_llm_url")
         if remote_url and self.character_profile:
-            lore_file = self.character_profile.get("lorebook_path") or "lorebooks/default.json"
-            lorebook_data = load_lorebook(lore_file)
+            lorebook_data = get_lorebooks(lorebook_paths(
+                self.character_profile,
+                memory_manager.get_metadata(self.history_profile_name),
+                get_setting("global_lorebooks", []),
+            ))
             if lorebook_data.get("entries"):
                 self._sync_lore_worker(remote_url, lorebook_data)
 
@@ -799,9 +821,14 @@ class TaiMenu(App):
 
         # Handle commands (original message)
         if message.startswith("//"):
+            if message.lstrip("/").split(" ", 1)[0].lower() in CHAT_CHANGING_COMMANDS:
+                # Stop the running turn before the history changes, so its reply
+                # is not committed onto the rewound or restored conversation.
+                self._cancel_generation()
             try:
                 command_action = handle_command_input(message, self.history_profile_name)
             except RestartRequested:
+                memory_manager.flush()
                 self.exit()
                 raise
             except ValueError as exc:
@@ -835,6 +862,15 @@ class TaiMenu(App):
                 )
                 return
 
+            if command_action["type"] == "branch_restore":
+                self.reload_chat_from_history()
+                self.check_for_rolling_summary()
+                self.add_message(
+                    f"[SYSTEM] Switched to branch #{command_action['branch_id']}: {command_action['original_count']} -> {command_action['kept_count']} messages.",
+                    role="command",
+                )
+                return
+
             if command_action["type"] == "command_noop":
                 self.add_message("[SYSTEM] Recognized command pattern but no action taken: Non-existent command.", role="command")
                 return
@@ -890,7 +926,22 @@ class TaiMenu(App):
     def stream_response(self, message: str, is_regeneration: bool = False, message_number: int | None = None) -> None:
         """Prepare UI targets on the main thread, then stream in a worker thread."""
         container, ai_msg, header = self._prepare_stream_widgets(is_regeneration, message_number=message_number)
-        self.response_worker(message, is_regeneration, container, ai_msg, header)
+        # A new turn replaces any reply still streaming.
+        self._cancel_generation()
+        self._generation_token = CancellationToken()
+        self.response_worker(message, is_regeneration, container, ai_msg, header, self._generation_token)
+
+    def _show_stopped_reply(self, ai_msg: Static, header: str, partial: str, is_regeneration: bool) -> None:
+        """Marks a stopped reply as unsaved, or puts back the stored reply a regeneration was replacing."""
+        recent = memory_manager.load_history(self.history_profile_name, limit=1)
+        if is_regeneration and recent and recent[-1].get("role") == "assistant":
+            last_msg = recent[-1]
+            alternatives = last_msg.get("alternatives", [])
+            self.refresh_last_ai_message(last_msg.get("content", ""), last_msg.get("selected_index", 0), len(alternatives))
+            return
+        ai_msg.update(
+            f"{header}\n{self.format_rp(partial, role='assistant')}\n\n[dim italic](stopped, not saved)[/dim italic]"
+        )
 
     @work(exclusive=True, thread=True)
     def response_worker(
@@ -900,6 +951,7 @@ class TaiMenu(App):
         container: ScrollableContainer,
         ai_msg: Static,
         header: str,
+        cancel_token: CancellationToken | None = None,
     ) -> None:
         """Worker to handle the LLM streaming and TTS queuing."""
         full_response = ""
@@ -911,6 +963,7 @@ class TaiMenu(App):
             history_profile_name=self.history_profile_name,
             is_regeneration=is_regeneration,
             user_name=user_name,
+            cancel_token=cancel_token,
         ):
 
             if event["type"] == "chunk":
@@ -918,14 +971,21 @@ class TaiMenu(App):
                 self.app.call_from_thread(ai_msg.update, f"{header}\n{self.format_rp(full_response, role='assistant')}")
                 self.app.call_from_thread(container.scroll_end, animate=False)
             elif event["type"] == "tts":
-                self.tts_text_queue.put(event["payload"])
+                self.tts_text_queue.put((*event["payload"], event.get("settings")))
             elif event["type"] == "complete":
                 full_response = event["full_response"]
+            elif event["type"] == "cancelled":
+                # Left alone if a newer turn or a chat change took over the bubble.
+                if cancel_token is self._generation_token:
+                    self.app.call_from_thread(
+                        self._show_stopped_reply, ai_msg, header, event["full_response"], is_regeneration
+                    )
+                return
 
         # Add pagination indicator if alternatives exist
-        full_history = memory_manager.load_history(self.history_profile_name)
-        if full_history and full_history[-1].get("role") == "assistant":
-            last_msg = full_history[-1]
+        recent = memory_manager.load_history(self.history_profile_name, limit=1)
+        if recent and recent[-1].get("role") == "assistant":
+            last_msg = recent[-1]
             alternatives = last_msg.get("alternatives", [])
             if alternatives:
                 idx = last_msg.get("selected_index", 0)
@@ -948,8 +1008,9 @@ class TaiMenu(App):
         limit = get_setting("memory_limit", 15)
         to_summarize_count = rolling_summary_target_index(history_len, last_index, limit)
         if to_summarize_count is not None:
-            full_history = memory_manager.load_history(self.history_profile_name)
-            new_messages_to_sum = full_history[last_index:to_summarize_count]
+            # Only the unsummarized tail is needed; older messages may already be archived.
+            unsummarized = memory_manager.load_history(self.history_profile_name, limit=history_len - last_index)
+            new_messages_to_sum = unsummarized[:to_summarize_count - last_index]
             self.perform_rolling_summary(new_messages_to_sum, to_summarize_count)
 
     @work(thread=True)
@@ -0,0 +1,70 @@
+"""
+Benchmark: cold `load_history(limit=N)` latency as the history grows.
+Compares the offset-index tail read against a full parse for each storage mode.
+
+Run from the repository root:
+    python -m tests.bench_history_tail
+"""
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engines.memory_v2 import HistoryManager
+
+SIZES = (100, 1_000, 10_000, 100_000)
+LIMIT = 15
+RUNS = 5
+PROFILE = "BenchProfile"
+
+
+def _make_history(count: int) -> list:
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message {i}: the lantern flickers as the companion answers at some length. " * 3,
+        }
+        for i in range(count)
+    ]
+
+
+def _median_ms(fn) -> float:
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    root = tempfile.mkdtemp(prefix="tai_bench_tail_")
+    try:
+        print(f"{'mode':<8} {'messages':>9} {'tail read (ms)':>15} {'full parse (ms)':>16}")
+        for mode in ("json", "journal", "sqlite"):
+            for size in SIZES:
+                manager = HistoryManager(history_dir=os.path.join(root, f"{mode}_{size}"), storage_mode=mode)
+                manager.save_history(PROFILE, _make_history(size))
+
+                def tail_read():
+                    manager.invalidate_cache()
+                    result = manager.load_history(PROFILE, limit=LIMIT)
+                    assert len(result) == LIMIT
+
+                def full_parse():
+                    manager.invalidate_cache()
+                    manager.load_history(PROFILE)
+
+                print(f"{mode:<8} {size:>9} {_median_ms(tail_read):>15.3f} {_median_ms(full_parse):>16.3f}")
+                getattr(manager.storage, "close", lambda: None)()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
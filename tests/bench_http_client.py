@@ -0,0 +1,110 @@
+"""
+Benchmark: per-request latency against a local HTTPS bridge stand-in, with a
+fresh connection per request (bare `requests.post`, as before) versus the
+pooled keep-alive client in engines.http_client.
+
+The stand-in adds `--rtt` seconds per round trip: two for each new
+connection (TCP + TLS 1.3 handshakes) and one per request, to approximate a
+Cloudflare/ngrok tunnel. Needs the `openssl` command for a throwaway
+certificate.
+
+Run from the repository root:
+    python -m tests.bench_http_client [--rtt 0.05] [--requests 20]
+"""
+
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+
+from engines import http_client
+
+
+def _make_certificate(directory: str) -> tuple[str, str]:
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+         "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def _start_bridge(cert: str, key: str, rtt: float) -> tuple[ThreadingHTTPServer, dict]:
+    stats = {"connections": 0}
+
+    class BridgeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            stats["connections"] += 1
+            time.sleep(2 * rtt)  # TCP + TLS handshakes
+            super().setup()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(rtt)
+            body = json.dumps({"choices": [{"message": {"content": "Hello."}}]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("localhost", 0), BridgeHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def _measure(name: str, post, url: str, cert: str, count: int, stats: dict) -> float:
+    payload = {"messages": [{"role": "user", "content": "Hi"}], "max_tokens": 16}
+    connections = stats["connections"]
+    started = time.perf_counter()
+    for _ in range(count):
+        response = post(url, json=payload, timeout=30, verify=cert)
+        response.raise_for_status()
+        response.json()
+    per_request = (time.perf_counter() - started) / count
+    print(f"{name:<26} {per_request * 1e3:8.2f} ms/request   {stats['connections'] - connections:3d} connections")
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt", type=float, default=0.05, help="simulated tunnel round trip, seconds")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = _make_certificate(directory)
+        for rtt in (0.0, args.rtt):
+            server, stats = _start_bridge(cert, key, rtt)
+            url = f"https://localhost:{server.server_address[1]}/chat"
+            print(f"simulated RTT {rtt * 1e3:.0f} ms, {args.requests} sequential requests")
+            before = _measure("fresh connection", requests.post, url, cert, args.requests, stats)
+            after = _measure("pooled keep-alive", http_client.post, url, cert, args.requests, stats)
+            print(f"saved per request: {(before - after) * 1e3:.2f} ms ({before / after:.1f}x)\n")
+            http_client.close_all()
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: one lorebook scan over a 5,000-entry synthetic lorebook, with the
+previous per-key regex loop versus the compiled Aho-Corasick matcher.
+
+Run from the repository root:
+    python -m tests.bench_lore_scan
+"""
+
+import os
+import random
+import re
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engines.lorebook import LoreMatcher, scan_for_lore
+
+ENTRIES = 5_000
+SCANS = 20
+SYLLABLES = ["ka", "ri", "mo", "then", "dor", "el", "va", "shi", "lun", "gar", "os", "quil"]
+FILLER = "the of and we you said walked toward into a quiet old harbor road light night".split()
+
+
+def _name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def _lorebook(rng: random.Random) -> dict:
+    entries = []
+    for i in range(ENTRIES):
+        keys = [_name(rng) for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.2:
+            keys.append(f"{_name(rng)} {_name(rng)}")
+        entries.append({
+            "id": str(i),
+            "keys": keys,
+            "content": f"Entry {i} about {keys[0]}.",
+            "enabled": rng.random() > 0.05,
+            "insertion_order": rng.randint(0, 200),
+        })
+    return {"entries": entries}
+
+
+def _messages(rng: random.Random, lorebook: dict) -> list:
+    """Last three turns plus the input, ~120 words each, mentioning a few entries."""
+    messages = []
+    for _ in range(4):
+        words = [rng.choice(FILLER) for _ in range(120)]
+        for _ in range(3):
+            words[rng.randrange(len(words))] = rng.choice(rng.choice(lorebook["entries"])["keys"])
+        messages.append({"role": "user", "content": " ".join(words).capitalize() + "."})
+    return messages
+
+
+def _regex_scan(recent_messages: list, lorebook_data: dict) -> str:
+    """The scan as it was: one fresh regex per key of every entry."""
+    text_to_scan = " ".join([msg.get("content", "").lower() for msg in recent_messages])
+    active_lore = []
+    for entry in lorebook_data.get("entries", []):
+        if not entry.get("enabled", True):
+            continue
+        for key in entry.get("keys", []):
+            if re.search(fr'\b{re.escape(key.lower())}\b', text_to_scan):
+                active_lore.append(entry)
+                break
+    if not active_lore:
+        return ""
+    active_lore.sort(key=lambda x: x.get("insertion_order", 100))
+    lore_text = "[WORLD INFO / LORE]\n"
+    for entry in active_lore:
+        content = entry.get("content", "").strip()
+        if content:
+            lore_text += f"- {content}\n"
+    return lore_text.strip()
+
+
+def main():
+    rng = random.Random(42)
+    lorebook = _lorebook(rng)
+    messages = _messages(rng, lorebook)
+    text_chars = sum(len(msg["content"]) for msg in messages)
+    key_count = sum(len(entry["keys"]) for entry in lorebook["entries"])
+    print(f"lorebook: {ENTRIES} entries, {key_count} keys; scanned text: {text_chars} chars")
+
+    expected = _regex_scan(messages, lorebook)
+    assert scan_for_lore(messages, lorebook) == expected, "matcher disagrees with the regex scan"
+    print(f"activated entries: {expected.count(chr(10))}")
+
+    started = time.perf_counter()
+    LoreMatcher(lorebook["entries"])
+    print(f"{'compile (once per lorebook)':<28} {(time.perf_counter() - started) * 1e3:8.2f} ms")
+
+    before = min(timeit.repeat(lambda: _regex_scan(messages, lorebook), number=SCANS, repeat=3)) / SCANS
+    print(f"{'regex per key':<28} {before * 1e3:8.2f} ms/scan")
+    after = min(timeit.repeat(lambda: scan_for_lore(messages, lorebook), number=SCANS, repeat=3)) / SCANS
+    print(f"{'compiled automaton':<28} {after * 1e3:8.2f} ms/scan")
+    print(f"speedup: {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
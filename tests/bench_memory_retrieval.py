@@ -0,0 +1,109 @@
+"""
+Benchmark: semantic memory retrieval on a synthetic 50k-message history.
+Plants "fact" messages with rare words among chatty filler, then asks questions
+that mention each fact's rare words alongside common ones, and reports
+recall@K (was the planted fact retrieved?) and per-query latency for:
+
+  * the original scorer (re-tokenize and score every message),
+  * the inverted index with overlap scoring,
+  * the inverted index with BM25 scoring.
+
+Run from the repository root:
+    python -m tests.bench_memory_retrieval
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engines.memory_index import MessageIndex, tokenize
+from engines.narrative_pipeline import retrieve_memory_stack
+
+MESSAGES = 50_000
+FACTS = 200
+QUERIES = 100
+TOP_K = 6
+SEED = 1234
+
+COMMON = (
+    "the you and that with have this your what are not but was for all just like "
+    "there they about know would really think can get feel yes well here now"
+).split()
+TOPICS = (
+    "harbor market lantern tavern forest river castle garden bridge tower road "
+    "storm rain dinner music dance letter story journey morning evening"
+).split()
+
+
+def _filler(rng: random.Random) -> str:
+    words = [rng.choice(COMMON) for _ in range(rng.randint(8, 60))]
+    words += [rng.choice(TOPICS) for _ in range(rng.randint(1, 4))]
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def _rare_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnpqrstvwxz") + rng.choice("aeiou") for _ in range(4))
+
+
+def _build(rng: random.Random) -> tuple[list, list]:
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": _filler(rng)}
+        for i in range(MESSAGES)
+    ]
+    queries = []
+    for position in rng.sample(range(MESSAGES - 50), FACTS):
+        rare = [_rare_word(rng) for _ in range(2)]
+        # Facts are buried in long, chatty messages on purpose.
+        history[position]["content"] = f"{_filler(rng)} remember the {rare[0]} near the {rare[1]} {_filler(rng)}"
+        query = f"what did you say about the {rare[0]} and the {rng.choice(TOPICS)} you know"
+        queries.append((query, position))
+    return history, queries[:QUERIES]
+
+
+def _evaluate(name: str, history: list, queries: list, search) -> None:
+    hits = 0
+    samples = []
+    for query, position in queries:
+        start = time.perf_counter()
+        ids = search(query)
+        samples.append((time.perf_counter() - start) * 1000)
+        hits += position in ids
+    print(
+        f"{name:<22} recall@{TOP_K}={hits / len(queries):6.1%}   "
+        f"median {statistics.median(samples):8.2f} ms   p95 {sorted(samples)[int(len(samples) * 0.95) - 1]:8.2f} ms"
+    )
+
+
+def main():
+    rng = random.Random(SEED)
+    history, queries = _build(rng)
+    print(f"{len(history)} messages, {len(queries)} queries, top {TOP_K}")
+
+    start = time.perf_counter()
+    index = MessageIndex()
+    index.sync(history)
+    print(f"index build: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    appended = history + [{"role": "user", "content": _filler(rng)}]
+    start = time.perf_counter()
+    index.sync(appended)
+    index.sync(history)
+    print(f"incremental append + rewind sync: {(time.perf_counter() - start) * 1000:.3f} ms")
+
+    def full_scan(query):
+        stack = retrieve_memory_stack(history, query, semantic_limit=TOP_K)
+        ids = {id(msg): i for i, msg in enumerate(history)}
+        return [ids[id(msg)] for msg in stack["semantic"]]
+
+    _evaluate("full scan (overlap)", history, queries[:10], full_scan)
+    _evaluate("index (overlap)", history, queries, lambda q: index.search(tokenize(q), TOP_K, scorer="overlap"))
+    _evaluate("index (bm25)", history, queries, lambda q: index.search(tokenize(q), TOP_K, scorer="bm25"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: system prompt assembly per turn with the real profile, rules and
+mood table. "uncached" clears the prompt caches before every turn, which is
+what every turn cost before the static parts were compiled (read the rules,
+parse and sort the mood table, load the user profile, render everything);
+"compiled" is the steady state.
+
+Run from the repository root:
+    python -m tests.bench_prompt_assembly
+"""
+
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engines import prompts
+from engines.prompts import build_system_prompt, get_mood_rule
+
+TURNS = 2_000
+
+
+def _clear_caches() -> None:
+    prompts._file_cache.clear()
+    prompts._compile_prefix.cache_clear()
+    prompts._compile_rules.cache_clear()
+
+
+def _turn(profile: dict, turn: int) -> None:
+    score = turn % 200 - 100
+    build_system_prompt(profile, score, "Respond normally.", "Maintain a balanced tone.", "rp", f"CURRENT SCENE: turn {turn}")
+    get_mood_rule(score)  # The sidebar refresh after each turn.
+
+
+def _measure(name: str, profile: dict, before_turn=None) -> float:
+    samples = []
+    for turn in range(TURNS):
+        if before_turn:
+            before_turn()
+        start = time.perf_counter()
+        _turn(profile, turn)
+        samples.append((time.perf_counter() - start) * 1e6)
+    median = statistics.median(samples)
+    print(f"{name:<10} median {median:8.1f} us/turn   p95 {sorted(samples)[int(len(samples) * 0.95)]:8.1f} us/turn")
+    return median
+
+
+def main():
+    profile_path = sorted(glob.glob("profiles/*.json"))[0]
+    with open(profile_path, "r", encoding="UTF-8") as f:
+        profile = json.load(f)
+    print(f"profile: {profile_path}, {TURNS} turns")
+    before = _measure("uncached", profile, before_turn=_clear_caches)
+    _clear_caches()
+    after = _measure("compiled", profile)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: prompt evaluation with the "classic" and "cache_friendly" prompt
+layouts against an Ollama stand-in that, like Ollama, keeps the evaluated
+tokens of the previous request per model and only evaluates the part of the
+new prompt after the longest shared token prefix.
+
+Each layout plays the same conversation through get_respond_stream (real
+history storage, lore and scene changing every turn) and reports prompt
+tokens, tokens that had to be evaluated, simulated prompt-eval time and
+time-to-first-token.
+
+Run from the repository root:
+    python -m tests.bench_prompt_layout
+"""
+
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engines import responses
+from engines.config import Settings
+from engines.memory_v2 import HistoryManager
+
+TURNS = 40
+# A window that slides every turn (the default) and one the conversation never outgrows.
+MEMORY_LIMITS = (15, 200)
+EVAL_SECONDS_PER_TOKEN = 0.0002  # ~5k prompt tokens/s
+SCENES = ["Harbor", "Market", "Forest road", "Old tower", "Tavern"]
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+PROFILE = {
+    "name": "Mira",
+    "system_prompt": "You are {{char}}, a travelling cartographer. Stay in character and speak to {{user}} naturally. " * 6,
+    "backstory": "Grew up in a lighthouse, mapped the northern coast, lost a brother at sea. " * 8,
+    "personality_type": "INFJ",
+    "rp_mannerisms": ["taps her compass", "hums sea shanties", "squints at the horizon"],
+    "character_info": {"age": 27, "appearance": "Weathered coat, ink-stained fingers.", "likes": ["maps", "tea"], "dislikes": ["fog"]},
+    "relationship_score": 20,
+}
+
+
+class OllamaStandIn:
+    """Stands in for ollama.chat with a per-model prompt prefix cache."""
+
+    def __init__(self):
+        self.cached_tokens = {}
+        self.requests = []
+
+    @staticmethod
+    def _render(messages: list) -> list[str]:
+        text = "".join(f"<|{msg['role']}|>\n{msg['content']}<|end|>\n" for msg in messages) + "<|assistant|>\n"
+        return _TOKEN_RE.findall(text)
+
+    def chat(self, model, messages, stream=False, options=None):
+        tokens = self._render(messages)
+        cached = self.cached_tokens.get(model, [])
+        shared = 0
+        for cached_token, token in zip(cached, tokens):
+            if cached_token != token:
+                break
+            shared += 1
+        evaluated = len(tokens) - shared
+        time.sleep(evaluated * EVAL_SECONDS_PER_TOKEN)
+        turn = len(self.requests)
+        # Replies move the scene on, so the scene instruction changes every turn.
+        reply = f"*She glances around.* Turn {turn}: we should check the map again. [SCENE: {SCENES[turn % len(SCENES)]}]"
+        reply = reply if stream else '{"rel": 1}'
+        self.cached_tokens[model] = tokens + _TOKEN_RE.findall(reply)
+        if stream:
+            self.requests.append({"tokens": len(tokens), "evaluated": evaluated})
+            return iter([{"message": {"content": reply}}])
+        return {"message": {"content": reply}}
+
+
+class _InlineThread:
+    """Runs post-processing synchronously so each turn is committed before the next."""
+
+    def __init__(self, target, kwargs, daemon=True):
+        self.target, self.kwargs = target, kwargs
+
+    def start(self):
+        self.target(**self.kwargs)
+
+
+def _play(layout: str, memory_limit: int) -> dict:
+    history_dir = tempfile.mkdtemp(prefix="bench_layout_")
+    stand_in = OllamaStandIn()
+    settings = Settings(prompt_layout=layout, memory_limit=memory_limit, default_llm_model="stand-in")
+    first_token = []
+    try:
+        manager = HistoryManager(history_dir, storage_mode="json", write_behind=False)
+        with patch.object(responses, "memory_manager", manager), \
+             patch.object(responses.ollama, "chat", stand_in.chat), \
+             patch.object(responses.threading, "Thread", _InlineThread), \
+             patch.object(responses, "get_lorebooks", return_value={}), \
+             patch.object(responses, "activate_lore", side_effect=lambda context, *_args, **_kwargs: (f"[LORE] {context[-1]['content'][:40]}", {})):
+            for turn in range(TURNS):
+                start = time.perf_counter()
+                stream = responses.get_respond_stream(
+                    f"Turn {turn}: what do you see from here, and where should we go next?",
+                    PROFILE, history_profile_name="bench", settings=settings,
+                )
+                next(stream)
+                first_token.append((time.perf_counter() - start) * 1000)
+                for _chunk in stream:
+                    pass
+    finally:
+        shutil.rmtree(history_dir, ignore_errors=True)
+    warm = stand_in.requests[1:]  # The first request is cold for both layouts.
+    return {
+        "tokens": statistics.mean(r["tokens"] for r in warm),
+        "evaluated": statistics.mean(r["evaluated"] for r in warm),
+        "ttft": statistics.median(first_token[1:]),
+    }
+
+
+def main():
+    print(f"{TURNS} turns, {EVAL_SECONDS_PER_TOKEN * 1000:.2f} ms per evaluated prompt token")
+    for memory_limit in MEMORY_LIMITS:
+        print(f"memory_limit={memory_limit}")
+        results = {}
+        for layout in ("classic", "cache_friendly"):
+            results[layout] = row = _play(layout, memory_limit)
+            print(
+                f"  {layout:<15} prompt {row['tokens']:6.0f} tok   evaluated {row['evaluated']:6.0f} tok   "
+                f"prompt eval {row['evaluated'] * EVAL_SECONDS_PER_TOKEN * 1000:6.1f} ms   TTFT median {row['ttft']:6.1f} ms"
+            )
+        print(f"  TTFT speedup: {results['classic']['ttft'] / results['cache_friendly']['ttft']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
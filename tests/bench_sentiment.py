@@ -0,0 +1,92 @@
+"""
+Benchmark: accuracy versus latency of the sentiment engines on the labelled
+messages in tests/fixtures/sentiment_labels.json.
+
+The lexicon engine always runs. With `--llm`, the LLM and hybrid engines run
+too, against the local Ollama server and `local_utility_model` (or
+`--model`); without it, the hybrid row shows how many messages would be
+escalated to the model at the given threshold.
+
+Run from the repository root:
+    python -m tests.bench_sentiment [--llm] [--model phi3] [--threshold 0.6]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ollama
+
+from engines.config import Settings, get_setting
+from engines.responses import create_sentiment_engine
+from engines.sentiment import score_sentiment
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "sentiment_labels.json")
+LEXICON_REPEATS = 200
+
+
+def _sign(value: int) -> int:
+    return (value > 0) - (value < 0)
+
+
+def _report(name: str, rows: list, scores: list, seconds_per_message: float, note: str = "") -> None:
+    count = len(rows)
+    polarity = sum(_sign(score) == _sign(row["label"]) for row, score in zip(rows, scores)) / count
+    within_one = sum(abs(score - row["label"]) <= 1 for row, score in zip(rows, scores)) / count
+    exact = sum(score == row["label"] for row, score in zip(rows, scores)) / count
+    mae = sum(abs(score - row["label"]) for row, score in zip(rows, scores)) / count
+    latency = f"{seconds_per_message * 1e6:9.1f} us" if seconds_per_message < 1e-3 else f"{seconds_per_message * 1e3:9.1f} ms"
+    print(f"{name:<8} {latency}/msg   polarity {polarity:6.1%}   ±1 {within_one:6.1%}   exact {exact:6.1%}   MAE {mae:4.2f}  {note}")
+
+
+def _run_engine(kind: str, rows: list, settings: Settings) -> tuple[list, float]:
+    engine = create_sentiment_engine(kind)
+    started = time.perf_counter()
+    scores = [engine.score(row["text"], settings.default_llm_model, settings=settings) for row in rows]
+    return scores, (time.perf_counter() - started) / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm", action="store_true", help="also run the LLM and hybrid engines (needs Ollama)")
+    parser.add_argument("--model", default=None, help="utility model for the LLM scorer")
+    parser.add_argument("--threshold", type=float, default=0.6, help="hybrid escalation confidence")
+    args = parser.parse_args()
+
+    with open(FIXTURES, "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    settings = Settings(
+        local_utility_model=args.model or get_setting("local_utility_model", "llama3.2"),
+        sentiment_confidence_threshold=args.threshold,
+    )
+    print(f"{len(rows)} labelled messages, hybrid threshold {args.threshold}")
+
+    started = time.perf_counter()
+    for _ in range(LEXICON_REPEATS):
+        estimates = [score_sentiment(row["text"]) for row in rows]
+    lexicon_seconds = (time.perf_counter() - started) / (LEXICON_REPEATS * len(rows))
+    _report("lexicon", rows, [estimate.score for estimate in estimates], lexicon_seconds)
+
+    unsure = sum(estimate.confidence < args.threshold for estimate in estimates)
+    if not args.llm:
+        print(f"hybrid   would escalate {unsure}/{len(rows)} messages ({unsure / len(rows):.0%}) to the LLM; run with --llm to measure")
+        return
+    try:
+        ollama.show(settings.local_utility_model)
+    except Exception as e:
+        print(f"Ollama model {settings.local_utility_model!r} unavailable ({e}); skipping the LLM engines")
+        return
+
+    llm_scores, llm_seconds = _run_engine("llm", rows, settings)
+    _report("llm", rows, llm_scores, llm_seconds, f"({settings.local_utility_model})")
+    hybrid_scores, hybrid_seconds = _run_engine("hybrid", rows, settings)
+    _report("hybrid", rows, hybrid_scores, hybrid_seconds, f"({unsure} escalated)")
+    print(f"hybrid vs llm: {llm_seconds / hybrid_seconds:.1f}x faster per message")
+
+
+if __name__ == "__main__":
+    main()
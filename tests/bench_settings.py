@@ -0,0 +1,46 @@
+"""
+Benchmark: cost of one get_setting call, uncached (open + parse settings.json
+every time, as before) versus the cached settings layer.
+
+Run from the repository root:
+    python -m tests.bench_settings
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from engines import config
+
+CALLS = 20_000
+KEYS = ("tts_enabled", "overhaul_memory_enabled", "memory_limit", "default_tts_engine")
+
+
+def _uncached_get_setting(key, default=None):
+    env_val = os.getenv(key.upper())
+    if env_val is not None:
+        return env_val
+    return config._read_settings_file(config.SETTINGS_FILE).get(key, default)
+
+
+def _measure(name: str, lookup) -> float:
+    def run():
+        for key in KEYS:
+            lookup(key)
+    rounds = CALLS // len(KEYS)
+    per_call = min(timeit.repeat(run, number=rounds, repeat=3)) / (rounds * len(KEYS))
+    print(f"{name:<28} {per_call * 1e6:8.2f} us/call")
+    return per_call
+
+
+def main():
+    print(f"settings file: {os.path.abspath(config.SETTINGS_FILE)}")
+    before = _measure("uncached (read + parse)", _uncached_get_setting)
+    after = _measure("cached (stat + dict lookup)", config.get_setting)
+    print(f"speedup: {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,7 @@ from colorama import Fore, Style # Import Fore and Style
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import app_commands and its dependencies (memory_manager, get_setting) at the top level
-from engines.app_commands import app_commands, RestartRequested, RegenerateRequested, RewindRequested
+from engines.app_commands import app_commands, RestartRequested, RegenerateRequested, RewindRequested, BranchRestoreRequested
 from engines.memory_v2 import memory_manager
 from engines.config import get_setting
 
@@ -116,13 +116,7 @@ class TestAppCommands(unittest.TestCase):
 
     def test_rewind_command_propagates_in_tui_mode(self):
         self.mock_get_setting.return_value = "TestProfile.json"
-        self.mock_memory_manager.get_full_data.return_value = {
-            "history": [
-                {"role": "user", "content": "1"},
-                {"role": "assistant", "content": "2"},
-                {"role": "user", "content": "3"},
-            ]
-        }
+        self.mock_memory_manager.get_history_length.return_value = 3
 
         with self.assertRaises(RewindRequested) as cm:
             app_commands("//rewind 2", suppress_output=True)
@@ -131,13 +125,7 @@ class TestAppCommands(unittest.TestCase):
 
     def test_rewind_command_calls_memory_manager_in_cli_mode(self):
         self.mock_get_setting.return_value = "TestProfile.json"
-        self.mock_memory_manager.get_full_data.return_value = {
-            "history": [
-                {"role": "user", "content": "1"},
-                {"role": "assistant", "content": "2"},
-                {"role": "user", "content": "3"},
-            ]
-        }
+        self.mock_memory_manager.get_history_length.return_value = 3
         self.mock_memory_manager.rewind_history.return_value = (3, 2)
 
         result = app_commands("//rewind 2")
@@ -146,14 +134,38 @@ class TestAppCommands(unittest.TestCase):
 
     def test_rewind_command_rejects_out_of_range_in_tui_mode(self):
         self.mock_get_setting.return_value = "TestProfile.json"
-        self.mock_memory_manager.get_full_data.return_value = {
-            "history": [{"role": "user", "content": "1"}]
-        }
+        self.mock_memory_manager.get_history_length.return_value = 1
 
         success, messages = app_commands("//rewind 3", suppress_output=True)
         self.assertTrue(success)
         self.assertTrue(any("out of range" in msg.lower() for msg in messages))
 
+    def test_branch_command_propagates_in_tui_mode(self):
+        self.mock_get_setting.return_value = "TestProfile.json"
+        self.mock_memory_manager.list_branches.return_value = [
+            {"id": 1, "fork_at": 2, "count": 3, "created": "", "preview": "Hello"}
+        ]
+
+        with self.assertRaises(BranchRestoreRequested) as cm:
+            app_commands("//branch 1", suppress_output=True)
+        self.assertEqual(cm.exception.branch_id, 1)
+
+        success, messages = app_commands("//branch 7", suppress_output=True)
+        self.assertTrue(success)
+        self.assertTrue(any("unknown branch" in msg.lower() for msg in messages))
+        self.mock_memory_manager.restore_branch.assert_not_called()
+
+    def test_branches_command_lists_branches(self):
+        self.mock_get_setting.return_value = "TestProfile.json"
+        self.mock_memory_manager.list_branches.return_value = [
+            {"id": 1, "fork_at": 2, "count": 3, "created": "2026-01-01 | 10:00:00", "preview": "Hello"}
+        ]
+
+        success, messages = app_commands("//branches", suppress_output=True)
+        self.assertTrue(success)
+        self.assertTrue(any("#1: 3 messages after message 2" in msg for msg in messages))
+        self.mock_memory_manager.list_branches.assert_called_with("TestProfile")
+
 
     @patch('sys.stdout', new_callable=StringIO)
     def test_toggle_errors_enables_suppression(self, mock_stdout):
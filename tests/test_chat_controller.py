@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import patch
 
-from engines.app_commands import RegenerateRequested
+from engines.app_commands import BranchRestoreRequested, RegenerateRequested
 from engines.chat_controller import (
     get_user_message_number,
     handle_command_input,
@@ -34,31 +34,40 @@ class TestChatController(unittest.TestCase):
         self.assertEqual(result["type"], "regenerate")
         self.assertEqual(result["user_text"], "x")
 
-    @patch("engines.chat_controller.memory_manager.save_history")
+    @patch("engines.chat_controller.memory_manager.restore_branch", return_value=(4, 7))
+    @patch("engines.chat_controller.app_commands", side_effect=BranchRestoreRequested(2))
+    def test_handle_command_input_branch_restore(self, _mock_app_commands, mock_restore_branch):
+        result = handle_command_input("//branch 2", "profile")
+        mock_restore_branch.assert_called_once_with("profile", 2)
+        self.assertEqual(
+            result,
+            {"type": "branch_restore", "branch_id": 2, "original_count": 4, "kept_count": 7},
+        )
+
+    @patch("engines.chat_controller.memory_manager.select_alternative")
     @patch("engines.chat_controller.memory_manager.load_history")
-    def test_previous_and_next_variants(self, mock_load_history, mock_save_history):
-        history = [
-            {"role": "user", "content": "u"},
-            {
-                "role": "assistant",
-                "content": "b",
-                "alternatives": ["a", "b", "c"],
-                "selected_index": 1,
-            },
-        ]
-        mock_load_history.return_value = history
+    def test_previous_and_next_variants(self, mock_load_history, mock_select_alternative):
+        last_msg = {
+            "role": "assistant",
+            "content": "b",
+            "alternatives": ["a", "b", "c"],
+            "selected_index": 1,
+        }
+        mock_load_history.return_value = [last_msg]
+        mock_select_alternative.side_effect = lambda _profile, index: {
+            **last_msg, "content": last_msg["alternatives"][index], "selected_index": index,
+        }
 
         prev = previous_response_variant("profile")
         self.assertEqual(prev["content"], "a")
         self.assertEqual(prev["index"], 0)
+        mock_select_alternative.assert_called_with("profile", 0)
 
-        history[-1]["selected_index"] = 1
-        history[-1]["content"] = "b"
         nxt = next_response_variant_or_regen("profile")
         self.assertEqual(nxt["type"], "next")
         self.assertEqual(nxt["content"], "c")
-        self.assertTrue(mock_save_history.called)
-
+        mock_select_alternative.assert_called_with("profile", 2)
+        mock_load_history.assert_called_with("profile", limit=1)
 
 if __name__ == "__main__":
     unittest.main()
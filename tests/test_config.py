@@ -2,7 +2,9 @@
 import unittest
 import os
 import json
-from engines.config import get_setting, update_setting, SETTINGS_FILE
+from unittest.mock import patch
+from engines import config
+from engines.config import Settings, get_setting, update_setting, reload_settings, subscribe_setting, SETTINGS_FILE
 
 class TestConfig(unittest.TestCase):
     def setUp(self):
@@ -48,5 +50,64 @@ class TestConfig(unittest.TestCase):
         self.assertTrue(get_setting("tts_enabled", True))
         self.assertFalse(get_setting("suppress_errors", False))
 
+    def test_settings_are_parsed_once_until_the_file_changes(self):
+        get_setting("tts_enabled")
+        with patch("engines.config.json.load", wraps=json.load) as mock_load:
+            for _ in range(100):
+                self.assertTrue(get_setting("tts_enabled", False))
+            mock_load.assert_not_called()
+
+            # An edit from outside the app is picked up on the next lookup.
+            with open(SETTINGS_FILE, "w") as f:
+                json.dump({"tts_enabled": False, "memory_limit": 25}, f)
+            self.assertFalse(get_setting("tts_enabled", True))
+            self.assertEqual(get_setting("memory_limit"), 25)
+            self.assertEqual(mock_load.call_count, 1)
+
+        update_setting("memory_limit", 30)
+        self.assertEqual(get_setting("memory_limit"), 30)
+        self.assertFalse(get_setting("tts_enabled", True))
+
+    def test_load_settings_returns_a_copy(self):
+        config.load_settings()["tts_enabled"] = False
+        self.assertTrue(get_setting("tts_enabled", False))
+
+    def test_environment_overrides_settings_file(self):
+        with patch.dict(os.environ, {"TTS_ENABLED": "false", "MEMORY_LIMIT": "12"}):
+            reload_settings()
+            self.assertFalse(get_setting("tts_enabled", True))
+            self.assertEqual(get_setting("memory_limit", 10), 12)
+        reload_settings()
+        self.assertTrue(get_setting("tts_enabled", False))
+        self.assertEqual(get_setting("memory_limit", 10), 10)
+
+    def test_settings_snapshot_is_frozen(self):
+        settings = Settings.capture()
+        self.assertTrue(settings.tts_enabled)
+        update_setting("tts_enabled", False)
+        self.assertTrue(settings.tts_enabled)
+        self.assertFalse(Settings.capture().tts_enabled)
+        with self.assertRaises(AttributeError):
+            settings.tts_enabled = False
+
+    def test_settings_snapshot_normalizes_values(self):
+        values = {"repetition_penalty": "bad", "overhaul_candidate_count": 0, "memory_limit": "20"}
+        settings = Settings.capture(lambda key, default=None: values.get(key, default))
+        self.assertEqual(settings.repetition_penalty, 1.15)
+        self.assertEqual(settings.candidate_count, 1)
+        self.assertEqual(settings.memory_limit, 20)
+        self.assertEqual(settings.memory_scorer, "overlap")
+        self.assertEqual(settings.context_packing, "messages")
+
+    def test_live_setting_follows_updates(self):
+        tts_switch = subscribe_setting("tts_enabled", False)
+        self.assertTrue(tts_switch)
+        with patch("engines.config.get_setting", wraps=get_setting) as mock_get_setting:
+            for _ in range(50):
+                self.assertTrue(tts_switch)
+            mock_get_setting.assert_not_called()
+        update_setting("tts_enabled", False)
+        self.assertFalse(tts_switch)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch
+
+from engines.context_packer import (
+    MESSAGE_OVERHEAD_TOKENS,
+    ApproximateTokenizer,
+    TokenCounter,
+    create_tokenizer,
+    fit_text,
+    pack_history,
+    plan_budgets,
+)
+
+
+class TestContextPacker(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = ApproximateTokenizer()
+
+    def test_approximate_tokenizer(self):
+        self.assertEqual(self.tokenizer.count(""), 0)
+        # "Hello" -> "Hell" + "o", "," , "wonderful" -> 3 pieces, "2024" -> 2 groups, "!"
+        self.assertEqual(self.tokenizer.count("Hello, wonderful 2024!"), 9)
+
+    def test_pack_history_keeps_whole_newest_messages(self):
+        history = [{"role": "user", "content": "one two three"} for _ in range(10)]
+        counter = TokenCounter(self.tokenizer)
+        per_message = self.tokenizer.count("one two three") + MESSAGE_OVERHEAD_TOKENS
+
+        self.assertEqual(pack_history(history, per_message * 3 + 1, counter), history[-3:])
+        self.assertEqual(pack_history(history, per_message - 1, counter), [])
+        self.assertEqual(pack_history(history, 10_000, counter), history)
+
+    def test_counts_are_cached_and_restored_from_metadata(self):
+        history = [{"role": "user", "content": f"message {i}"} for i in range(5)]
+        counter = TokenCounter(self.tokenizer)
+        pack_history(history, 10_000, counter)
+        self.assertEqual(counter.computed, 5)
+        stored = counter.to_metadata()
+        self.assertEqual(stored["tokenizer"], "approximate")
+        self.assertEqual(len(stored["counts"]), 5)
+
+        history.append({"role": "assistant", "content": "a new reply"})
+        restored = TokenCounter(self.tokenizer, stored)
+        with patch.object(self.tokenizer, "count", wraps=self.tokenizer.count) as mock_count:
+            pack_history(history, 10_000, restored)
+            mock_count.assert_called_once_with("a new reply")
+
+        # Only the newest messages' counts are kept, the turn's new ones first.
+        stored = restored.to_metadata(latest=history[-1:], limit=3)
+        self.assertEqual(list(stored["counts"]), [TokenCounter._key(message) for message in (history[5], history[4], history[3])])
+
+        # Counts made by another tokenizer are not trusted.
+        self.assertEqual(len(TokenCounter(self.tokenizer, {"tokenizer": "other", "counts": stored["counts"]})._counts), 0)
+
+    def test_fit_text_trims_at_paragraph_and_line_boundaries(self):
+        text = "alpha beta\n\ngamma delta\nepsilon zeta\n\ntheta"
+        self.assertEqual(fit_text(text, 1000, self.tokenizer), text)
+        budget = self.tokenizer.count("alpha beta") + self.tokenizer.count("gamma delta")
+        self.assertEqual(fit_text(text, budget, self.tokenizer), "alpha beta\n\ngamma delta")
+        self.assertEqual(fit_text(text, 1, self.tokenizer), "")
+
+    def test_budgets_and_tokenizer_fallback(self):
+        budgets = plan_budgets(5024, reserve=1024)
+        self.assertEqual(budgets["prompt"], 4000)
+        self.assertEqual(budgets["lore"], 600)
+        self.assertEqual(plan_budgets(100)["prompt"], 0)
+
+        with patch("engines.context_packer.HuggingFaceTokenizer", side_effect=ImportError):
+            self.assertIsInstance(create_tokenizer("some/missing-model"), ApproximateTokenizer)
+        self.assertIs(create_tokenizer("approximate"), create_tokenizer("approximate"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from engines import http_client
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        http_client.close_all()
+        _EchoHandler.connections = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        http_client.close_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_to_one_bridge_reuse_a_connection(self):
+        for i in range(3):
+            response = http_client.post(f"{self.url}/chat", json={"turn": i}, timeout=5)
+            response.raise_for_status()
+            self.assertEqual(response.json(), {"turn": i})
+        self.assertEqual(_EchoHandler.connections, 1)
+
+        with http_client.post(f"{self.url}/generate_tts", data=b"x" * 10_000, timeout=5, stream=True) as response:
+            self.assertEqual(len(b"".join(response.iter_content(chunk_size=4096))), 10_000)
+        self.assertEqual(http_client.post(f"{self.url}/chat", json={}, timeout=5).json(), {})
+        self.assertEqual(_EchoHandler.connections, 1)
+
+    def test_sessions_are_shared_per_base_url(self):
+        session = http_client.get_session(f"{self.url}/chat")
+        self.assertIs(http_client.get_session(f"{self.url}/sync_lore"), session)
+        self.assertIsNot(http_client.get_session("https://bridge.example/chat"), session)
+        with patch("engines.http_client.get_setting", side_effect=lambda key, default=None: 2 if key == "http_pool_size" else default):
+            self.assertIsNot(http_client.get_session(f"{self.url}/chat"), session)
+
+    def test_timeouts_split_into_connect_and_read(self):
+        with patch("engines.http_client.get_setting", side_effect=lambda key, default=None: 3 if key == "http_connect_timeout" else default):
+            self.assertEqual(http_client._timeouts(90), (3.0, 90))
+            self.assertEqual(http_client._timeouts(1), (1, 1))
+            self.assertEqual(http_client._timeouts((5, 6)), (5, 6))
+            self.assertIsNone(http_client._timeouts(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from engines.llm_client import HTTPX_AVAILABLE, CancellationToken, GenerationCancelled, ollama_host, stream_chat
+
+
+class _StreamingHandler(BaseHTTPRequestHandler):
+    """Streams one chunk every `delay` seconds until the reply ends or the client hangs up."""
+    protocol_version = "HTTP/1.1"
+    chunks = 5
+    delay = 0.0
+    disconnected = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i in range(self.chunks):
+                if self.path == "/api/chat":
+                    line = {"model": body["model"], "message": {"role": "assistant", "content": f"tok{i} "}, "done": False}
+                    data = (json.dumps(line) + "\n").encode("utf-8")
+                else:
+                    data = f"tok{i} ".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+                time.sleep(self.delay)
+            if self.path == "/api/chat":
+                data = (json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            type(self).disconnected.set()
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipUnless(HTTPX_AVAILABLE, "httpx not installed")
+class TestLLMClient(unittest.TestCase):
+    def setUp(self):
+        _StreamingHandler.chunks = 5
+        _StreamingHandler.delay = 0.0
+        _StreamingHandler.disconnected = threading.Event()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StreamingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_streams_remote_bridge_and_ollama_replies(self):
+        chunks = list(stream_chat(CancellationToken(), remote_url=self.url, payload={"messages": []}))
+        self.assertEqual("".join(chunks), "tok0 tok1 tok2 tok3 tok4 ")
+
+        with patch.dict(os.environ, {"OLLAMA_HOST": self.url}):
+            chunks = list(stream_chat(CancellationToken(), model="m", messages=[], options={"temperature": 0.8}))
+        self.assertEqual(chunks, [f"tok{i} " for i in range(5)])
+
+    def test_cancel_closes_the_upstream_connection(self):
+        _StreamingHandler.chunks = 1000
+        _StreamingHandler.delay = 0.01
+        token = CancellationToken()
+        received = []
+        with self.assertRaises(GenerationCancelled):
+            for chunk in stream_chat(token, remote_url=self.url, payload={"messages": []}):
+                received.append(chunk)
+                if len(received) == 3:
+                    token.cancel()
+        self.assertEqual(len(received), 3)
+        # The server notices the hang-up on its next write instead of streaming all 1000 chunks.
+        self.assertTrue(_StreamingHandler.disconnected.wait(5))
+
+    def test_cancelled_token_never_connects(self):
+        token = CancellationToken()
+        token.cancel()
+        with self.assertRaises(GenerationCancelled):
+            next(stream_chat(token, remote_url=self.url, payload={}))
+
+    def test_ollama_host_follows_environment(self):
+        with patch.dict(os.environ, {"OLLAMA_HOST": ""}):
+            self.assertEqual(ollama_host(), "http://127.0.0.1:11434")
+        with patch.dict(os.environ, {"OLLAMA_HOST": "0.0.0.0"}):
+            self.assertEqual(ollama_host(), "http://127.0.0.1:11434")
+        with patch.dict(os.environ, {"OLLAMA_HOST": "https://gpu.example:8443/"}):
+            self.assertEqual(ollama_host(), "https://gpu.example:8443")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,23 @@
 import unittest
 import json
 import os
+import random
+import re
 import shutil
-from engines.lorebook import load_lorebook, scan_for_lore
+from unittest.mock import patch
+
+from engines import lorebook
+from engines.lorebook import (
+    LoreMatcher,
+    LoreScanCache,
+    activate_lore,
+    compile_lorebook,
+    get_lorebook,
+    get_lorebooks,
+    load_lorebook,
+    lorebook_paths,
+    scan_for_lore,
+)
 
 class TestLorebook(unittest.TestCase):
     def setUp(self):
@@ -75,5 +90,152 @@ class TestLorebook(unittest.TestCase):
         lore_text = scan_for_lore(messages, self.lore_data)
         self.assertEqual(lore_text, "")
 
+    def test_matcher_agrees_with_regex_scan(self):
+        rng = random.Random(5)
+        keys = ["elf", "elves", "self", "dark elf", "sir.", "@bob", "o'neil", "_x", "éclair", "ab", "b", "a b"]
+        words = ["elf", "Elves", "himself", "dark", "Elf", "sir.", "@bob", "o'neil", "_x", "ÉCLAIR", "ab", "b", "a", "x"]
+        entries = [
+            {"keys": rng.sample(keys, rng.randint(1, 3)), "enabled": rng.random() > 0.2, "insertion_order": rng.randint(0, 3)}
+            for _ in range(40)
+        ]
+        matcher = LoreMatcher(entries)
+        for _ in range(300):
+            text = rng.choice(["", " ", "."]).join(rng.choice(words) for _ in range(rng.randint(0, 8)))
+            expected = [
+                entry_id for entry_id, entry in enumerate(entries)
+                if entry.get("enabled", True)
+                and any(re.search(fr"\b{re.escape(key.lower())}\b", text.lower()) for key in entry["keys"])
+            ]
+            self.assertEqual(matcher.match(text), expected, text)
+
+    def test_compiled_matcher_is_reused_per_lorebook(self):
+        matcher = compile_lorebook(self.lore_data)
+        self.assertIs(compile_lorebook(self.lore_data), matcher)
+        self.lore_data["entries"].append({"keys": ["dragon"], "content": "Dragons sleep."})
+        self.assertIsNot(compile_lorebook(self.lore_data), matcher)
+        self.assertIn("Dragons sleep.", scan_for_lore([{"content": "A DRAGON!"}], self.lore_data))
+
+    def test_registry_parses_once_per_file_version(self):
+        with patch.object(lorebook, "load_lorebook", wraps=load_lorebook) as mock_load:
+            first = get_lorebook(self.lore_path)
+            self.assertIs(get_lorebook(self.lore_path), first)
+            self.assertEqual(mock_load.call_count, 1)
+
+            self.lore_data["entries"].append({"keys": ["dragon"], "content": "Dragons sleep."})
+            with open(self.lore_path, "w") as f:
+                json.dump(self.lore_data, f)
+            self.assertEqual(len(get_lorebook(self.lore_path)["entries"]), 4)
+            self.assertEqual(mock_load.call_count, 2)
+
+        self.assertEqual(get_lorebook(os.path.join(self.test_dir, "missing.json")), {"entries": []})
+
+    def test_stacked_lorebooks_share_one_compiled_matcher(self):
+        world_path = os.path.join(self.test_dir, "world.json")
+        with open(world_path, "w") as f:
+            json.dump({"entries": [{"keys": ["tavern"], "content": "Taverns close at dawn.", "insertion_order": 50}]}, f)
+        paths = [world_path, self.lore_path, world_path]
+
+        merged = get_lorebooks(paths)
+        self.assertEqual(len(merged["entries"]), 4)
+        self.assertIs(get_lorebooks(paths), merged)
+        with patch.object(lorebook, "LoreMatcher") as mock_matcher:
+            lore_text = scan_for_lore([{"content": "To the tavern!"}], get_lorebooks(paths))
+            mock_matcher.assert_not_called()
+        # Equal insertion_order: the earlier (global) book comes first.
+        self.assertLess(lore_text.find("Taverns close at dawn."), lore_text.find("The tavern is cozy."))
+
+    def test_lorebook_paths_stack_global_character_and_chat(self):
+        self.assertEqual(lorebook_paths({}), ["lorebooks/default.json"])
+        self.assertEqual(
+            lorebook_paths({"lorebook_path": ["a.json", "b.json"]}, {"lorebook_path": "chat.json"}, ("world.json",)),
+            ["world.json", "a.json", "b.json", "chat.json"],
+        )
+
+    def test_activation_packs_whole_entries_by_insertion_order(self):
+        messages = [{"role": "user", "content": "An elf walks into the tavern."}]
+        lore_text, _state = activate_lore(messages, self.lore_data)
+        self.assertEqual(lore_text, scan_for_lore(messages, self.lore_data))
+
+        # Room for the header and one entry: the elf entry (order 10) wins.
+        count_words = lambda text: len(text.split())
+        budget = count_words("[WORLD INFO / LORE]") + count_words("- Elves have pointy ears.")
+        lore_text, _state = activate_lore(messages, self.lore_data, token_budget=budget, count_tokens=count_words)
+        self.assertIn("Elves have pointy ears.", lore_text)
+        self.assertNotIn("The tavern is cozy.", lore_text)
+        self.assertEqual(activate_lore(messages, self.lore_data, token_budget=0)[0], "")
+
+    def test_sticky_entries_stay_active_for_their_turns(self):
+        self.lore_data["entries"][0]["sticky"] = 2
+        quiet = [{"role": "user", "content": "Hello there."}]
+        lore_text, state = activate_lore([{"content": "The inn."}], self.lore_data)
+        self.assertIn("The tavern is cozy.", lore_text)
+        self.assertEqual(state["turn"], 1)
+
+        # Regenerating doesn't use up a turn.
+        self.assertEqual(activate_lore(quiet, self.lore_data, state, advance_turn=False)[1], state)
+        for _ in range(2):
+            lore_text, state = activate_lore(quiet, self.lore_data, state)
+            self.assertIn("The tavern is cozy.", lore_text)
+        lore_text, state = activate_lore(quiet, self.lore_data, state)
+        self.assertEqual(lore_text, "")
+        self.assertEqual(state, {"turn": 4, "sticky": {}})
+
+    def test_recursion_is_bounded_and_can_be_opted_out_of(self):
+        lore_data = {"entries": [
+            {"id": "a", "keys": ["castle"], "content": "The castle is ruled by the queen."},
+            {"id": "b", "keys": ["queen"], "content": "The queen keeps a dragon."},
+            {"id": "c", "keys": ["dragon"], "content": "The dragon guards the castle."},
+        ]}
+        messages = [{"content": "We reach the castle."}]
+        self.assertEqual(activate_lore(messages, lore_data)[0].count("\n- "), 1)
+        self.assertEqual(activate_lore(messages, lore_data, recursion_depth=1)[0].count("\n- "), 2)
+        self.assertEqual(activate_lore(messages, lore_data, recursion_depth=5)[0].count("\n- "), 3)
+
+        lore_data["entries"][1]["prevent_recursion"] = True
+        self.assertNotIn("dragon guards", activate_lore(messages, lore_data, recursion_depth=5)[0])
+        lore_data["entries"][1]["prevent_recursion"] = False
+        lore_data["entries"][1]["exclude_recursion"] = True
+        self.assertEqual(activate_lore(messages, lore_data, recursion_depth=5)[0], scan_for_lore(messages, lore_data))
+
+    def test_semantic_hits_are_activated_and_ranked_by_score(self):
+        messages = [{"role": "user", "content": "An elf walks in."}]
+        count_words = lambda text: len(text.split())
+        budget = count_words("[WORLD INFO / LORE]") + count_words("- Elves have pointy ears.")
+
+        lore_text, _state = activate_lore(messages, self.lore_data, semantic_scores={0: 0.5})
+        self.assertIn("The tavern is cozy.", lore_text)
+        self.assertLess(lore_text.find("Elves"), lore_text.find("The tavern"))
+        # A strong semantic hit on top of a key match outranks a plain key match...
+        lore_text, _state = activate_lore([{"content": "elf inn"}], self.lore_data, token_budget=budget, count_tokens=count_words, semantic_scores={0: 0.5})
+        self.assertIn("The tavern is cozy.", lore_text)
+        # ...while disabled entries stay out.
+        lore_text, _state = activate_lore(messages, self.lore_data, semantic_scores={2: 0.9})
+        self.assertNotIn("This should not show.", lore_text)
+
+    def test_scan_cache_scans_only_new_messages(self):
+        rng = random.Random(9)
+        words = ["elf", "tavern", "inn", "legolas", "road", "himself", "rain"]
+        cache = LoreScanCache()
+        matcher = compile_lorebook(self.lore_data)
+        history = []
+        for turn in range(30):
+            if turn % 7 == 6:
+                # Rewind or regenerate: the tail changes under the cache.
+                history[-2:] = [{"role": "assistant", "content": " ".join(rng.choice(words) for _ in range(4))}]
+            user_input = {"role": "user", "content": " ".join(rng.choice(words) for _ in range(4))}
+            window = history[-3:] + [user_input]
+            with patch.object(matcher, "match", wraps=matcher.match) as mock_match:
+                cached = activate_lore(window, self.lore_data, scan_cache=cache)
+                new_messages = mock_match.call_count
+            self.assertEqual(cached, activate_lore(window, self.lore_data), turn)
+            if turn > 1 and turn % 7 != 6:
+                # The latest reply and the input; the rest of the window was seen before.
+                self.assertLessEqual(new_messages, 2, turn)
+            history += [user_input, {"role": "assistant", "content": " ".join(rng.choice(words) for _ in range(6))}]
+
+        # A recompiled lorebook starts the cache over.
+        self.lore_data["entries"].append({"keys": ["rain"], "content": "It always rains."})
+        self.assertIn("It always rains.", activate_lore([{"content": "rain"}], self.lore_data, scan_cache=cache)[0])
+
 if __name__ == "__main__":
     unittest.main()
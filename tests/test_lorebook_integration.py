@@ -48,9 +48,7 @@ class TestLorebookIntegration(unittest.TestCase):
             "memory_limit": 15
         }.get(key, default)
         
-        mock_memory_manager.get_full_data.return_value = {
-            "metadata": {"current_scene": "Test Room", "memory_core": ""}
-        }
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Test Room", "memory_core": ""}
         mock_memory_manager.load_history.return_value = []
         
         # Mock ollama stream
@@ -61,8 +59,8 @@ class TestLorebookIntegration(unittest.TestCase):
         list(get_respond_stream(self.user_input, self.profile, history_profile_name="test_profile"))
 
         # Verify that build_system_prompt was (indirectly) called with lore
-        # We check the FIRST call to ollama.chat (the stream)
-        args, kwargs = mock_ollama_chat.call_args_list[0]
+        # We check the streaming call to ollama.chat (sentiment scoring runs alongside it)
+        kwargs = next(call.kwargs for call in mock_ollama_chat.call_args_list if call.kwargs.get("stream"))
         system_msg = kwargs['messages'][0]['content']
         
         self.assertIn("[WORLD INFO / LORE]", system_msg)
@@ -0,0 +1,251 @@
+import math
+import os
+import random
+import shutil
+import unittest
+from unittest.mock import patch
+
+from engines import memory_index
+from engines.memory_index import MessageIndex, follow_history, get_message_index
+from engines.memory_v2 import HistoryManager
+from engines.narrative_pipeline import retrieve_indexed_memory_stack, retrieve_memory_stack
+
+WORDS = ["harbor", "market", "lantern", "promise", "the", "you", "quest", "storm", "map", "tea", "and", "goal"]
+
+
+def _random_message(rng: random.Random, role: str = "user") -> dict:
+    return {"role": role, "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))}
+
+
+class TestMessageIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_memory_index"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.path = os.path.join(self.test_dir, "Profile_tokens.jsonl")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_matches_overlap_scorer_through_appends_rewinds_and_regens(self):
+        rng = random.Random(7)
+        index = MessageIndex(self.path)
+        history = []
+        for step in range(300):
+            action = rng.random()
+            if action < 0.1 and history:
+                del history[rng.randint(0, len(history) - 1):]
+            elif action < 0.2 and history:
+                history[-1] = _random_message(rng, "assistant")
+            else:
+                history.append(_random_message(rng))
+
+            query = " ".join(rng.choice(WORDS) for _ in range(3))
+            expected = retrieve_memory_stack(history, query)["semantic"]
+            self.assertEqual(retrieve_memory_stack(history, query, index=index)["semantic"], expected, step)
+
+        reloaded = MessageIndex(self.path)
+        query = "harbor storm promise"
+        self.assertEqual(
+            retrieve_memory_stack(history, query, index=reloaded)["semantic"],
+            retrieve_memory_stack(history, query)["semantic"],
+        )
+
+    def test_sync_only_indexes_changed_tail(self):
+        history = [{"role": "user", "content": f"message number {i}"} for i in range(50)]
+        index = MessageIndex(self.path)
+        self.assertEqual(index.sync(history), 50)
+
+        history.append({"role": "assistant", "content": "a new lantern"})
+        with patch.object(memory_index, "term_counts", wraps=memory_index.term_counts) as mock_term_counts:
+            self.assertEqual(index.sync(history), 1)
+            self.assertEqual(mock_term_counts.call_count, 1)
+
+        # A rewind only truncates; nothing is re-tokenized.
+        del history[40:]
+        with patch.object(memory_index, "term_counts", wraps=memory_index.term_counts) as mock_term_counts:
+            self.assertEqual(index.sync(history), 0)
+            mock_term_counts.assert_not_called()
+        self.assertEqual(len(index), 40)
+        self.assertEqual(index.search({"lantern"}, 5), [])
+
+        reloaded = MessageIndex(self.path)
+        self.assertEqual(reloaded.sync(history), 0)
+        self.assertEqual(reloaded.search({"number"}, 2), [39, 38])
+
+    def test_torn_trailing_record_is_reindexed(self):
+        history = [{"role": "user", "content": "harbor lights"}, {"role": "assistant", "content": "storm clouds"}]
+        MessageIndex(self.path).sync(history)
+        with open(self.path, "a", encoding="UTF-8") as f:
+            f.write('{"id": 2, "fp": 1, "tok')
+
+        history.append({"role": "user", "content": "storm again"})
+        index = MessageIndex(self.path)
+        self.assertEqual(index.sync(history), 1)
+        self.assertEqual(index.search({"storm"}, 5), [2, 1])
+
+    def test_edit_before_an_unchanged_last_message_is_reindexed(self):
+        index = MessageIndex(self.path)
+        contents = ["hello", "dragon", "okay"]
+        index.sync([{"role": "user", "content": content} for content in contents])
+
+        contents[1] = "wizard"
+        self.assertEqual(index.sync([{"role": "user", "content": content} for content in contents]), 2)
+        self.assertEqual(index.search({"dragon"}, 5), [])
+        self.assertEqual(index.search({"wizard"}, 5), [1])
+        self.assertEqual(MessageIndex(self.path).search({"wizard"}, 5), [1])
+
+    def test_log_is_compacted(self):
+        index = MessageIndex(self.path)
+        history = [{"role": "user", "content": "first words"}]
+        for i in range(memory_index.INDEX_COMPACTION_SLACK + 10):
+            history[-1:] = [{"role": "user", "content": f"regenerated {i}"}]
+            index.sync(history)
+        with open(self.path, encoding="UTF-8") as f:
+            self.assertLess(len(f.readlines()), memory_index.INDEX_COMPACTION_SLACK)
+        self.assertEqual(MessageIndex(self.path).search({"regenerated"}, 1), [0])
+
+    def test_bm25_stays_consistent_with_a_fresh_index(self):
+        rng = random.Random(11)
+        index = MessageIndex(self.path)
+        history = []
+        for _step in range(200):
+            if rng.random() < 0.1 and history:
+                del history[rng.randint(0, len(history) - 1):]
+            else:
+                history.append(_random_message(rng))
+            index.sync(history)
+
+        fresh = MessageIndex()
+        fresh.sync(history)
+        for query in ({"harbor", "storm"}, {"the", "map"}, {"promise"}):
+            self.assertEqual(index.search(query, 6, scorer="bm25"), fresh.search(query, 6, scorer="bm25"))
+        self.assertEqual(
+            MessageIndex(self.path).search({"quest", "you"}, 6, scorer="bm25"),
+            fresh.search({"quest", "you"}, 6, scorer="bm25"),
+        )
+
+    def test_bm25_pruning_matches_exhaustive_scoring(self):
+        rng = random.Random(3)
+        history = [_random_message(rng) for _ in range(400)]
+        index = MessageIndex()
+        index.sync(history)
+
+        documents = [memory_index.term_counts(msg["content"]) for msg in history]
+        average_length = sum(sum(doc.values()) for doc in documents) / len(documents)
+        for _ in range(30):
+            query = {rng.choice(WORDS) for _ in range(rng.randint(1, 5))}
+            idfs = {}
+            for token in query:
+                df = sum(1 for doc in documents if token in doc)
+                if df:
+                    idfs[token] = math.log(1.0 + (len(documents) - df + 0.5) / (df + 0.5))
+            scores = {}
+            for token in sorted(idfs, key=idfs.get, reverse=True):
+                for message_id, doc in enumerate(documents):
+                    tf = doc.get(token)
+                    if tf:
+                        norm = memory_index.BM25_K1 * (1 - memory_index.BM25_B + memory_index.BM25_B * sum(doc.values()) / average_length)
+                        scores[message_id] = scores.get(message_id, 0.0) + idfs[token] * tf * (memory_index.BM25_K1 + 1) / (tf + norm)
+            expected = sorted(scores, key=lambda message_id: (scores[message_id], message_id), reverse=True)[:6]
+            self.assertEqual(
+                [round(scores[message_id], 9) for message_id in index.search(query, 6, scorer="bm25")],
+                [round(scores[message_id], 9) for message_id in expected],
+            )
+
+    def test_bm25_favours_rare_terms_and_short_messages(self):
+        history = [{"role": "user", "content": "you and the map and the map and the tea"} for _ in range(20)]
+        history += [
+            {"role": "assistant", "content": "the lighthouse keeper hid the map " + "while you waited " * 20},
+            {"role": "assistant", "content": "the lighthouse keeper"},
+        ]
+        query = {"the", "you", "map", "lighthouse"}
+
+        overlap = retrieve_memory_stack(history, "the you map lighthouse", semantic_limit=1, scorer="overlap")
+        bm25 = retrieve_memory_stack(history, "the you map lighthouse", semantic_limit=1, scorer="bm25")
+        self.assertEqual(overlap["semantic"], [history[20]])
+        self.assertEqual(bm25["semantic"], [history[21]])
+
+        index = MessageIndex()
+        index.sync(history)
+        self.assertEqual(index.search(query, 2, scorer="bm25"), [21, 20])
+        with self.assertRaises(ValueError):
+            index.search(query, 2, scorer="tfidf")
+
+    def test_sync_from_a_start_position_reads_only_the_tail(self):
+        history = [{"role": "user", "content": f"message number {i}"} for i in range(20)]
+        index = MessageIndex(self.path)
+        index.sync(history)
+
+        tail = [{"role": "assistant", "content": "regenerated lantern"}, {"role": "user", "content": "new harbor"}]
+        self.assertEqual(index.sync(tail, 19), 2)
+        history[19:] = tail
+        fresh = MessageIndex()
+        fresh.sync(history)
+        self.assertEqual(MessageIndex(self.path).search({"lantern", "harbor", "number"}, 5), fresh.search({"lantern", "harbor", "number"}, 5))
+        self.assertEqual(index.sync(history[15:], 15), 0)
+        with self.assertRaises(ValueError):
+            index.sync(tail, 30)
+
+    def test_follows_history_manager_changes_without_reloading(self):
+        rng = random.Random(5)
+        profile = "Follow"
+        manager = HistoryManager(history_dir=self.test_dir, storage_mode="json")
+        manager.add_change_listener(memory_index.apply_history_change)
+        index = get_message_index(profile, self.test_dir)
+        self.addCleanup(memory_index._indexes.pop, index.path, None)
+        manager.save_history(profile, [_random_message(rng) for _ in range(30)])
+        follow_history([index], manager.get_history_length(profile), lambda: manager.load_history(profile))
+
+        for step in range(60):
+            action = rng.random()
+            length = manager.get_history_length(profile)
+            if action < 0.15 and length:
+                manager.rewind_history(profile, rng.randint(0, length))
+            elif action < 0.25 and any(branch["fork_at"] <= length for branch in manager.list_branches(profile)):
+                branches = [branch for branch in manager.list_branches(profile) if branch["fork_at"] <= length]
+                manager.restore_branch(profile, rng.choice(branches)["id"])
+            elif action < 0.4 and length:
+                replacement = _random_message(rng, "assistant")
+                replacement["alternatives"] = [_random_message(rng)["content"], replacement["content"]]
+                manager.commit_turn(profile, replace_last=replacement)
+                manager.select_alternative(profile, 0)
+            else:
+                manager.commit_turn(profile, messages=[_random_message(rng), _random_message(rng, "assistant")])
+
+            length = manager.get_history_length(profile)
+            with patch.object(manager, "load_history", side_effect=AssertionError("full reload")):
+                follow_history([index], length, lambda: manager.load_history(profile))
+            history = manager.load_history(profile)
+            query = " ".join(rng.choice(WORDS) for _ in range(3))
+            expected = retrieve_memory_stack(history, query, short_limit=6)
+            stack = retrieve_indexed_memory_stack(
+                history[-6:], length, lambda ids: manager.load_messages(profile, ids), query, index, short_limit=6
+            )
+            self.assertEqual(stack, expected, step)
+
+    def test_indexed_episodic_cues_match_whole_words_like_the_regex(self):
+        contents = ["we set the scene's lighting", "a 'promise' kept", "scene_1 draft", "the scenes", "hello"] + [f"filler {i}" for i in range(6)]
+        history = [{"role": "user", "content": content} for content in contents]
+        index = MessageIndex()
+        index.sync(history)
+
+        expected = retrieve_memory_stack(history, "tea", short_limit=6)
+        self.assertEqual(expected["episodic"], history[:2])
+        stack = retrieve_indexed_memory_stack(
+            history[-6:], len(history), lambda ids: [history[i] for i in ids], "tea", index, short_limit=6
+        )
+        self.assertEqual(stack, expected)
+
+        # Once the possessive is gone, so is its cue.
+        index.sync([{"role": "user", "content": "plain words"}] + history[1:])
+        self.assertEqual(index.latest_containing(("scene",), 5, len(history)), [2])
+
+    def test_get_message_index_is_shared_per_profile(self):
+        first = get_message_index("Some Profile", self.test_dir)
+        self.assertIs(first, get_message_index("Some Profile", self.test_dir))
+        self.assertIsNot(first, get_message_index("Other", self.test_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,10 +3,14 @@ import os
 import sys
 import json
 import shutil
+import subprocess
+import time
+from unittest.mock import patch
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from engines import history_storage
 from engines.memory_v2 import HistoryManager
 
 class TestHistoryManager(unittest.TestCase):
@@ -147,6 +151,746 @@ class TestHistoryManager(unittest.TestCase):
         self.assertEqual(data["metadata"]["memory_core"], "")
         self.assertEqual(data["metadata"]["last_summarized_index"], 0)
 
+class TestJournalHistoryStorage(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_journal"
+        self.manager = HistoryManager(history_dir=self.test_dir, storage_mode="journal")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def _journal_lines(self, profile):
+        with open(self.manager._get_filename(profile), "r", encoding="UTF-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def test_append_messages_only_appends_records(self):
+        profile = "JournalProfile"
+        self.manager.save_history(profile, [{"role": "assistant", "content": "Welcome"}], mood_score=3)
+        self.manager.append_messages(
+            profile,
+            [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}],
+            metadata={"current_scene": "Garden"},
+        )
+
+        lines = self._journal_lines(profile)
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[-1], {"op": "append", "message": {"role": "assistant", "content": "Hello"}})
+
+        data = self.manager.get_full_data(profile)
+        self.assertEqual([m["content"] for m in data["history"]], ["Welcome", "Hi", "Hello"])
+        self.assertEqual(data["metadata"]["mood_score"], 3)
+        self.assertEqual(data["metadata"]["current_scene"], "Garden")
+        self.assertEqual(self.manager.load_history(profile, limit=1), [{"role": "assistant", "content": "Hello"}])
+
+    def test_append_preserves_narrative_state(self):
+        profile = "JournalState"
+        self.manager.update_narrative_state(profile, {"current_goal": "Find clue"})
+        self.manager.append_messages(profile, [{"role": "user", "content": "Hi"}])
+        self.assertEqual(self.manager.get_narrative_state(profile), {"current_goal": "Find clue"})
+
+    def test_save_history_with_changed_tail_appends_truncate(self):
+        profile = "JournalRegen"
+        history = [{"role": "user", "content": "Q"}, {"role": "assistant", "content": "A1"}]
+        self.manager.save_history(profile, history)
+        history[-1] = {"role": "assistant", "content": "A2", "alternatives": ["A1", "A2"], "selected_index": 1}
+        self.manager.save_history(profile, history)
+
+        lines = self._journal_lines(profile)
+        self.assertEqual(lines[2], {"op": "truncate", "count": 1})
+        self.assertEqual(self.manager.load_history(profile), history)
+
+    def test_rewind_history_only_moves_head(self):
+        profile = "JournalRewind"
+        history = [{"role": "user", "content": f"msg {i}"} for i in range(6)]
+        self.manager.save_history(profile, history, memory_core="Summary", last_summarized_index=2)
+
+        self.assertEqual(self.manager.rewind_history(profile, 4), (6, 4))
+        self.assertEqual(len(self._journal_lines(profile)), 6)
+        data = self.manager.get_full_data(profile)
+        self.assertEqual(len(data["history"]), 4)
+        self.assertEqual(data["metadata"]["memory_core"], "Summary")
+
+        self.manager.append_messages(profile, [{"role": "user", "content": "fork"}])
+        self.assertEqual(self._journal_lines(profile)[6:], [
+            {"op": "truncate", "count": 4},
+            {"op": "append", "message": {"role": "user", "content": "fork"}},
+        ])
+
+    def test_torn_trailing_line_is_ignored(self):
+        profile = "JournalTorn"
+        self.manager.save_history(profile, [{"role": "user", "content": "kept"}])
+        with open(self.manager._get_filename(profile), "a", encoding="UTF-8") as f:
+            f.write('{"op": "append", "message": {"role": "assis')
+
+        self.assertEqual(self.manager.load_history(profile), [{"role": "user", "content": "kept"}])
+
+    def test_legacy_json_history_is_migrated_on_first_load(self):
+        profile = "LegacyProfile"
+        legacy = HistoryManager(history_dir=self.test_dir, storage_mode="json")
+        legacy.save_history(profile, [{"role": "user", "content": "old"}], mood_score=7, memory_core="Core")
+        legacy_path = legacy._get_filename(profile)
+
+        self.assertTrue(self.manager.has_history(profile))
+        data = self.manager.get_full_data(profile)
+        self.assertEqual(data["history"], [{"role": "user", "content": "old"}])
+        self.assertEqual(data["metadata"]["mood_score"], 7)
+        self.assertEqual(data["metadata"]["memory_core"], "Core")
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertTrue(os.path.exists(legacy_path + ".bak"))
+        self.assertTrue(os.path.exists(self.manager._get_filename(profile)))
+        self.assertEqual(self.manager.list_profiles(), [profile])
+
+    def test_failed_writes_return_false_and_leave_no_temp_file(self):
+        profile = "JournalReadOnly"
+        storage = self.manager.storage
+        history = [{"role": "user", "content": "kept"}]
+        self.manager.save_history(profile, history)
+        real_open = open
+
+        def read_only_open(path, mode="r", *args, **kwargs):
+            if any(flag in mode for flag in "wa"):
+                raise OSError("disk full")
+            return real_open(path, mode, *args, **kwargs)
+
+        with patch("builtins.open", side_effect=read_only_open):
+            data = {"metadata": history_storage.default_metadata(), "history": history + [{"role": "user", "content": "new"}]}
+            self.assertFalse(storage.write(profile, data))
+            data["history"] = [{"role": "user", "content": "rewritten"}] * 100
+            self.assertFalse(storage.write(profile, data))
+            self.assertFalse(storage.write("JournalFresh", data))
+        self.assertFalse(storage.write(profile, {"metadata": {}, "history": history + [{"content": object()}]}))
+
+        self.assertEqual([name for name in os.listdir(self.test_dir) if name.endswith(".tmp")], [])
+        self.assertEqual(self.manager.load_history(profile), history)
+
+    def test_journal_is_compacted_when_dead_records_pile_up(self):
+        profile = "JournalCompact"
+        self.manager.save_history(profile, [{"role": "user", "content": "base"}])
+        for i in range(80):
+            self.manager.save_history(profile, [{"role": "user", "content": "base"}, {"role": "assistant", "content": f"v{i}"}])
+
+        self.assertLessEqual(len(self._journal_lines(profile)), 2 + 64 + 2)
+        self.assertEqual(self.manager.load_history(profile)[-1]["content"], "v79")
+
+
+class TestHistoryCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_cache"
+        self.manager = HistoryManager(history_dir=self.test_dir, storage_mode="json")
+        self.profile = "CacheProfile"
+        self.manager.save_history(self.profile, [{"role": "user", "content": "Hello"}], mood_score=2)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_repeated_reads_do_not_reparse(self):
+        self.manager.invalidate_cache()
+        with patch.object(self.manager.storage, "read", wraps=self.manager.storage.read) as mock_read:
+            self.manager.get_full_data(self.profile)
+            self.manager.load_history(self.profile, limit=10)
+            self.manager.get_history_length(self.profile)
+            self.manager.get_memory_core(self.profile)
+            self.assertEqual(mock_read.call_count, 1)
+
+    def test_writes_populate_cache(self):
+        with patch.object(self.manager.storage, "read", wraps=self.manager.storage.read) as mock_read:
+            self.manager.append_messages(self.profile, [{"role": "assistant", "content": "Hi"}])
+            self.manager.update_memory_core(self.profile, "Core", 1)
+            self.assertEqual(len(self.manager.load_history(self.profile)), 2)
+            self.assertEqual(self.manager.get_memory_core(self.profile), "Core")
+            mock_read.assert_not_called()
+
+    def test_external_edit_invalidates_cache(self):
+        self.manager.load_history(self.profile)
+        filename = self.manager._get_filename(self.profile)
+        with open(filename, "r", encoding="UTF-8") as f:
+            data = json.load(f)
+        data["history"].append({"role": "assistant", "content": "Edited outside"})
+        with open(filename, "w", encoding="UTF-8") as f:
+            json.dump(data, f)
+
+        self.assertEqual(self.manager.load_history(self.profile)[-1]["content"], "Edited outside")
+
+    def test_mutating_returned_data_does_not_touch_cache(self):
+        history = self.manager.load_history(self.profile)
+        history[0]["content"] = "Mutated"
+        history.append({"role": "assistant", "content": "Extra"})
+        self.manager.get_full_data(self.profile)["metadata"]["mood_score"] = 99
+
+        self.assertEqual(self.manager.load_history(self.profile), [{"role": "user", "content": "Hello"}])
+        self.assertEqual(self.manager.get_full_data(self.profile)["metadata"]["mood_score"], 2)
+
+
+class TestSqliteHistoryStorage(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_sqlite"
+        self.manager = HistoryManager(history_dir=self.test_dir, storage_mode="sqlite")
+        self.profile = "SqliteProfile"
+
+    def tearDown(self):
+        self.manager.storage.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_round_trip_preserves_messages_and_metadata(self):
+        history = [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "b", "alternatives": ["a", "b"], "selected_index": 1},
+            {"role": "assistant", "content": "note", "pipeline": {"beat": 1}},
+        ]
+        self.manager.save_history(self.profile, history, mood_score=4, memory_core="Core")
+        self.manager.invalidate_cache()
+
+        data = self.manager.get_full_data(self.profile)
+        self.assertEqual(data["history"], history)
+        self.assertEqual(data["metadata"]["mood_score"], 4)
+        self.assertEqual(data["metadata"]["memory_core"], "Core")
+        self.assertEqual(self.manager.list_profiles(), [self.profile])
+
+    def test_partial_operations_do_not_load_full_history(self):
+        history = [{"role": "user", "content": f"msg {i}"} for i in range(20)]
+        self.manager.save_history(self.profile, history, memory_core="Core", last_summarized_index=4)
+        self.manager.invalidate_cache()
+
+        with patch.object(self.manager.storage, "read", wraps=self.manager.storage.read) as mock_read:
+            self.assertEqual(self.manager.load_history(self.profile, limit=2), history[-2:])
+            self.assertEqual(self.manager.get_history_length(self.profile), 20)
+            self.manager.append_messages(self.profile, [{"role": "assistant", "content": "new"}], {"mood_score": 3})
+            self.manager.update_narrative_state(self.profile, {"scene_goal": "Explore"})
+            self.assertEqual(self.manager.rewind_history(self.profile, 18), (21, 18))
+            metadata = self.manager.get_metadata(self.profile)
+            mock_read.assert_not_called()
+
+        self.assertEqual(metadata["mood_score"], 3)
+        self.assertEqual(metadata["memory_core"], "Core")
+        self.assertEqual(metadata["narrative_state"], {"scene_goal": "Explore"})
+        self.assertEqual(self.manager.load_history(self.profile), history[:18])
+
+    def test_rewind_past_threshold_resets_memory_core(self):
+        history = [{"role": "user", "content": f"msg {i}"} for i in range(20)]
+        self.manager.save_history(self.profile, history, memory_core="Core", last_summarized_index=2)
+        self.manager.invalidate_cache()
+
+        self.manager.rewind_history(self.profile, 3)
+        self.assertEqual(self.manager.get_memory_core(self.profile), "")
+        self.assertEqual(self.manager.get_last_summarized_index(self.profile), 0)
+        self.assertEqual(self.manager.get_history_length(self.profile), 3)
+
+    def test_select_alternative_updates_last_message_only(self):
+        history = [
+            {"role": "user", "content": "u"},
+            {"role": "assistant", "content": "b", "alternatives": ["a", "b", "c"], "selected_index": 1},
+        ]
+        self.manager.save_history(self.profile, history, mood_score=6)
+        self.manager.invalidate_cache()
+
+        updated = self.manager.select_alternative(self.profile, 2)
+        self.assertEqual(updated["content"], "c")
+        self.assertIsNone(self.manager.select_alternative(self.profile, 3))
+
+        last = self.manager.load_history(self.profile)[-1]
+        self.assertEqual((last["content"], last["selected_index"]), ("c", 2))
+        self.assertEqual(last["alternatives"], ["a", "b", "c"])
+        self.assertEqual(self.manager.get_metadata(self.profile)["mood_score"], 6)
+
+    def test_writes_from_another_connection_invalidate_cache(self):
+        self.manager.save_history(self.profile, [{"role": "user", "content": "Hello"}])
+        self.manager.load_history(self.profile)
+
+        other = HistoryManager(history_dir=self.test_dir, storage_mode="sqlite")
+        other.append_messages(self.profile, [{"role": "assistant", "content": "From elsewhere"}])
+        other.storage.close()
+
+        self.assertEqual(self.manager.load_history(self.profile)[-1]["content"], "From elsewhere")
+
+    def test_legacy_json_history_is_imported(self):
+        legacy = HistoryManager(history_dir=self.test_dir, storage_mode="json")
+        legacy.save_history("LazyProfile", [{"role": "user", "content": "old"}], mood_score=7)
+        legacy.save_history("BulkProfile", [{"role": "user", "content": "bulk"}])
+        lazy_path = legacy._get_filename("LazyProfile")
+
+        self.assertEqual(self.manager.load_history("LazyProfile", limit=5), [{"role": "user", "content": "old"}])
+        self.assertEqual(self.manager.get_metadata("LazyProfile")["mood_score"], 7)
+        self.assertTrue(os.path.exists(lazy_path + ".bak"))
+
+        self.assertEqual(self.manager.storage.import_json_history(), ["BulkProfile"])
+        self.assertEqual(self.manager.storage.import_json_history(), [])
+        self.assertEqual(self.manager.list_profiles(), ["BulkProfile", "LazyProfile"])
+        self.assertEqual(self.manager.load_history("BulkProfile"), [{"role": "user", "content": "bulk"}])
+
+
+class TestTurnCommit(unittest.TestCase):
+    MODES = ("json", "journal", "sqlite")
+
+    def setUp(self):
+        self.test_dir = "test_history_turn"
+        self.profile = "TurnProfile"
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def _manager(self, mode):
+        manager = HistoryManager(history_dir=os.path.join(self.test_dir, mode), storage_mode=mode)
+        self.addCleanup(getattr(manager.storage, "close", lambda: None))
+        manager.save_history(
+            self.profile,
+            [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}],
+            memory_core="Core",
+            last_summarized_index=2,
+        )
+        return manager
+
+    def test_turn_is_a_single_storage_write(self):
+        for mode in self.MODES:
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                with patch("engines.history_storage.save_json_atomic", wraps=history_storage.save_json_atomic) as mock_save, \
+                        patch.object(manager.storage, "write_metadata") as mock_write_metadata, \
+                        patch.object(manager.storage, "append") as mock_append:
+                    manager.commit_turn(
+                        self.profile,
+                        messages=[{"role": "user", "content": "Next"}, {"role": "assistant", "content": "Reply"}],
+                        metadata={"mood_score": 5, "narrative_state": {"turn": 1}, "last_turn_metrics": {"total": 8}},
+                    )
+                    mock_write_metadata.assert_not_called()
+                    mock_append.assert_not_called()
+                    self.assertLessEqual(mock_save.call_count, 1)
+
+                manager.invalidate_cache()
+                data = manager.get_full_data(self.profile)
+                self.assertEqual([msg["content"] for msg in data["history"]], ["Hi", "Hello", "Next", "Reply"])
+                self.assertEqual(data["metadata"]["mood_score"], 5)
+                self.assertEqual(data["metadata"]["narrative_state"], {"turn": 1})
+                self.assertEqual(data["metadata"]["last_turn_metrics"], {"total": 8})
+                self.assertEqual(data["metadata"]["memory_core"], "Core")
+
+    def test_replace_last_rewrites_only_the_reply(self):
+        for mode in self.MODES:
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                manager.update_narrative_state(self.profile, {"scene_goal": "Explore"})
+                manager.invalidate_cache()
+                last = manager.load_history(self.profile, limit=1)[-1]
+                last.update({"alternatives": ["Hello", "Howdy"], "selected_index": 1, "content": "Howdy"})
+
+                manager.commit_turn(self.profile, replace_last=last, metadata={"current_scene": "Porch"})
+
+                manager.invalidate_cache()
+                data = manager.get_full_data(self.profile)
+                self.assertEqual(len(data["history"]), 2)
+                self.assertEqual(data["history"][-1]["alternatives"], ["Hello", "Howdy"])
+                self.assertEqual(data["metadata"]["current_scene"], "Porch")
+                self.assertEqual(data["metadata"]["narrative_state"], {"scene_goal": "Explore"})
+
+
+class TestOffsetIndexTailReads(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_offsets"
+        self.profile = "TailProfile"
+        self.history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"msg {i} é"} for i in range(30)]
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def _manager(self, mode):
+        manager = HistoryManager(history_dir=os.path.join(self.test_dir, mode), storage_mode=mode)
+        manager.save_history(self.profile, self.history, mood_score=3, memory_core="Core")
+        manager.invalidate_cache()
+        return manager
+
+    def test_tail_and_metadata_reads_skip_full_parse(self):
+        for mode in ("json", "journal"):
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                with patch.object(manager.storage, "read", wraps=manager.storage.read) as mock_read:
+                    self.assertEqual(manager.load_history(self.profile, limit=4), self.history[-4:])
+                    self.assertEqual(manager.get_history_length(self.profile), 30)
+                    self.assertEqual(manager.get_metadata(self.profile)["memory_core"], "Core")
+                    mock_read.assert_not_called()
+
+    def test_json_file_keeps_its_pretty_printed_format(self):
+        manager = self._manager("json")
+        with open(manager._get_filename(self.profile), "r", encoding="UTF-8") as f:
+            raw = f.read()
+        self.assertEqual(raw, json.dumps(json.loads(raw), indent=4, ensure_ascii=False))
+
+    def test_failed_json_write_keeps_the_file_and_its_index(self):
+        manager = self._manager("json")
+        with patch("engines.history_storage.save_json_atomic", wraps=history_storage.save_json_atomic) as mock_save:
+            self.assertFalse(manager.storage.write(self.profile, {"metadata": {}, "history": [{"content": object()}]}))
+            mock_save.assert_called_once()
+        self.assertEqual([name for name in os.listdir(manager.history_dir) if name.endswith(".tmp")], [])
+        with patch.object(manager.storage, "read", wraps=manager.storage.read) as mock_read:
+            self.assertEqual(manager.load_history(self.profile, limit=4), self.history[-4:])
+            mock_read.assert_not_called()
+
+    def test_stale_index_falls_back_to_full_parse(self):
+        manager = self._manager("json")
+        filename = manager._get_filename(self.profile)
+        with open(filename, "r", encoding="UTF-8") as f:
+            data = json.load(f)
+        data["history"].append({"role": "user", "content": "Edited outside"})
+        with open(filename, "w", encoding="UTF-8") as f:
+            json.dump(data, f)
+
+        self.assertEqual(manager.load_history(self.profile, limit=2)[-1]["content"], "Edited outside")
+        self.assertEqual(manager.get_history_length(self.profile), 31)
+
+    def test_journal_index_follows_appends_and_rewinds(self):
+        manager = self._manager("journal")
+        manager.commit_turn(self.profile, messages=[{"role": "user", "content": "new"}])
+        manager.rewind_history(self.profile, 28)
+        manager.append_messages(self.profile, [{"role": "assistant", "content": "after rewind"}])
+        manager.invalidate_cache()
+
+        expected = self.history[:28] + [{"role": "assistant", "content": "after rewind"}]
+        with patch.object(manager.storage, "read", wraps=manager.storage.read) as mock_read:
+            self.assertEqual(manager.load_history(self.profile, limit=3), expected[-3:])
+            mock_read.assert_not_called()
+
+    def test_missing_journal_index_is_rebuilt_on_full_read(self):
+        manager = self._manager("journal")
+        index_path = manager.storage.get_index(self.profile).path
+        os.remove(index_path)
+
+        self.assertEqual(manager.load_history(self.profile, limit=2), self.history[-2:])
+        self.assertTrue(os.path.exists(index_path))
+
+    def test_append_after_torn_line_is_not_lost(self):
+        manager = self._manager("journal")
+        with open(manager._get_filename(self.profile), "a", encoding="UTF-8") as f:
+            f.write('{"op": "append", "message": {"role": "assis')
+        manager.append_messages(self.profile, [{"role": "assistant", "content": "after tear"}])
+        manager.invalidate_cache()
+
+        self.assertEqual(manager.load_history(self.profile)[-1]["content"], "after tear")
+        self.assertEqual(manager.get_history_length(self.profile), 31)
+
+
+class TestHistoryArchive(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_archive"
+        self.profile = "ArchiveProfile"
+        self.history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"msg {i}"} for i in range(40)]
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def _manager(self, mode):
+        manager = HistoryManager(history_dir=os.path.join(self.test_dir, mode), storage_mode=mode)
+        self.addCleanup(getattr(manager.storage, "close", lambda: None))
+        manager.ARCHIVE_MIN_SEGMENT = 10
+        manager.save_history(self.profile, self.history, mood_score=2)
+        manager.update_memory_core(self.profile, "Core", 30)
+        return manager
+
+    def test_summarized_messages_move_to_compressed_segments(self):
+        for mode in ("json", "journal", "sqlite"):
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                metadata = manager.get_metadata(self.profile)
+                self.assertEqual(metadata["archived_count"], 30)
+                segment_path = os.path.join(manager.archive.archive_dir, metadata["archive_segments"][0]["file"])
+                self.assertTrue(segment_path.endswith(".json.gz"))
+                self.assertTrue(os.path.exists(segment_path))
+                self.assertEqual(len(manager.storage.read(self.profile)["history"]), 10)
+
+                manager.invalidate_cache()
+                manager.archive = type(manager.archive)(manager.history_dir)
+                self.assertEqual(manager.get_history_length(self.profile), 40)
+                self.assertEqual(manager.load_history(self.profile), self.history)
+                self.assertEqual(manager.get_full_data(self.profile)["history"], self.history)
+                self.assertEqual(manager.get_last_summarized_index(self.profile), 30)
+                self.assertEqual(manager.get_memory_core(self.profile), "Core")
+
+    def test_recent_reads_leave_archive_untouched(self):
+        manager = self._manager("json")
+        manager.commit_turn(self.profile, messages=[{"role": "user", "content": "new"}])
+        manager.invalidate_cache()
+        with patch.object(manager.archive, "read_segment") as mock_read_segment:
+            self.assertEqual(manager.load_history(self.profile, limit=5)[-1]["content"], "new")
+            self.assertEqual(manager.get_history_length(self.profile), 41)
+            mock_read_segment.assert_not_called()
+
+        # Asking for more than the live part pulls in just the archived tail.
+        self.assertEqual(manager.load_history(self.profile, limit=13), self.history[-12:] + [{"role": "user", "content": "new"}])
+
+    def test_load_messages_reads_only_the_requested_messages(self):
+        for mode in ("json", "journal", "sqlite"):
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                manager.rewind_history(self.profile, 38)
+                ids = [35, 3, 31, 39, 99, 30]
+                expected = [self.history[i] for i in (35, 3, 31, 30)]
+                self.assertEqual(manager.load_messages(self.profile, ids), expected)
+
+                manager.invalidate_cache()
+                with patch.object(manager.storage, "read", side_effect=AssertionError("full read")):
+                    self.assertEqual(manager.load_messages(self.profile, ids), expected)
+                    self.assertEqual(manager.load_messages(self.profile, []), [])
+
+    def test_rewind_within_live_part_keeps_archive(self):
+        manager = self._manager("json")
+        self.assertEqual(manager.rewind_history(self.profile, 35), (40, 35))
+        self.assertEqual(manager.get_metadata(self.profile)["archived_count"], 30)
+        self.assertEqual(manager.load_history(self.profile), self.history[:35])
+
+    def test_rewind_past_archive_boundary_restores_messages(self):
+        for mode in ("json", "sqlite"):
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                segments = manager.get_metadata(self.profile)["archive_segments"]
+
+                self.assertEqual(manager.rewind_history(self.profile, 12), (40, 12))
+                metadata = manager.get_metadata(self.profile)
+                self.assertEqual(metadata["archived_count"], 0)
+                self.assertEqual(metadata["memory_core"], "")
+                self.assertEqual(manager.load_history(self.profile), self.history[:12])
+                self.assertFalse(os.path.exists(os.path.join(manager.archive.archive_dir, segments[0]["file"])))
+
+    def test_save_history_supersedes_archive(self):
+        manager = self._manager("json")
+        segments = manager.get_metadata(self.profile)["archive_segments"]
+        manager.save_history(self.profile, [{"role": "assistant", "content": "fresh start"}])
+
+        self.assertEqual(manager.get_history_length(self.profile), 1)
+        self.assertFalse(os.path.exists(os.path.join(manager.archive.archive_dir, segments[0]["file"])))
+
+
+class TestRewindBranches(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_branches"
+        self.profile = "BranchProfile"
+        self.history = [{"role": "user", "content": f"msg {i}"} for i in range(10)]
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def _manager(self, mode):
+        manager = HistoryManager(history_dir=os.path.join(self.test_dir, mode), storage_mode=mode)
+        self.addCleanup(getattr(manager.storage, "close", lambda: None))
+        manager.save_history(self.profile, self.history, memory_core="Core", last_summarized_index=4)
+        return manager
+
+    def test_rewind_only_writes_metadata(self):
+        for mode in ("json", "journal", "sqlite"):
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                manager.invalidate_cache()
+                storage = manager.storage
+                with patch.object(storage, "truncate") as mock_truncate, \
+                        patch.object(storage, "commit") as mock_commit, \
+                        patch.object(storage, "write_metadata", wraps=storage.write_metadata) as mock_write_metadata:
+                    self.assertEqual(manager.rewind_history(self.profile, 6), (10, 6))
+                    mock_truncate.assert_not_called()
+                    mock_commit.assert_not_called()
+                    mock_write_metadata.assert_called_once()
+
+                manager.invalidate_cache()
+                self.assertEqual(manager.get_history_length(self.profile), 6)
+                self.assertEqual(manager.load_history(self.profile, limit=2), self.history[4:6])
+                self.assertEqual(manager.load_history(self.profile), self.history[:6])
+                self.assertEqual(manager.get_memory_core(self.profile), "Core")
+                self.assertEqual(
+                    [(b["id"], b["fork_at"], b["count"], b["preview"]) for b in manager.list_branches(self.profile)],
+                    [(1, 6, 4, "msg 6")],
+                )
+
+    def test_new_messages_fork_and_restore_swaps_branches(self):
+        for mode in ("json", "journal", "sqlite"):
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                manager.rewind_history(self.profile, 6)
+                manager.commit_turn(self.profile, messages=[{"role": "user", "content": "alt 6"}])
+                manager.invalidate_cache()
+
+                self.assertEqual(manager.load_history(self.profile), self.history[:6] + [{"role": "user", "content": "alt 6"}])
+                self.assertEqual(manager.list_branches(self.profile)[0]["preview"], "msg 6")
+
+                self.assertEqual(manager.restore_branch(self.profile, 1), (7, 10))
+                manager.invalidate_cache()
+                self.assertEqual(manager.load_history(self.profile), self.history)
+                self.assertEqual(
+                    [(b["id"], b["fork_at"], b["count"], b["preview"]) for b in manager.list_branches(self.profile)],
+                    [(2, 6, 1, "alt 6")],
+                )
+                self.assertEqual(manager.get_memory_core(self.profile), "Core")
+
+    def test_restore_branch_still_in_log(self):
+        manager = self._manager("sqlite")
+        manager.rewind_history(self.profile, 8)
+        manager.rewind_history(self.profile, 5)
+
+        self.assertEqual([b["count"] for b in manager.list_branches(self.profile)], [2, 3])
+        with self.assertRaises(ValueError):
+            manager.restore_branch(self.profile, 1)
+
+        self.assertEqual(manager.restore_branch(self.profile, 2), (5, 8))
+        self.assertEqual(manager.load_history(self.profile), self.history[:8])
+        self.assertEqual(manager.restore_branch(self.profile, 1), (8, 10))
+        self.assertEqual(manager.load_history(self.profile), self.history)
+        self.assertEqual(manager.get_last_summarized_index(self.profile), 4)
+
+    def test_rewind_resets_memory_core_against_branch_head(self):
+        manager = self._manager("journal")
+        manager.rewind_history(self.profile, 3)
+        self.assertEqual(manager.get_memory_core(self.profile), "")
+
+        manager.update_memory_core(self.profile, "New core", 2)
+        manager.restore_branch(self.profile, 1)
+        self.assertEqual(manager.get_memory_core(self.profile), "New core")
+        self.assertEqual(manager.get_last_summarized_index(self.profile), 2)
+
+    def test_save_history_drops_branch_segments(self):
+        manager = self._manager("json")
+        manager.rewind_history(self.profile, 6)
+        manager.append_messages(self.profile, [{"role": "user", "content": "fork"}])
+        segment_path = os.path.join(manager.archive.archive_dir, manager.get_metadata(self.profile)["branches"][0]["file"])
+        self.assertTrue(os.path.exists(segment_path))
+
+        manager.save_history(self.profile, [])
+        self.assertFalse(os.path.exists(segment_path))
+        self.assertEqual(manager.list_branches(self.profile), [])
+
+
+class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_write_behind"
+        self.profile = "WriteBehindProfile"
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def _manager(self, mode="json", delay=60.0):
+        manager = HistoryManager(history_dir=os.path.join(self.test_dir, mode), storage_mode=mode, write_behind=True)
+        manager.write_delay = delay
+        self.addCleanup(manager.flush)
+        self.addCleanup(getattr(manager.storage, "close", lambda: None))
+        return manager
+
+    def test_reads_see_pending_writes_before_flush(self):
+        manager = self._manager()
+        manager.save_history(self.profile, [{"role": "user", "content": "Hi"}], mood_score=4)
+        manager.commit_turn(self.profile, messages=[{"role": "assistant", "content": "Hello"}])
+
+        self.assertIsNone(manager.storage.read(self.profile))
+        self.assertTrue(manager.has_history(self.profile))
+        self.assertEqual(manager.get_history_length(self.profile), 2)
+        self.assertEqual(manager.load_history(self.profile, limit=1)[0]["content"], "Hello")
+        self.assertEqual(manager.get_metadata(self.profile)["mood_score"], 4)
+
+        self.assertTrue(manager.flush())
+        self.assertEqual(len(manager.storage.read(self.profile)["history"]), 2)
+
+    def test_mutations_coalesce_into_one_write(self):
+        for mode in ("json", "journal", "sqlite"):
+            with self.subTest(mode=mode):
+                manager = self._manager(mode)
+                with patch.object(manager.storage, "write", wraps=manager.storage.write) as mock_write:
+                    manager.save_history(self.profile, [{"role": "user", "content": "Hi"}])
+                    manager.append_messages(self.profile, [{"role": "assistant", "content": "Hello"}])
+                    manager.update_narrative_state(self.profile, {"scene_goal": "Explore"})
+                    manager.rewind_history(self.profile, 1)
+                    manager.flush()
+                    self.assertEqual(mock_write.call_count, 1)
+
+                manager.invalidate_cache()
+                self.assertEqual(manager.load_history(self.profile), [{"role": "user", "content": "Hi"}])
+                self.assertEqual(manager.get_narrative_state(self.profile), {"scene_goal": "Explore"})
+
+    def test_background_flusher_persists_after_delay(self):
+        manager = self._manager(delay=0.05)
+        manager.save_history(self.profile, [{"role": "user", "content": "Hi"}])
+
+        deadline = time.monotonic() + 5
+        while manager.storage.read(self.profile) is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(manager.storage.read(self.profile)["history"], [{"role": "user", "content": "Hi"}])
+
+    def test_flusher_survives_a_raising_write_and_retries(self):
+        manager = self._manager(delay=0.05)
+        real_write = manager.storage.write
+        calls = []
+
+        def flaky_write(*args, **kwargs):
+            calls.append(args[0])
+            if len(calls) == 1:
+                raise RuntimeError("disk gone")
+            return real_write(*args, **kwargs)
+
+        with patch.object(manager.storage, "write", side_effect=flaky_write), patch("builtins.print"):
+            manager.save_history(self.profile, [{"role": "user", "content": "Hi"}])
+            deadline = time.monotonic() + 5
+            while manager.storage.read(self.profile) is None and time.monotonic() < deadline:
+                time.sleep(0.02)
+
+        self.assertTrue(manager._flusher.is_alive())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(manager.storage.read(self.profile)["history"], [{"role": "user", "content": "Hi"}])
+
+    def test_archive_segments_are_deleted_only_after_flush(self):
+        manager = self._manager()
+        manager.ARCHIVE_MIN_SEGMENT = 5
+        manager.save_history(self.profile, [{"role": "user", "content": f"msg {i}"} for i in range(12)])
+        manager.update_memory_core(self.profile, "Core", 8)
+        manager.flush()
+        segment = manager.get_metadata(self.profile)["archive_segments"][0]
+        segment_path = os.path.join(manager.archive.archive_dir, segment["file"])
+
+        manager.save_history(self.profile, [])
+        self.assertTrue(os.path.exists(segment_path))
+        manager.flush()
+        self.assertFalse(os.path.exists(segment_path))
+
+    def test_killing_the_process_mid_flush_leaves_a_consistent_history(self):
+        script = (
+            "import sys\n"
+            "sys.path.insert(0, sys.argv[1])\n"
+            "from engines.memory_v2 import HistoryManager\n"
+            "manager = HistoryManager(history_dir=sys.argv[2], storage_mode=sys.argv[3], write_behind=True)\n"
+            "manager.write_delay = 0\n"
+            "manager.fsync_policy = 'always'\n"
+            "pad = 'x' * 2000\n"
+            "for i in range(100000):\n"
+            "    manager.append_messages('Crash', [{'role': 'user', 'content': f'{i} {pad}'}])\n"
+            "    if i % 25 == 0:\n"
+            "        print(i, flush=True)\n"
+        )
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        for mode in ("json", "journal"):
+            for wait in (0.0, 0.05, 0.2):
+                with self.subTest(mode=mode, wait=wait):
+                    history_dir = os.path.abspath(os.path.join(self.test_dir, f"crash_{mode}_{wait}"))
+                    proc = subprocess.Popen(
+                        [sys.executable, "-c", script, root, history_dir, mode],
+                        cwd=root,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL,
+                        text=True,
+                    )
+                    try:
+                        while int(proc.stdout.readline() or "-1") < 200:
+                            self.assertIsNone(proc.poll())
+                        time.sleep(wait)
+                    finally:
+                        proc.kill()
+                        proc.wait()
+                        proc.stdout.close()
+
+                    recovered = HistoryManager(history_dir=history_dir, storage_mode=mode, write_behind=False)
+                    history = recovered.load_history("Crash")
+                    self.assertGreater(len(history), 0)
+                    numbers = [int(msg["content"].split(" ", 1)[0]) for msg in history]
+                    self.assertEqual(numbers, list(range(len(numbers))))
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -1,3 +1,5 @@
+import asyncio
+import shutil
 import unittest
 import sys
 import os
@@ -6,6 +8,10 @@ from unittest.mock import MagicMock, patch
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from engines.config import Settings
+from engines.llm_client import CancellationToken
+from engines.memory_v2 import HistoryManager
+from engines.responses import _perform_post_processing
 from menu import TaiMenu, format_rp
 
 class TestMenu(unittest.TestCase):
@@ -34,5 +40,48 @@ class TestMenu(unittest.TestCase):
         self.assertEqual(app.char_path, "profiles/test.json")
         self.assertEqual(app.user_path, "user_profiles/test.json")
 
+class TestRewindDuringGeneration(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_menu_rewind"
+        self.manager = HistoryManager(history_dir=self.test_dir, storage_mode="json")
+        self.manager.save_history("Rewind", [{"role": "user", "content": f"message {i}"} for i in range(4)])
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    @patch("engines.responses.append_turn_telemetry")
+    @patch("engines.responses.update_profile_score")
+    def test_reply_finishing_after_a_rewind_is_not_committed(self, mock_update_score, _mock_telemetry):
+        menu = MagicMock()
+        menu.history_profile_name = "Rewind"
+        menu._generation_token = token = CancellationToken()
+        menu._cancel_generation = lambda: TaiMenu._cancel_generation(menu)
+
+        def rewind(message, profile_name):
+            # By the time the history changes, the running turn must already be cancelled.
+            self.assertTrue(token.cancelled)
+            original_count, kept_count = self.manager.rewind_history(profile_name, 2)
+            return {"type": "rewind", "original_count": original_count, "kept_count": kept_count}
+
+        event = MagicMock(value="//rewind 2")
+        with patch("menu.handle_command_input", side_effect=rewind), patch("menu.memory_manager", self.manager):
+            asyncio.run(TaiMenu.on_chat_input_submitted(menu, event))
+
+        # The turn that was generating during the rewind reaches post-processing only now.
+        with patch("engines.responses.memory_manager", self.manager):
+            _perform_post_processing(
+                user_input="late question", model="model", remote_url=None, profile={},
+                profile_path="profiles/test.json", history_profile_name="Rewind", is_regeneration=False,
+                full_reply="late reply", current_scene="Room", rel_score=0, pipeline_flags={"enabled": False},
+                narrative_plan=None, memory_stack=None, selected_metrics=None, candidate_metrics=[],
+                critic_applied=False, settings=Settings(), sentiment_future=MagicMock(**{"result.return_value": 3}),
+                cancel_token=token,
+            )
+        self.assertEqual([msg["content"] for msg in self.manager.load_history("Rewind")], ["message 0", "message 1"])
+        mock_update_score.assert_not_called()
+        menu.reload_chat_from_history.assert_called_once()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import time
+import unittest
+from unittest.mock import patch
+
+from engines import prompts
+from engines.prompts import build_split_system_prompt, build_system_prompt, get_mood_rule, load_user_profile
+
+USER_PROFILE = "test_prompts_user.json"
+
+
+class TestPrompts(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_prompts_rules"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.mood_path = os.path.join(self.test_dir, "mood_intensity.json")
+        self.rules_path = os.path.join(self.test_dir, "rp_rule.md")
+        self.user_path = os.path.join("user_profiles", USER_PROFILE)
+        self._write(self.mood_path, json.dumps({
+            "hostile": {"min_score": -100, "label": "Hostile", "instruction": "Be cold."},
+            "neutral": {"min_score": 0, "label": "Neutral", "instruction": "Be polite."},
+            "neutral_twin": {"min_score": 0, "label": "Twin", "instruction": "Never chosen."},
+            "friendly": {"min_score": 40, "label": "Friendly", "instruction": "Be warm."},
+        }))
+        self._write(self.rules_path, "Never speak for {{user}}.")
+        self._write(self.user_path, json.dumps({"name": "Alex", "personality_type": "Calm", "rp_mannerisms": ["sighs"]}))
+
+        self.patchers = [
+            patch.object(prompts, "MOOD_INTENSITY_PATH", self.mood_path),
+            patch.object(prompts, "RP_RULES_PATH", self.rules_path),
+            patch("engines.config.get_setting", side_effect=lambda key, default=None: USER_PROFILE if key == "current_user_profile" else default),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.profile = {
+            "name": "Nova",
+            "system_prompt": "You are {{char}}, talking to {{user}}.",
+            "backstory": "A pilot.",
+            "rp_mannerisms": ["hums"],
+            "character_info": {"age": 30, "likes": ["stars"], "dislikes": []},
+        }
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        if os.path.exists(self.user_path):
+            os.remove(self.user_path)
+
+    def _write(self, path, text):
+        with open(path, "w", encoding="UTF-8") as f:
+            f.write(text)
+        # Make every rewrite visible even on filesystems with coarse mtimes.
+        stamp = time.time_ns() + len(text)
+        os.utime(path, ns=(stamp, stamp))
+
+    def test_mood_rule_brackets(self):
+        self.assertEqual(get_mood_rule(-101), {})
+        self.assertEqual(get_mood_rule(-100)["label"], "Hostile")
+        self.assertEqual(get_mood_rule(-1)["label"], "Hostile")
+        self.assertEqual(get_mood_rule(0)["label"], "Neutral")
+        self.assertEqual(get_mood_rule(39)["label"], "Neutral")
+        self.assertEqual(get_mood_rule(100)["label"], "Friendly")
+
+    def test_build_system_prompt_layout(self):
+        prompt = build_system_prompt(self.profile, 45, "Respond normally.", "Warm {{char}}.", "rp", "Lore about {{user}}")
+        self.assertTrue(prompt.startswith("You are Nova, talking to Alex.\n\n\n[CHARACTER PROFILE]\nName: Nova\n"))
+        self.assertIn("Age: 30\n", prompt)
+        self.assertIn("Likes: stars\nDislikes: \nMannerisms: hums\n", prompt)
+        self.assertIn("[USER PROFILE (WHO YOU ARE TALKING TO)]\nName: Alex\nPersonality: Calm\n", prompt)
+        self.assertTrue(prompt.endswith(
+            "[CONTEXT]\nRel: Friendly (45/100)\nAction: Respond normally.\nTone: Warm Nova.\nMode: RP\nBe warm.\n"
+            "Note: Lore about Alex\nNever speak for Alex."
+        ))
+
+    def test_static_parts_are_read_once_until_files_change(self):
+        build_system_prompt(self.profile, 0, "a", "t")
+        with patch("engines.prompts.open", create=True, side_effect=open) as mock_open:
+            for score in range(-20, 20):
+                build_system_prompt(dict(self.profile), score, "a", "t", "rp", f"turn {score}")
+            mock_open.assert_not_called()
+
+            self._write(self.rules_path, "Rules v2 for {{char}}.")
+            self._write(self.user_path, json.dumps({"name": "Sam"}))
+            prompt = build_system_prompt(self.profile, 0, "a", "t")
+            self.assertEqual(mock_open.call_count, 2)
+        self.assertTrue(prompt.endswith("Rules v2 for Nova."))
+        self.assertIn("You are Nova, talking to Sam.", prompt)
+        self.assertEqual(load_user_profile(), {"name": "Sam"})
+
+        changed = dict(self.profile, backstory="A retired pilot.")
+        self.assertIn("Backstory: A retired pilot.\n", build_system_prompt(changed, 0, "a", "t"))
+
+    def test_split_prompt_has_a_stable_static_part(self):
+        static, context = build_split_system_prompt(self.profile, 45, "Respond normally.", "Warm.", "rp", "Scene: harbor")
+        later_static, later_context = build_split_system_prompt(self.profile, -5, "MUST REFUSE.", "Cold.", "rp", "Scene: forest")
+        self.assertEqual(static, later_static)
+        self.assertTrue(static.endswith("Never speak for Alex."))
+        self.assertNotIn("[CONTEXT]", static)
+        self.assertEqual(context, "[CONTEXT]\nRel: Friendly (45/100)\nAction: Respond normally.\nTone: Warm.\nMode: RP\nBe warm.\nNote: Scene: harbor")
+        self.assertIn("Note: Scene: forest", later_context)
+
+        full = build_system_prompt(self.profile, 45, "Respond normally.", "Warm.", "rp", "Scene: harbor")
+        self.assertEqual(sorted(full), sorted(static + context + "\n"))
+
+    def test_missing_files_fall_back(self):
+        os.remove(self.mood_path)
+        os.remove(self.user_path)
+        with patch.object(prompts, "CASUAL_RULES_PATH", os.path.join(self.test_dir, "missing.md")):
+            prompt = build_system_prompt(self.profile, 10, "a", "t", "casual")
+        self.assertEqual(get_mood_rule(10), {})
+        self.assertIn("You are Nova, talking to User.", prompt)
+        self.assertIn("Rel: Neutral (10/100)", prompt)
+        self.assertTrue(prompt.endswith("No response rules."))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,7 @@ class TestRepetitionFix(unittest.TestCase):
     """
 
     @patch("engines.responses.get_setting")
-    @patch("engines.responses.requests.post")
+    @patch("engines.responses.http_client.post")
     def test_remote_bridge_receives_penalty(self, mock_post, mock_get_setting):
         # Setup: Mock setting to a high penalty to ensure it's distinct
         mock_get_setting.side_effect = lambda key, default=None: {
@@ -1,13 +1,16 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+from engines.config import Settings
+from engines.llm_client import CancellationToken
 from engines.response_orchestrator import iterate_response_events
 
 
 class TestResponseOrchestrator(unittest.TestCase):
+    @patch("engines.response_orchestrator.subscribe_setting", return_value=False)
     @patch("engines.response_orchestrator.get_respond_stream", return_value=iter(["Hello ", "world!"]))
     @patch("engines.response_orchestrator.get_setting")
-    def test_iterate_response_events_without_tts(self, mock_get_setting, _mock_stream):
+    def test_iterate_response_events_without_tts(self, mock_get_setting, _mock_stream, _mock_subscribe):
         mock_get_setting.side_effect = lambda key, default=None: {
             "tts_enabled": False,
             "character_speak": False,
@@ -21,10 +24,11 @@ class TestResponseOrchestrator(unittest.TestCase):
         self.assertEqual(events[-1]["type"], "complete")
         self.assertEqual(events[-1]["full_response"], "Hello world!")
 
+    @patch("engines.response_orchestrator.subscribe_setting", return_value=True)
     @patch("engines.response_orchestrator.clean_text_for_tts", side_effect=lambda text, speak_narration=True: text.strip())
     @patch("engines.response_orchestrator.get_respond_stream", return_value=iter(["Hi. ", "*Act* done."]))
     @patch("engines.response_orchestrator.get_setting")
-    def test_iterate_response_events_with_tts(self, mock_get_setting, _mock_stream, _mock_clean):
+    def test_iterate_response_events_with_tts(self, mock_get_setting, _mock_stream, _mock_clean, _mock_subscribe):
         mock_get_setting.side_effect = lambda key, default=None: {
             "tts_enabled": True,
             "character_speak": True,
@@ -37,28 +41,52 @@ class TestResponseOrchestrator(unittest.TestCase):
         self.assertTrue(tts_events)
         self.assertEqual(events[-1]["type"], "complete")
 
+    @patch("engines.response_orchestrator.subscribe_setting")
     @patch("engines.response_orchestrator.clean_text_for_tts", side_effect=lambda text, speak_narration=True: text.strip())
     @patch("engines.response_orchestrator.get_respond_stream", return_value=iter(["Hello. ", "World."]))
-    @patch("engines.response_orchestrator.get_setting")
-    def test_tts_master_toggle_applies_mid_stream(self, mock_get_setting, _mock_stream, _mock_clean):
-        tts_calls = {"count": 0}
-
-        def setting_side_effect(key, default=None):
-            if key == "tts_enabled":
-                tts_calls["count"] += 1
-                return tts_calls["count"] == 1
-            values = {
-                "character_speak": True,
-                "narration_tts_voice": "en-US-AndrewNeural",
-                "speak_narration": True,
-            }
-            return values.get(key, default)
+    def test_tts_master_toggle_applies_mid_stream(self, _mock_stream, _mock_clean, mock_subscribe):
+        tts_switch = MagicMock()
+        tts_switch.__bool__.side_effect = [True, False, False]
+        mock_subscribe.return_value = tts_switch
+        settings = Settings(character_speak=True, speak_narration=True)
 
-        mock_get_setting.side_effect = setting_side_effect
-        events = list(iterate_response_events("hi", {"tts_language": "en"}, "profile"))
+        events = list(iterate_response_events("hi", {"tts_language": "en"}, "profile", settings=settings))
         tts_events = [event for event in events if event["type"] == "tts"]
         self.assertEqual(len(tts_events), 1)
         self.assertEqual(events[-1]["type"], "complete")
+        mock_subscribe.assert_called_once_with("tts_enabled", False)
+
+    @patch("engines.response_orchestrator.subscribe_setting", return_value=True)
+    @patch("engines.response_orchestrator.clean_text_for_tts", side_effect=lambda text, speak_narration=True: text.strip())
+    @patch("engines.response_orchestrator.get_respond_stream", return_value=iter(["Hello. ", "World."]))
+    @patch("engines.response_orchestrator.get_setting")
+    def test_settings_snapshot_is_taken_once_per_turn(self, mock_get_setting, mock_stream, _mock_clean, _mock_subscribe):
+        mock_get_setting.side_effect = lambda key, default=None: {
+            "character_speak": True,
+            "speak_narration": True,
+        }.get(key, default)
+
+        events = list(iterate_response_events("hi", {"tts_language": "en"}, "profile"))
+        settings = mock_stream.call_args.kwargs["settings"]
+        self.assertIsInstance(settings, Settings)
+        self.assertTrue(settings.character_speak)
+        self.assertEqual(mock_get_setting.call_count, len(Settings.__dataclass_fields__))
+        self.assertTrue(all(event["settings"] is settings for event in events if event["type"] == "tts"))
+
+    @patch("engines.response_orchestrator.subscribe_setting", return_value=True)
+    @patch("engines.response_orchestrator.clean_text_for_tts", side_effect=lambda text, speak_narration=True: text.strip())
+    @patch("engines.response_orchestrator.get_respond_stream", return_value=iter(["Hello. ", "Wor"]))
+    @patch("engines.response_orchestrator.get_setting")
+    def test_cancelled_turn_ends_with_cancelled_event(self, mock_get_setting, mock_stream, _mock_clean, _mock_subscribe):
+        mock_get_setting.side_effect = lambda key, default=None: {"character_speak": True}.get(key, default)
+        token = CancellationToken()
+        token.cancel()
+
+        events = list(iterate_response_events("hi", {}, "profile", cancel_token=token))
+        self.assertIs(mock_stream.call_args.kwargs["cancel_token"], token)
+        self.assertEqual(events[-1], {"type": "cancelled", "full_response": "Hello. Wor"})
+        # The unfinished tail is not spoken.
+        self.assertEqual([event["payload"][0] for event in events if event["type"] == "tts"], ["Hello."])
 
 
 if __name__ == "__main__":
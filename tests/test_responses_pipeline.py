@@ -1,12 +1,12 @@
 import unittest
 from unittest.mock import MagicMock, patch
 
-from engines.responses import _call_llm_once, get_respond_stream
+from engines.responses import _call_llm_once, _perform_post_processing, get_respond_stream
 
 
 class TestResponsesPipeline(unittest.TestCase):
     @patch("engines.responses.get_setting")
-    @patch("engines.responses.requests.post")
+    @patch("engines.responses.http_client.post")
     def test_call_llm_once_remote_sends_repetition_penalty(self, mock_post, mock_get_setting):
         def side_effect(key, default=None):
             if key == "repetition_penalty":
@@ -53,7 +53,7 @@ class TestResponsesPipeline(unittest.TestCase):
         self.assertEqual(options["repeat_penalty"], 1.3)
         self.assertEqual(options["temperature"], 0.6)
 
-    @patch("engines.responses.requests.post")
+    @patch("engines.responses.http_client.post")
     def test_call_llm_once_remote_plain_text_fallback(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.side_effect = ValueError("not json")
@@ -70,7 +70,7 @@ class TestResponsesPipeline(unittest.TestCase):
         self.assertEqual(reply, "Plain text remote reply")
         mock_post.assert_called_once()
 
-    @patch("engines.responses.requests.post")
+    @patch("engines.responses.http_client.post")
     def test_call_llm_once_remote_json_choices(self, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = {
@@ -91,8 +91,8 @@ class TestResponsesPipeline(unittest.TestCase):
 
     @patch("engines.responses.get_sentiment_score", return_value=1)
     @patch("engines.responses.build_system_prompt", return_value="SYSTEM")
-    @patch("engines.responses.scan_for_lore", return_value="")
-    @patch("engines.responses.load_lorebook", return_value={})
+    @patch("engines.responses.activate_lore", return_value=("", {}))
+    @patch("engines.responses.get_lorebooks", return_value={})
     @patch("engines.responses._generate_candidate_replies", return_value=['"Reply one."', '"Reply two."'])
     @patch("engines.responses._call_llm_once", return_value='"Fallback reply."')
     @patch("engines.responses.get_pipeline_flags")
@@ -134,8 +134,10 @@ class TestResponsesPipeline(unittest.TestCase):
             "style_profile": "balanced",
         }
 
-        mock_memory_manager.get_full_data.return_value = full_data
+        mock_memory_manager.get_metadata.return_value = full_data["metadata"]
         mock_memory_manager.load_history.side_effect = [history, history, list(history)]
+        mock_memory_manager.get_history_length.return_value = len(history)
+        mock_memory_manager.load_messages.side_effect = lambda _name, ids: [history[i] for i in ids]
         mock_rank_candidates.return_value = [
             {
                 "index": 1,
@@ -153,13 +155,18 @@ class TestResponsesPipeline(unittest.TestCase):
         chunks = list(get_respond_stream("Hi", profile, history_profile_name="test_profile", is_regeneration=False))
         combined = "".join(chunks)
         self.assertIn("Reply two.", combined)
-        self.assertTrue(mock_memory_manager.save_history.called)
-        self.assertTrue(mock_memory_manager.update_narrative_state.called)
+        mock_memory_manager.commit_turn.assert_called_once()
+        commit_kwargs = mock_memory_manager.commit_turn.call_args.kwargs
+        self.assertEqual([msg["role"] for msg in commit_kwargs["messages"]], ["user", "assistant"])
+        self.assertIn("narrative_state", commit_kwargs["metadata"])
+        self.assertIn("last_turn_metrics", commit_kwargs["metadata"])
+        mock_memory_manager.update_narrative_state.assert_not_called()
+        mock_memory_manager.append_messages.assert_not_called()
 
     @patch("engines.responses.get_sentiment_score", return_value=0)
     @patch("engines.responses.build_system_prompt", return_value="SYSTEM")
-    @patch("engines.responses.scan_for_lore", return_value="")
-    @patch("engines.responses.load_lorebook", return_value={})
+    @patch("engines.responses.activate_lore", return_value=("", {}))
+    @patch("engines.responses.get_lorebooks", return_value={})
     @patch("engines.responses._generate_candidate_replies", return_value=['"Old answer"', '"Different answer"'])
     @patch("engines.responses.get_pipeline_flags")
     @patch("engines.responses.rank_candidates")
@@ -210,7 +217,7 @@ class TestResponsesPipeline(unittest.TestCase):
             "candidate_count": 2,
             "style_profile": "balanced",
         }
-        mock_memory_manager.get_full_data.return_value = full_data
+        mock_memory_manager.get_metadata.return_value = full_data["metadata"]
         mock_memory_manager.load_history.side_effect = [prompt_history, full_history]
         mock_rank_candidates.return_value = [
             {"index": 0, "text": "Old answer", "metrics": {"total": 9.5}},
@@ -221,15 +228,14 @@ class TestResponsesPipeline(unittest.TestCase):
         combined = "".join(chunks)
         self.assertIn("Different answer", combined)
 
-        saved_history = mock_memory_manager.save_history.call_args[0][1]
-        last_msg = saved_history[-1]
+        last_msg = mock_memory_manager.commit_turn.call_args.kwargs["replace_last"]
         self.assertEqual(last_msg["content"], "Different answer")
         self.assertEqual(last_msg["alternatives"], ["Old answer", "Different answer"])
 
     @patch("engines.responses.get_sentiment_score", return_value=0)
     @patch("engines.responses.build_system_prompt", return_value="SYSTEM")
-    @patch("engines.responses.scan_for_lore", return_value="")
-    @patch("engines.responses.load_lorebook", return_value={})
+    @patch("engines.responses.activate_lore", return_value=("", {}))
+    @patch("engines.responses.get_lorebooks", return_value={})
     @patch("engines.responses._generate_candidate_replies")
     @patch("engines.responses._call_llm_once", return_value='Single pass reply')
     @patch("engines.responses.get_pipeline_flags")
@@ -269,7 +275,7 @@ class TestResponsesPipeline(unittest.TestCase):
             "style_profile": "balanced",
         }
 
-        mock_memory_manager.get_full_data.return_value = full_data
+        mock_memory_manager.get_metadata.return_value = full_data["metadata"]
         mock_memory_manager.load_history.side_effect = [history, list(history)]
 
         chunks = list(get_respond_stream("Hi", profile, history_profile_name="test_profile", is_regeneration=False))
@@ -279,14 +285,14 @@ class TestResponsesPipeline(unittest.TestCase):
 
     @patch("engines.responses.get_sentiment_score", return_value=1)
     @patch("engines.responses.build_system_prompt", return_value="SYSTEM")
-    @patch("engines.responses.scan_for_lore", return_value="")
-    @patch("engines.responses.load_lorebook", return_value={})
+    @patch("engines.responses.activate_lore", return_value=("", {}))
+    @patch("engines.responses.get_lorebooks", return_value={})
     @patch("engines.responses._generate_candidate_replies", return_value=[])
     @patch("engines.responses.get_pipeline_flags")
     @patch("engines.responses.rank_candidates")
     @patch("engines.responses.memory_manager")
     @patch("engines.responses.get_setting")
-    @patch("engines.responses.requests.post")
+    @patch("engines.responses.http_client.post")
     def test_pipeline_remote_candidate_fallback_uses_plain_text_bridge(
         self,
         mock_post,
@@ -322,8 +328,10 @@ class TestResponsesPipeline(unittest.TestCase):
             "candidate_count": 2,
             "style_profile": "balanced",
         }
-        mock_memory_manager.get_full_data.return_value = full_data
+        mock_memory_manager.get_metadata.return_value = full_data["metadata"]
         mock_memory_manager.load_history.side_effect = [history, history, list(history)]
+        mock_memory_manager.get_history_length.return_value = len(history)
+        mock_memory_manager.load_messages.side_effect = lambda _name, ids: [history[i] for i in ids]
         mock_rank_candidates.return_value = [
             {
                 "index": 0,
@@ -350,6 +358,213 @@ class TestResponsesPipeline(unittest.TestCase):
         payload = mock_post.call_args.kwargs["json"]
         self.assertEqual(payload["repetition_penalty"], 1.4)
 
+    @patch("engines.responses.threading")
+    @patch("engines.responses.activate_lore")
+    @patch("engines.responses.get_lorebooks", return_value={})
+    @patch("engines.responses.get_pipeline_flags", return_value={"enabled": False})
+    @patch("engines.responses.memory_manager")
+    @patch("engines.responses.ollama.chat")
+    def test_cache_friendly_layout_keeps_a_stable_prefix(
+        self,
+        mock_ollama_chat,
+        mock_memory_manager,
+        _mock_flags,
+        _mock_lorebook,
+        mock_scan,
+        _mock_threading,
+    ):
+        from engines.config import Settings
+
+        profile = {"name": "TestAI", "system_prompt": "You are {{char}}.", "relationship_score": 0}
+        history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi there"}]
+        mock_memory_manager.load_history.return_value = history
+        mock_ollama_chat.return_value = [{"message": {"content": "Reply"}}]
+        settings = Settings(prompt_layout="cache_friendly", remote_llm_url=None)
+
+        sent = []
+        for scene, lore in (("Harbor", "[LORE: harbor]"), ("Forest", "[LORE: forest]")):
+            mock_memory_manager.get_metadata.return_value = {"current_scene": scene, "memory_core": ""}
+            mock_scan.return_value = (lore, {})
+            list(get_respond_stream("What now?", profile, history_profile_name="test_profile", settings=settings))
+            sent.append(mock_ollama_chat.call_args.kwargs["messages"])
+
+        first, second = sent
+        self.assertEqual(first[:3], second[:3])
+        self.assertEqual(first[1:3], history)
+        self.assertNotIn("Harbor", first[0]["content"])
+        self.assertNotIn("[CONTEXT]", first[0]["content"])
+        self.assertTrue(first[0]["content"].startswith("You are TestAI."))
+        for messages, scene, lore in ((first, "Harbor", "[LORE: harbor]"), (second, "Forest", "[LORE: forest]")):
+            self.assertEqual(messages[3]["role"], "system")
+            self.assertIn("[CONTEXT]", messages[3]["content"])
+            self.assertIn(f"CURRENT SCENE: {scene}", messages[3]["content"])
+            self.assertIn(lore, messages[3]["content"])
+            self.assertEqual(messages[4], {"role": "user", "content": "What now?"})
+
+    @patch("engines.responses.get_sentiment_score", return_value=0)
+    @patch("engines.responses.threading")
+    @patch("engines.responses.activate_lore", return_value=("", {}))
+    @patch("engines.responses.get_lorebooks", return_value={})
+    @patch("engines.responses.get_pipeline_flags", return_value={"enabled": False})
+    @patch("engines.responses.memory_manager")
+    @patch("engines.responses.ollama.chat")
+    def test_token_packing_fills_budget_with_newest_messages(
+        self,
+        mock_ollama_chat,
+        mock_memory_manager,
+        _mock_flags,
+        _mock_lorebook,
+        _mock_scan,
+        mock_threading,
+        _mock_sentiment,
+    ):
+        from engines.config import Settings
+        from engines.context_packer import PACK_CANDIDATE_MESSAGES, RESPONSE_TOKEN_RESERVE
+
+        profile = {"name": "TestAI", "system_prompt": "You are {{char}}.", "relationship_score": 0}
+        history = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i}: " + "words " * 40}
+            for i in range(60)
+        ]
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Room", "memory_core": ""}
+        mock_memory_manager.load_history.return_value = history
+        mock_ollama_chat.return_value = [{"message": {"content": "Reply"}}]
+
+        settings = Settings(
+            remote_llm_url=None, memory_limit=4, context_packing="tokens", context_window_tokens=RESPONSE_TOKEN_RESERVE + 1500
+        )
+        list(get_respond_stream("What now?", profile, history_profile_name="test_profile", settings=settings))
+        self.assertEqual(mock_memory_manager.load_history.call_args.kwargs["limit"], PACK_CANDIDATE_MESSAGES)
+        sent = mock_ollama_chat.call_args.kwargs["messages"][1:-1]
+        # More than memory_limit, fewer than everything, and always the newest ones.
+        self.assertGreater(len(sent), 4)
+        self.assertLess(len(sent), len(history))
+        self.assertEqual(sent, history[-len(sent):])
+
+        # Post-processing stores the counts of the packed messages, the first one
+        # that no longer fit, and the two new ones.
+        kwargs = mock_threading.Thread.call_args.kwargs["kwargs"]
+        _perform_post_processing(**{**kwargs, "full_reply": "Reply"})
+        stored = mock_memory_manager.commit_turn.call_args.kwargs["metadata"]["token_counts"]
+        self.assertEqual(stored["tokenizer"], "approximate")
+        self.assertEqual(len(stored["counts"]), len(sent) + 3)
+        self.assertEqual(mock_memory_manager.commit_turn.call_args.kwargs["metadata"]["lore_state"], {})
+
+        settings = Settings(remote_llm_url=None, memory_limit=4, context_packing="messages")
+        list(get_respond_stream("What now?", profile, history_profile_name="test_profile", settings=settings))
+        self.assertEqual(mock_memory_manager.load_history.call_args.kwargs["limit"], 4)
+
+    @patch("engines.responses.append_turn_telemetry")
+    @patch("engines.responses.update_profile_score")
+    @patch("engines.responses.get_sentiment_score")
+    @patch("engines.responses.threading")
+    @patch("engines.responses.activate_lore", return_value=("", {}))
+    @patch("engines.responses.get_lorebooks", return_value={})
+    @patch("engines.responses.get_pipeline_flags", return_value={"enabled": False})
+    @patch("engines.responses.memory_manager")
+    @patch("engines.responses.ollama.chat")
+    def test_sentiment_is_scored_while_the_reply_generates(
+        self,
+        mock_ollama_chat,
+        mock_memory_manager,
+        _mock_flags,
+        _mock_lorebook,
+        _mock_lore,
+        mock_threading,
+        mock_sentiment,
+        mock_update_score,
+        mock_telemetry,
+    ):
+        import threading
+        from engines.config import Settings
+
+        sentiment_started = threading.Event()
+
+        def score(*args, **kwargs):
+            sentiment_started.set()
+            return 2
+
+        def generate(**kwargs):
+            # Generation only finishes once sentiment scoring has started alongside it.
+            self.assertTrue(sentiment_started.wait(5))
+            return [{"message": {"content": "Reply"}}]
+
+        mock_sentiment.side_effect = score
+        mock_ollama_chat.side_effect = generate
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Room", "memory_core": ""}
+        mock_memory_manager.load_history.return_value = []
+        profile = {"name": "TestAI", "system_prompt": "You are {{char}}.", "relationship_score": 0}
+
+        list(get_respond_stream("You are wonderful", profile, profile_path="profiles/test.json", history_profile_name="test_profile", settings=Settings(remote_llm_url=None)))
+        kwargs = mock_threading.Thread.call_args.kwargs["kwargs"]
+        _perform_post_processing(**kwargs)
+        mock_sentiment.assert_called_once()
+        mock_update_score.assert_called_once_with("profiles/test.json", 2)
+
+        timings = mock_telemetry.call_args.args[1]["timings"]
+        self.assertGreaterEqual(timings["overlap_ms"], 0)
+        self.assertLessEqual(timings["overlap_ms"], timings["generation_ms"])
+        self.assertLessEqual(timings["sentiment_wait_ms"], timings["sentiment_ms"] + timings["post_processing_ms"])
+        self.assertGreaterEqual(timings["turn_ms"], timings["generation_ms"])
+
+    @patch("engines.responses.append_turn_telemetry")
+    @patch("engines.responses.update_profile_score")
+    @patch("engines.responses.memory_manager")
+    def test_failing_sentiment_engine_still_saves_the_reply(self, mock_memory_manager, mock_update_score, _mock_telemetry):
+        from concurrent.futures import Future
+        from engines.config import Settings
+
+        sentiment_future = Future()
+        sentiment_future.set_exception(RuntimeError("custom engine broke"))
+        _perform_post_processing(
+            user_input="Hello", model="model", remote_url=None, profile={}, profile_path="profiles/test.json",
+            history_profile_name="test_profile", is_regeneration=False, full_reply="Hi there", current_scene="Room",
+            rel_score=0, pipeline_flags={"enabled": False}, narrative_plan=None, memory_stack=None,
+            selected_metrics=None, candidate_metrics=[], critic_applied=False,
+            settings=Settings(), sentiment_future=sentiment_future,
+        )
+        mock_update_score.assert_not_called()
+        self.assertEqual(
+            mock_memory_manager.commit_turn.call_args.kwargs["messages"],
+            [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi there"}],
+        )
+
+    @patch("engines.responses.threading")
+    @patch("engines.responses.activate_lore", return_value=("", {}))
+    @patch("engines.responses.get_lorebooks", return_value={})
+    @patch("engines.responses.get_pipeline_flags", return_value={"enabled": False})
+    @patch("engines.responses.memory_manager")
+    @patch("engines.responses.llm_client.stream_chat")
+    def test_cancelled_stream_skips_post_processing(
+        self,
+        mock_stream_chat,
+        mock_memory_manager,
+        _mock_flags,
+        _mock_lorebook,
+        _mock_lore,
+        mock_threading,
+    ):
+        from engines.config import Settings
+        from engines.llm_client import CancellationToken
+
+        token = CancellationToken()
+
+        def stream(cancel_token, **kwargs):
+            yield "Once upon"
+            cancel_token.cancel()
+            yield " a time"
+
+        mock_stream_chat.side_effect = stream
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Room", "memory_core": ""}
+        mock_memory_manager.load_history.return_value = []
+        profile = {"name": "TestAI", "system_prompt": "You are {{char}}.", "relationship_score": 0}
+
+        settings = Settings(remote_llm_url=None)
+        chunks = list(get_respond_stream("Tell me a story", profile, history_profile_name="test_profile", settings=settings, cancel_token=token))
+        self.assertEqual(chunks, ["Once upon"])
+        self.assertIs(mock_stream_chat.call_args.args[0], token)
+        self.assertEqual(mock_stream_chat.call_args.kwargs["model"], settings.default_llm_model)
+        mock_threading.Thread.assert_not_called()
 
 if __name__ == "__main__":
     unittest.main()
@@ -46,9 +46,7 @@ class TestResponsesRegeneration(unittest.TestCase):
             "interaction_mode": "rp",
             "memory_limit": 15,
         }.get(key, default)
-        mock_memory_manager.get_full_data.return_value = {
-            "metadata": {"current_scene": "Room", "memory_core": ""}
-        }
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Room", "memory_core": ""}
         mock_memory_manager.load_history.side_effect = [prompt_history, full_history]
         mock_ollama_chat.return_value = [{"message": {"content": "New answer"}}]
 
@@ -106,9 +104,7 @@ class TestResponsesRegeneration(unittest.TestCase):
             "interaction_mode": "rp",
             "memory_limit": 15,
         }.get(key, default)
-        mock_memory_manager.get_full_data.return_value = {
-            "metadata": {"current_scene": "Room", "memory_core": ""}
-        }
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Room", "memory_core": ""}
         mock_memory_manager.load_history.side_effect = [prompt_history, full_history]
         mock_ollama_chat.return_value = [{"message": {"content": "Regenerated answer"}}]
 
@@ -121,10 +117,11 @@ class TestResponsesRegeneration(unittest.TestCase):
             )
         )
 
-        saved_history = mock_memory_manager.save_history.call_args[0][1]
-        last_msg = saved_history[-1]
+        mock_memory_manager.commit_turn.assert_called_once()
+        commit_kwargs = mock_memory_manager.commit_turn.call_args.kwargs
+        last_msg = commit_kwargs["replace_last"]
 
-        self.assertEqual(len(saved_history), 2)
+        self.assertEqual(commit_kwargs["messages"], [])
         self.assertEqual(last_msg["alternatives"], ["Old answer", "Regenerated answer"])
         self.assertEqual(last_msg["selected_index"], 1)
         self.assertEqual(last_msg["content"], "Regenerated answer")
@@ -174,9 +171,7 @@ class TestResponsesRegeneration(unittest.TestCase):
             "interaction_mode": "rp",
             "memory_limit": 15,
         }.get(key, default)
-        mock_memory_manager.get_full_data.return_value = {
-            "metadata": {"current_scene": "Room", "memory_core": ""}
-        }
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Room", "memory_core": ""}
         mock_memory_manager.load_history.side_effect = [prompt_history, full_history]
         mock_ollama_chat.return_value = [{"message": {"content": "Duplicate response"}}]
 
@@ -194,8 +189,7 @@ class TestResponsesRegeneration(unittest.TestCase):
         mock_call_once.assert_not_called()
         
         # 2. Bookkeeping SHOULD still happen (new alternative added)
-        saved_history = mock_memory_manager.save_history.call_args[0][1]
-        last_msg = saved_history[-1]
+        last_msg = mock_memory_manager.commit_turn.call_args.kwargs["replace_last"]
         self.assertEqual(len(last_msg["alternatives"]), 2)
         self.assertEqual(last_msg["selected_index"], 1)
         self.assertEqual(last_msg["content"], "Duplicate response")
@@ -238,9 +232,7 @@ class TestResponsesRegeneration(unittest.TestCase):
             "interaction_mode": "rp",
             "memory_limit": 15,
         }.get(key, default)
-        mock_memory_manager.get_full_data.return_value = {
-            "metadata": {"current_scene": "Room", "memory_core": ""}
-        }
+        mock_memory_manager.get_metadata.return_value = {"current_scene": "Room", "memory_core": ""}
         mock_memory_manager.load_history.side_effect = [prompt_history, full_history]
         mock_ollama_chat.return_value = [{"message": {"content": "Streamed response"}}]
 
@@ -0,0 +1,109 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from engines.config import Settings
+from engines.responses import (
+    SENTIMENT_ENGINES,
+    HybridSentimentEngine,
+    LexiconSentimentEngine,
+    SentimentEngine,
+    create_sentiment_engine,
+    get_sentiment_score,
+    register_sentiment_engine,
+)
+from engines.sentiment import score_sentiment
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "sentiment_labels.json")
+
+
+class TestLexiconScorer(unittest.TestCase):
+    def test_polarity_negation_and_intensity(self):
+        self.assertGreater(score_sentiment("You're nice.").score, 0)
+        self.assertLess(score_sentiment("You're not nice.").score, 0)
+        self.assertLess(score_sentiment("You're stupid.").score, 0)
+        self.assertGreater(
+            score_sentiment("I really love you!!").score,
+            score_sentiment("I kinda love you").score,
+        )
+        self.assertGreaterEqual(score_sentiment("You are AMAZING").score, score_sentiment("You are amazing").score)
+        self.assertEqual(score_sentiment("Tell me about the tavern.").score, 0)
+        self.assertEqual(score_sentiment("").score, 0)
+
+    def test_emoji_and_roleplay_actions(self):
+        self.assertGreater(score_sentiment("🥰").score, 0)
+        self.assertLess(score_sentiment("Sure 🙄").score, 0)
+        self.assertGreater(score_sentiment("ok :)").score, 0)
+        self.assertGreater(score_sentiment("*hugs you*").score, 0)
+        self.assertLess(score_sentiment("*slaps you*").score, 0)
+        self.assertEqual(score_sentiment("*opens the door*").score, 0)
+
+    def test_contrast_favours_the_second_clause(self):
+        self.assertLess(score_sentiment("It was good, but you lied to me.").score, 0)
+        self.assertGreater(score_sentiment("You can be annoying but I still love you.").score, 0)
+
+    def test_confidence_drops_for_mixed_and_sarcastic_messages(self):
+        clear = score_sentiment("Thank you so much!")
+        self.assertGreaterEqual(clear.confidence, 0.8)
+        self.assertLess(score_sentiment("Yeah right, great job.").confidence, 0.6)
+        self.assertLess(score_sentiment("You're sweet but you're really rude.").confidence, clear.confidence)
+
+    def test_agrees_with_labelled_fixtures(self):
+        with open(FIXTURES, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        sign = lambda value: (value > 0) - (value < 0)
+        polarity = sum(sign(score_sentiment(row["text"]).score) == sign(row["label"]) for row in rows) / len(rows)
+        within_one = sum(abs(score_sentiment(row["text"]).score - row["label"]) <= 1 for row in rows) / len(rows)
+        self.assertGreaterEqual(polarity, 0.85)
+        self.assertGreaterEqual(within_one, 0.8)
+
+
+class TestSentimentEngines(unittest.TestCase):
+    @patch("engines.responses.ollama.chat")
+    def test_lexicon_engine_never_calls_the_model(self, mock_chat):
+        settings = Settings(sentiment_engine="lexicon")
+        self.assertGreater(get_sentiment_score("I love you", "model", settings=settings), 0)
+        mock_chat.assert_not_called()
+
+    @patch("engines.responses.ollama.chat", return_value={"message": {"content": '{"rel": -2}'}})
+    def test_hybrid_escalates_only_when_unsure(self, mock_chat):
+        settings = Settings(sentiment_engine="hybrid", sentiment_confidence_threshold=0.6)
+        self.assertGreater(get_sentiment_score("Thank you so much!", "model", settings=settings), 0)
+        mock_chat.assert_not_called()
+
+        self.assertEqual(get_sentiment_score("Yeah right, great job.", "model", settings=settings), -2)
+        mock_chat.assert_called_once()
+
+        # If the model is unavailable, the lexicon's guess stands.
+        mock_chat.side_effect = ConnectionError("ollama down")
+        self.assertEqual(
+            get_sentiment_score("Yeah right, great job.", "model", settings=settings),
+            score_sentiment("Yeah right, great job.").score,
+        )
+
+    @patch("engines.responses.ollama.chat", return_value={"message": {"content": '{"rel": 4}'}})
+    def test_llm_engine_is_the_default_and_fallback(self, mock_chat):
+        self.assertEqual(get_sentiment_score("hello", "model", settings=Settings()), 4)
+        self.assertEqual(get_sentiment_score("hello", "model", settings=Settings(sentiment_engine="missing")), 4)
+        self.assertEqual(mock_chat.call_count, 2)
+
+    def test_custom_engines_can_be_registered(self):
+        class ConstantEngine(SentimentEngine):
+            name = "constant"
+
+            def score(self, user_input, model, remote_url=None, profile=None, settings=None):
+                return 3
+
+        with self.assertRaises(TypeError):
+            SentimentEngine()
+        register_sentiment_engine("constant", ConstantEngine)
+        self.addCleanup(SENTIMENT_ENGINES.pop, "constant")
+        self.assertIsInstance(create_sentiment_engine("constant"), ConstantEngine)
+        self.assertEqual(get_sentiment_score("anything", "model", settings=Settings(sentiment_engine="constant")), 3)
+        self.assertIsInstance(create_sentiment_engine("lexicon"), LexiconSentimentEngine)
+        self.assertIsInstance(create_sentiment_engine("hybrid"), HybridSentimentEngine)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -66,6 +66,50 @@ class TestStandaloneLLMBridge(unittest.TestCase):
         self.assertIn("Moonlight means caution.", engine.last_stream_messages[0]["content"])
         self.assertIn("Stay in character.", engine.last_stream_messages[0]["content"])
 
+    def test_cache_friendly_layout_keeps_rag_out_of_the_prefix(self):
+        engine = FakeLLMEngine()
+        client = TestClient(BRIDGE.create_app(lore_manager=FakeLoreManager(), llm_engine=engine))
+
+        payload = {
+            "messages": [
+                {"role": "system", "content": "Stay in character."},
+                {"role": "user", "content": "Earlier question"},
+                {"role": "assistant", "content": "Earlier answer"},
+                {"role": "system", "content": "[CONTEXT] Harbor"},
+                {"role": "user", "content": "What should we do now?"},
+            ],
+            "use_rag": True,
+            "prompt_layout": "cache_friendly",
+        }
+        response = client.post("/chat", json=payload)
+
+        self.assertEqual(response.status_code, 200)
+        messages = engine.last_stream_messages
+        self.assertEqual(messages[0], {"role": "system", "content": "Stay in character."})
+        self.assertEqual(messages[3], {"role": "system", "content": "[CONTEXT] Harbor"})
+        self.assertIn("Moonlight means caution.", messages[4]["content"])
+        self.assertEqual(messages[5]["content"], "What should we do now?")
+
+    def test_cache_friendly_layout_without_a_user_message(self):
+        engine = FakeLLMEngine()
+        client = TestClient(BRIDGE.create_app(lore_manager=FakeLoreManager(), llm_engine=engine))
+
+        payload = {
+            "messages": [
+                {"role": "system", "content": "Stay in character."},
+                {"role": "assistant", "content": "The tide was turning when"},
+            ],
+            "use_rag": True,
+            "prompt_layout": "cache_friendly",
+        }
+        response = client.post("/chat", json=payload)
+
+        self.assertEqual(response.status_code, 200)
+        messages = engine.last_stream_messages
+        self.assertEqual(messages[:2], payload["messages"])
+        self.assertEqual(messages[2]["role"], "system")
+        self.assertIn("Moonlight means caution.", messages[2]["content"])
+
     def test_chat_batch_returns_candidates_json(self):
         lore_manager = FakeLoreManager()
         engine = FakeLLMEngine()
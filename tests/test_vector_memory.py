@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from engines.lorebook import activate_lore, get_lorebooks, semantic_lore_scores
+from engines.narrative_pipeline import retrieve_memory_stack
+from engines.vector_memory import (
+    NUMPY_AVAILABLE,
+    HashingEmbedder,
+    LoreVectorIndex,
+    VectorMemoryIndex,
+    create_embedder,
+    get_vector_index,
+)
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "numpy is required for vector memory tests")
+class TestVectorMemory(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_history_vectors"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.prefix = os.path.join(self.test_dir, "Profile")
+        self.history = [
+            {"role": "user", "content": "The old lighthouse keeper promised to show us the hidden cove."},
+            {"role": "assistant", "content": "We bought bread and apples at the morning market."},
+            {"role": "user", "content": "My sister Mira is afraid of thunderstorms."},
+            {"role": "assistant", "content": "The tavern band played until midnight."},
+        ]
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_hashing_embedder_is_normalized_and_deterministic(self):
+        embedder = HashingEmbedder(dim=64)
+        vectors = embedder.embed(["storm over the harbor", "storm over the harbor", ""])
+        self.assertEqual(vectors.shape, (3, 64))
+        self.assertAlmostEqual(float(vectors[0] @ vectors[0]), 1.0, places=5)
+        self.assertEqual(vectors[0].tolist(), vectors[1].tolist())
+        self.assertFalse(vectors[2].any())
+
+    def test_search_finds_related_message(self):
+        index = VectorMemoryIndex(self.prefix, HashingEmbedder())
+        self.assertEqual(index.sync(self.history), 4)
+
+        self.assertEqual(index.search("is Mira scared of thunderstorms?", 1), [2])
+        self.assertEqual(index.search("lighthouse keeper cove", 2)[0], 0)
+        self.assertEqual(index.search("lighthouse keeper cove", 2, before=0), [])
+        self.assertEqual(index.search("zzzz qqqq", 3), [])
+
+    def test_sync_embeds_only_new_or_changed_messages(self):
+        embedder = HashingEmbedder()
+        index = VectorMemoryIndex(self.prefix, embedder)
+        index.sync(self.history)
+
+        history = self.history + [{"role": "user", "content": "Let's sail to the cove tomorrow."}]
+        with patch.object(embedder, "embed", wraps=embedder.embed) as mock_embed:
+            self.assertEqual(index.sync(history), 1)
+            mock_embed.assert_called_once()
+            self.assertEqual(len(mock_embed.call_args.args[0]), 1)
+
+        # Rewind and regenerate the last kept message.
+        history = history[:2]
+        history[-1] = {"role": "assistant", "content": "We sold fish at the evening market."}
+        with patch.object(embedder, "embed", wraps=embedder.embed) as mock_embed:
+            self.assertEqual(index.sync(history), 1)
+            self.assertEqual(mock_embed.call_args.args[0], ["We sold fish at the evening market."])
+
+        self.assertEqual(os.path.getsize(index.vectors_path), 2 * embedder.dim * 4)
+        reloaded = VectorMemoryIndex(self.prefix, HashingEmbedder())
+        self.assertEqual(reloaded.sync(history), 0)
+        self.assertEqual(reloaded.search("fish market evening", 1), [1])
+
+    def test_edit_before_an_unchanged_last_message_is_reembedded(self):
+        embedder = HashingEmbedder()
+        index = VectorMemoryIndex(self.prefix, embedder)
+        index.sync(self.history)
+
+        history = list(self.history)
+        history[1] = {"role": "assistant", "content": "We sold fish at the evening market."}
+        with patch.object(embedder, "embed", wraps=embedder.embed) as mock_embed:
+            self.assertEqual(index.sync(history), 3)
+            self.assertEqual(mock_embed.call_args.args[0][0], "We sold fish at the evening market.")
+        self.assertEqual(index.search("fish market evening", 1), [1])
+
+    def test_changed_embedder_rebuilds_index(self):
+        VectorMemoryIndex(self.prefix, HashingEmbedder(dim=128)).sync(self.history)
+        index = VectorMemoryIndex(self.prefix, HashingEmbedder(dim=256))
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.sync(self.history), 4)
+
+    def test_torn_append_is_trimmed_on_load(self):
+        embedder = HashingEmbedder()
+        VectorMemoryIndex(self.prefix, embedder).sync(self.history)
+        with open(self.prefix + "_vectors.f32", "ab") as f:
+            f.write(b"\0" * (embedder.dim * 4 + 3))
+
+        index = VectorMemoryIndex(self.prefix, embedder)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(os.path.getsize(index.vectors_path), 4 * embedder.dim * 4)
+
+    def test_retrieve_memory_stack_uses_vector_index_for_episodic_layer(self):
+        history = self.history + [{"role": "user", "content": f"small talk {i}"} for i in range(6)]
+        history[1] = {"role": "assistant", "content": "We plan to visit the morning market."}
+        index = VectorMemoryIndex(self.prefix, HashingEmbedder())
+
+        # Vector hits first, then keyword cues fill the layer; output stays chronological.
+        stack = retrieve_memory_stack(
+            history, "Mira hates thunderstorms", short_limit=6, episodic_limit=2, vector_index=index
+        )
+        self.assertEqual(stack["episodic"], [history[1], history[2]])
+
+        without_vectors = retrieve_memory_stack(history, "Mira hates thunderstorms", short_limit=6, episodic_limit=2)
+        self.assertEqual(without_vectors["episodic"], [history[1]])
+
+    def test_lore_index_embeds_only_new_or_edited_entries(self):
+        embedder = HashingEmbedder()
+        lore_path = os.path.join(self.test_dir, "world.json")
+        index = LoreVectorIndex(lore_path, embedder)
+        keys = ["a", "b", "c"]
+        texts = ["harbor fishing boats", "mountain snow pass", "royal castle guards"]
+        self.assertEqual(index.sync(keys, texts), 3)
+        self.assertEqual(index.search("boats in the harbor", 1)[0][0], "a")
+
+        with patch.object(embedder, "embed", wraps=embedder.embed) as mock_embed:
+            self.assertEqual(index.sync(["a", "b2", "c"], [texts[0], "desert sand dunes", texts[2]]), 1)
+            self.assertEqual(mock_embed.call_args.args[0], ["desert sand dunes"])
+
+        # Same key, new text (e.g. only the entry's trigger keys were edited).
+        with patch.object(embedder, "embed", wraps=embedder.embed) as mock_embed:
+            self.assertEqual(index.sync(["a", "b2", "c"], [texts[0], "desert sand dunes", "royal castle moat"]), 1)
+            self.assertEqual(mock_embed.call_args.args[0], ["royal castle moat"])
+
+        reloaded = LoreVectorIndex(lore_path, HashingEmbedder())
+        self.assertEqual(len(reloaded), 3)
+        self.assertEqual(reloaded.search("sand dunes of the desert", 1)[0][0], "b2")
+        self.assertEqual(reloaded.sync(["a", "b2", "c"], [texts[0], "desert sand dunes", "royal castle moat"]), 0)
+        self.assertEqual(LoreVectorIndex(lore_path, HashingEmbedder(dim=128)).sync(["a"], [texts[0]]), 1)
+
+    def test_semantic_lore_activates_entries_without_their_keyword(self):
+        lore_path = os.path.join(self.test_dir, "world.json")
+        with open(lore_path, "w", encoding="UTF-8") as f:
+            json.dump({"entries": [
+                {"id": "1", "keys": ["Saltmere"], "content": "Saltmere is a harbor town of fishing boats and nets."},
+                {"id": "2", "keys": ["Highpass"], "content": "Highpass is a mountain pass buried in snow."},
+            ]}, f)
+        lorebook_data = get_lorebooks([lore_path])
+        messages = [{"role": "user", "content": "Do the fishing boats leave the harbor at dawn?"}]
+
+        self.assertEqual(activate_lore(messages, lorebook_data)[0], "")
+        scores = semantic_lore_scores(messages[-1]["content"], lorebook_data, [lore_path])
+        self.assertEqual(list(scores), [0])
+        lore_text, _state = activate_lore(messages, lorebook_data, semantic_scores=scores)
+        self.assertIn("Saltmere is a harbor town", lore_text)
+        self.assertTrue(os.path.exists(lore_path + ".vectors.f32"))
+
+    def test_registry_and_embedder_fallback(self):
+        with patch("engines.vector_memory.SentenceTransformerEmbedder", side_effect=ImportError):
+            self.assertIsInstance(create_embedder("sentence-transformers"), HashingEmbedder)
+        index = get_vector_index("Some Profile", self.test_dir)
+        self.assertIs(index, get_vector_index("Some Profile", self.test_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
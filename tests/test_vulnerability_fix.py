@@ -82,7 +82,7 @@ class TestVulnerabilityFix(unittest.TestCase):
         self.assertEqual(user_msg['content'], f"[USER_MSG]\n{user_input}\n[/USER_MSG]")
 
     @patch("engines.responses.get_setting")
-    @patch("engines.responses.requests.post")
+    @patch("engines.responses.http_client.post")
     @patch("engines.responses.redact_pii")
     def test_privacy_mode_redaction_llm(self, mock_redact, mock_post, mock_get_setting):
         # Setup mocks
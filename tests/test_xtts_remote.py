@@ -12,8 +12,8 @@ class TestXTTSRemote(unittest.TestCase):
         from engines.xtts_remote import _UPLOADED_VOICES
         _UPLOADED_VOICES.clear()
 
-    @patch('engines.xtts_remote.requests.get')
-    @patch('engines.xtts_remote.requests.post')
+    @patch('engines.xtts_remote.http_client.get')
+    @patch('engines.xtts_remote.http_client.post')
     @patch('engines.xtts_remote.get_setting')
     def test_generate_audio_remote_success(self, mock_get_setting, mock_post, mock_get):
         from engines.xtts_remote import generate_remote_xtts
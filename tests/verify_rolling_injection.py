@@ -16,11 +16,9 @@ class TestRollingInjection(unittest.TestCase):
         }.get(key, default)
         
         # Mock memory data with a Memory Core
-        mock_memory_manager.get_full_data.return_value = {
-            "metadata": {
-                "current_scene": "The woods",
-                "memory_core": "PREVIOUS EVENTS: The hero found a sword."
-            }
+        mock_memory_manager.get_metadata.return_value = {
+            "current_scene": "The woods",
+            "memory_core": "PREVIOUS EVENTS: The hero found a sword."
         }
         mock_memory_manager.load_history.return_value = []
         